@@ -0,0 +1,43 @@
+import argparse
+import sys
+import time
+from PySide6.QtCore import QPointF
+from PySide6.QtWidgets import QApplication
+from ui.node_editor import NodeEditorView
+from ui.viewer_benchmark import benchmark_project, run_pan_zoom, format_benchmark_stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time panning and zooming a large graph in the node editor")
+    parser.add_argument("--nodes", type=int, default=10000)
+    parser.add_argument("--size", default="1280x800", help="WIDTHxHEIGHT of the editor")
+    parser.add_argument("--frames", type=int, default=60, help="frames of panning at each scale")
+    parser.add_argument("--compare", action="store_true", help="time it again with level of detail off")
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    width, height = (int(value) for value in args.size.lower().split("x"))
+    editor = NodeEditorView()
+    editor.resize(width, height)
+    editor.show()
+    viewer = editor.node_graph.viewer()
+
+    project = benchmark_project(args.nodes)
+    start = time.perf_counter()
+    editor.import_project(project)
+    print(f"Loaded {len(project)} nodes and {project.edge_count()} connections and generated the shader in "
+          f"{time.perf_counter() - start:.2f} s")
+    # Normally built in the background; all of them are needed to pan over
+    start = time.perf_counter()
+    editor.create_views()
+    app.processEvents()
+    print(f"Built their views in {time.perf_counter() - start:.2f} s")
+
+    bounds = viewer.scene().itemsBoundingRect()
+    center = QPointF(bounds.center())
+    print("Level of detail on:")
+    print(format_benchmark_stats(run_pan_zoom(viewer, center, args.frames)))
+    if args.compare:
+        viewer.set_lod_enabled(False)
+        print("Level of detail off:")
+        print(format_benchmark_stats(run_pan_zoom(viewer, center, args.frames)))
+    sys.exit(0)
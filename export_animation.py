@@ -0,0 +1,41 @@
+import argparse
+import sys
+from shaders.headless import HeadlessContext
+from shaders.export_pipeline import ExportPipeline, FORMATS, format_export_stats
+from shaders.shader_utils import load_shader_source_with_includes
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export an animated shader as an image sequence or raw video")
+    parser.add_argument("shader", help="fragment shader (.glsl)")
+    parser.add_argument("output", help="directory for a PNG sequence, or a .y4m / .raw file")
+    parser.add_argument("--frames", type=int, default=240)
+    parser.add_argument("--fps", type=float, default=60.0)
+    parser.add_argument("--size", default="1280x720", help="WIDTHxHEIGHT")
+    parser.add_argument("--start-time", type=float, default=0.0, help="iTime of the first frame")
+    parser.add_argument("--format", choices=FORMATS, help="defaults to the output's extension")
+    parser.add_argument("--workers", type=int, default=None, help="encoder processes")
+    parser.add_argument("--queue-depth", type=int, default=8, help="frames buffered between render and encode")
+    args = parser.parse_args()
+
+    width, height = (int(value) for value in args.size.lower().split("x"))
+    source, _ = load_shader_source_with_includes(args.shader)
+    pipeline = ExportPipeline(source, args.output, args.frames, fps=args.fps, width=width, height=height,
+                              export_format=args.format, workers=args.workers, queue_depth=args.queue_depth,
+                              start_time=args.start_time)
+
+    def on_progress(completed, total, stats):
+        # Parsed by the editor's export action, keep the format stable
+        print(f"progress {completed}/{total} {stats['fps']:.1f} fps", flush=True)
+
+    context = HeadlessContext()
+    try:
+        stats = pipeline.run(on_progress)
+    except KeyboardInterrupt:
+        print("Interrupted; run the same command again to resume.")
+        sys.exit(1)
+    finally:
+        context.release()
+    if stats["resumed_from"]:
+        print(f"Resumed from frame {stats['resumed_from']}")
+    print(format_export_stats(stats))
+    sys.exit(0)
@@ -0,0 +1,484 @@
+# glsl_codegen.py
+import re
+import time
+from graph.port_types import convert, default_value
+from graph.shader_graph import ShaderGraph
+from utils.tracing import tracer
+
+DECLARATION_PATTERN = re.compile(r"\b(float|vec2|vec3|vec4)\s+([A-Za-z_]\w*)\s*=")
+PREVIEW_UNIFORM = "previewNode"
+# Nodes whose output depends only on their properties, their inputs and the
+# pixel's UV: a branch made only of these can be rendered once into a texture
+BAKEABLE_TYPES = ("UVNode", "ColorNode", "GradientNode", "BlendNode", "AddNode", "MaterialNode")
+BAKE_PASS_PREFIX = "bake_"
+
+
+class GlslGenerator:
+    # Turns a ShaderGraph into GLSL. Built once per graph change: it orders the
+    # nodes, names them (glsl_ids) and resolves every port's type, raising
+    # PortTypeError for a graph that can't compile.
+    def __init__(self, graph):
+        self.graph = graph
+        self.nodes = graph.ordered_nodes()
+        # Types first: their topological order refuses a cycle by name
+        self.input_types, self.output_types = graph.port_types()
+        self.glsl_ids = graph.glsl_ids(self.nodes)
+        # node -> generate(generated_code, used_vars) standing in for the
+        # node's own code, e.g. a lookup into a baked texture
+        self.overrides = {}
+
+    def generate(self, node, generated_code, used_vars):
+        # Appends the node's statements (after those of its inputs) unless
+        # used_vars shows they're there already, and returns its variable
+        override = self.overrides.get(node)
+        if override is not None:
+            return override(generated_code, used_vars)
+        return GENERATORS[self.graph.type_name(node)](self, node, generated_code, used_vars)
+
+    def input_var(self, node, input_name, generated_code, used_vars):
+        # The connected variable as the type the input works in, or None
+        spec = self.graph.spec(node)
+        source = self.graph.source(node, spec.inputs.index(input_name))
+        if source is None:
+            return None
+        var_name = self.generate(source[0], generated_code, used_vars)
+        source_type, target_type = self.input_types[(node, input_name)]
+        return convert(var_name, source_type, target_type)
+
+    def build_glsl_code(self, skip=()):
+        generated_code = []
+        used_vars = set()
+        final_output_var = None
+
+        for node in self.nodes:
+            if node not in skip:
+                final_output_var = self.generate(node, generated_code, used_vars)
+
+        # Several nodes declare the same uniform (resolution); keep the first
+        declared = set()
+        unique_code = []
+        for line in generated_code:
+            if line.strip().startswith("uniform "):
+                if line.strip() in declared:
+                    continue
+                declared.add(line.strip())
+            unique_code.append(line)
+        generated_code = unique_code
+
+        # Construct the final GLSL code
+        if final_output_var:
+            # Ensure the final output variable is a vec3 before using it in a vec4 context
+            final_code = f"""#version 120
+    {format_glsl_code(generated_code)}
+
+    void main() {{
+        vec3 color = {final_output_var}.rgb;  // Ensure it's a vec3
+        gl_FragColor = vec4(color, 1.0);  // Convert to vec4 with alpha 1.0
+    }}
+    """
+        else:
+            final_code = """#version 120
+    void main() {
+        gl_FragColor = vec4(0.0, 0.0, 0.0, 1.0);  // Default to black if no output
+    }
+    """
+        return final_code
+
+    def bake_roots(self):
+        # Outputs of static UV-driven branches that something still needs: a
+        # node that can't be baked reads them, or they are the final output.
+        # Returns the roots and, per baked node, the nodes in its branch.
+        graph = self.graph
+        nodes = self.nodes
+        upstream = {node: [source for _, source, _ in graph.sources(node)] for node in nodes}
+        order = []
+        visited = set()
+        for start in nodes:
+            stack = [(start, False)]
+            while stack:
+                node, expanded = stack.pop()
+                if expanded:
+                    order.append(node)
+                    continue
+                if node in visited:
+                    continue
+                visited.add(node)
+                stack.append((node, True))
+                stack.extend((source, False) for source in upstream.get(node, []) if source not in visited)
+
+        branches = {}
+        reads_uv = {}
+        for node in order:
+            inputs = upstream.get(node, [])
+            type_name = graph.type_name(node)
+            # Anything in a cycle is never baked: its inputs have no branch yet
+            if type_name in BAKEABLE_TYPES and all(source in branches for source in inputs):
+                branches[node] = {node}.union(*(branches[source] for source in inputs))
+                reads_uv[node] = type_name == "UVNode" or any(reads_uv[source] for source in inputs)
+
+        readers = {node: [] for node in nodes}
+        for node in nodes:
+            for source in upstream[node]:
+                readers.setdefault(source, []).append(node)
+        final = nodes[-1] if nodes else None
+        roots = []
+        for node in nodes:
+            # Constant-only branches are folded by the GLSL compiler, and a
+            # lone UV node is cheaper to compute than to look up
+            if node not in branches or not reads_uv[node] or len(branches[node]) < 2:
+                continue
+            if node == final or any(reader not in branches for reader in readers[node]):
+                roots.append(node)
+        return roots, branches
+
+    def build_baked_glsl_code(self, bake_scale=1.0):
+        # A multi-pass shader: one pass per baked branch and a main pass that
+        # samples them. Passes are named after the root's glsl_id, which
+        # hashes every upstream property, so editing a branch gives its pass a
+        # new name and only that bake is rendered again.
+        roots, branches = self.bake_roots()
+        if not roots:
+            return self.build_glsl_code()
+
+        bakes = []
+        for root in roots:
+            body = []
+            var_name = self.generate(root, body, set())
+            var_types = {name: glsl_type for glsl_type, name in DECLARATION_PATTERN.findall("\n".join(body))}
+            bakes.append((root, f"{BAKE_PASS_PREFIX}{self.glsl_ids[root]}", var_name, var_types.get(var_name, "vec4"),
+                          body))
+
+        def baked_lookup(pass_name, var_name, var_type):
+            swizzle = {"vec4": "", "vec3": ".rgb", "vec2": ".rg", "float": ".r"}[var_type]
+
+            def generate_glsl(generated_code, used_vars):
+                if var_name not in used_vars:
+                    used_vars.add(var_name)
+                    generated_code.append(f"// Baked into pass {pass_name}")
+                    generated_code.append(f"uniform sampler2D {pass_name};")
+                    generated_code.append("uniform vec2 resolution;")
+                    generated_code.append(f"{var_type} {var_name} = texture2D({pass_name}, gl_FragCoord.xy / resolution){swizzle};")
+                return var_name
+            return generate_glsl
+
+        # The last node is the graph's output and is always emitted
+        inner = set().union(*(branches[root] for root in roots)) - set(roots) - {self.nodes[-1]}
+        for root, pass_name, var_name, var_type, _ in bakes:
+            self.overrides[root] = baked_lookup(pass_name, var_name, var_type)
+        try:
+            main_code = self.build_glsl_code(skip=inner)
+        finally:
+            for root, _, _, _, _ in bakes:
+                del self.overrides[root]
+
+        sections = []
+        for _, pass_name, var_name, var_type, body in bakes:
+            uniforms, statements = split_uniforms(body)
+            output = {"vec4": var_name, "vec3": f"vec4({var_name}, 1.0)", "vec2": f"vec4({var_name}, 0.0, 1.0)",
+                      "float": f"vec4(vec3({var_name}), 1.0)"}[var_type]
+            header = "\n".join(uniforms)
+            sections.append(f"""// @pass {pass_name} float scale={bake_scale:g}
+#version 120
+{header}
+
+void main() {{
+{format_glsl_code(statements)}
+    gl_FragColor = {output};
+}}
+""")
+        inputs = " ".join(f"{pass_name}={pass_name}" for _, pass_name, _, _, _ in bakes)
+        sections.append(f"// @pass main {inputs}\n{main_code}")
+        return "\n".join(sections)
+
+    def build_preview_glsl_code(self):
+        # The whole graph in one program with every node's value reachable:
+        # the previewNode uniform picks which one is shown. Returns the code
+        # and each node's previewNode index.
+        generated_code = []
+        used_vars = set()
+        preview_vars = []
+
+        for node in self.nodes:
+            preview_vars.append((node, self.generate(node, generated_code, used_vars)))
+
+        # Node code runs inside main() here, so uniform declarations are hoisted
+        uniforms, body = split_uniforms(generated_code)
+
+        var_types = {name: glsl_type for glsl_type, name in DECLARATION_PATTERN.findall("\n".join(body))}
+        preview_index = {}
+        branches = []
+        for index, (node, var_name) in enumerate(preview_vars):
+            preview_index[node] = index
+            keyword = "if" if index == 0 else "else if"
+            branches.append(f"{keyword} ({PREVIEW_UNIFORM} == {index}) preview = {preview_expression(var_name, var_types)};")
+
+        final_output = preview_expression(preview_vars[-1][1], var_types) if preview_vars else "vec3(0.0)"
+        header = "\n".join([f"uniform int {PREVIEW_UNIFORM};"] + uniforms)
+        branch_code = "\n".join(f"    {branch}" for branch in branches)
+        final_code = f"""#version 120
+{header}
+
+void main() {{
+{format_glsl_code(body)}
+    vec3 preview = {final_output};
+{branch_code}
+    gl_FragColor = vec4(preview, 1.0);
+}}
+"""
+        return final_code, preview_index
+
+    def build_node_glsl_code(self, node):
+        # Just the node and what feeds it
+        generated_code = []
+        final_output_var = self.generate(node, generated_code, set())
+        return f"""
+    #version 120
+    {format_glsl_code(generated_code)}
+
+    void main() {{
+        gl_FragColor = vec4(vec3({final_output_var}), 1.0);
+    }}
+    """
+
+
+def format_glsl_code(code_lines):
+    formatted_code = ""
+    indent = "    "
+    for line in code_lines:
+        if line.strip().startswith("//"):
+            formatted_code += f"{line}\n"
+        else:
+            formatted_code += f"{indent}{line}\n"
+    return formatted_code
+
+
+def split_uniforms(generated_code):
+    # Node code run inside main() needs its uniform declarations hoisted
+    uniforms = []
+    body = []
+    for line in generated_code:
+        if line.strip().startswith("uniform "):
+            if line.strip() not in uniforms:
+                uniforms.append(line.strip())
+        else:
+            body.append(line)
+    return uniforms, body
+
+
+def preview_expression(var_name, var_types):
+    glsl_type = var_types.get(var_name, "vec3")
+    if glsl_type == "vec4":
+        return f"{var_name}.rgb"
+    if glsl_type == "vec2":
+        return f"vec3({var_name}, 0.0)"
+    if glsl_type == "float":
+        return f"vec3({var_name})"
+    return var_name
+
+
+def default_uv(generated_code, used_vars):
+    # Shared by every unconnected UV input
+    var_name = "default_uv"
+    if var_name not in used_vars:
+        generated_code.append(f"vec2 {var_name} = vec2(0.0, 0.0);")
+        used_vars.add(var_name)
+    return var_name
+
+
+@tracer.traced(category="codegen")
+def generate_material(generator, node, generated_code, used_vars):
+    graph = generator.graph
+    node_id = generator.glsl_ids[node]
+    label = graph.spec(node).label
+    shading_model = graph.get_property(node, 'shading_model')
+    color_var = generator.input_var(node, 'Color', generated_code, used_vars)
+    if color_var is None:
+        # Use the node's base color if no connection is found
+        base_color = graph.get_property(node, 'node_color')
+        color_var = f"base_color_{node_id}"
+        if color_var not in used_vars:
+            generated_code.append(f"vec3 {color_var} = vec3({base_color[0]}, {base_color[1]}, {base_color[2]});")
+            used_vars.add(color_var)
+    var_name = f"material_{node_id}"
+    if var_name in used_vars:
+        return var_name
+    used_vars.add(var_name)
+
+    spec_color = graph.get_property(node, 'specular_color')
+    spec_intensity = graph.get_property(node, 'specular_intensity')
+    shininess = graph.get_property(node, 'shininess')
+
+    generated_code.append(f"// Begin Material Node {node_id} ({label})")
+    if shading_model == 'Lambert':
+        generated_code.append(f"""
+    vec3 lightDir_{node_id} = normalize(vec3(0.0, 0.0, 1.0)); // Light coming straight down
+    vec3 normal_{node_id} = normalize(vec3(0.0, 0.0, 1.0)); // Surface normal
+    vec4 {var_name} = vec4({color_var}.rgb * max(dot(normal_{node_id}, lightDir_{node_id}), 0.0), 1.0);
+    """)
+    elif shading_model == 'Phong':
+        generated_code.append(f"""
+    vec3 normal_{node_id} = normalize(vec3(0.0, 0.0, 1.0)); // Surface normal
+    vec3 lightDir_{node_id} = normalize(vec3(0.0, 0.0, 1.0)); // Light coming straight down
+    vec3 viewDir_{node_id} = normalize(vec3(0.0, 0.0, 1.0)); // View direction
+    vec3 reflectDir_{node_id} = reflect(-lightDir_{node_id}, normal_{node_id});
+    float spec_{node_id} = {spec_intensity} * pow(max(dot(viewDir_{node_id}, reflectDir_{node_id}), {shininess}), 32.0);
+    vec4 {var_name} = vec4({color_var}.rgb * max(dot(normal_{node_id}, lightDir_{node_id}), 0.0) + vec3({spec_color[0]}, {spec_color[1]}, {spec_color[2]}) * spec_{node_id}, 1.0);
+    """)
+    return var_name
+
+
+@tracer.traced(category="codegen")
+def generate_color(generator, node, generated_code, used_vars):
+    graph = generator.graph
+    node_id = generator.glsl_ids[node]
+    label = graph.spec(node).label
+    color = graph.get_property(node, 'node_color')
+    var_name = f"color_{node_id}"
+    if var_name in used_vars:
+        return var_name
+    used_vars.add(var_name)
+    generated_code.append(f"// Begin Color Node {node_id} ({label})")
+    generated_code.append(f"vec4 {var_name} = vec4({color[0]}, {color[1]}, {color[2]}, 1.0);")
+    generated_code.append(f"// End Color Node {node_id} ({label})")
+    return var_name
+
+
+@tracer.traced(category="codegen")
+def generate_blend(generator, node, generated_code, used_vars):
+    graph = generator.graph
+    node_id = generator.glsl_ids[node]
+    label = graph.spec(node).label
+    # Default to white if no input
+    color_a_var = generator.input_var(node, 'Color A', generated_code, used_vars) or "vec3(1.0)"
+    color_b_var = generator.input_var(node, 'Color B', generated_code, used_vars) or "vec3(1.0)"
+    var_name = f"blend_{node_id}"
+    if var_name in used_vars:
+        return var_name
+    used_vars.add(var_name)
+
+    blend_mode = graph.get_property(node, 'blend_mode')
+    generated_code.append(f"// Begin Blend Node {node_id} ({label})")
+
+    if blend_mode == 'Multiply':
+        generated_code.append(f"vec4 {var_name} = vec4({color_a_var}.rgb * {color_b_var}.rgb, 1.0);")
+    elif blend_mode == 'Screen':
+        generated_code.append(f"vec4 {var_name} = vec4(1.0 - (1.0 - {color_a_var}.rgb) * (1.0 - {color_b_var}.rgb), 1.0);")
+    elif blend_mode == 'Overlay':
+        generated_code.append(f"vec4 {var_name} = vec4("
+                    f"({color_a_var}.r < 0.5) ? (2.0 * {color_a_var}.r * {color_b_var}.r) : (1.0 - 2.0 * (1.0 - {color_a_var}.r) * (1.0 - {color_b_var}.r)), "
+                    f"({color_a_var}.g < 0.5) ? (2.0 * {color_a_var}.g * {color_b_var}.g) : (1.0 - 2.0 * (1.0 - {color_a_var}.g) * (1.0 - {color_b_var}.g)), "
+                    f"({color_a_var}.b < 0.5) ? (2.0 * {color_a_var}.b * {color_b_var}.b) : (1.0 - 2.0 * (1.0 - {color_a_var}.b) * (1.0 - {color_b_var}.b)), 1.0);")
+    return var_name
+
+
+@tracer.traced(category="codegen")
+def generate_texture(generator, node, generated_code, used_vars):
+    node_id = generator.glsl_ids[node]
+    label = generator.graph.spec(node).label
+    uv_var = generator.input_var(node, 'UV', generated_code, used_vars) or default_uv(generated_code, used_vars)
+    var_name = f"texture_{node_id}"
+    if var_name in used_vars:
+        return var_name
+    used_vars.add(var_name)
+
+    texture_uniform_name = f"texture_sampler_{node_id}"
+    generated_code.append(f"// Begin Texture Node {node_id} ({label})")
+    generated_code.append(f"uniform sampler2D {texture_uniform_name};")
+    generated_code.append(f"vec4 {var_name} = texture2D({texture_uniform_name}, {uv_var});")
+    generated_code.append(f"// End Texture Node {node_id} ({label})")
+    return var_name
+
+
+@tracer.traced(category="codegen")
+def generate_uv(generator, node, generated_code, used_vars):
+    node_id = generator.glsl_ids[node]
+    label = generator.graph.spec(node).label
+    var_name = f"uv_{node_id}"
+    if var_name in used_vars:
+        return var_name
+    used_vars.add(var_name)
+
+    generated_code.append(f"// Begin UV Node {node_id} ({label})")
+    generated_code.append(f"uniform vec2 resolution;")
+    generated_code.append(f"vec2 {var_name} = gl_FragCoord.xy / resolution;")
+    generated_code.append(f"// End UV Node {node_id} ({label})")
+    return var_name
+
+
+@tracer.traced(category="codegen")
+def generate_gradient(generator, node, generated_code, used_vars):
+    node_id = generator.glsl_ids[node]
+    label = generator.graph.spec(node).label
+    uv_var = generator.input_var(node, 'UV', generated_code, used_vars) or default_uv(generated_code, used_vars)
+    var_name = f"gradient_{node_id}"
+    if var_name in used_vars:
+        return var_name
+    used_vars.add(var_name)
+
+    generated_code.append(f"// Begin Gradient Node {node_id} ({label})")
+    generated_code.append(f"vec3 {var_name} = mix(vec3(1.0, 0.0, 0.0), vec3(0.0, 0.0, 1.0), {uv_var}.y);")
+    generated_code.append(f"// End Gradient Node {node_id} ({label})")
+    return var_name
+
+
+@tracer.traced(category="codegen")
+def generate_add(generator, node, generated_code, used_vars):
+    node_id = generator.glsl_ids[node]
+    label = generator.graph.spec(node).label
+    inputs = []
+    for input_name in ('A', 'B'):
+        var_name = generator.input_var(node, input_name, generated_code, used_vars)
+        if var_name is None:
+            # Default value if no input is connected
+            glsl_type = generator.input_types[(node, input_name)][1]
+            var_name = f"default_{input_name}_{node_id}"
+            if var_name not in used_vars:
+                generated_code.append(f"{glsl_type} {var_name} = {default_value(glsl_type)};")
+                used_vars.add(var_name)
+        inputs.append(var_name)
+    var_name = f"add_{node_id}"
+    if var_name in used_vars:
+        return var_name
+    used_vars.add(var_name)
+
+    generated_code.append(f"// Begin Add Node {node_id} ({label})")
+    generated_code.append(f"{generator.output_types[(node, 'Output')]} {var_name} = {inputs[0]} + {inputs[1]};")
+    generated_code.append(f"// End Add Node {node_id} ({label})")
+    return var_name
+
+
+GENERATORS = {
+    "MaterialNode": generate_material,
+    "ColorNode": generate_color,
+    "BlendNode": generate_blend,
+    "TextureNode": generate_texture,
+    "UVNode": generate_uv,
+    "GradientNode": generate_gradient,
+    "AddNode": generate_add,
+}
+
+
+def generate_project_glsl(project, bake=True, bake_scale=1.0):
+    # A saved node graph straight to a shader, without Qt or the editor.
+    # Returns the code and the time each step took.
+    stats = {"nodes": len(project), "edges": project.edge_count()}
+    start = time.perf_counter()
+    graph = ShaderGraph.from_project(project)
+    stats["build"] = time.perf_counter() - start
+    start = time.perf_counter()
+    generator = GlslGenerator(graph)
+    stats["analyse"] = time.perf_counter() - start
+    start = time.perf_counter()
+    code = generator.build_baked_glsl_code(bake_scale) if bake else generator.build_glsl_code()
+    stats["codegen"] = time.perf_counter() - start
+    return code, stats
+
+
+def format_codegen_stats(stats):
+    lines = [f"{stats['nodes']} nodes, {stats['edges']} connections",
+             f"  build model   {stats['build'] * 1000.0:9.1f} ms",
+             f"  ids and types {stats['analyse'] * 1000.0:9.1f} ms",
+             f"  generate GLSL {stats['codegen'] * 1000.0:9.1f} ms"]
+    if "memory" in stats:
+        lines.append(f"  model memory  {stats['memory'] / (1024 * 1024):9.1f} MB")
+    return "\n".join(lines)
@@ -0,0 +1,105 @@
+# port_types.py
+SIZES = {"float": 1, "vec2": 2, "vec3": 3, "vec4": 4}
+GLSL_TYPES = tuple(SIZES)
+# A node's generic ports take the widest type connected to its generic inputs
+GENERIC = "genType"
+GENERIC_DEFAULT = "vec4"
+COLOR_TYPES = ("float", "vec3", "vec4")
+COMPONENTS = "xyzw"
+
+
+class PortTypeError(ValueError):
+    pass
+
+
+def can_convert(source, target):
+    # Wider to narrower is a swizzle, narrower to wider pads (alpha 1.0) or
+    # splats a float. Nothing narrows to a float: which channel is ambiguous.
+    return source in SIZES and target in SIZES and (source == target or SIZES[target] > 1)
+
+
+def convert(expression, source, target):
+    # expression (of type source) as a target, e.g. vec3 -> vec4(x, 1.0)
+    if source == target:
+        return expression
+    if not can_convert(source, target):
+        raise PortTypeError(f"a {source} can't be used as a {target}")
+    source_size, target_size = SIZES[source], SIZES[target]
+    if target_size < source_size:
+        return f"{expression}.{COMPONENTS[:target_size]}"
+    if source_size == 1:
+        return f"{target}({expression})"
+    padding = ["0.0"] * (target_size - source_size)
+    if target_size == 4:
+        padding[-1] = "1.0"
+    return f"{target}({expression}, {', '.join(padding)})"
+
+
+def default_value(glsl_type):
+    return "vec4(0.0, 0.0, 0.0, 1.0)" if glsl_type == "vec4" else f"{glsl_type}(0.0)"
+
+
+def widest(types):
+    return max(types, key=SIZES.get) if types else GENERIC_DEFAULT
+
+
+def topological_order(nodes, edges, names):
+    # Sources before the nodes reading them; raises on a cycle
+    upstream = {node: [] for node in nodes}
+    for (node, _), (source, _) in edges.items():
+        upstream[node].append(source)
+    order = []
+    state = {}  # node -> 1 while on the stack, 2 once ordered
+    for start in nodes:
+        if state.get(start):
+            continue
+        stack = [(start, iter(upstream[start]))]
+        state[start] = 1
+        while stack:
+            node, sources = stack[-1]
+            source = next(sources, None)
+            if source is None:
+                stack.pop()
+                state[node] = 2
+                order.append(node)
+            elif state.get(source) == 1:
+                raise PortTypeError(f"{names.get(source, source)} feeds back into itself")
+            elif not state.get(source):
+                state[source] = 1
+                stack.append((source, iter(upstream[source])))
+    return order
+
+
+def infer_port_types(specs, edges, names=None):
+    # specs: {node: ({input: (type, accepted types)}, {output: type})}, where a
+    # type may be GENERIC. edges: {(node, input): (source node, output)}.
+    # Returns ({(node, input): (source type or None, type)}, {(node, output): type})
+    # with every generic type resolved, or raises PortTypeError naming the
+    # first connection that can't compile.
+    names = names or {}
+    inputs = {}
+    outputs = {}
+    for node in topological_order(list(specs), edges, names):
+        input_specs, output_specs = specs[node]
+        connected = {}
+        for name, (glsl_type, accepted) in input_specs.items():
+            edge = edges.get((node, name))
+            if edge is None:
+                continue
+            source, output = edge
+            source_type = outputs[(source, output)]
+            if source_type not in accepted:
+                raise PortTypeError(f"{names.get(node, node)}.{name} takes {' or '.join(accepted)}, but "
+                                    f"{names.get(source, source)}.{output} gives {source_type}")
+            connected[name] = source_type
+        generic = widest([connected[name] for name, (glsl_type, _) in input_specs.items()
+                          if glsl_type == GENERIC and name in connected])
+        for name, (glsl_type, _) in input_specs.items():
+            target = generic if glsl_type == GENERIC else glsl_type
+            source_type = connected.get(name)
+            if source_type is not None and not can_convert(source_type, target):
+                raise PortTypeError(f"{names.get(node, node)}.{name} can't use a {source_type} as a {target}")
+            inputs[(node, name)] = (source_type, target)
+        for name, glsl_type in output_specs.items():
+            outputs[(node, name)] = generic if glsl_type == GENERIC else glsl_type
+    return inputs, outputs
@@ -0,0 +1,250 @@
+# project_format.py
+import json
+import struct
+import sys
+import zlib
+from array import array
+
+# Binary layout: a fixed header followed by a zlib-compressed payload of
+# length-prefixed columns. Every per-node column is a flat typed array so a
+# large graph is written and read with a handful of bulk copies.
+MAGIC = b"SEPJ"
+VERSION = 2
+HEADER = struct.Struct("<4sHIII")
+SECTION = struct.Struct("<I")
+JSON_EXTENSIONS = (".json",)
+
+
+class GraphProject:
+    def __init__(self):
+        self.types = []
+        self.property_keys = {}
+        self.node_types = array("H")
+        self.node_rows = array("I")
+        self.uids = array("I")
+        self.positions = array("f")
+        self.edges = array("i")
+        self.names = []
+        self.property_rows = []
+        self._type_index = {}
+        self._row_index = {}
+
+    def __len__(self):
+        return len(self.node_types)
+
+    def edge_count(self):
+        return len(self.edges) // 4
+
+    def add_node(self, type_name, name, x, y, properties, uid=0):
+        type_index = self._type_index.get(type_name)
+        if type_index is None:
+            type_index = len(self.types)
+            self._type_index[type_name] = type_index
+            self.types.append(type_name)
+            self.property_keys[type_name] = sorted(properties)
+        keys = self.property_keys[type_name]
+
+        # Nodes of the same type mostly share their settings, so identical
+        # property rows are stored once and referenced by index
+        row = json.dumps([properties.get(key) for key in keys], separators=(",", ":"))
+        row_index = self._row_index.get(row)
+        if row_index is None:
+            row_index = len(self.property_rows)
+            self._row_index[row] = row_index
+            self.property_rows.append(row)
+
+        self.node_types.append(type_index)
+        self.node_rows.append(row_index)
+        self.uids.append(uid)
+        self.positions.append(x)
+        self.positions.append(y)
+        self.names.append(name)
+        return len(self.node_types) - 1
+
+    def add_edge(self, out_node, out_port, in_node, in_port):
+        self.edges.extend((out_node, out_port, in_node, in_port))
+
+    def nodes(self):
+        rows = [json.loads(row) for row in self.property_rows]
+        for index, type_index in enumerate(self.node_types):
+            type_name = self.types[type_index]
+            values = rows[self.node_rows[index]]
+            properties = {key: decode_value(value) for key, value in zip(self.property_keys[type_name], values)}
+            uid = self.uids[index] if self.uids else 0
+            yield type_name, self.names[index], (self.positions[2 * index], self.positions[2 * index + 1]), properties, uid
+
+    def edge_tuples(self):
+        edges = self.edges
+        return [tuple(edges[i:i + 4]) for i in range(0, len(edges), 4)]
+
+    def to_bytes(self, compress=True):
+        meta = json.dumps({"types": self.types, "property_keys": self.property_keys}).encode("utf-8")
+        names = "\0".join(self.names).encode("utf-8")
+        rows = ("[" + ",".join(self.property_rows) + "]").encode("utf-8")
+        sections = [meta, to_little_endian(self.node_types), to_little_endian(self.node_rows),
+                    to_little_endian(self.positions), to_little_endian(self.edges), names, rows,
+                    to_little_endian(self.uids)]
+        payload = b"".join(SECTION.pack(len(section)) + section for section in sections)
+        flags = 0
+        if compress:
+            payload = zlib.compress(payload, 1)
+            flags = 1
+        header = HEADER.pack(MAGIC, VERSION, len(self), self.edge_count(), flags)
+        return header + payload
+
+    @classmethod
+    def from_bytes(cls, data):
+        if len(data) < HEADER.size:
+            raise ValueError("Project file is truncated or corrupt.")
+        magic, version, node_count, edge_count, flags = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a shader editor project file.")
+        if version > VERSION:
+            raise ValueError(f"Project version {version} is newer than supported version {VERSION}.")
+        payload = memoryview(data)[HEADER.size:]
+        if flags & 1:
+            try:
+                payload = memoryview(zlib.decompress(payload))
+            except zlib.error as e:
+                raise ValueError("Project file is truncated or corrupt.") from e
+
+        sections = []
+        offset = 0
+        while offset < len(payload):
+            if offset + SECTION.size > len(payload):
+                raise ValueError("Project file is truncated or corrupt.")
+            (length,) = SECTION.unpack_from(payload, offset)
+            offset += SECTION.size
+            if offset + length > len(payload):
+                raise ValueError("Project file is truncated or corrupt.")
+            sections.append(payload[offset:offset + length])
+            offset += length
+        # Version 2 added the uid column
+        if len(sections) < (8 if version >= 2 else 7):
+            raise ValueError("Project file is truncated or corrupt.")
+        meta, node_types, node_rows, positions, edges, names, rows = sections[:7]
+
+        project = cls()
+        try:
+            meta = json.loads(bytes(meta))
+            project.set_meta(meta["types"], meta["property_keys"])
+            project.node_types = from_little_endian("H", node_types)
+            project.node_rows = from_little_endian("I", node_rows)
+            project.positions = from_little_endian("f", positions)
+            project.edges = from_little_endian("i", edges)
+            if len(sections) > 7:
+                project.uids = from_little_endian("I", sections[7])
+            project.names = bytes(names).decode("utf-8").split("\0") if node_count else []
+            project.set_property_rows(json.loads(bytes(rows)))
+        except (KeyError, TypeError, AttributeError) as e:
+            raise ValueError("Project file is truncated or corrupt.") from e
+        project.validate(node_count, edge_count)
+        return project
+
+    def set_meta(self, types, property_keys):
+        if not isinstance(types, list) or not isinstance(property_keys, dict) or \
+                any(not isinstance(property_keys.get(name), list) for name in types):
+            raise ValueError("Project file is truncated or corrupt.")
+        self.types = types
+        self.property_keys = property_keys
+        self._type_index = {name: i for i, name in enumerate(types)}
+
+    def set_property_rows(self, rows):
+        if not isinstance(rows, list) or any(not isinstance(row, list) for row in rows):
+            raise ValueError("Project file is truncated or corrupt.")
+        self.property_rows = [json.dumps(row, separators=(",", ":")) for row in rows]
+        self._row_index = {row: i for i, row in enumerate(self.property_rows)}
+
+    def validate(self, node_count, edge_count):
+        # Everything nodes() and edge_tuples() index with, for both file
+        # formats: a damaged or hand-edited file fails here, not later
+        edges = self.edges
+        valid = (len(self) == node_count and self.edge_count() == edge_count and len(edges) % 4 == 0
+                 and len(self.positions) == 2 * node_count and len(self.names) == node_count
+                 and len(self.uids) in (0, node_count)
+                 and isinstance(self.names, list) and all(isinstance(name, str) for name in self.names)
+                 and (not node_count or (max(self.node_types) < len(self.types)
+                                         and max(self.node_rows) < len(self.property_rows)))
+                 and (not edges or (min(edges) >= 0 and max(edges[0::4]) < node_count
+                                    and max(edges[2::4]) < node_count)))
+        if valid:
+            # A row has a value per property of every type using it
+            lengths = [len(json.loads(row)) for row in self.property_rows]
+            valid = all(lengths[row] == len(self.property_keys[self.types[type_index]])
+                        for type_index, row in set(zip(self.node_types, self.node_rows)))
+        if not valid:
+            raise ValueError("Project file is truncated or corrupt.")
+
+    def to_json(self):
+        return json.dumps({
+            "version": VERSION,
+            "types": self.types,
+            "property_keys": self.property_keys,
+            "node_types": self.node_types.tolist(),
+            "node_rows": self.node_rows.tolist(),
+            "uids": self.uids.tolist(),
+            "positions": self.positions.tolist(),
+            "edges": self.edges.tolist(),
+            "names": self.names,
+            "property_rows": [json.loads(row) for row in self.property_rows],
+        })
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        project = cls()
+        try:
+            version = data.get("version", 1)
+            if version > VERSION:
+                raise ValueError(f"Project version {version} is newer than supported version {VERSION}.")
+            project.set_meta(data["types"], data["property_keys"])
+            project.node_types = array("H", data["node_types"])
+            project.node_rows = array("I", data["node_rows"])
+            project.uids = array("I", data.get("uids", []))
+            project.positions = array("f", data["positions"])
+            project.edges = array("i", data["edges"])
+            project.names = data["names"]
+            project.set_property_rows(data["property_rows"])
+        except (KeyError, TypeError, AttributeError, OverflowError) as e:
+            raise ValueError("Project file is truncated or corrupt.") from e
+        project.validate(len(project), project.edge_count())
+        return project
+
+
+def decode_value(value):
+    # JSON has no tuples; colours and vectors are tuples everywhere else
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
+
+def to_little_endian(values):
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def from_little_endian(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def save_project(project, file_path):
+    if file_path.lower().endswith(JSON_EXTENSIONS):
+        with open(file_path, "w") as file:
+            file.write(project.to_json())
+    else:
+        with open(file_path, "wb") as file:
+            file.write(project.to_bytes())
+
+
+def load_project(file_path):
+    with open(file_path, "rb") as file:
+        data = file.read()
+    if data[:len(MAGIC)] == MAGIC:
+        return GraphProject.from_bytes(data)
+    return GraphProject.from_json(data.decode("utf-8"))
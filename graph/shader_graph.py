@@ -0,0 +1,288 @@
+# shader_graph.py
+import hashlib
+from array import array
+from graph.port_types import GENERIC, GLSL_TYPES, COLOR_TYPES, PortTypeError, infer_port_types
+from graph.project_format import GraphProject
+
+GREY = (128 / 255.0, 128 / 255.0, 128 / 255.0)
+# node_types entry of a removed node; its slot is never reused
+REMOVED = 0xFFFF
+
+
+class NodeSpec:
+    # What every node of a type shares: its ports, their GLSL types (see
+    # graph.port_types) and its properties with their defaults
+    __slots__ = ("type_name", "label", "inputs", "outputs", "input_types", "output_types", "property_keys",
+                 "defaults")
+
+    def __init__(self, type_name, label, input_types, output_types, defaults):
+        self.type_name = type_name
+        self.label = label
+        self.input_types = input_types
+        self.output_types = output_types
+        self.inputs = tuple(input_types)
+        self.outputs = tuple(output_types)
+        self.property_keys = tuple(defaults)
+        self.defaults = tuple(defaults.values())
+
+
+NODE_SPECS = {spec.type_name: spec for spec in (
+    NodeSpec("MaterialNode", "Material", {'Color': ('vec3', COLOR_TYPES)}, {'Output': 'vec4'},
+             {'shading_model': 'Lambert', 'node_color': GREY, 'specular_color': GREY, 'specular_intensity': 1.0,
+              'shininess': 32.0}),
+    NodeSpec("ColorNode", "Color", {}, {'Color': 'vec4'}, {'node_color': GREY}),
+    NodeSpec("BlendNode", "Blend", {'Color A': ('vec3', COLOR_TYPES), 'Color B': ('vec3', COLOR_TYPES)},
+             {'Output': 'vec4'}, {'blend_mode': 'Multiply'}),
+    NodeSpec("TextureNode", "Texture", {'UV': ('vec2', ('vec2',))}, {'Color': 'vec4'}, {'texture': ''}),
+    NodeSpec("UVNode", "UV", {}, {'UV': 'vec2'}, {}),
+    NodeSpec("GradientNode", "Gradient", {'UV': ('vec2', ('vec2',))}, {'Color': 'vec3'}, {}),
+    # Adds in the wider of its inputs' types; the other input is widened
+    NodeSpec("AddNode", "Add", {'A': (GENERIC, GLSL_TYPES), 'B': (GENERIC, GLSL_TYPES)}, {'Output': GENERIC}, {}),
+)}
+SPEC_LIST = tuple(NODE_SPECS.values())
+SPEC_INDEX = {spec.type_name: index for index, spec in enumerate(SPEC_LIST)}
+
+
+class ShaderGraph:
+    # The node graph without Qt: a node is an index into flat typed arrays,
+    # its properties a row shared by every node with the same settings, and
+    # each input slot holds the node and output port feeding it (-1 if none).
+    # The editor's nodes are views of one of these; a project can also be
+    # loaded and turned into GLSL without them (see graph.glsl_codegen).
+    def __init__(self):
+        self.node_types = array("H")
+        self.node_rows = array("I")
+        self.uids = array("I")
+        self.positions = array("f")
+        self.input_offsets = array("I")
+        self.source_nodes = array("i")
+        self.source_ports = array("B")
+        self.names = []
+        self.property_rows = []
+        self._row_index = {}
+        self.removed = 0
+
+    def __len__(self):
+        return len(self.node_types) - self.removed
+
+    def node_ids(self):
+        return [node for node, type_index in enumerate(self.node_types) if type_index != REMOVED]
+
+    def is_live(self, node):
+        return 0 <= node < len(self.node_types) and self.node_types[node] != REMOVED
+
+    def spec(self, node):
+        if not self.is_live(node):
+            raise ValueError(f"No node {node} in the graph")
+        return SPEC_LIST[self.node_types[node]]
+
+    def type_name(self, node):
+        return self.spec(node).type_name
+
+    def add_node(self, type_name, name="", x=0.0, y=0.0, properties=None, uid=0):
+        type_index = SPEC_INDEX.get(type_name)
+        if type_index is None:
+            raise ValueError(f"Unknown node type '{type_name}'")
+        spec = SPEC_LIST[type_index]
+        properties = properties or {}
+        node = len(self.node_types)
+        self.node_types.append(type_index)
+        self.node_rows.append(self._row(tuple(plain_value(properties.get(key, default))
+                                              for key, default in zip(spec.property_keys, spec.defaults))))
+        self.uids.append(uid)
+        self.positions.append(x)
+        self.positions.append(y)
+        self.names.append(name or spec.label)
+        self.input_offsets.append(len(self.source_nodes))
+        self.source_nodes.extend([-1] * len(spec.inputs))
+        self.source_ports.extend([0] * len(spec.inputs))
+        return node
+
+    def remove_node(self, node):
+        # Inputs fed by it read as unconnected from now on (see source)
+        spec = self.spec(node)
+        offset = self.input_offsets[node]
+        for slot in range(offset, offset + len(spec.inputs)):
+            self.source_nodes[slot] = -1
+        self.node_types[node] = REMOVED
+        self.names[node] = ""
+        self.removed += 1
+
+    def _row(self, row):
+        # Identical rows are stored once, as in graph.project_format
+        row_index = self._row_index.get(row)
+        if row_index is None:
+            row_index = len(self.property_rows)
+            self._row_index[row] = row_index
+            self.property_rows.append(row)
+        return row_index
+
+    def properties(self, node):
+        return dict(zip(self.spec(node).property_keys, self.property_rows[self.node_rows[node]]))
+
+    def get_property(self, node, name):
+        spec = self.spec(node)
+        if name not in spec.property_keys:
+            raise ValueError(f"{spec.label} nodes have no property '{name}'")
+        return self.property_rows[self.node_rows[node]][spec.property_keys.index(name)]
+
+    def set_property(self, node, name, value):
+        self.set_properties(node, {name: value})
+
+    def set_properties(self, node, properties):
+        spec = self.spec(node)
+        row = list(self.property_rows[self.node_rows[node]])
+        for name, value in properties.items():
+            if name not in spec.property_keys:
+                raise ValueError(f"{spec.label} nodes have no property '{name}'")
+            row[spec.property_keys.index(name)] = plain_value(value)
+        self.node_rows[node] = self._row(tuple(row))
+
+    def position(self, node):
+        return self.positions[2 * node], self.positions[2 * node + 1]
+
+    def set_position(self, node, x, y):
+        self.positions[2 * node] = x
+        self.positions[2 * node + 1] = y
+
+    def connect(self, out_node, out_port, in_node, in_port):
+        # Ports by index, as in a project's edges; an input has one source,
+        # so this replaces any connection it had
+        out_spec = self.spec(out_node)
+        in_spec = self.spec(in_node)
+        if not 0 <= out_port < len(out_spec.outputs):
+            raise ValueError(f"{out_spec.label} nodes have no output {out_port}")
+        if not 0 <= in_port < len(in_spec.inputs):
+            raise ValueError(f"{in_spec.label} nodes have no input {in_port}")
+        slot = self.input_offsets[in_node] + in_port
+        self.source_nodes[slot] = out_node
+        self.source_ports[slot] = out_port
+
+    def disconnect(self, in_node, in_port):
+        self.source_nodes[self.input_offsets[in_node] + in_port] = -1
+
+    def source(self, node, in_port):
+        # (node, output port) feeding an input, or None
+        slot = self.input_offsets[node] + in_port
+        source = self.source_nodes[slot]
+        if source < 0 or self.node_types[source] == REMOVED:
+            return None
+        return source, self.source_ports[slot]
+
+    def sources(self, node):
+        # [(input port, source node, output port)] of the connected inputs
+        offset = self.input_offsets[node]
+        connected = []
+        for in_port in range(len(self.spec(node).inputs)):
+            source = self.source_nodes[offset + in_port]
+            if source >= 0 and self.node_types[source] != REMOVED:
+                connected.append((in_port, source, self.source_ports[offset + in_port]))
+        return connected
+
+    def edges(self):
+        for node in self.node_ids():
+            for in_port, out_node, out_port in self.sources(node):
+                yield out_node, out_port, node, in_port
+
+    def ordered_nodes(self):
+        # Canonical emission order: by persistent uid, handing new uids to
+        # nodes that have none yet or share another node's
+        nodes = self.node_ids()
+        uids = self.uids
+        used = set()
+        fresh = []
+        for node in nodes:
+            uid = uids[node]
+            if not uid or uid in used:
+                fresh.append(node)
+            else:
+                used.add(uid)
+        next_uid = max(used, default=0) + 1
+        for node in fresh:
+            uids[node] = next_uid
+            next_uid += 1
+        nodes.sort(key=uids.__getitem__)
+        return nodes
+
+    def glsl_ids(self, nodes=None):
+        # Content-addressed names: a node's id hashes its type, its properties and
+        # the ids of everything upstream, so identical graphs give identical GLSL
+        # in every session and identical subgraphs collapse into one variable.
+        # Returns a list indexed by node; raises PortTypeError on a cycle.
+        digests = [None] * len(self.node_types)
+        # Nodes sharing a property row share its part of the hash
+        row_parts = {}
+        hashing = set()  # nodes whose sources are still being hashed
+        for root in self.node_ids() if nodes is None else nodes:
+            if digests[root] is not None:
+                continue
+            stack = [(root, iter(self.sources(root)))]
+            hashing.add(root)
+            while stack:
+                node, upstream = stack[-1]
+                edge = next(upstream, None)
+                if edge is not None:
+                    source = edge[1]
+                    if source in hashing:
+                        raise PortTypeError(f"{self.names[source]} feeds back into itself")
+                    if digests[source] is None:
+                        hashing.add(source)
+                        stack.append((source, iter(self.sources(source))))
+                    continue
+                stack.pop()
+                hashing.discard(node)
+
+                spec = self.spec(node)
+                key = (spec.type_name, self.node_rows[node])
+                properties = row_parts.get(key)
+                if properties is None:
+                    properties = row_parts[key] = [f"{name}={value!r}"
+                                                   for name, value in sorted(self.properties(node).items())]
+                parts = [spec.type_name] + properties
+                for in_port, source, out_port in self.sources(node):
+                    parts.append(f"{spec.inputs[in_port]}<{digests[source]}."
+                                 f"{SPEC_LIST[self.node_types[source]].outputs[out_port]}")
+                digests[node] = hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:10]
+        return digests
+
+    def port_types(self):
+        # graph.port_types.infer_port_types over the whole graph, keyed by
+        # (node, port name); raises PortTypeError for a graph that can't compile
+        specs = {}
+        edges = {}
+        names = {}
+        for node in self.node_ids():
+            spec = SPEC_LIST[self.node_types[node]]
+            specs[node] = (spec.input_types, spec.output_types)
+            names[node] = self.names[node]
+            for in_port, source, out_port in self.sources(node):
+                edges[(node, spec.inputs[in_port])] = (source, SPEC_LIST[self.node_types[source]].outputs[out_port])
+        return infer_port_types(specs, edges, names)
+
+    def to_project(self):
+        project = GraphProject()
+        nodes = self.ordered_nodes()
+        node_index = {node: index for index, node in enumerate(nodes)}
+        for node in nodes:
+            project.add_node(self.type_name(node), self.names[node], *self.position(node), self.properties(node),
+                             self.uids[node])
+        for in_index, node in enumerate(nodes):
+            for in_port, out_node, out_port in self.sources(node):
+                project.add_edge(node_index[out_node], out_port, in_index, in_port)
+        return project
+
+    @classmethod
+    def from_project(cls, project):
+        graph = cls()
+        for type_name, name, (x, y), properties, uid in project.nodes():
+            graph.add_node(type_name, name, x, y, properties, uid)
+        for out_node, out_port, in_node, in_port in project.edge_tuples():
+            graph.connect(out_node, out_port, in_node, in_port)
+        return graph
+
+
+def plain_value(value):
+    # Rows are hashed to share them: lists (from JSON or Qt) become tuples
+    if isinstance(value, list):
+        return tuple(value)
+    return value
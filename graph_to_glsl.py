@@ -0,0 +1,39 @@
+import argparse
+import sys
+import tracemalloc
+from graph.project_format import load_project
+from graph.port_types import PortTypeError
+from graph.shader_graph import ShaderGraph
+from graph.glsl_codegen import generate_project_glsl, format_codegen_stats
+from ui.viewer_benchmark import benchmark_project
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a node graph's shader without opening the editor")
+    parser.add_argument("project", nargs="?", help="node graph (.sep or .json)")
+    parser.add_argument("--output", "-o", help="write the shader here instead of printing it")
+    parser.add_argument("--nodes", type=int, help="use the viewer benchmark's graph of this many nodes instead")
+    parser.add_argument("--no-bake", action="store_true", help="don't bake static branches into passes")
+    parser.add_argument("--memory", action="store_true", help="also measure the model's memory")
+    args = parser.parse_args()
+    if not args.project and not args.nodes:
+        parser.error("give a project or --nodes")
+
+    project = benchmark_project(args.nodes) if args.nodes else load_project(args.project)
+    try:
+        code, stats = generate_project_glsl(project, bake=not args.no_bake)
+    except PortTypeError as e:
+        print(f"The graph can't be compiled: {e}")
+        sys.exit(1)
+    if args.memory:
+        # Built again under tracemalloc, which would skew the timings
+        tracemalloc.start()
+        graph = ShaderGraph.from_project(project)
+        stats["memory"] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(code)
+        print(format_codegen_stats(stats))
+    else:
+        print(code)
@@ -1,11 +1,33 @@
+import os
 import sys
-from PySide6 import QtWidgets
-from ui.main_window import MainWindow
+from utils.startup_profiler import startup_profiler
+from utils.tracing import tracer
 
 if __name__ == "__main__":
+    if "--profile-startup" in sys.argv:
+        sys.argv.remove("--profile-startup")
+        startup_profiler.enable()
+    if "--software-renderer" in sys.argv:
+        sys.argv.remove("--software-renderer")
+        os.environ["SHADER_EDITOR_SOFTWARE_RENDERER"] = "1"
+    if "--compile-history" in sys.argv:
+        sys.argv.remove("--compile-history")
+        os.environ["SHADER_EDITOR_COMPILE_HISTORY"] = "1"
+    if "--trace" in sys.argv:
+        sys.argv.remove("--trace")
+        tracer.enable()
+    if "--verbose" in sys.argv:
+        sys.argv.remove("--verbose")
+        tracer.set_level("debug")
+
+    with startup_profiler.phase("imports", "PySide6 / main window"):
+        from PySide6 import QtWidgets
+        from ui.main_window import MainWindow
+
     app = QtWidgets.QApplication(sys.argv)
 
-    window = MainWindow()
+    with startup_profiler.phase("widget construction", "main window"):
+        window = MainWindow()
     window.show()
 
     sys.exit(app.exec())
@@ -0,0 +1,43 @@
+import argparse
+import sys
+from shaders.headless import HeadlessContext
+from shaders.frame_capture import FrameReplayer, format_report, save_report, load_report, compare_reports
+from shaders.gl_resources import gl_resources
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a frame capture in a headless GL context")
+    parser.add_argument("capture", help="capture recorded with Tools > Record Frame Capture")
+    parser.add_argument("--fixed-step", type=float, default=None,
+                        help="drive iTime with a fixed step per frame instead of the recorded times")
+    parser.add_argument("--warmup", type=int, default=5, help="frames rendered before timing starts")
+    parser.add_argument("--save", help="write the report as JSON")
+    parser.add_argument("--readback", action="store_true",
+                        help="read every frame back to the CPU, to measure the cost of continuous capture")
+    parser.add_argument("--compare", help="JSON report from an earlier replay to compare against")
+    args = parser.parse_args()
+
+    read_back = {"frames": 0, "bytes": 0}
+
+    def on_frame(index, pixels):
+        read_back["frames"] += 1
+        read_back["bytes"] += pixels.nbytes
+
+    context = HeadlessContext()
+    replayer = FrameReplayer(args.capture, fixed_step=args.fixed_step, warmup=args.warmup,
+                             on_frame=on_frame if args.readback else None)
+    try:
+        report = replayer.replay()
+    finally:
+        replayer.release()
+        if gl_resources.live():
+            print(gl_resources.leak_report())
+        context.release()
+
+    print(format_report(report))
+    if args.readback:
+        print(f"read back {read_back['frames']} frames ({read_back['bytes'] / 1048576:.1f} MB)")
+    if args.save:
+        save_report(report, args.save)
+    if args.compare:
+        print(compare_reports(load_report(args.compare), report))
+    sys.exit(0)
@@ -0,0 +1,350 @@
+# cost_analysis.py
+import ast
+import bisect
+import math
+import re
+import time
+
+# Rough per-call ALU weights; transcendental functions cost several slots
+BUILTIN_COSTS = {
+    "sin": 4, "cos": 4, "tan": 5, "asin": 6, "acos": 6, "atan": 6,
+    "pow": 5, "exp": 4, "exp2": 4, "log": 4, "log2": 4, "sqrt": 4, "inversesqrt": 4,
+    "normalize": 4, "length": 3, "distance": 4, "dot": 1, "cross": 2, "reflect": 3, "refract": 6,
+    "mix": 2, "clamp": 2, "smoothstep": 4, "step": 1, "min": 1, "max": 1, "abs": 1,
+    "sign": 1, "floor": 1, "ceil": 1, "fract": 1, "mod": 2, "faceforward": 3,
+}
+TEXTURE_FUNCTIONS = {"texture2D", "texture2DLod", "texture2DProj", "textureCube", "textureCubeLod", "texture", "textureLod"}
+CONSTRUCTORS = {"vec2", "vec3", "vec4", "ivec2", "ivec3", "ivec4", "bvec2", "bvec3", "bvec4",
+                "mat2", "mat3", "mat4", "float", "int", "bool"}
+KEYWORDS = {"if", "for", "while", "return", "else", "do", "switch"}
+
+DEFINE_PATTERN = re.compile(r"^[ \t]*#[ \t]*define[ \t]+(\w+)[ \t]+([^\n]+)$", re.MULTILINE)
+CONST_PATTERN = re.compile(r"\bconst\s+(?:int|float)\s+(\w+)\s*=\s*([^;]+);")
+FUNCTION_PATTERN = re.compile(r"\b(void|float|int|bool|vec[234]|ivec[234]|bvec[234]|mat[234])\s+(\w+)\s*\(([^)]*)\)\s*\{")
+CALL_PATTERN = re.compile(r"\b([A-Za-z_]\w*)\s*\(")
+OPERATOR_PATTERN = re.compile(r"\+\+|--|[+\-*/]=?|[<>]=?|==|!=|&&|\|\|")
+LOOP_PATTERN = re.compile(r"\b(for|while)\s*\(")
+NODE_BEGIN_PATTERN = re.compile(r"//\s*Begin (\w+) Node (\w+) \(([^)]*)\)")
+NODE_END_PATTERN = re.compile(r"//\s*End (\w+) Node (\w+)")
+
+
+class Cost:
+    def __init__(self, alu=0.0, texture=0.0):
+        self.alu = alu
+        self.texture = texture
+
+    def add(self, other, scale=1.0):
+        self.alu += other.alu * scale
+        self.texture += other.texture * scale
+
+    def total(self, texture_weight=4.0):
+        # A fetch is weighted as several ALU slots to rank hot spots
+        return self.alu + self.texture * texture_weight
+
+    def __repr__(self):
+        return f"Cost(alu={self.alu:g}, texture={self.texture:g})"
+
+
+class FunctionInfo:
+    def __init__(self, name, start, body_start, end):
+        self.name = name
+        self.start = start
+        self.body_start = body_start
+        self.end = end
+        self.self_cost = Cost()
+        self.calls = {}  # callee -> calls per invocation (loop trips included)
+        self.invocations = 0.0
+        self.inclusive_cost = Cost()
+
+
+class CostReport:
+    def __init__(self):
+        self.functions = {}
+        self.line_costs = {}  # line number -> per-pixel Cost
+        self.node_costs = {}  # node id -> (label, per-pixel Cost)
+        self.loops = []  # (line, trips, resolved)
+        self.per_pixel = Cost()
+        self.elapsed_ms = 0.0
+
+    def hot_lines(self, count=10):
+        ranked = sorted(self.line_costs.items(), key=lambda item: item[1].total(), reverse=True)
+        return [(line, cost) for line, cost in ranked[:count] if cost.total() > 0]
+
+    def format(self):
+        lines = [f"Estimated per-pixel cost: {self.per_pixel.alu:.0f} ALU ops, {self.per_pixel.texture:.0f} texture fetches",
+                 f"(analysed in {self.elapsed_ms:.2f} ms; loop counts are upper bounds)", "", "Functions:"]
+        ranked = sorted(self.functions.values(), key=lambda f: f.self_cost.total() * f.invocations, reverse=True)
+        for function in ranked:
+            self_cost = function.self_cost.total() * function.invocations
+            lines.append(f"  {function.name:<20} calls/pixel {function.invocations:>8.0f}   "
+                         f"self/pixel {self_cost:>10.0f}   inclusive/call {function.inclusive_cost.total():>10.0f}")
+        if self.node_costs:
+            lines.append("")
+            lines.append("Nodes:")
+            for node_id, (label, cost) in sorted(self.node_costs.items(), key=lambda item: item[1][1].total(), reverse=True):
+                lines.append(f"  {label:<28} {cost.total():>10.0f}")
+        unresolved = [line for line, _, resolved in self.loops if not resolved]
+        if unresolved:
+            lines.append("")
+            lines.append("Loops with unresolved trip counts (counted once): lines " + ", ".join(map(str, unresolved)))
+        return "\n".join(lines)
+
+
+def strip_comments(source):
+    # Blank out comments but keep offsets and newlines so line numbers survive
+    def blank(match):
+        return re.sub(r"[^\n]", " ", match.group(0))
+    return re.sub(r"/\*.*?\*/|//[^\n]*", blank, source, flags=re.DOTALL)
+
+
+def find_matching(text, start, open_char, close_char):
+    depth = 0
+    for index in range(start, len(text)):
+        if text[index] == open_char:
+            depth += 1
+        elif text[index] == close_char:
+            depth -= 1
+            if depth == 0:
+                return index
+    return len(text) - 1
+
+
+BINARY_OPERATORS = {ast.Add: lambda a, b: a + b, ast.Sub: lambda a, b: a - b,
+                    ast.Mult: lambda a, b: a * b, ast.Div: lambda a, b: a / b}
+UNARY_OPERATORS = {ast.UAdd: lambda a: a, ast.USub: lambda a: -a}
+
+
+def evaluate_constant(expression, constants):
+    expression = expression.strip().rstrip("f")
+    for _ in range(8):
+        replaced = re.sub(r"\b[A-Za-z_]\w*\b", lambda m: str(constants.get(m.group(0), m.group(0))), expression)
+        if replaced == expression:
+            break
+        expression = replaced
+    if not re.fullmatch(r"[\d.\s+\-*/()eE]+", expression):
+        return None
+    try:
+        return float(evaluate_node(ast.parse(expression, mode="eval").body))
+    except (SyntaxError, ValueError, ZeroDivisionError, OverflowError, RecursionError):
+        return None
+
+
+def evaluate_node(node):
+    # Only numbers and the four arithmetic operators GLSL constants use;
+    # anything else (such as Python's **) isn't a constant here
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return float(node.value)
+    if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+        return BINARY_OPERATORS[type(node.op)](evaluate_node(node.left), evaluate_node(node.right))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPERATORS:
+        return UNARY_OPERATORS[type(node.op)](evaluate_node(node.operand))
+    raise ValueError("Not a constant expression")
+
+
+def loop_trip_count(header, constants):
+    parts = header.split(";")
+    if len(parts) != 3:
+        return None
+    init, condition, step = parts
+    init_match = re.search(r"(\w+)\s*=\s*([^,]+)$", init.strip())
+    cond_match = re.fullmatch(r"\s*(\w+)\s*(<=|<|>=|>)\s*(.+?)\s*", condition)
+    if not init_match or not cond_match or init_match.group(1) != cond_match.group(1):
+        return None
+    start = evaluate_constant(init_match.group(2), constants)
+    bound = evaluate_constant(cond_match.group(3), constants)
+    step = step.strip()
+    if re.fullmatch(r"\w+\s*\+\+|\+\+\s*\w+", step):
+        increment = 1.0
+    elif re.fullmatch(r"\w+\s*--|--\s*\w+", step):
+        increment = -1.0
+    else:
+        step_match = re.fullmatch(r"\w+\s*([+-])=\s*(.+)", step)
+        if not step_match:
+            return None
+        increment = evaluate_constant(step_match.group(2), constants)
+        if increment is None:
+            return None
+        increment = increment if step_match.group(1) == "+" else -increment
+    if start is None or bound is None or increment == 0:
+        return None
+    operator = cond_match.group(2)
+    span = bound - start
+    if operator in ("<=", ">="):
+        span += math.copysign(1.0, increment)
+    return max(0.0, math.ceil(span / increment))
+
+
+class ShaderCostAnalyser:
+    def __init__(self, source):
+        self.source = source
+        self.text = strip_comments(source)
+        self.line_starts = [0] + [match.end() for match in re.finditer("\n", source)]
+        self.constants = {}
+        self.functions = {}
+        self.report = CostReport()
+        # (function name, line) -> local cost per function invocation
+        self.local_line_costs = {}
+
+    def line_of(self, offset):
+        return bisect.bisect_right(self.line_starts, offset)
+
+    def analyse(self):
+        for name, value in DEFINE_PATTERN.findall(self.text):
+            number = evaluate_constant(value, self.constants)
+            if number is not None:
+                self.constants[name] = number
+        for name, value in CONST_PATTERN.findall(self.text):
+            number = evaluate_constant(value, self.constants)
+            if number is not None:
+                self.constants[name] = number
+
+        for match in FUNCTION_PATTERN.finditer(self.text):
+            name = match.group(2)
+            if name in KEYWORDS:
+                continue
+            body_start = match.end() - 1
+            end = find_matching(self.text, body_start, "{", "}")
+            self.functions[name] = FunctionInfo(name, match.start(), body_start, end)
+
+        for function in self.functions.values():
+            self.analyse_block(function, function.body_start + 1, function.end, 1.0)
+
+        # Statements outside any function (node graphs emit globals) run once
+        # per pixel alongside main
+        global_function = FunctionInfo("<global>", 0, 0, len(self.text))
+        position = 0
+        for function in sorted(self.functions.values(), key=lambda f: f.start):
+            self.analyse_span(global_function, position, function.start, 1.0)
+            position = function.end + 1
+        self.analyse_span(global_function, position, len(self.text), 1.0)
+
+        self.propagate(global_function)
+        self.attribute_nodes()
+        self.report.functions = self.functions
+        return self.report
+
+    def analyse_block(self, function, start, end, multiplier):
+        position = start
+        while True:
+            match = LOOP_PATTERN.search(self.text, position, end)
+            if not match:
+                break
+            self.analyse_span(function, position, match.start(), multiplier)
+            header_open = match.end() - 1
+            header_close = find_matching(self.text, header_open, "(", ")")
+            header = self.text[header_open + 1:header_close]
+            trips = loop_trip_count(header, self.constants) if match.group(1) == "for" else None
+            resolved = trips is not None
+            trips = trips if resolved else 1.0
+            self.report.loops.append((self.line_of(match.start()), trips, resolved))
+
+            body_start = header_close + 1
+            while body_start < end and self.text[body_start].isspace():
+                body_start += 1
+            if body_start < end and self.text[body_start] == "{":
+                body_end = find_matching(self.text, body_start, "{", "}")
+                self.analyse_block(function, body_start + 1, body_end, multiplier * trips)
+            else:
+                body_end = self.text.find(";", body_start, end)
+                body_end = end if body_end == -1 else body_end
+                self.analyse_block(function, body_start, body_end, multiplier * trips)
+            # The condition and increment run once per iteration as well
+            self.analyse_span(function, header_open + 1, header_close, multiplier * trips)
+            position = body_end + 1
+        self.analyse_span(function, position, end, multiplier)
+
+    def analyse_span(self, function, start, end, multiplier):
+        if start >= end:
+            return
+        span = self.text[start:end]
+        for match in CALL_PATTERN.finditer(span):
+            name = match.group(1)
+            line = self.line_of(start + match.start())
+            if name in TEXTURE_FUNCTIONS:
+                self.add_line_cost(function, line, Cost(texture=multiplier))
+            elif name in BUILTIN_COSTS:
+                self.add_line_cost(function, line, Cost(alu=BUILTIN_COSTS[name] * multiplier))
+            elif name in self.functions:
+                function.calls[name] = function.calls.get(name, 0.0) + multiplier
+        for match in OPERATOR_PATTERN.finditer(span):
+            self.add_line_cost(function, self.line_of(start + match.start()), Cost(alu=multiplier))
+
+    def add_line_cost(self, function, line, cost):
+        function.self_cost.add(cost)
+        self.local_line_costs.setdefault((function.name, line), Cost()).add(cost)
+
+    def propagate(self, global_function):
+        functions = dict(self.functions)
+        functions["<global>"] = global_function
+
+        # GLSL forbids recursion, so the call graph is a DAG: order callers
+        # before callees and push invocation counts down from main
+        order = []
+        state = {}
+
+        def visit(name):
+            if state.get(name):
+                return
+            state[name] = True
+            for callee in functions[name].calls:
+                if callee in functions:
+                    visit(callee)
+            order.append(name)
+
+        for name in functions:
+            visit(name)
+
+        for function in functions.values():
+            function.invocations = 0.0
+        global_function.invocations = 1.0
+        if "main" in functions:
+            functions["main"].invocations = 1.0
+        for name in reversed(order):
+            caller = functions[name]
+            for callee, count in caller.calls.items():
+                if callee in functions and callee != name:
+                    functions[callee].invocations += caller.invocations * count
+
+        for name in order:
+            function = functions[name]
+            inclusive = Cost()
+            inclusive.add(function.self_cost)
+            for callee, count in function.calls.items():
+                if callee in functions and callee != name:
+                    inclusive.add(functions[callee].inclusive_cost, count)
+            function.inclusive_cost = inclusive
+
+        for (function_name, line), cost in self.local_line_costs.items():
+            invocations = functions[function_name].invocations
+            self.report.line_costs.setdefault(line, Cost()).add(cost, invocations)
+
+        self.report.per_pixel = Cost()
+        self.report.per_pixel.add(global_function.inclusive_cost)
+        if "main" in functions:
+            self.report.per_pixel.add(functions["main"].inclusive_cost)
+
+    def attribute_nodes(self):
+        # Generated node code is fenced by "// Begin <Type> Node <id> (<name>)"
+        # comments; a node's region runs to its End marker or the next Begin
+        current = None
+        for number, line in enumerate(self.source.splitlines(), start=1):
+            begin = NODE_BEGIN_PATTERN.search(line)
+            if begin:
+                current = begin.group(2)
+                label = f"{begin.group(3)} ({begin.group(1)})"
+                self.report.node_costs.setdefault(current, (label, Cost()))
+                continue
+            if NODE_END_PATTERN.search(line):
+                current = None
+                continue
+            if line.strip().startswith("void main") or line.strip().startswith("}"):
+                current = None
+            if current and number in self.report.line_costs:
+                self.report.node_costs[current][1].add(self.report.line_costs[number])
+
+
+def analyse_shader_cost(source):
+    start = time.perf_counter()
+    report = ShaderCostAnalyser(source).analyse()
+    report.elapsed_ms = (time.perf_counter() - start) * 1000.0
+    return report
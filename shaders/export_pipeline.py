@@ -0,0 +1,323 @@
+# export_pipeline.py
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
+import multiprocessing
+import numpy as np
+
+FORMATS = ("png", "y4m", "raw")
+MANIFEST_NAME = "export.json"
+
+
+def format_for_output(output):
+    extension = os.path.splitext(output)[1].lower()
+    if extension == ".y4m":
+        return "y4m"
+    if extension in (".raw", ".rgba"):
+        return "raw"
+    return "png"
+
+
+def write_png(path, pixels):
+    # Minimal RGBA8 PNG writer (filter 0 on every row); written to a temp
+    # name first so an interrupted export never leaves a truncated frame
+    height, width, _ = pixels.shape
+    rows = np.empty((height, width * 4 + 1), dtype=np.uint8)
+    rows[:, 0] = 0
+    rows[:, 1:] = pixels.reshape(height, width * 4)
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    data = b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows.tobytes(), 6)) \
+        + chunk(b"IEND", b"")
+    temp_path = path + ".part"
+    with open(temp_path, "wb") as file:
+        file.write(data)
+    os.replace(temp_path, path)
+
+
+def rgba_to_i420(pixels):
+    # Full-range BT.601 (Y4M "C420jpeg"); chroma is the mean of each 2x2 block
+    rgb = pixels[:, :, :3].astype(np.float32)
+    r, g, b = rgb[:, :, 0], rgb[:, :, 1], rgb[:, :, 2]
+    y = 0.299 * r + 0.587 * g + 0.114 * b
+    u = -0.168736 * r - 0.331264 * g + 0.5 * b + 128.0
+    v = 0.5 * r - 0.418688 * g - 0.081312 * b + 128.0
+    height, width = y.shape
+    u = u.reshape(height // 2, 2, width // 2, 2).mean(axis=(1, 3))
+    v = v.reshape(height // 2, 2, width // 2, 2).mean(axis=(1, 3))
+    planes = [np.clip(plane + 0.5, 0, 255).astype(np.uint8).ravel() for plane in (y, u, v)]
+    return np.concatenate(planes)
+
+
+# Each worker process maps the frame ring once
+_worker_rings = {}
+
+
+def encode_frame(ring_path, ring_shape, slot, frame_shape, output_format, path):
+    start = time.perf_counter()
+    ring = _worker_rings.get(ring_path)
+    if ring is None:
+        ring = _worker_rings[ring_path] = np.memmap(ring_path, dtype=np.uint8, mode="r+", shape=ring_shape)
+    height, width = frame_shape
+    pixels = ring[slot, :height * width * 4].reshape(height, width, 4)
+    if output_format == "png":
+        write_png(path, pixels)
+        size = 0
+    elif output_format == "y4m":
+        planes = rgba_to_i420(pixels)
+        ring[slot, :planes.size] = planes
+        size = planes.size
+    else:
+        size = height * width * 4
+    return time.perf_counter() - start, size
+
+
+class ExportPipeline:
+    # GL thread: render a frame at a fixed timestep, start an async readback
+    # into a free slot of a shared ring. Process pool: PNG-encode or convert
+    # to I420 in place. GL thread again: write stream frames in order. The
+    # ring is the bounded queue; rendering waits when every slot is in use.
+    def __init__(self, source, output, frames, fps=60.0, width=1280, height=720, export_format=None,
+                 workers=None, queue_depth=8, start_time=0.0, uniforms=None):
+        self.source = source
+        self.output = output
+        self.frames = frames
+        self.fps = fps
+        self.width = width
+        self.height = height
+        self.format = export_format or format_for_output(output)
+        if self.format == "y4m" and (width % 2 or height % 2):
+            raise ValueError("Y4M export needs an even width and height")
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.queue_depth = queue_depth
+        self.start_time = start_time
+        self.uniforms = dict(uniforms or {})
+        self.stats = {}
+        self.cancelled = False
+
+    def settings(self):
+        return {"source": hashlib.sha1(self.source.encode("utf-8")).hexdigest(), "frames": self.frames,
+                "fps": self.fps, "width": self.width, "height": self.height, "format": self.format,
+                "start_time": self.start_time}
+
+    def manifest_path(self):
+        if self.format == "png":
+            return os.path.join(self.output, MANIFEST_NAME)
+        return self.output + "." + MANIFEST_NAME
+
+    def frame_path(self, frame):
+        return os.path.join(self.output, f"frame_{frame:05d}.png")
+
+    def load_progress(self):
+        # Number of frames already finished by an earlier run of the same export
+        try:
+            with open(self.manifest_path()) as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            return 0
+        if manifest.get("settings") != self.settings():
+            return 0
+        return min(int(manifest.get("completed", 0)), self.frames)
+
+    def save_progress(self, completed):
+        temp_path = self.manifest_path() + ".part"
+        with open(temp_path, "w") as file:
+            json.dump({"settings": self.settings(), "completed": completed}, file)
+        os.replace(temp_path, self.manifest_path())
+
+    def frame_bytes(self):
+        if self.format == "y4m":
+            return self.width * self.height * 3 // 2
+        return self.width * self.height * 4
+
+    def y4m_header(self):
+        rate = Fraction(self.fps).limit_denominator(1001)
+        return f"YUV4MPEG2 W{self.width} H{self.height} F{rate.numerator}:{rate.denominator} Ip A1:1 C420jpeg\n".encode()
+
+    def stream_layout(self):
+        # (header, bytes per frame) of a y4m or raw stream
+        header = self.y4m_header() if self.format == "y4m" else b""
+        return header, self.frame_bytes() + (len(b"FRAME\n") if self.format == "y4m" else 0)
+
+    def resume_point(self, completed):
+        # The manifest can outlive its output: resume after the frames that
+        # are actually there, which may be none
+        if self.format == "png":
+            for frame in range(completed):
+                if not os.path.exists(self.frame_path(frame)):
+                    return frame
+            return completed
+        header, frame_size = self.stream_layout()
+        try:
+            with open(self.output, "rb") as stream:
+                if stream.read(len(header)) != header:
+                    return 0
+                size = stream.seek(0, os.SEEK_END)
+        except OSError:
+            return 0
+        return min(completed, (size - len(header)) // frame_size)
+
+    def open_stream(self, completed):
+        # Drops anything past the last completed frame, then appends
+        header, frame_size = self.stream_layout()
+        if completed and os.path.exists(self.output):
+            stream = open(self.output, "r+b")
+            stream.truncate(len(header) + completed * frame_size)
+            stream.seek(0, os.SEEK_END)
+        else:
+            stream = open(self.output, "wb")
+            stream.write(header)
+        return stream
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self, progress=None):
+        # Needs a current GL context. progress(completed, total, stats) is
+        # called from the GL thread as frames finish, in order.
+        from shaders.render_graph import RenderGraph, is_multipass_source, parse_multipass_source
+        from shaders.pixel_readback import PixelReadback
+        from shaders.shader_utils import clean_shader_code
+
+        if self.format == "png":
+            os.makedirs(self.output, exist_ok=True)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(self.output)), exist_ok=True)
+        first_frame = self.resume_point(self.load_progress())
+        stream = self.open_stream(first_frame) if self.format != "png" else None
+
+        graph = RenderGraph(owner="export")
+        if is_multipass_source(self.source):
+            for name, pass_source, inputs, feedback, scale, internal_format in parse_multipass_source(self.source):
+                graph.add_pass(name, clean_shader_code(pass_source), inputs, feedback=feedback, scale=scale,
+                               internal_format=internal_format)
+        else:
+            graph.add_pass("main", clean_shader_code(self.source))
+        for name in graph.passes:
+            for uniform, value in self.uniforms.items():
+                graph.set_uniform(name, uniform, value)
+        graph.resize(self.width, self.height)
+        readback = PixelReadback(ring_size=min(3, self.queue_depth), owner="export readback")
+
+        # The ring lives in shared memory where there is some (/dev/shm)
+        ring_directory = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        ring_file = tempfile.NamedTemporaryFile(prefix="shader-export-", dir=ring_directory, delete=False)
+        ring_file.close()
+        ring_shape = (self.queue_depth, self.width * self.height * 4)
+        ring = np.memmap(ring_file.name, dtype=np.uint8, mode="w+", shape=ring_shape)
+
+        free_slots = deque(range(self.queue_depth))
+        slot_for_request = {}
+        in_flight = deque()  # (frame, slot, future) in frame order
+        timings = {"render": 0.0, "readback": 0.0, "wait": 0.0, "write": 0.0, "encode": 0.0}
+        completed = first_frame
+        pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        start = time.perf_counter()
+        last_saved = start
+
+        def on_pixels(request_id, pixels):
+            begin = time.perf_counter()
+            frame, slot = slot_for_request.pop(request_id)
+            ring[slot, :pixels.nbytes].reshape(pixels.shape)[:] = pixels
+            path = self.frame_path(frame) if self.format == "png" else None
+            in_flight.append((frame, slot, pool.submit(encode_frame, ring_file.name, ring_shape, slot,
+                                                       (self.height, self.width), self.format, path)))
+            timings["readback"] += time.perf_counter() - begin
+
+        def finish_head(block):
+            nonlocal completed, last_saved
+            while in_flight and (block or in_flight[0][2].done()):
+                frame, slot, future = in_flight.popleft()
+                wait_start = time.perf_counter()
+                busy, size = future.result()
+                timings["wait"] += time.perf_counter() - wait_start
+                timings["encode"] += busy
+                if stream:
+                    write_start = time.perf_counter()
+                    if self.format == "y4m":
+                        stream.write(b"FRAME\n")
+                    stream.write(ring[slot, :size].tobytes())
+                    timings["write"] += time.perf_counter() - write_start
+                free_slots.append(slot)
+                completed = frame + 1
+                block = False
+                now = time.perf_counter()
+                if now - last_saved > 0.5:
+                    if stream:
+                        stream.flush()
+                    self.save_progress(completed)
+                    last_saved = now
+                if progress:
+                    progress(completed, self.frames, self.current_stats(completed - first_frame, now - start, timings))
+
+        try:
+            for frame in range(first_frame, self.frames):
+                if self.cancelled:
+                    break
+                # Backpressure: every slot is queued for readback or encoding
+                while not free_slots:
+                    if in_flight:
+                        finish_head(block=True)
+                    else:
+                        readback.poll(wait=True)
+                render_start = time.perf_counter()
+                builtins = {"iTime": self.start_time + frame / self.fps, "resolution": (self.width, self.height)}
+                graph.render(builtins)
+                output = graph.passes[graph.output].output_target()
+                slot = free_slots.popleft()
+                request_id = readback.queue(output.fbo, 0, 0, self.width, self.height, on_pixels)
+                slot_for_request[request_id] = (frame, slot)
+                timings["render"] += time.perf_counter() - render_start
+                readback.poll()
+                finish_head(block=False)
+            readback.poll(wait=True)
+            while in_flight:
+                finish_head(block=True)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            readback.release()
+            graph.release()
+            if stream:
+                stream.close()
+            self.save_progress(completed)
+            del ring
+            os.unlink(ring_file.name)
+
+        self.stats = self.current_stats(completed - first_frame, time.perf_counter() - start, timings)
+        self.stats["resumed_from"] = first_frame
+        self.stats["completed"] = completed
+        return self.stats
+
+    def current_stats(self, frames, elapsed, timings):
+        elapsed = max(elapsed, 1e-9)
+        return {
+            "frames": frames,
+            "seconds": elapsed,
+            "fps": frames / elapsed,
+            # Share of wall time each stage was busy; encode is spread over
+            # the worker processes
+            "utilisation": {
+                "render": timings["render"] / elapsed,
+                "readback": timings["readback"] / elapsed,
+                "encode": timings["encode"] / (elapsed * self.workers),
+                "write": timings["write"] / elapsed,
+                "backpressure wait": timings["wait"] / elapsed,
+            },
+        }
+
+
+def format_export_stats(stats):
+    lines = [f"{stats['frames']} frames in {stats['seconds']:.2f} s ({stats['fps']:.1f} fps)"]
+    for stage, share in stats["utilisation"].items():
+        lines.append(f"  {stage:<18} {share * 100:5.1f}%")
+    return "\n".join(lines)
@@ -0,0 +1,273 @@
+# frame_capture.py
+import hashlib
+import json
+import struct
+import time
+import numpy as np
+
+# Capture log: a header followed by tagged records, appended as frames are
+# drawn so an interrupted session still leaves a readable log.
+#   b"S" <20s sha1><I length><source utf-8>      new source, indexed in order
+#   b"N" <H length><name utf-8>                  new custom uniform name
+#   b"F" <I source><d wall time><f iTime><2f resolution><3f cameraPos>
+#        <3f lightPos><H custom count> then per custom uniform
+#        <H name><c kind 'i'|'f'><B count><count values>
+MAGIC = b"SEFC"
+VERSION = 1
+HEADER = struct.Struct("<4sH")
+SOURCE_RECORD = struct.Struct("<20sI")
+NAME_RECORD = struct.Struct("<H")
+FRAME_RECORD = struct.Struct("<Idf2f3f3fH")
+UNIFORM_RECORD = struct.Struct("<HcB")
+
+
+def source_hash(source):
+    return hashlib.sha1(source.encode("utf-8")).digest()
+
+
+class CapturedFrame:
+    __slots__ = ("source", "wall_time", "time", "resolution", "camera_pos", "light_pos", "custom")
+
+    def __init__(self, source, wall_time, time, resolution, camera_pos, light_pos, custom):
+        self.source = source
+        self.wall_time = wall_time
+        self.time = time
+        self.resolution = resolution
+        self.camera_pos = camera_pos
+        self.light_pos = light_pos
+        self.custom = custom
+
+    def builtins(self, time_override=None):
+        return {
+            "resolution": self.resolution,
+            "iTime": self.time if time_override is None else time_override,
+            "cameraPos": self.camera_pos,
+            "lightPos": self.light_pos,
+        }
+
+
+class FrameRecorder:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION))
+        self.sources = {}
+        self.names = {}
+        self.frames = 0
+
+    def source_index(self, source):
+        digest = source_hash(source)
+        index = self.sources.get(digest)
+        if index is None:
+            index = len(self.sources)
+            self.sources[digest] = index
+            encoded = source.encode("utf-8")
+            self.file.write(b"S" + SOURCE_RECORD.pack(digest, len(encoded)) + encoded)
+        return index
+
+    def name_index(self, name):
+        index = self.names.get(name)
+        if index is None:
+            index = len(self.names)
+            self.names[name] = index
+            encoded = name.encode("utf-8")
+            self.file.write(b"N" + NAME_RECORD.pack(len(encoded)) + encoded)
+        return index
+
+    def record(self, source, builtins, custom_uniforms):
+        source = self.source_index(source)
+        custom = [(self.name_index(name), value) for name, value in sorted(custom_uniforms.items())]
+        width, height = builtins["resolution"]
+        parts = [b"F", FRAME_RECORD.pack(source, time.perf_counter(), builtins["iTime"], width, height,
+                                         *[float(v) for v in builtins["cameraPos"]],
+                                         *[float(v) for v in builtins["lightPos"]], len(custom))]
+        for name, value in custom:
+            values = value if isinstance(value, (list, tuple, np.ndarray)) else [value]
+            kind = b"i" if isinstance(value, int) else b"f"
+            parts.append(UNIFORM_RECORD.pack(name, kind, len(values)))
+            parts.append(struct.pack(f"<{len(values)}{kind.decode()}", *values))
+        self.file.write(b"".join(parts))
+        self.frames += 1
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+def read_capture(path):
+    # Returns (sources, frames) where sources is a list of (sha1, text)
+    with open(path, "rb") as file:
+        data = file.read()
+    magic, version = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a frame capture")
+    if version > VERSION:
+        raise ValueError(f"Frame capture version {version} is newer than this editor supports")
+    sources, names, frames = [], [], []
+    offset = HEADER.size
+    while offset < len(data):
+        tag = data[offset:offset + 1]
+        offset += 1
+        try:
+            if tag == b"S":
+                digest, length = SOURCE_RECORD.unpack_from(data, offset)
+                offset += SOURCE_RECORD.size
+                sources.append((digest, data[offset:offset + length].decode("utf-8")))
+                offset += length
+            elif tag == b"N":
+                (length,) = NAME_RECORD.unpack_from(data, offset)
+                offset += NAME_RECORD.size
+                names.append(data[offset:offset + length].decode("utf-8"))
+                offset += length
+            elif tag == b"F":
+                values = FRAME_RECORD.unpack_from(data, offset)
+                offset += FRAME_RECORD.size
+                custom = {}
+                for _ in range(values[-1]):
+                    name, kind, count = UNIFORM_RECORD.unpack_from(data, offset)
+                    offset += UNIFORM_RECORD.size
+                    item = struct.unpack_from(f"<{count}{kind.decode()}", data, offset)
+                    offset += 4 * count
+                    custom[names[name]] = item[0] if count == 1 else item
+                frames.append(CapturedFrame(values[0], values[1], values[2], values[3:5], values[5:8],
+                                            values[8:11], custom))
+            else:
+                raise ValueError(f"Unknown record {tag!r} at byte {offset - 1}")
+        except struct.error:
+            # A session that was killed mid-write leaves a truncated last record
+            break
+    return sources, frames
+
+
+def frame_time_statistics(times_ms):
+    times = np.asarray(times_ms, dtype=np.float64)
+    if not len(times):
+        return {"frames": 0}
+    return {
+        "frames": int(len(times)),
+        "mean_ms": float(times.mean()),
+        "median_ms": float(np.median(times)),
+        "p95_ms": float(np.percentile(times, 95)),
+        "p99_ms": float(np.percentile(times, 99)),
+        "min_ms": float(times.min()),
+        "max_ms": float(times.max()),
+        "stdev_ms": float(times.std()),
+    }
+
+
+class FrameReplayer:
+    # Plays a capture back through the render graph at a fixed resolution and
+    # with the recorded uniforms, timing each frame to completion. Needs a
+    # current GL context (see shaders.headless).
+    def __init__(self, path, fixed_step=None, warmup=5, on_frame=None):
+        self.path = path
+        self.sources, self.frames = read_capture(path)
+        self.fixed_step = fixed_step
+        self.warmup = warmup
+        # on_frame(frame index, pixels) reads every timed frame back through
+        # a PBO ring; the readback cost is included in the frame times
+        self.on_frame = on_frame
+        self.readback = None
+        self.graphs = {}
+
+    def build_graphs(self):
+        from shaders.render_graph import RenderGraph, is_multipass_source, parse_multipass_source
+        from shaders.shader_utils import clean_shader_code
+        for index, (_, source) in enumerate(self.sources):
+            graph = RenderGraph(owner="replay")
+            if is_multipass_source(source):
+                for name, pass_source, inputs, feedback, scale, internal_format in parse_multipass_source(source):
+                    graph.add_pass(name, clean_shader_code(pass_source), inputs, feedback=feedback, scale=scale,
+                                   internal_format=internal_format)
+            else:
+                graph.add_pass("main", clean_shader_code(source))
+            self.graphs[index] = graph
+
+    def render_frame(self, index, frame):
+        from OpenGL.GL import glFinish
+        graph = self.graphs[frame.source]
+        width, height = (int(v) for v in frame.resolution)
+        graph.resize(width, height)
+        for render_pass in graph.passes.values():
+            # Measure the shader itself, not the editor's frame caching
+            render_pass.invalidate()
+            for name, value in frame.custom.items():
+                render_pass.uniforms[name] = value
+        time_value = index * self.fixed_step if self.fixed_step else None
+        start = time.perf_counter()
+        graph.render(frame.builtins(time_value))
+        if self.readback:
+            output = graph.passes[graph.output].output_target()
+            # The readback reports its request id; on_frame gets the frame index
+            self.readback.queue(output.fbo, 0, 0, output.width, output.height,
+                                lambda request_id, pixels: self.on_frame(index, pixels))
+            self.readback.poll()
+        glFinish()
+        return (time.perf_counter() - start) * 1000.0
+
+    def replay(self):
+        from OpenGL.GL import glGetString, GL_RENDERER
+        self.build_graphs()
+        for index, frame in enumerate(self.frames[:self.warmup]):
+            self.render_frame(index, frame)
+        if self.on_frame:
+            from shaders.pixel_readback import PixelReadback
+            self.readback = PixelReadback(owner="replay readback")
+        times = []
+        per_source = {}
+        for index, frame in enumerate(self.frames):
+            elapsed = self.render_frame(index, frame)
+            times.append(elapsed)
+            per_source.setdefault(frame.source, []).append(elapsed)
+        if self.readback:
+            self.readback.poll(wait=True)
+
+        recorded = np.diff([frame.wall_time for frame in self.frames]) * 1000.0
+        renderer = glGetString(GL_RENDERER)
+        report = frame_time_statistics(times)
+        report["capture"] = self.path
+        report["renderer"] = renderer.decode() if isinstance(renderer, bytes) else str(renderer)
+        report["recorded_interval"] = frame_time_statistics(recorded)
+        report["per_source"] = {self.sources[index][0].hex()[:10]: frame_time_statistics(values)
+                                for index, values in per_source.items()}
+        return report
+
+    def release(self):
+        if self.readback:
+            self.readback.release()
+            self.readback = None
+        for graph in self.graphs.values():
+            graph.release()
+        self.graphs = {}
+
+
+def compare_reports(baseline, current):
+    lines = [f"{'':<10}{'baseline':>12}{'current':>12}{'change':>10}"]
+    for key in ("mean_ms", "median_ms", "p95_ms", "p99_ms", "max_ms"):
+        old, new = baseline.get(key), current.get(key)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old * 100.0 if old else 0.0
+        lines.append(f"{key:<10}{old:>12.3f}{new:>12.3f}{change:>+9.1f}%")
+    return "\n".join(lines)
+
+
+def format_report(report):
+    lines = [f"{report['frames']} frames replayed from {report['capture']} on {report['renderer']}"]
+    if report["frames"]:
+        lines.append(f"frame time: mean {report['mean_ms']:.3f} ms, median {report['median_ms']:.3f}, "
+                     f"p95 {report['p95_ms']:.3f}, p99 {report['p99_ms']:.3f}, max {report['max_ms']:.3f}")
+    for digest, stats in report["per_source"].items():
+        lines.append(f"  source {digest}: {stats['frames']} frames, mean {stats['mean_ms']:.3f} ms, p95 {stats['p95_ms']:.3f}")
+    return "\n".join(lines)
+
+
+def save_report(report, path):
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2)
+
+
+def load_report(path):
+    with open(path) as file:
+        return json.load(file)
@@ -0,0 +1,176 @@
+# gl_resources.py
+import threading
+import time
+from OpenGL.GL import *
+from OpenGL.error import GLError
+
+# Bytes per texel for the internal formats the editor allocates
+TEXEL_BYTES = {GL_RGBA8: 4, GL_RGBA: 4, GL_RGBA16F: 8, GL_RGBA32F: 16}
+
+
+class GLResource:
+    __slots__ = ("kind", "name", "owner", "bytes", "created")
+
+    def __init__(self, kind, name, owner):
+        self.kind = kind
+        self.name = name
+        self.owner = owner
+        self.bytes = 0
+        self.created = time.time()
+
+
+class GLResourceRegistry:
+    # Every GL object the editor makes goes through here, tagged with the
+    # subsystem that owns it, so growth and leaks can be attributed
+    def __init__(self):
+        self.resources = {}
+        self.created = {}
+        self.deleted = {}
+        # Background compiles create programs from a worker thread
+        self.lock = threading.Lock()
+
+    def track(self, kind, name, owner):
+        with self.lock:
+            self.resources[(kind, name)] = GLResource(kind, name, owner)
+            self.created[kind] = self.created.get(kind, 0) + 1
+        return name
+
+    def untrack(self, kind, name):
+        with self.lock:
+            if self.resources.pop((kind, name), None) is not None:
+                self.deleted[kind] = self.deleted.get(kind, 0) + 1
+
+    def set_bytes(self, kind, name, size):
+        resource = self.resources.get((kind, name))
+        if resource:
+            resource.bytes = int(size)
+
+    def set_owner(self, kind, name, owner):
+        resource = self.resources.get((kind, name))
+        if resource:
+            resource.owner = owner
+
+    def create_program(self, owner):
+        return self.track("program", glCreateProgram(), owner)
+
+    def create_shader(self, shader_type, owner):
+        return self.track("shader", glCreateShader(shader_type), owner)
+
+    def gen_buffer(self, owner):
+        return self.track("buffer", glGenBuffers(1), owner)
+
+    def gen_texture(self, owner):
+        return self.track("texture", glGenTextures(1), owner)
+
+    def gen_framebuffer(self, owner):
+        return self.track("framebuffer", glGenFramebuffers(1), owner)
+
+    def gen_query(self, owner):
+        return self.track("query", int(glGenQueries(1)[0]), owner)
+
+    def buffer_data(self, target, name, data, usage):
+        glBufferData(target, data.nbytes, data, usage)
+        self.set_bytes("buffer", name, data.nbytes)
+
+    def texture_image(self, name, internal_format, width, height, pixel_format, pixel_type, data):
+        # Expects the texture to be bound to GL_TEXTURE_2D
+        glTexImage2D(GL_TEXTURE_2D, 0, internal_format, width, height, 0, pixel_format, pixel_type, data)
+        self.set_bytes("texture", name, width * height * TEXEL_BYTES.get(internal_format, 4))
+
+    def set_program_bytes(self, name):
+        # The driver's binary size is the closest estimate available; it
+        # needs GL 4.1 or ARB_get_program_binary
+        try:
+            self.set_bytes("program", name, glGetProgramiv(name, GL_PROGRAM_BINARY_LENGTH))
+        except (GLError, NameError):
+            pass
+
+    def delete_program(self, name):
+        if name:
+            glDeleteProgram(name)
+            self.untrack("program", name)
+
+    def delete_shader(self, name):
+        if name:
+            glDeleteShader(name)
+            self.untrack("shader", name)
+
+    def delete_buffer(self, name):
+        if name:
+            glDeleteBuffers(1, [name])
+            self.untrack("buffer", name)
+
+    def delete_texture(self, name):
+        if name:
+            glDeleteTextures(1, [name])
+            self.untrack("texture", name)
+
+    def delete_framebuffer(self, name):
+        if name:
+            glDeleteFramebuffers(1, [name])
+            self.untrack("framebuffer", name)
+
+    def delete_query(self, name):
+        if name:
+            glDeleteQueries(1, [name])
+            self.untrack("query", name)
+
+    def live(self, owner=None):
+        with self.lock:
+            resources = list(self.resources.values())
+        if owner is not None:
+            resources = [resource for resource in resources if resource.owner.startswith(owner)]
+        return resources
+
+    def summary(self):
+        # {kind: {"count", "bytes", "created", "deleted"}} plus per-owner totals
+        kinds = {}
+        owners = {}
+        for resource in self.live():
+            entry = kinds.setdefault(resource.kind, {"count": 0, "bytes": 0})
+            entry["count"] += 1
+            entry["bytes"] += resource.bytes
+            owner = owners.setdefault(resource.owner, {"count": 0, "bytes": 0})
+            owner["count"] += 1
+            owner["bytes"] += resource.bytes
+        for kind in set(self.created) | set(kinds):
+            entry = kinds.setdefault(kind, {"count": 0, "bytes": 0})
+            entry["created"] = self.created.get(kind, 0)
+            entry["deleted"] = self.deleted.get(kind, 0)
+        return {"kinds": kinds, "owners": owners}
+
+    def format_summary(self):
+        summary = self.summary()
+        lines = [f"{'kind':<12}{'live':>6}{'created':>9}{'deleted':>9}{'est. size':>12}"]
+        for kind, entry in sorted(summary["kinds"].items()):
+            lines.append(f"{kind:<12}{entry['count']:>6}{entry['created']:>9}{entry['deleted']:>9}"
+                         f"{format_bytes(entry['bytes']):>12}")
+        lines.append("")
+        lines.append(f"{'owner':<30}{'live':>6}{'est. size':>12}")
+        for owner, entry in sorted(summary["owners"].items(), key=lambda item: item[1]["bytes"], reverse=True):
+            lines.append(f"{owner:<30}{entry['count']:>6}{format_bytes(entry['bytes']):>12}")
+        return "\n".join(lines)
+
+    def leak_report(self):
+        # Call after the owners have released their objects, before the
+        # context goes away; whatever is still live was leaked
+        leaked = self.live()
+        if not leaked:
+            return "No GL objects leaked."
+        lines = [f"{len(leaked)} GL objects still alive at teardown:"]
+        for resource in sorted(leaked, key=lambda r: (r.owner, r.kind, r.name)):
+            age = time.time() - resource.created
+            lines.append(f"  {resource.kind:<12} {resource.name:>6}  {resource.owner:<30} "
+                         f"{format_bytes(resource.bytes):>10}  created {age:.0f}s ago")
+        return "\n".join(lines)
+
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024.0
+    return f"{size:.1f} GB"
+
+
+gl_resources = GLResourceRegistry()
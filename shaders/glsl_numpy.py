@@ -0,0 +1,1600 @@
+# glsl_numpy.py
+import re
+import numpy as np
+from shaders.cost_analysis import strip_comments
+
+# Translates a GLSL 1.20 fragment shader subset into Python over NumPy arrays.
+# Lanes (pixels) are the first axis and components the last: a float is
+# (n, 1), a vec3 (n, 3), a mat3 (n, 3, 3) stored column by column. Values that
+# are the same in every lane (literals, uniforms, loop counters) stay Python
+# numbers or unbatched arrays and broadcast. Both sides of a divergent branch
+# run under a boolean lane mask, and a loop runs until every lane has left it.
+
+FLOAT = np.float32
+# A loop still running after this many iterations is treated as runaway
+LOOP_LIMIT = 100000
+
+TYPES = {"void", "bool", "int", "float", "vec2", "vec3", "vec4", "ivec2", "ivec3", "ivec4",
+         "bvec2", "bvec3", "bvec4", "mat2", "mat3", "mat4", "sampler2D"}
+QUALIFIERS = {"const", "uniform", "varying", "attribute", "invariant", "centroid", "highp", "mediump", "lowp",
+              "in", "out", "inout"}
+SWIZZLE_SETS = ("xyzw", "rgba", "stpq")
+ASSIGN_OPS = {"=", "+=", "-=", "*=", "/="}
+BINARY_PRECEDENCE = {"||": 1, "^^": 2, "&&": 3, "==": 7, "!=": 7, "<": 8, ">": 8, "<=": 8, ">=": 8,
+                     "+": 10, "-": 10, "*": 11, "/": 11, "%": 11}
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<num>0[xX][0-9a-fA-F]+|(?:\d+\.\d*|\.\d+)(?:[eE][+-]?\d+)?[fF]?|\d+[eE][+-]?\d+[fF]?|\d+[uU]?)
+  | (?P<id>[A-Za-z_]\w*)
+  | (?P<op>\+\+|--|\+=|-=|\*=|/=|%=|==|!=|<=|>=|&&|\|\||\^\^|<<|>>|[-+*/%<>=!?:;,.(){}\[\]&|^~])
+  | (?P<space>\s+)
+    """, re.VERBOSE)
+
+# name: (Python callable in the generated code, result) where result is the
+# index of the argument whose type the call takes, or a fixed type
+BUILTINS = {
+    "radians": ("np.radians", 0), "degrees": ("np.degrees", 0), "sin": ("np.sin", 0), "cos": ("np.cos", 0),
+    "tan": ("np.tan", 0), "asin": ("np.arcsin", 0), "acos": ("np.arccos", 0), "atan": ("glsl_atan", 0),
+    "pow": ("np.power", 0), "exp": ("np.exp", 0), "log": ("np.log", 0), "exp2": ("np.exp2", 0),
+    "log2": ("np.log2", 0), "sqrt": ("np.sqrt", 0), "inversesqrt": ("glsl_inversesqrt", 0),
+    "abs": ("np.abs", 0), "sign": ("np.sign", 0), "floor": ("np.floor", 0), "ceil": ("np.ceil", 0),
+    "fract": ("glsl_fract", 0), "mod": ("glsl_mod", 0), "min": ("np.minimum", 0), "max": ("np.maximum", 0),
+    "clamp": ("glsl_clamp", 0), "mix": ("glsl_mix", 0), "step": ("glsl_step", 1),
+    "smoothstep": ("glsl_smoothstep", 2), "length": ("glsl_length", "float"),
+    "distance": ("glsl_distance", "float"), "dot": ("glsl_dot", "float"), "cross": ("glsl_cross", "vec3"),
+    "normalize": ("glsl_normalize", 0), "faceforward": ("glsl_faceforward", 0), "reflect": ("glsl_reflect", 0),
+    "refract": ("glsl_refract", 0), "matrixCompMult": ("np.multiply", 0), "transpose": ("glsl_transpose", 0),
+    "lessThan": ("np.less", "bvec"), "lessThanEqual": ("np.less_equal", "bvec"),
+    "greaterThan": ("np.greater", "bvec"), "greaterThanEqual": ("np.greater_equal", "bvec"),
+    "equal": ("np.equal", "bvec"), "notEqual": ("np.not_equal", "bvec"), "any": ("glsl_any_of", "bool"),
+    "all": ("glsl_all_of", "bool"), "not": ("np.logical_not", 0),
+    "texture2D": ("glsl_texture2D", "vec4"), "texture2DLod": ("glsl_texture2D", "vec4"),
+}
+
+
+def error(line, message):
+    # Same shape as a driver log line, so the code editor can mark the line
+    return RuntimeError(f"ERROR:{line}: {message}")
+
+
+def type_size(type_name):
+    if type_name.startswith("mat"):
+        return int(type_name[3])
+    if "vec" in type_name:
+        return int(type_name[-1])
+    return 1
+
+
+def element_type(type_name):
+    if type_name.startswith("bvec"):
+        return "bool"
+    if type_name.startswith("ivec"):
+        return "int"
+    if type_name.startswith(("vec", "mat")):
+        return "float"
+    return type_name
+
+
+def vector_of(element, size):
+    if size == 1:
+        return element
+    return {"float": "vec", "int": "ivec", "bool": "bvec"}[element] + str(size)
+
+
+def is_vector(type_name):
+    return "vec" in type_name
+
+
+def is_matrix(type_name):
+    return type_name.startswith("mat")
+
+
+def zero_code(type_name):
+    if is_matrix(type_name):
+        return f"np.zeros(({type_size(type_name)}, {type_size(type_name)}), FLOAT)"
+    if type_name.startswith("bvec"):
+        return f"np.zeros({type_size(type_name)}, bool)"
+    if is_vector(type_name):
+        return f"np.zeros({type_size(type_name)}, FLOAT)"
+    return {"bool": "False", "int": "0", "float": "0.0"}.get(type_name, "None")
+
+
+# Preprocessing and tokens
+
+def tokenize_line(text, line):
+    tokens = []
+    position = 0
+    while position < len(text):
+        match = TOKEN_PATTERN.match(text, position)
+        if not match:
+            raise error(line, f"unexpected character '{text[position]}'")
+        if match.lastgroup != "space":
+            tokens.append((match.lastgroup, match.group(), line))
+        position = match.end()
+    return tokens
+
+
+def collect_macro_arguments(tokens, start, line):
+    # tokens[start] follows the '('; returns ([argument tokens], index after ')')
+    arguments = [[]]
+    depth = 0
+    for index in range(start, len(tokens)):
+        text = tokens[index][1]
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            if depth == 0:
+                return arguments, index + 1
+            depth -= 1
+        elif text == "," and depth == 0:
+            arguments.append([])
+            continue
+        arguments[-1].append(tokens[index])
+    raise error(line, "unterminated macro arguments")
+
+
+def expand_macros(tokens, macros, disabled=frozenset()):
+    result = []
+    index = 0
+    while index < len(tokens):
+        kind, text, line = tokens[index]
+        macro = macros.get(text) if kind == "id" and text not in disabled else None
+        if macro is None:
+            result.append(tokens[index])
+            index += 1
+            continue
+        parameters, body = macro
+        if parameters is None:
+            result.extend(expand_macros([(k, t, line) for k, t, _ in body], macros, disabled | {text}))
+            index += 1
+            continue
+        if index + 1 >= len(tokens) or tokens[index + 1][1] != "(":
+            result.append(tokens[index])
+            index += 1
+            continue
+        arguments, index = collect_macro_arguments(tokens, index + 2, line)
+        if arguments == [[]] and not parameters:
+            arguments = []
+        if len(arguments) != len(parameters):
+            raise error(line, f"macro {text} takes {len(parameters)} arguments")
+        arguments = [expand_macros(argument, macros, disabled) for argument in arguments]
+        substituted = []
+        for k, t, _ in body:
+            if k == "id" and t in parameters:
+                substituted.extend(arguments[parameters.index(t)])
+            else:
+                substituted.append((k, t, line))
+        result.extend(expand_macros(substituted, macros, disabled | {text}))
+    return result
+
+
+def evaluate_condition(tokens, macros, line):
+    # #if expressions: integers, defined(), comparisons and logic
+    resolved = []
+    index = 0
+    while index < len(tokens):
+        text = tokens[index][1]
+        if text == "defined":
+            name_index = index + 2 if index + 1 < len(tokens) and tokens[index + 1][1] == "(" else index + 1
+            if name_index >= len(tokens):
+                raise error(line, "defined needs a macro name")
+            resolved.append(("num", "1" if tokens[name_index][1] in macros else "0", line))
+            index = name_index + (2 if name_index == index + 2 else 1)
+            continue
+        resolved.append(tokens[index])
+        index += 1
+    words = []
+    for kind, text, _ in expand_macros(resolved, macros):
+        if kind == "id":
+            words.append("0")
+        elif kind == "num":
+            words.append(str(int(text.rstrip("uU"), 0)))
+        else:
+            words.append({"&&": " and ", "||": " or ", "!": " not ", "/": "//"}.get(text, text))
+    try:
+        return bool(eval("".join(words) or "0", {"__builtins__": {}}))
+    except Exception:
+        raise error(line, "could not evaluate #if expression")
+
+
+def preprocess(source):
+    # Tokens of the expanded source; #version, #extension and #pragma are
+    # ignored and line numbers are those of the original source
+    macros = {}
+    tokens = []
+    active = []  # (this branch taken, some branch already taken) per #if
+    line = 0
+    for line, text in enumerate(strip_comments(source).split("\n"), 1):
+        stripped = text.strip()
+        if stripped.startswith("#"):
+            directive_tokens = tokenize_line(stripped[1:], line)
+            if not directive_tokens:
+                continue
+            directive = directive_tokens[0][1]
+            rest = directive_tokens[1:]
+            enabled = all(taken for taken, _ in active)
+            if directive in ("ifdef", "ifndef"):
+                taken = bool(rest) and (rest[0][1] in macros) == (directive == "ifdef")
+                active.append((taken, taken))
+            elif directive == "if":
+                taken = enabled and evaluate_condition(rest, macros, line)
+                active.append((taken, taken))
+            elif directive == "elif":
+                if not active:
+                    raise error(line, "#elif without #if")
+                _, done = active.pop()
+                taken = not done and evaluate_condition(rest, macros, line)
+                active.append((taken, done or taken))
+            elif directive == "else":
+                if not active:
+                    raise error(line, "#else without #if")
+                _, done = active.pop()
+                active.append((not done, True))
+            elif directive == "endif":
+                if not active:
+                    raise error(line, "#endif without #if")
+                active.pop()
+            elif not enabled:
+                continue
+            elif directive == "define":
+                if not rest or rest[0][0] != "id":
+                    raise error(line, "#define needs a name")
+                name = rest[0][1]
+                # Function-like only when '(' follows the name directly
+                after_name = stripped[stripped.index(name) + len(name):]
+                if after_name.startswith("("):
+                    close = next(index for index, token in enumerate(rest) if token[1] == ")")
+                    parameters = [token[1] for token in rest[2:close] if token[1] != ","]
+                    macros[name] = (parameters, rest[close + 1:])
+                else:
+                    macros[name] = (None, rest[1:])
+            elif directive == "undef":
+                if rest:
+                    macros.pop(rest[0][1], None)
+            elif directive in ("version", "extension", "pragma", "line"):
+                continue
+            else:
+                raise error(line, f"unsupported preprocessor directive #{directive}")
+            continue
+        if all(taken for taken, _ in active):
+            tokens.extend(expand_macros(tokenize_line(text, line), macros))
+    if active:
+        raise error(line, "missing #endif")
+    tokens.append(("eof", "", line))
+    return tokens
+
+
+# Parsing. Expressions and statements are tuples tagged by their first item.
+
+class Function:
+    def __init__(self, return_type, name, parameters, body, line):
+        self.return_type = return_type
+        self.name = name
+        self.parameters = parameters  # [(type, name)]
+        self.body = body
+        self.line = line
+        self.python_name = f"f_{name}"
+
+
+class Program:
+    def __init__(self):
+        self.uniforms = []  # (type, name, line)
+        self.varyings = []
+        self.globals = []  # declaration statements in source order
+        self.functions = []
+
+
+class Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self, offset=0):
+        return self.tokens[min(self.position + offset, len(self.tokens) - 1)]
+
+    def next(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def accept(self, text):
+        if self.peek()[0] in ("op", "id") and self.peek()[1] == text:
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, text):
+        if not self.accept(text):
+            token = self.peek()
+            raise error(token[2], f"expected '{text}' but found '{token[1] or 'end of file'}'")
+
+    def identifier(self):
+        token = self.next()
+        if token[0] != "id" or token[1] in TYPES:
+            raise error(token[2], f"expected a name but found '{token[1] or 'end of file'}'")
+        return token[1]
+
+    def qualifiers(self):
+        found = []
+        while self.peek()[0] == "id" and self.peek()[1] in QUALIFIERS:
+            found.append(self.next()[1])
+        return found
+
+    def type_name(self):
+        token = self.next()
+        if token[1] == "struct":
+            raise error(token[2], "structs are not supported by the software renderer")
+        if token[1] not in TYPES:
+            raise error(token[2], f"unknown type '{token[1]}'")
+        return token[1]
+
+    def no_array(self):
+        if self.peek()[1] == "[":
+            raise error(self.peek()[2], "arrays are not supported by the software renderer")
+
+    def parse_program(self):
+        program = Program()
+        while self.peek()[0] != "eof":
+            if self.accept(";"):
+                continue
+            line = self.peek()[2]
+            if self.accept("precision"):
+                while not self.accept(";"):
+                    self.next()
+                continue
+            qualifiers = self.qualifiers()
+            type_name = self.type_name()
+            name = self.identifier()
+            if self.accept("("):
+                parameters = self.parameters()
+                if self.accept(";"):
+                    continue  # prototype
+                program.functions.append(Function(type_name, name, parameters, self.block(), line))
+                continue
+            declarators = self.declarators(name, line)
+            if "uniform" in qualifiers or "varying" in qualifiers or "attribute" in qualifiers:
+                if any(init is not None for _, init, _ in declarators):
+                    raise error(line, "uniforms and varyings can't be initialised")
+                storage = program.uniforms if "uniform" in qualifiers else program.varyings
+                storage.extend((type_name, declared, declared_line) for declared, _, declared_line in declarators)
+            else:
+                program.globals.append(("decl", type_name, declarators, line))
+        return program
+
+    def parameters(self):
+        parameters = []
+        if self.accept(")"):
+            return parameters
+        if self.peek()[1] == "void" and self.peek(1)[1] == ")":
+            self.next()
+            self.next()
+            return parameters
+        while True:
+            line = self.peek()[2]
+            qualifiers = self.qualifiers()
+            if "out" in qualifiers or "inout" in qualifiers:
+                raise error(line, "out and inout parameters are not supported by the software renderer")
+            type_name = self.type_name()
+            name = self.identifier() if self.peek()[0] == "id" else f"_unnamed{len(parameters)}"
+            self.no_array()
+            parameters.append((type_name, name))
+            if self.accept(")"):
+                return parameters
+            self.expect(",")
+
+    def declarators(self, name, line):
+        # After "type name" of a declaration; consumes the ';'
+        declarators = []
+        while True:
+            self.no_array()
+            init = self.assignment() if self.accept("=") else None
+            declarators.append((name, init, line))
+            if self.accept(";"):
+                return declarators
+            self.expect(",")
+            line = self.peek()[2]
+            name = self.identifier()
+
+    def block(self):
+        self.expect("{")
+        statements = []
+        while not self.accept("}"):
+            if self.peek()[0] == "eof":
+                raise error(self.peek()[2], "missing '}'")
+            statements.append(self.statement())
+        return ("block", statements)
+
+    def starts_declaration(self):
+        token = self.peek()
+        if token[1] in QUALIFIERS:
+            return True
+        return token[0] == "id" and token[1] in TYPES and self.peek(1)[0] == "id"
+
+    def declaration(self):
+        line = self.peek()[2]
+        self.qualifiers()
+        type_name = self.type_name()
+        return ("decl", type_name, self.declarators(self.identifier(), line), line)
+
+    def statement(self):
+        token = self.peek()
+        line = token[2]
+        text = token[1] if token[0] != "num" else None
+        if text == "{":
+            return self.block()
+        if text == ";":
+            self.next()
+            return ("block", [])
+        if text == "if":
+            self.next()
+            self.expect("(")
+            condition = self.expression()
+            self.expect(")")
+            then = self.statement()
+            otherwise = self.statement() if self.accept("else") else None
+            return ("if", condition, then, otherwise, line)
+        if text == "for":
+            self.next()
+            self.expect("(")
+            if self.accept(";"):
+                init = None
+            elif self.starts_declaration():
+                init = self.declaration()
+            else:
+                init = ("expr", self.expression(), line)
+                self.expect(";")
+            condition = None if self.peek()[1] == ";" else self.expression()
+            self.expect(";")
+            step = None if self.peek()[1] == ")" else self.expression()
+            self.expect(")")
+            return ("for", init, condition, step, self.statement(), line)
+        if text == "while":
+            self.next()
+            self.expect("(")
+            condition = self.expression()
+            self.expect(")")
+            return ("for", None, condition, None, self.statement(), line)
+        if text == "do":
+            self.next()
+            body = self.statement()
+            self.expect("while")
+            self.expect("(")
+            condition = self.expression()
+            self.expect(")")
+            self.expect(";")
+            return ("do", body, condition, line)
+        if text in ("break", "continue", "discard"):
+            self.next()
+            self.expect(";")
+            return (text, line)
+        if text == "return":
+            self.next()
+            value = None if self.peek()[1] == ";" else self.expression()
+            self.expect(";")
+            return ("return", value, line)
+        if text in ("switch", "struct"):
+            raise error(line, f"{text} is not supported by the software renderer")
+        if self.starts_declaration():
+            return self.declaration()
+        expression = self.expression()
+        self.expect(";")
+        return ("expr", expression, line)
+
+    def expression(self):
+        line = self.peek()[2]
+        expression = self.assignment()
+        if self.peek()[1] != ",":
+            return expression
+        items = [expression]
+        while self.accept(","):
+            items.append(self.assignment())
+        return ("seq", items, line)
+
+    def assignment(self):
+        left = self.ternary()
+        token = self.peek()
+        if token[0] == "op" and token[1] in ASSIGN_OPS:
+            self.next()
+            return ("assign", token[1], left, self.assignment(), token[2])
+        if token[0] == "op" and token[1] == "%=":
+            raise error(token[2], "'%=' is not supported")
+        return left
+
+    def ternary(self):
+        condition = self.binary(1)
+        line = self.peek()[2]
+        if self.accept("?"):
+            when_true = self.assignment()
+            self.expect(":")
+            return ("ternary", condition, when_true, self.assignment(), line)
+        return condition
+
+    def binary(self, minimum):
+        left = self.unary()
+        while True:
+            token = self.peek()
+            precedence = BINARY_PRECEDENCE.get(token[1]) if token[0] == "op" else None
+            if precedence is None or precedence < minimum:
+                return left
+            self.next()
+            left = ("binary", token[1], left, self.binary(precedence + 1), token[2])
+
+    def unary(self):
+        token = self.peek()
+        if token[0] == "op" and token[1] in ("-", "+", "!"):
+            self.next()
+            return ("unary", token[1], self.unary(), token[2])
+        if token[0] == "op" and token[1] in ("++", "--"):
+            self.next()
+            return ("incdec", token[1], self.unary(), token[2])
+        return self.postfix(self.primary())
+
+    def postfix(self, expression):
+        while True:
+            token = self.peek()
+            if self.accept("["):
+                index = self.expression()
+                self.expect("]")
+                expression = ("index", expression, index, token[2])
+            elif self.accept("."):
+                expression = ("field", expression, self.next()[1], token[2])
+            elif token[0] == "op" and token[1] in ("++", "--"):
+                self.next()
+                expression = ("incdec", token[1], expression, token[2])
+            else:
+                return expression
+
+    def primary(self):
+        token = self.next()
+        kind, text, line = token
+        if kind == "num":
+            if text.lower().startswith("0x"):
+                return ("literal", int(text, 16), "int")
+            if re.search(r"[.eE]", text) or text[-1] in "fF":
+                return ("literal", float(text.rstrip("fF")), "float")
+            text = text.rstrip("uU")
+            return ("literal", int(text, 8) if len(text) > 1 and text.startswith("0") else int(text), "int")
+        if text in ("true", "false") and kind == "id":
+            return ("literal", text == "true", "bool")
+        if kind == "id":
+            if self.accept("("):
+                arguments = []
+                if self.peek()[1] == "void" and self.peek(1)[1] == ")":
+                    self.next()
+                if not self.accept(")"):
+                    while True:
+                        arguments.append(self.assignment())
+                        if self.accept(")"):
+                            break
+                        self.expect(",")
+                return ("call", text, arguments, line)
+            if text in TYPES:
+                raise error(line, f"unexpected type '{text}'")
+            return ("name", text, line)
+        if text == "(":
+            expression = self.expression()
+            self.expect(")")
+            return expression
+        raise error(line, f"unexpected '{text or 'end of file'}'")
+
+
+# Translation
+
+class Symbol:
+    __slots__ = ("type", "python", "writable")
+
+    def __init__(self, type_name, python, writable=True):
+        self.type = type_name
+        self.python = python
+        self.writable = writable
+
+
+class Loop:
+    def __init__(self, number):
+        self.left = f"_k{number}"  # lanes that broke out or failed the condition
+        self.skipped = f"_j{number}"  # lanes that hit continue this iteration
+
+
+def statement_exits(statement):
+    # Which of break/continue/return/discard can end lanes inside statement
+    kind = statement[0]
+    if kind in ("break", "continue", "discard"):
+        return {kind}
+    if kind == "return":
+        return {"return"}
+    if kind == "block":
+        exits = set()
+        for child in statement[1]:
+            exits |= statement_exits(child)
+        return exits
+    if kind == "if":
+        exits = statement_exits(statement[2])
+        if statement[3] is not None:
+            exits |= statement_exits(statement[3])
+        return exits
+    if kind == "for":
+        return statement_exits(statement[4]) - {"break", "continue"}
+    if kind == "do":
+        return statement_exits(statement[1]) - {"break", "continue"}
+    return set()
+
+
+def count_returns(statement):
+    kind = statement[0]
+    if kind == "return":
+        return 1
+    if kind == "block":
+        return sum(count_returns(child) for child in statement[1])
+    if kind == "if":
+        return count_returns(statement[2]) + (count_returns(statement[3]) if statement[3] is not None else 0)
+    if kind == "for":
+        return count_returns(statement[4])
+    if kind == "do":
+        return count_returns(statement[1])
+    return 0
+
+
+class Translator:
+    def __init__(self, program):
+        self.program = program
+        self.lines = []
+        self.depth = 0
+        self.counter = 0
+        self.scopes = [{}]
+        self.functions = {}
+        self.function = None
+        self.direct = False
+        self.loops = []
+        self.used_names = {}
+        self.uses_discard = False
+
+    def emit(self, line):
+        self.lines.append("    " * self.depth + line)
+
+    def new_number(self):
+        self.counter += 1
+        return self.counter
+
+    def lookup(self, name, line):
+        for scope in reversed(self.scopes):
+            if name in scope:
+                return scope[name]
+        raise error(line, f"'{name}' undeclared")
+
+    def declare(self, name, type_name, line, python=None):
+        if name in self.scopes[-1]:
+            raise error(line, f"redeclaration of '{name}'")
+        if python is None:
+            count = self.used_names.get(name, 0) + 1
+            self.used_names[name] = count
+            python = f"v_{name}" if count == 1 else f"v_{name}_{count}"
+        symbol = self.scopes[-1][name] = Symbol(type_name, python)
+        return symbol
+
+    def translate(self):
+        globals_scope = self.scopes[0]
+        globals_scope["gl_FragCoord"] = Symbol("vec4", "G.gl_FragCoord", writable=False)
+        globals_scope["gl_FragColor"] = Symbol("vec4", "G.gl_FragColor")
+        for type_name, name, line in self.program.uniforms:
+            globals_scope[name] = Symbol(type_name, f"G.u_{name}", writable=False)
+        for type_name, name, line in self.program.varyings:
+            if type_name != "vec2":
+                raise error(line, f"varying '{name}': only the quad's vec2 texture coordinates are available")
+            globals_scope[name] = Symbol(type_name, f"G.i_{name}", writable=False)
+        self.uses_discard = any("discard" in statement_exits(function.body) for function in self.program.functions)
+
+        for function in self.program.functions:
+            overloads = self.functions.setdefault(function.name, [])
+            signature = [type_name for type_name, _ in function.parameters]
+            if any(signature == [t for t, _ in other.parameters] for other in overloads):
+                raise error(function.line, f"function '{function.name}' is defined twice")
+            if overloads or function.name in BUILTINS:
+                function.python_name = f"f_{function.name}_{len(overloads) + 1}"
+            overloads.append(function)
+        if "main" not in self.functions:
+            raise error(1, "no main() function")
+
+        self.emit("def run_globals(_m):")
+        self.depth += 1
+        self.emit("pass")
+        for statement in self.program.globals:
+            _, type_name, declarators, line = statement
+            for name, init, declared_line in declarators:
+                symbol = Symbol(type_name, f"G.g_{name}")
+                value = self.convert(init, type_name, declared_line) if init is not None else zero_code(type_name)
+                globals_scope[name] = symbol
+                self.emit(f"{symbol.python} = {value}")
+        self.depth -= 1
+
+        for function in self.program.functions:
+            self.translate_function(function)
+        return "\n".join(self.lines) + "\n"
+
+    def translate_function(self, function):
+        self.function = function
+        self.used_names = {}
+        self.loops = []
+        self.scopes.append({})
+        parameters = [self.declare(name, type_name, function.line).python for type_name, name in function.parameters]
+        self.emit(f"def {function.python_name}({', '.join(['_m'] + parameters)}):")
+        self.depth += 1
+        statements = function.body[1]
+        # A function whose only return is its last statement returns directly;
+        # otherwise returning lanes are merged into _r and leave the mask
+        self.direct = (count_returns(function.body) == 0 or
+                       (count_returns(function.body) == 1 and statements and statements[-1][0] == "return" and
+                        not any(statement_exits(statement) for statement in statements[:-1])))
+        if not self.direct:
+            self.emit("_r = None")
+            self.emit("_ret = False")
+        self.emit("_entry = _m")
+        self.block(statements, "_entry")
+        if function.return_type == "void":
+            self.emit("return None")
+        elif self.direct:
+            self.emit(f"return {zero_code(function.return_type)}")
+        else:
+            self.emit(f"return _r if _r is not None else {zero_code(function.return_type)}")
+        self.depth -= 1
+        self.scopes.pop()
+
+    def alive(self, base, exits):
+        # Lanes of base that haven't left through any of exits
+        gone = []
+        if "return" in exits and not self.direct:
+            gone.append("_ret")
+        if "discard" in exits:
+            gone.append("G.discarded")
+        if self.loops:
+            if "break" in exits:
+                gone.append(self.loops[-1].left)
+            if "continue" in exits:
+                gone.append(self.loops[-1].skipped)
+        if not gone:
+            return base
+        merged = gone[0]
+        for name in gone[1:]:
+            merged = f"glsl_or({merged}, {name})"
+        return f"glsl_and({base}, glsl_not({merged}))"
+
+    def block(self, statements, base):
+        # Once a statement can end lanes, the rest of the block only runs
+        # for the lanes still alive
+        opened = 0
+        for index, statement in enumerate(statements):
+            self.statement(statement)
+            exits = statement_exits(statement)
+            if exits and index < len(statements) - 1:
+                self.emit(f"_m = {self.alive(base, exits)}")
+                self.emit("if glsl_any(_m):")
+                self.depth += 1
+                opened += 1
+        if not statements:
+            self.emit("pass")
+        self.depth -= opened
+
+    def scoped_block(self, statement, base):
+        self.scopes.append({})
+        self.block(statement[1] if statement[0] == "block" else [statement], base)
+        self.scopes.pop()
+
+    def statement(self, statement):
+        kind = statement[0]
+        if kind == "block":
+            self.scopes.append({})
+            self.block(statement[1], self.save_mask())
+            self.scopes.pop()
+        elif kind == "decl":
+            self.declaration(statement)
+        elif kind == "expr":
+            self.expression_statement(statement[1])
+        elif kind == "if":
+            self.if_statement(statement)
+        elif kind in ("for", "do"):
+            self.loop_statement(statement)
+        elif kind == "break" or kind == "continue":
+            if not self.loops:
+                raise error(statement[1], f"{kind} outside a loop")
+            loop = self.loops[-1]
+            target = loop.left if kind == "break" else loop.skipped
+            self.emit(f"{target} = glsl_or({target}, _m)")
+            self.emit("_m = False")
+        elif kind == "discard":
+            self.emit("G.discarded = glsl_or(G.discarded, _m)")
+            self.emit("_m = False")
+        elif kind == "return":
+            self.return_statement(statement)
+
+    def save_mask(self):
+        name = f"_b{self.new_number()}"
+        self.emit(f"{name} = _m")
+        return name
+
+    def declaration(self, statement):
+        _, type_name, declarators, _ = statement
+        if type_name in ("void", "sampler2D"):
+            raise error(statement[3], f"can't declare a local {type_name}")
+        for name, init, line in declarators:
+            # Lanes outside the mask never read a variable declared here, so
+            # it is set without one
+            value = self.convert(init, type_name, line) if init is not None else zero_code(type_name)
+            self.emit(f"{self.declare(name, type_name, line).python} = {value}")
+
+    def expression_statement(self, expression, unmasked=()):
+        kind = expression[0]
+        if kind == "seq":
+            for item in expression[1]:
+                self.expression_statement(item, unmasked)
+        elif kind == "assign":
+            _, op, target, value, line = expression
+            if op == "=":
+                code, value_type = self.expression(value)
+            else:
+                code, value_type = self.binary(op[0], target, value, line)
+            self.assign(target, code, value_type, line, unmasked)
+        elif kind == "incdec":
+            _, op, target, line = expression
+            code, value_type = self.binary(op[0], target, ("literal", 1, "int"), line)
+            self.assign(target, code, value_type, line, unmasked)
+        else:
+            self.emit(self.expression(expression)[0])
+
+    def if_statement(self, statement):
+        _, condition, then, otherwise, line = statement
+        number = self.new_number()
+        code, condition_type = self.expression(condition)
+        if condition_type != "bool":
+            raise error(line, "if condition must be a bool")
+        self.emit(f"_c{number} = {code}")
+        self.emit(f"_b{number} = _m")
+        self.emit(f"_t{number} = glsl_and(_b{number}, _c{number})")
+        self.emit(f"_m = _t{number}")
+        self.emit("if glsl_any(_m):")
+        self.depth += 1
+        self.scoped_block(then, f"_t{number}")
+        self.depth -= 1
+        if otherwise is not None:
+            self.emit(f"_e{number} = glsl_and(_b{number}, glsl_not(_c{number}))")
+            self.emit(f"_m = _e{number}")
+            self.emit("if glsl_any(_m):")
+            self.depth += 1
+            self.scoped_block(otherwise, f"_e{number}")
+            self.depth -= 1
+        self.emit(f"_m = {self.alive(f'_b{number}', statement_exits(statement))}")
+
+    def loop_statement(self, statement):
+        number = self.new_number()
+        loop = Loop(number)
+        line = statement[-1]
+        if statement[0] == "for":
+            _, init, condition, step, body, _ = statement
+        else:
+            _, body, condition, _ = statement
+            init = step = None
+        self.scopes.append({})
+        counters = ()
+        if init is not None:
+            self.statement(init)
+            if init[0] == "decl":
+                # The step of a counter declared here needs no mask: lanes
+                # that left the loop never read it again
+                counters = {name for name, _, _ in init[2]}
+        exits = statement_exits(body) - {"break", "continue"}
+        self.emit(f"_l{number} = _m")
+        self.emit(f"{loop.left} = False")
+        self.emit(f"for _n{number} in range(LOOP_LIMIT):")
+        self.depth += 1
+        self.emit(f"_m = glsl_and(_l{number}, glsl_not({self.gone(loop, exits)}))")
+        if condition is not None and statement[0] == "for":
+            self.loop_condition(condition, loop, line)
+        self.emit("if not glsl_any(_m):")
+        self.emit("    break")
+        self.emit(f"_i{number} = _m")
+        self.emit(f"{loop.skipped} = False")
+        self.loops.append(loop)
+        self.scoped_block(body, f"_i{number}")
+        self.loops.pop()
+        if step is not None or statement[0] == "do":
+            self.emit(f"_m = glsl_and(_l{number}, glsl_not({self.gone(loop, exits)}))")
+        if step is not None:
+            self.expression_statement(step, unmasked=counters)
+        if statement[0] == "do":
+            self.loop_condition(condition, loop, line)
+        self.depth -= 1
+        self.emit("else:")
+        self.emit(f"    raise RuntimeError('Loop at line {line} ran more than {LOOP_LIMIT} iterations')")
+        self.emit(f"_m = {self.alive(f'_l{number}', exits)}")
+        self.scopes.pop()
+
+    def gone(self, loop, exits):
+        names = [loop.left]
+        if "return" in exits and not self.direct:
+            names.append("_ret")
+        if self.uses_discard:
+            names.append("G.discarded")
+        merged = names[0]
+        for name in names[1:]:
+            merged = f"glsl_or({merged}, {name})"
+        return merged
+
+    def loop_condition(self, condition, loop, line):
+        # Lanes whose condition fails have left the loop for good
+        code, condition_type = self.expression(condition)
+        if condition_type != "bool":
+            raise error(line, "loop condition must be a bool")
+        number = self.new_number()
+        self.emit(f"_c{number} = {code}")
+        self.emit(f"{loop.left} = glsl_or({loop.left}, glsl_and(_m, glsl_not(_c{number})))")
+        self.emit(f"_m = glsl_and(_m, _c{number})")
+
+    def return_statement(self, statement):
+        _, value, line = statement
+        return_type = self.function.return_type
+        if value is None:
+            if return_type != "void":
+                raise error(line, "missing return value")
+            code = None
+        else:
+            if return_type == "void":
+                raise error(line, "void function can't return a value")
+            code = self.convert(value, return_type, line)
+        if self.direct:
+            self.emit(f"return {code}")
+            return
+        if code is not None:
+            select = "glsl_select_matrix" if is_matrix(return_type) else "glsl_select"
+            self.emit(f"_r = {select}(_m, {code}, _r)")
+        self.emit("_ret = glsl_or(_ret, _m)")
+        self.emit("_m = False")
+
+    def assign(self, target, code, value_type, line, unmasked=()):
+        kind = target[0]
+        if kind == "name":
+            symbol = self.writable(target[1], line)
+            self.check_conversion(value_type, symbol.type, line)
+            if target[1] in unmasked:
+                self.emit(f"{symbol.python} = {code}")
+            else:
+                select = "glsl_select_matrix" if is_matrix(symbol.type) else "glsl_select"
+                self.emit(f"{symbol.python} = {select}(_m, {code}, {symbol.python})")
+        elif kind == "field":
+            _, base, field, _ = target
+            if base[0] != "name":
+                raise error(line, "can only assign to the components of a variable")
+            symbol = self.writable(base[1], line)
+            indices = self.swizzle_indices(symbol.type, field, line)
+            if len(set(indices)) != len(indices):
+                raise error(line, f"'{field}' repeats a component and can't be assigned")
+            self.check_conversion(value_type, vector_of(element_type(symbol.type), len(indices)), line)
+            self.emit(f"{symbol.python} = glsl_write({symbol.python}, {indices}, {code}, _m)")
+        elif kind == "index":
+            _, base, index, _ = target
+            if base[0] != "name":
+                raise error(line, "can only assign to the components of a variable")
+            symbol = self.writable(base[1], line)
+            index_code, index_type = self.expression(index)
+            if index_type != "int":
+                raise error(line, "index must be an int")
+            if is_matrix(symbol.type):
+                self.check_conversion(value_type, f"vec{type_size(symbol.type)}", line)
+                self.emit(f"{symbol.python} = glsl_write_column({symbol.python}, {index_code}, {code}, _m)")
+            elif is_vector(symbol.type):
+                self.check_conversion(value_type, element_type(symbol.type), line)
+                self.emit(f"{symbol.python} = glsl_write({symbol.python}, [int({index_code})], {code}, _m)")
+            else:
+                raise error(line, f"can't index a {symbol.type}")
+        else:
+            raise error(line, "left side of an assignment must be a variable")
+
+    def writable(self, name, line):
+        symbol = self.lookup(name, line)
+        if not symbol.writable:
+            raise error(line, f"'{name}' is read-only")
+        return symbol
+
+    def check_conversion(self, source, target, line):
+        if source == target or (element_type(source) == "int" and element_type(target) == "float" and
+                                type_size(source) == type_size(target) and not is_matrix(target)):
+            return
+        raise error(line, f"can't convert {source} to {target}")
+
+    def convert(self, expression, type_name, line):
+        code, value_type = self.expression(expression)
+        self.check_conversion(value_type, type_name, line)
+        return code
+
+    # Expressions return (Python code, GLSL type)
+
+    def expression(self, expression):
+        kind = expression[0]
+        if kind == "literal":
+            _, value, type_name = expression
+            return repr(value), type_name
+        if kind == "name":
+            symbol = self.lookup(expression[1], expression[2])
+            return symbol.python, symbol.type
+        if kind == "call":
+            return self.call(expression)
+        if kind == "field":
+            return self.field(expression)
+        if kind == "index":
+            return self.index(expression)
+        if kind == "unary":
+            _, op, operand, line = expression
+            code, type_name = self.expression(operand)
+            if op == "!":
+                if type_name != "bool":
+                    raise error(line, "'!' needs a bool")
+                return f"glsl_not({code})", "bool"
+            if element_type(type_name) == "bool":
+                raise error(line, f"'{op}' needs a number")
+            return (f"(-{code})" if op == "-" else code), type_name
+        if kind == "binary":
+            _, op, left, right, line = expression
+            return self.binary(op, left, right, line)
+        if kind == "ternary":
+            _, condition, when_true, when_false, line = expression
+            condition_code, condition_type = self.expression(condition)
+            if condition_type != "bool":
+                raise error(line, "'?' condition must be a bool")
+            true_code, true_type = self.expression(when_true)
+            false_code, false_type = self.expression(when_false)
+            if true_type != false_type:
+                raise error(line, f"'?' branches have different types ({true_type}, {false_type})")
+            choose = "glsl_choose_matrix" if is_matrix(true_type) else "glsl_choose"
+            return f"{choose}({condition_code}, lambda: {true_code}, lambda: {false_code})", true_type
+        if kind == "seq":
+            raise error(expression[2], "comma expressions are only supported as statements")
+        if kind in ("assign", "incdec"):
+            raise error(expression[-1], "assignments inside expressions are not supported")
+        raise error(expression[-1], "unsupported expression")
+
+    def binary(self, op, left, right, line):
+        left_code, left_type = self.expression(left)
+        right_code, right_type = self.expression(right)
+        if op in ("&&", "||", "^^"):
+            if left_type != "bool" or right_type != "bool":
+                raise error(line, f"'{op}' needs bools")
+            helper = {"&&": "glsl_and", "||": "glsl_or", "^^": "glsl_xor"}[op]
+            return f"{helper}({left_code}, {right_code})", "bool"
+        if op in ("==", "!="):
+            if element_type(left_type) != element_type(right_type) and \
+                    {element_type(left_type), element_type(right_type)} != {"int", "float"}:
+                raise error(line, f"can't compare {left_type} with {right_type}")
+            if type_size(left_type) != type_size(right_type) or is_matrix(left_type) != is_matrix(right_type):
+                raise error(line, f"can't compare {left_type} with {right_type}")
+            if is_vector(left_type) or is_matrix(left_type):
+                helper = "glsl_equal_matrix" if is_matrix(left_type) else "glsl_equal"
+                code = f"{helper}({left_code}, {right_code})"
+                return (code if op == "==" else f"glsl_not({code})"), "bool"
+            return f"({left_code} {op} {right_code})", "bool"
+        if "bool" in (element_type(left_type), element_type(right_type)) or "sampler2D" in (left_type, right_type):
+            raise error(line, f"'{op}' needs numbers, not {left_type} and {right_type}")
+        if op in ("<", ">", "<=", ">="):
+            if is_vector(left_type) or is_vector(right_type) or is_matrix(left_type) or is_matrix(right_type):
+                raise error(line, f"'{op}' compares scalars; use lessThan() and friends for vectors")
+            return f"({left_code} {op} {right_code})", "bool"
+        if is_matrix(left_type) or is_matrix(right_type):
+            return self.matrix_arithmetic(op, left_code, left_type, right_code, right_type, line)
+        left_size, right_size = type_size(left_type), type_size(right_type)
+        if left_size > 1 and right_size > 1 and left_size != right_size:
+            raise error(line, f"'{op}' on {left_type} and {right_type}")
+        element = "float" if "float" in (element_type(left_type), element_type(right_type)) else "int"
+        result_type = vector_of(element, max(left_size, right_size))
+        if element == "int" and op == "/":
+            return f"glsl_idiv({left_code}, {right_code})", result_type
+        if op == "%":
+            if element != "int":
+                raise error(line, "'%' needs ints; use mod() for floats")
+            return f"glsl_imod({left_code}, {right_code})", result_type
+        return f"({left_code} {op} {right_code})", result_type
+
+    def matrix_arithmetic(self, op, left_code, left_type, right_code, right_type, line):
+        if is_matrix(left_type) and is_matrix(right_type):
+            if left_type != right_type:
+                raise error(line, f"'{op}' on {left_type} and {right_type}")
+            if op == "*":
+                return f"np.matmul({right_code}, {left_code})", left_type
+            return f"({left_code} {op} {right_code})", left_type
+        if is_vector(left_type) or is_vector(right_type):
+            vector_type, matrix_type = (left_type, right_type) if is_vector(left_type) else (right_type, left_type)
+            if op != "*" or type_size(vector_type) != type_size(matrix_type):
+                raise error(line, f"'{op}' on {left_type} and {right_type}")
+            result = f"vec{type_size(matrix_type)}"
+            if is_matrix(left_type):
+                return f"glsl_matrix_vector({left_code}, {right_code})", result
+            return f"glsl_vector_matrix({left_code}, {right_code})", result
+        # Scalar with matrix: the scalar needs an extra axis to broadcast
+        if is_matrix(left_type):
+            return f"({left_code} {op} glsl_scalar_for_matrix({right_code}))", left_type
+        return f"(glsl_scalar_for_matrix({left_code}) {op} {right_code})", right_type
+
+    def swizzle_indices(self, type_name, field, line):
+        if not is_vector(type_name):
+            raise error(line, f"can't select '{field}' from a {type_name}")
+        for letters in SWIZZLE_SETS:
+            if all(letter in letters for letter in field):
+                indices = [letters.index(letter) for letter in field]
+                if max(indices) >= type_size(type_name) or len(indices) > 4:
+                    break
+                return indices
+        raise error(line, f"invalid swizzle '{field}' on a {type_name}")
+
+    def field(self, expression):
+        _, base, field, line = expression
+        code, type_name = self.expression(base)
+        indices = self.swizzle_indices(type_name, field, line)
+        if len(indices) == 1:
+            return f"glsl_component({code}, {indices[0]})", element_type(type_name)
+        return f"{code}[..., {indices}]", vector_of(element_type(type_name), len(indices))
+
+    def index(self, expression):
+        _, base, index, line = expression
+        code, type_name = self.expression(base)
+        index_code, index_type = self.expression(index)
+        if index_type != "int":
+            raise error(line, "index must be an int")
+        if is_matrix(type_name):
+            return f"glsl_column({code}, {index_code})", f"vec{type_size(type_name)}"
+        if is_vector(type_name):
+            return f"glsl_component_at({code}, {index_code})", element_type(type_name)
+        raise error(line, f"can't index a {type_name}")
+
+    def call(self, expression):
+        _, name, arguments, line = expression
+        if name in ("float", "int", "bool") or is_vector(name) or is_matrix(name):
+            if name in self.functions:
+                raise error(line, f"'{name}' can't be redefined")
+            return self.constructor(name, arguments, line)
+        compiled = [self.expression(argument) for argument in arguments]
+        codes = [code for code, _ in compiled]
+        types = [type_name for _, type_name in compiled]
+        if name in self.functions:
+            function = self.resolve(name, types, line)
+            return f"{function.python_name}({', '.join(['_m'] + codes)})", function.return_type
+        if name not in BUILTINS:
+            raise error(line, f"no function '{name}'")
+        helper, result = BUILTINS[name]
+        if not types:
+            raise error(line, f"{name}() needs arguments")
+        if name.startswith("texture2D"):
+            if types[0] != "sampler2D" or types[1] != "vec2":
+                raise error(line, f"{name} takes a sampler2D and a vec2")
+        elif "sampler2D" in types:
+            raise error(line, f"{name} can't take a sampler")
+        if isinstance(result, int):
+            if result >= len(types):
+                raise error(line, f"{name}() needs {result + 1} arguments")
+            result_type = types[result]
+        elif result == "bvec":
+            result_type = vector_of("bool", type_size(types[0]))
+        else:
+            result_type = result
+        if name in ("lessThan", "lessThanEqual", "greaterThan", "greaterThanEqual", "equal", "notEqual",
+                    "any", "all", "not") and not is_vector(types[0]):
+            raise error(line, f"{name} needs vectors")
+        if element_type(result_type) == "int" and name not in ("abs", "sign", "min", "max", "clamp"):
+            result_type = vector_of("float", type_size(result_type))
+        return f"{helper}({', '.join(codes)})", result_type
+
+    def resolve(self, name, types, line):
+        overloads = self.functions[name]
+        for exact in (True, False):
+            for function in overloads:
+                expected = [type_name for type_name, _ in function.parameters]
+                if len(expected) != len(types):
+                    continue
+                if exact and expected == types:
+                    return function
+                if not exact:
+                    try:
+                        for source, target in zip(types, expected):
+                            self.check_conversion(source, target, line)
+                    except RuntimeError:
+                        continue
+                    return function
+        raise error(line, f"no overload of '{name}' takes ({', '.join(types)})")
+
+    def constructor(self, name, arguments, line):
+        compiled = [self.expression(argument) for argument in arguments]
+        if not compiled:
+            raise error(line, f"{name}() needs arguments")
+        if any(type_name in ("void", "sampler2D") for _, type_name in compiled):
+            raise error(line, f"invalid argument to {name}()")
+        size = type_size(name)
+        element = element_type(name)
+        first_code, first_type = compiled[0]
+        if not is_vector(name) and not is_matrix(name):
+            # float(x), int(x), bool(x) take the first component
+            if is_vector(first_type):
+                first_code = f"glsl_component({first_code}, 0)"
+            elif is_matrix(first_type):
+                first_code = f"glsl_component(glsl_column({first_code}, 0), 0)"
+            return f"glsl_to_{name}({first_code})", name
+        if is_matrix(name):
+            if len(compiled) == 1 and not is_vector(first_type) and not is_matrix(first_type):
+                return f"glsl_diagonal({first_code}, {size})", name
+            if len(compiled) == 1 and is_matrix(first_type):
+                return f"glsl_resize_matrix({first_code}, {size})", name
+            total = sum(type_size(t) ** 2 if is_matrix(t) else type_size(t) for _, t in compiled)
+            if total != size * size or any(is_matrix(t) for _, t in compiled):
+                raise error(line, f"{name}() needs {size * size} components")
+            return f"glsl_matrix({size}, {', '.join(code for code, _ in compiled)})", name
+        if len(compiled) == 1 and not is_vector(first_type) and not is_matrix(first_type):
+            return f"glsl_splat({first_code}, {size}, {element!r})", name
+        if any(is_matrix(t) for _, t in compiled):
+            raise error(line, f"{name}() from a matrix is not supported")
+        total = sum(type_size(t) for _, t in compiled)
+        last = type_size(compiled[-1][1])
+        if total < size or total - last >= size:
+            raise error(line, f"{name}() needs {size} components")
+        return f"glsl_vector({size}, {element!r}, {', '.join(code for code, _ in compiled)})", name
+
+
+# Runtime helpers the generated code calls
+
+def glsl_any(mask):
+    if np.ndim(mask) == 0:
+        return bool(mask)
+    return bool(mask.any())
+
+
+def glsl_and(a, b):
+    if np.ndim(a) == 0:
+        return b if a else False
+    if np.ndim(b) == 0:
+        return a if b else False
+    return a & b
+
+
+def glsl_or(a, b):
+    if np.ndim(a) == 0:
+        return True if a else b
+    if np.ndim(b) == 0:
+        return True if b else a
+    return a | b
+
+
+def glsl_xor(a, b):
+    return glsl_not(a) if np.ndim(b) == 0 and b else (a ^ b if np.ndim(b) else a)
+
+
+def glsl_not(a):
+    if np.ndim(a) == 0:
+        return not a
+    return ~a
+
+
+def glsl_select(mask, value, old):
+    if old is None or (np.ndim(mask) == 0 and mask):
+        return value
+    if np.ndim(mask) == 0:
+        return old
+    return np.where(mask, value, old)
+
+
+def glsl_select_matrix(mask, value, old):
+    if old is None or np.ndim(mask) == 0:
+        return glsl_select(mask, value, old)
+    return np.where(mask[..., None], value, old)
+
+
+def glsl_choose(condition, when_true, when_false):
+    if np.ndim(condition) == 0:
+        return when_true() if condition else when_false()
+    return np.where(condition, when_true(), when_false())
+
+
+def glsl_choose_matrix(condition, when_true, when_false):
+    if np.ndim(condition) == 0:
+        return when_true() if condition else when_false()
+    return np.where(condition[..., None], when_true(), when_false())
+
+
+def glsl_component(value, index):
+    # One component as a float: a scalar when value is uniform, else (n, 1)
+    if np.ndim(value) <= 1:
+        return value[index]
+    return value[..., index:index + 1]
+
+
+def glsl_component_at(value, index):
+    if np.ndim(index) == 0:
+        return glsl_component(value, int(index))
+    return np.take_along_axis(value, index.astype(np.intp), axis=-1)
+
+
+def glsl_column(matrix, index):
+    return matrix[..., int(index), :]
+
+
+def glsl_write(vector, indices, value, mask):
+    # vector with the components at indices replaced where mask is set
+    value = np.asarray(glsl_select(mask, value, vector[..., indices]))
+    lanes = np.broadcast_shapes(vector.shape[:-1], value.shape[:-1], np.shape(mask)[:-1])
+    result = np.array(np.broadcast_to(vector, lanes + vector.shape[-1:]))
+    result[..., indices] = value
+    return result
+
+
+def glsl_write_column(matrix, index, value, mask):
+    index = int(index)
+    value = np.asarray(glsl_select(mask, value, matrix[..., index, :]))
+    lanes = np.broadcast_shapes(matrix.shape[:-2], value.shape[:-1])
+    result = np.array(np.broadcast_to(matrix, lanes + matrix.shape[-2:]))
+    result[..., index, :] = value
+    return result
+
+
+def as_components(value, element):
+    dtype = bool if element == "bool" else FLOAT
+    value = np.asarray(value, dtype=dtype)
+    return value.reshape(1) if value.ndim == 0 else value
+
+
+def glsl_vector(size, element, *parts):
+    parts = [as_components(part, element) for part in parts]
+    lanes = np.broadcast_shapes(*[part.shape[:-1] for part in parts])
+    if lanes:
+        parts = [np.broadcast_to(part, lanes + part.shape[-1:]) for part in parts]
+    return np.concatenate(parts, axis=-1)[..., :size]
+
+
+def glsl_splat(value, size, element):
+    value = as_components(value, element)
+    return np.broadcast_to(value, value.shape[:-1] + (size,))
+
+
+def glsl_matrix(size, *parts):
+    # Components fill the matrix a column at a time
+    columns = glsl_vector(size * size, "float", *parts)
+    return columns.reshape(columns.shape[:-1] + (size, size))
+
+
+def glsl_diagonal(value, size):
+    value = np.asarray(value, dtype=FLOAT)
+    return np.eye(size, dtype=FLOAT) * (value[..., None] if value.ndim else value)
+
+
+def glsl_resize_matrix(matrix, size):
+    result = np.array(np.broadcast_to(np.eye(size, dtype=FLOAT), matrix.shape[:-2] + (size, size)))
+    count = min(size, matrix.shape[-1])
+    result[..., :count, :count] = matrix[..., :count, :count]
+    return result
+
+
+def glsl_scalar_for_matrix(value):
+    return value[..., None] if np.ndim(value) else value
+
+
+def glsl_matrix_vector(matrix, vector):
+    return np.matmul(vector[..., None, :], matrix)[..., 0, :]
+
+
+def glsl_vector_matrix(vector, matrix):
+    return np.matmul(matrix, vector[..., None])[..., 0]
+
+
+def glsl_to_float(value):
+    if np.ndim(value) == 0:
+        return FLOAT(value)
+    return value.astype(FLOAT)
+
+
+def glsl_to_int(value):
+    if np.ndim(value) == 0:
+        return int(value)
+    return np.trunc(value).astype(FLOAT)
+
+
+def glsl_to_bool(value):
+    if np.ndim(value) == 0:
+        return bool(value)
+    return value != 0
+
+
+def glsl_idiv(a, b):
+    if np.ndim(a) == 0 and np.ndim(b) == 0:
+        return int(a / b) if b else 0
+    return np.trunc(np.divide(a, b)).astype(FLOAT)
+
+
+def glsl_imod(a, b):
+    return a - b * glsl_idiv(a, b)
+
+
+def glsl_equal(a, b):
+    return glsl_all_of(np.equal(a, b))
+
+
+def glsl_equal_matrix(a, b):
+    return glsl_all_of(np.equal(a, b).all(axis=-1))
+
+
+def glsl_reduce(value):
+    # Sum over components: uniform values give a scalar, batched ones (n, 1)
+    if np.ndim(value) <= 1:
+        return np.sum(value)
+    return np.sum(value, axis=-1, keepdims=True)
+
+
+def glsl_atan(y, x=None):
+    if x is None:
+        return np.arctan(y)
+    return np.arctan2(y, x)
+
+
+def glsl_inversesqrt(value):
+    return 1.0 / np.sqrt(value)
+
+
+def glsl_fract(value):
+    return value - np.floor(value)
+
+
+def glsl_mod(x, y):
+    return x - y * np.floor(x / y)
+
+
+def glsl_clamp(x, low, high):
+    return np.minimum(np.maximum(x, low), high)
+
+
+def glsl_mix(x, y, a):
+    return x * (1.0 - a) + y * a
+
+
+def glsl_step(edge, x):
+    return (np.asarray(x) >= edge).astype(FLOAT)
+
+
+def glsl_smoothstep(edge0, edge1, x):
+    t = glsl_clamp((x - edge0) / (edge1 - edge0), 0.0, 1.0)
+    return t * t * (3.0 - 2.0 * t)
+
+
+def glsl_dot(a, b):
+    return glsl_reduce(a * b)
+
+
+def glsl_length(value):
+    return np.sqrt(glsl_reduce(value * value))
+
+
+def glsl_distance(a, b):
+    return glsl_length(a - b)
+
+
+def glsl_normalize(value):
+    return value / glsl_length(value)
+
+
+def glsl_cross(a, b):
+    a, b = np.broadcast_arrays(a, b)
+    return np.stack([a[..., 1] * b[..., 2] - a[..., 2] * b[..., 1],
+                     a[..., 2] * b[..., 0] - a[..., 0] * b[..., 2],
+                     a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]], axis=-1)
+
+
+def glsl_faceforward(normal, incident, reference):
+    return glsl_choose(glsl_dot(reference, incident) < 0.0, lambda: normal, lambda: -normal)
+
+
+def glsl_reflect(incident, normal):
+    return incident - 2.0 * glsl_dot(normal, incident) * normal
+
+
+def glsl_refract(incident, normal, eta):
+    cosine = glsl_dot(normal, incident)
+    k = 1.0 - eta * eta * (1.0 - cosine * cosine)
+    refracted = eta * incident - (eta * cosine + np.sqrt(np.maximum(k, 0.0))) * normal
+    return np.where(k < 0.0, 0.0, refracted).astype(FLOAT)
+
+
+def glsl_transpose(matrix):
+    return np.swapaxes(matrix, -1, -2)
+
+
+def glsl_any_of(value):
+    if np.ndim(value) <= 1:
+        return bool(np.any(value))
+    return np.any(value, axis=-1, keepdims=True)
+
+
+def glsl_all_of(value):
+    if np.ndim(value) <= 1:
+        return bool(np.all(value))
+    return np.all(value, axis=-1, keepdims=True)
+
+
+WHITE = np.ones(4, dtype=FLOAT)
+
+
+def glsl_texture2D(image, coordinates, *unused):
+    # Bilinear with repeat wrapping, like the viewport's texture; image is
+    # (height, width, 4) floats with row 0 at t = 0, or None for plain white
+    if image is None:
+        return WHITE
+    height, width = image.shape[:2]
+    coordinates = np.asarray(coordinates, dtype=FLOAT)
+    x = coordinates[..., 0] * width - 0.5
+    y = coordinates[..., 1] * height - 0.5
+    x0 = np.floor(x)
+    y0 = np.floor(y)
+    fx = (x - x0)[..., None]
+    fy = (y - y0)[..., None]
+    x0 = x0.astype(np.intp) % width
+    y0 = y0.astype(np.intp) % height
+    x1 = (x0 + 1) % width
+    y1 = (y0 + 1) % height
+    top = image[y0, x0] * (1.0 - fx) + image[y0, x1] * fx
+    bottom = image[y1, x0] * (1.0 - fx) + image[y1, x1] * fx
+    return top * (1.0 - fy) + bottom * fy
+
+
+def uniform_value(value, type_name):
+    # A host value (number, tuple, array) in the representation above
+    if type_name == "float":
+        return FLOAT(value or 0.0)
+    if type_name == "int":
+        return int(value or 0)
+    if type_name == "bool":
+        return bool(value)
+    size = type_size(type_name)
+    dtype = bool if element_type(type_name) == "bool" else FLOAT
+    shape = (size, size) if is_matrix(type_name) else (size,)
+    if value is None:
+        return np.zeros(shape, dtype)
+    return np.array(np.broadcast_to(np.asarray(value, dtype=dtype).reshape(-1) if np.size(value) > 1 else
+                                    np.asarray(value, dtype=dtype), (size * size,) if is_matrix(type_name) else
+                                    shape)).reshape(shape)
+
+
+class FrameState:
+    # Globals of one run: builtins, uniforms (u_), varyings (i_) and globals (g_)
+    pass
+
+
+class CompiledShader:
+    # Raises RuntimeError with driver-style "ERROR:line: message" lines when
+    # the source uses something outside the subset
+    def __init__(self, source):
+        program = Parser(preprocess(source)).parse_program()
+        for function in program.functions:
+            if function.name == "main" and (function.return_type != "void" or function.parameters):
+                raise error(function.line, "main() must be 'void main()'")
+        self.python_source = Translator(program).translate()
+        self.uniforms = {name: type_name for type_name, name, _ in program.uniforms}
+        self.varyings = [name for _, name, _ in program.varyings]
+        self.namespace = {name: value for name, value in globals().items() if name.startswith("glsl_")}
+        self.namespace.update(np=np, FLOAT=FLOAT, LOOP_LIMIT=LOOP_LIMIT)
+        exec(compile(self.python_source, "<glsl>", "exec"), self.namespace)
+        self.main = next(self.namespace[function.python_name] for function in program.functions
+                         if function.name == "main")
+
+    def shade(self, frag_coord, resolution, uniforms=None, textures=None):
+        # frag_coord: (n, 4) gl_FragCoord values; returns (n, 4) colours.
+        # textures: {sampler: (height, width, 4) float image}
+        state = FrameState()
+        state.gl_FragCoord = frag_coord
+        state.gl_FragColor = np.zeros(4, FLOAT)
+        state.discarded = False
+        uniforms = uniforms or {}
+        for name, type_name in self.uniforms.items():
+            if type_name == "sampler2D":
+                value = (textures or {}).get(name)
+            else:
+                value = uniform_value(uniforms.get(name), type_name)
+            setattr(state, f"u_{name}", value)
+        # The quad's texture coordinates run 0..1 across the viewport
+        coordinates = frag_coord[:, :2] / np.asarray(resolution, dtype=FLOAT)
+        for name in self.varyings:
+            setattr(state, f"i_{name}", coordinates)
+        self.namespace["G"] = state
+        with np.errstate(all="ignore"):
+            self.namespace["run_globals"](True)
+            self.main(True)
+        color = np.broadcast_to(np.asarray(state.gl_FragColor, dtype=FLOAT), (len(frag_coord), 4))
+        if np.ndim(state.discarded) or state.discarded:
+            color = np.where(state.discarded, FLOAT(0.0), color)
+        return color
@@ -0,0 +1,78 @@
+# gpu_timer.py
+import ctypes
+from OpenGL.GL import *
+from OpenGL.error import GLError, NullFunctionError
+from shaders.gl_resources import gl_resources
+
+# Some drivers (llvmpipe) report nonsense for the first query of a context
+LONGEST_FRAME_NS = 60 * 10 ** 9
+
+
+class GpuTimer:
+    # GL_TIME_ELAPSED queries around the draw calls of a frame. Results are
+    # read a frame or more later, once the GPU has them, so timing doesn't
+    # stall the pipeline. Needs GL 3.3 or ARB_timer_query; without it
+    # supported is False and begin()/end() do nothing.
+    def __init__(self, ring_size=4, owner="gpu timer"):
+        self.ring_size = ring_size
+        self.owner = owner
+        self.queries = []
+        self.free = []
+        self.pending = []
+        self.active = None
+        self.supported = None  # found out on the first begin()
+        self.dropped = 0
+
+    def begin(self):
+        if self.supported is False:
+            return
+        if not self.free and len(self.queries) >= self.ring_size:
+            # Results are late; skip this frame rather than wait for them
+            self.dropped += 1
+            return
+        if not self.free:
+            try:
+                query = gl_resources.gen_query(self.owner)
+            except (GLError, NullFunctionError):
+                self.supported = False
+                return
+            self.queries.append(query)
+            self.free.append(query)
+        query = self.free.pop()
+        try:
+            glBeginQuery(GL_TIME_ELAPSED, query)
+        except GLError:
+            self.free.append(query)
+            self.supported = False
+            return
+        self.supported = True
+        self.active = query
+
+    def end(self):
+        if self.active is None:
+            return
+        glEndQuery(GL_TIME_ELAPSED)
+        self.pending.append(self.active)
+        self.active = None
+
+    def poll(self):
+        # Frame times in milliseconds for the queries that finished, in order
+        times = []
+        elapsed = GLuint64(0)
+        while self.pending and glGetQueryObjectiv(self.pending[0], GL_QUERY_RESULT_AVAILABLE):
+            query = self.pending.pop(0)
+            glGetQueryObjectui64v(query, GL_QUERY_RESULT, ctypes.byref(elapsed))
+            if elapsed.value < LONGEST_FRAME_NS:
+                times.append(elapsed.value / 1e6)
+            self.free.append(query)
+        return times
+
+    def release(self):
+        if self.active is not None:
+            glEndQuery(GL_TIME_ELAPSED)
+            self.active = None
+        for query in self.queries:
+            gl_resources.delete_query(query)
+        self.queries = []
+        self.free = []
+        self.pending = []
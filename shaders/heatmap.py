@@ -0,0 +1,192 @@
+# heatmap.py
+import re
+import numpy as np
+from OpenGL.GL import *
+from shaders.cost_analysis import strip_comments, find_matching, FUNCTION_PATTERN, LOOP_PATTERN, KEYWORDS
+from shaders.render_graph import RenderGraph
+
+LOOP_COUNTER = "_heatLoopIterations"
+CALL_COUNTER = "_heatCalls"
+ORIGINAL_MAIN = "_heatOriginalMain"
+METRICS = ("loop iterations", "function calls")
+DO_PATTERN = re.compile(r"\bdo\b")
+
+# Maps the raw per-pixel counts (r = loop iterations, g = calls) onto a
+# blue -> green -> yellow -> red ramp
+HEATMAP_FRAGMENT_SHADER = """
+#version 120
+varying vec2 TexCoords;
+uniform sampler2D counts;
+uniform int heatMetric;
+uniform float heatScale;
+void main() {
+    vec4 value = texture2D(counts, TexCoords);
+    float count = heatMetric == 0 ? value.r : value.g;
+    float t = clamp(count / max(heatScale, 1.0), 0.0, 1.0);
+    vec3 colour = mix(vec3(0.0, 0.0, 0.5), vec3(0.0, 0.8, 1.0), clamp(t * 4.0, 0.0, 1.0));
+    colour = mix(colour, vec3(0.1, 0.9, 0.1), clamp(t * 4.0 - 1.0, 0.0, 1.0));
+    colour = mix(colour, vec3(1.0, 0.9, 0.0), clamp(t * 4.0 - 2.0, 0.0, 1.0));
+    colour = mix(colour, vec3(1.0, 0.0, 0.0), clamp(t * 4.0 - 3.0, 0.0, 1.0));
+    gl_FragColor = vec4(count > 0.0 ? colour : vec3(0.0), 1.0);
+}
+"""
+
+
+def instrument_shader(source):
+    # Rewrites a fragment shader so every loop iteration and user function
+    # call bumps a per-pixel counter; the original main() still runs and
+    # the counts are written out instead of its colour
+    text = strip_comments(source)
+    if not re.search(r"\bvoid\s+main\s*\(", text):
+        raise RuntimeError("Shader has no main() to instrument")
+
+    insertions = []  # (offset, text); applied back to front
+    # A do loop's body is counted; the while (...) after it is its condition,
+    # not a loop of its own
+    do_conditions = set()
+    for match in DO_PATTERN.finditer(text):
+        body_end = instrument_loop_body(text, match.end(), insertions)
+        condition = LOOP_PATTERN.search(text, body_end + 1)
+        if condition and condition.group(1) == "while" and not text[body_end + 1:condition.start()].strip():
+            do_conditions.add(condition.start())
+    for match in LOOP_PATTERN.finditer(text):
+        if match.start() in do_conditions:
+            continue
+        header_open = match.end() - 1
+        header_close = find_matching(text, header_open, "(", ")")
+        instrument_loop_body(text, header_close + 1, insertions)
+
+    for match in FUNCTION_PATTERN.finditer(text):
+        name = match.group(2)
+        if name in KEYWORDS or name == "main":
+            continue
+        insertions.append((match.end(), f" {CALL_COUNTER} += 1.0;"))
+
+    # Counters go after the leading preprocessor block (#version, #extension)
+    lines = source.split("\n")
+    header_end = 0
+    offset = 0
+    for line in lines:
+        if not line.strip().startswith("#"):
+            break
+        offset += len(line) + 1
+        header_end = offset
+    insertions.append((header_end, f"float {LOOP_COUNTER} = 0.0;\nfloat {CALL_COUNTER} = 0.0;\n"))
+
+    instrumented = source
+    for position, snippet in sorted(insertions, key=lambda item: item[0], reverse=True):
+        instrumented = instrumented[:position] + snippet + instrumented[position:]
+
+    instrumented = re.sub(r"\bvoid\s+main\s*\(", f"void {ORIGINAL_MAIN}(", instrumented, count=1)
+    instrumented += f"""
+
+void main() {{
+    {ORIGINAL_MAIN}();
+    gl_FragColor = vec4({LOOP_COUNTER}, {CALL_COUNTER}, 0.0, 1.0);
+}}
+"""
+    return instrumented
+
+
+def instrument_loop_body(text, body_start, insertions):
+    # Counts each run of the loop body starting at body_start, bracing a
+    # single statement; returns the offset of the body's last character
+    while body_start < len(text) and text[body_start].isspace():
+        body_start += 1
+    if body_start < len(text) and text[body_start] == "{":
+        insertions.append((body_start + 1, f" {LOOP_COUNTER} += 1.0;"))
+        return find_matching(text, body_start, "{", "}")
+    body_end = text.find(";", body_start) + 1
+    insertions.append((body_start, f"{{ {LOOP_COUNTER} += 1.0; "))
+    insertions.append((body_end, " }"))
+    return body_end - 1
+
+
+class HeatMapProfiler:
+    def __init__(self, source, metric=0):
+        self.source = source
+        self.metric = metric
+        self.graph = RenderGraph(owner="heat map")
+        # Float target so counts above 255 survive the readback
+        self.graph.add_pass("counts", instrument_shader(source), internal_format=GL_RGBA32F)
+        self.graph.add_pass("heat", HEATMAP_FRAGMENT_SHADER, inputs={"counts": "counts"},
+                            uniforms={"heatMetric": metric, "heatScale": 1.0})
+        self.counts_version = 0
+        self.read_version = -1
+        self.counts = None
+
+    def prepare(self, width, height):
+        # Compiles both passes now so errors surface at compile time
+        self.graph.resize(width, height)
+        for name in self.graph.execution_order():
+            self.graph.prepare_pass(self.graph.passes[name])
+
+    def set_metric(self, metric):
+        self.metric = metric
+        self.graph.set_uniform("heat", "heatMetric", metric)
+
+    def render(self, builtins, width, height, screen_fbo=0):
+        self.graph.resize(width, height)
+        self.graph.render(builtins, screen_fbo)
+        self.counts_version = self.graph.passes["counts"].version
+        self.graph.present(width, height, screen_fbo)
+
+    def read_counts(self):
+        # Returns an (height, width, 2) float array of loop iterations and calls
+        target = self.graph.passes["counts"].output_target()
+        if target is None:
+            return None
+        if self.read_version != self.counts_version:
+            glBindFramebuffer(GL_FRAMEBUFFER, target.fbo)
+            data = glReadPixels(0, 0, target.width, target.height, GL_RGBA, GL_FLOAT)
+            glBindFramebuffer(GL_FRAMEBUFFER, 0)
+            pixels = np.frombuffer(data, dtype=np.float32).reshape(target.height, target.width, 4)
+            self.counts = pixels[:, :, :2].copy()
+            self.read_version = self.counts_version
+            # Normalise the colour ramp to the busiest pixel
+            scale = float(self.counts[:, :, self.metric].max())
+            self.graph.set_uniform("heat", "heatScale", max(scale, 1.0))
+        return self.counts
+
+    def summary(self, bins=16):
+        counts = self.read_counts()
+        if counts is None:
+            return None
+        result = {"pixels": int(counts.shape[0] * counts.shape[1])}
+        for index, metric in enumerate(METRICS):
+            values = counts[:, :, index].ravel()
+            ordered = np.sort(values)[::-1]
+            total = float(ordered.sum())
+            top_decile = ordered[:max(1, len(ordered) // 10)].sum()
+            histogram, edges = np.histogram(values, bins=bins, range=(0.0, max(float(ordered[0]), 1.0)))
+            result[metric] = {
+                "total": total,
+                "mean": float(values.mean()),
+                "median": float(np.median(values)),
+                "p95": float(np.percentile(values, 95)),
+                "max": float(ordered[0]),
+                # Share of all work done by the most expensive 10% of pixels
+                "top_decile_share": float(top_decile / total) if total else 0.0,
+                "histogram": (histogram.tolist(), edges.tolist()),
+            }
+        return result
+
+    def release(self):
+        self.graph.release()
+        self.counts = None
+
+
+def format_heatmap_summary(summary, width=40):
+    lines = [f"{summary['pixels']} pixels"]
+    for metric in METRICS:
+        stats = summary[metric]
+        lines.append("")
+        lines.append(f"{metric}: mean {stats['mean']:.1f}, median {stats['median']:.0f}, "
+                     f"p95 {stats['p95']:.0f}, max {stats['max']:.0f}; "
+                     f"top 10% of pixels do {stats['top_decile_share'] * 100:.0f}% of the work")
+        histogram, edges = stats["histogram"]
+        peak = max(histogram) or 1
+        for count, low, high in zip(histogram, edges, edges[1:]):
+            bar = "#" * int(round(width * count / peak))
+            lines.append(f"  {low:>7.0f}-{high:<7.0f} {count:>9} {bar}")
+    return "\n".join(lines)
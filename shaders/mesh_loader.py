@@ -0,0 +1,461 @@
+# mesh_loader.py
+import os
+import struct
+import time
+import warnings
+import numpy as np
+from utils.tracing import tracer
+
+# Interleaved vertex layout shared with the viewport: position, normal, texCoord
+VERTEX_FLOATS = 8
+MESH_EXTENSIONS = (".obj", ".ply")
+# Sidecar cache: a header recording the source file's size and mtime, then
+# the vertex and index arrays exactly as they are uploaded
+CACHE_SUFFIX = ".meshcache"
+CACHE_MAGIC = b"SEMC"
+CACHE_VERSION = 1
+CACHE_HEADER = struct.Struct("<4sHQqII6f")
+PLY_TYPES = {
+    "char": "i1", "int8": "i1", "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2", "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4", "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4", "double": "f8", "float64": "f8",
+}
+NEWLINE = ord("\n")
+SLASH = ord("/")
+SPACE = ord(" ")
+
+
+class Mesh:
+    def __init__(self, vertices, indices, from_cache=False, bounds=None):
+        self.vertices = vertices  # (n, VERTEX_FLOATS) float32
+        self.indices = indices  # uint32, three per triangle
+        self.from_cache = from_cache
+        self.load_ms = 0.0
+        if bounds is not None:
+            self.bounds = bounds
+        elif len(vertices):
+            self.bounds = (vertices[:, :3].min(axis=0), vertices[:, :3].max(axis=0))
+        else:
+            self.bounds = (np.zeros(3, dtype=np.float32), np.zeros(3, dtype=np.float32))
+
+    def triangle_count(self):
+        return len(self.indices) // 3
+
+    def model_matrix(self):
+        # Centres the mesh and scales its bounding sphere to radius 1
+        low, high = self.bounds
+        radius = float(np.linalg.norm(high - low)) / 2.0 or 1.0
+        matrix = np.identity(4, dtype=np.float32)
+        matrix[:3, :3] /= radius
+        matrix[:3, 3] = -(low + high) / 2.0 / radius
+        return matrix
+
+
+@tracer.traced("load_mesh", "io")
+def load_mesh(path, use_cache=True):
+    # OBJ or PLY, read through a memory map with whole-array NumPy passes
+    # instead of a loop per line. Raises ValueError for files it can't read.
+    start = time.perf_counter()
+    mesh = read_cache(path) if use_cache else None
+    if mesh is None:
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in MESH_EXTENSIONS:
+            raise ValueError(f"Unsupported mesh format: {extension or path}")
+        if os.path.getsize(path) == 0:
+            raise ValueError(f"{path} is empty")
+        data = np.memmap(path, dtype=np.uint8, mode="r")
+        with warnings.catch_warnings():
+            # NumPy only warns when a number can't be parsed
+            warnings.simplefilter("error", DeprecationWarning)
+            try:
+                mesh = parse_obj(data) if extension == ".obj" else parse_ply(data)
+            except DeprecationWarning as e:
+                raise ValueError(f"Malformed number in {path}") from e
+        del data
+        if use_cache:
+            write_cache(path, mesh)
+    mesh.load_ms = (time.perf_counter() - start) * 1000.0
+    return mesh
+
+
+def line_bounds(data):
+    newlines = np.flatnonzero(data == NEWLINE)
+    starts = np.concatenate(([0], newlines + 1))
+    ends = np.concatenate((newlines, [len(data)]))
+    return starts, ends
+
+
+def line_keywords(data, starts, ends):
+    # The first three bytes of every line (zero past the end), as one integer
+    padded = np.concatenate((data, np.zeros(3, dtype=np.uint8)))
+    keys = np.zeros(len(starts), dtype=np.uint32)
+    for offset in range(3):
+        byte = padded[starts + offset].astype(np.uint32)
+        byte[starts + offset >= ends] = 0
+        keys |= byte << (8 * offset)
+    return keys
+
+
+def keyword(text):
+    text = text.encode("ascii")
+    return sum(byte << (8 * offset) for offset, byte in enumerate(text))
+
+
+def line_text(data, starts, ends, skip):
+    # The chosen lines, each ending in its newline and with its first `skip`
+    # bytes blanked, plus where each line begins in the result. Files keep
+    # each kind of line together, so this is usually a few long slices.
+    stops = np.minimum(ends + 1, len(data))
+    breaks = np.flatnonzero(starts[1:] != stops[:-1]) + 1
+    if len(breaks) < 4096:
+        runs = zip(np.concatenate(([0], breaks)), np.concatenate((breaks, [len(starts)])))
+        text = np.concatenate([data[starts[first]:stops[last - 1]] for first, last in runs])
+    else:
+        marks = np.zeros(len(data) + 1, dtype=np.int8)
+        marks[starts] += 1
+        marks[stops] -= 1
+        text = data[np.cumsum(marks[:len(data)], dtype=np.int8).view(bool)]
+    offsets = np.concatenate(([0], np.cumsum(stops - starts)[:-1]))
+    for column in range(skip):
+        text[offsets[starts + column < stops] + column] = SPACE
+    return text, offsets
+
+
+def token_counts(text, offsets):
+    # Whitespace-separated tokens on each line of line_text's result; every
+    # line ends in a newline, so a token starts wherever a blank is followed
+    # by anything else
+    blank = text <= SPACE
+    first = ~blank
+    first[1:] &= blank[:-1]
+    tokens = np.flatnonzero(first)
+    return np.diff(np.searchsorted(tokens, np.append(offsets, len(text))))
+
+
+def parse_numbers(text, dtype):
+    return np.fromstring(text.tobytes(), dtype=dtype, sep=" ")
+
+
+def leading_columns(values, counts, columns, what):
+    # The first `columns` numbers of every line, whether or not lines carry
+    # extras (w, vertex colours)
+    if len(counts) and counts.min() < columns:
+        raise ValueError(f"A {what} line has fewer than {columns} values")
+    if len(counts) and counts.min() == counts.max():
+        return values.reshape(len(counts), counts[0])[:, :columns]
+    offsets = np.cumsum(counts) - counts
+    return values[offsets[:, None] + np.arange(columns)]
+
+
+def parse_obj(data):
+    starts, ends = line_bounds(data)
+    keys = line_keywords(data, starts, ends)
+    # Tabs count as separators too, so match on the keyword's first bytes
+    lines = {}
+    for name in ("v", "vt", "vn", "f"):
+        code = keyword(name)
+        width = len(name)
+        mask = (keys & ((1 << (8 * width)) - 1)) == code
+        separator = (keys >> (8 * width)) & 0xFF
+        lines[name] = np.flatnonzero(mask & ((separator == SPACE) | (separator == ord("\t"))))
+    if not len(lines["v"]) or not len(lines["f"]):
+        raise ValueError("OBJ file has no vertices or no faces")
+
+    columns = {}
+    for name, width in (("v", 3), ("vt", 2), ("vn", 3)):
+        chosen = lines[name]
+        if not len(chosen):
+            columns[name] = None
+            continue
+        text, offsets = line_text(data, starts[chosen], ends[chosen], len(name) + 1)
+        values = parse_numbers(text, np.float32)
+        counts = token_counts(text, offsets)
+        if values.size != counts.sum():
+            raise ValueError(f"Malformed '{name}' lines")
+        columns[name] = leading_columns(values, counts, width, f"'{name}'")
+
+    # Every face corner has the same layout as the first one: v, v/vt, v//vn or v/vt/vn
+    chosen = lines["f"]
+    text, offsets = line_text(data, starts[chosen], ends[chosen], 2)
+    corners = token_counts(text, offsets)
+    if not corners.sum():
+        raise ValueError("OBJ faces have no corners")
+    first_corner = bytes(text[:64]).split()[0]
+    layout = {0: ("v",), 1: ("v", "vt"), 2: ("v", "vt", "vn")}[min(first_corner.count(b"/"), 2)]
+    if b"//" in first_corner:
+        layout = ("v", "vn")
+    text[text == SLASH] = SPACE
+    numbers = parse_numbers(text, np.int64)
+    if numbers.size != corners.sum() * len(layout):
+        raise ValueError("OBJ faces mix index formats (v, v/vt, v//vn, v/vt/vn)")
+    numbers = numbers.reshape(-1, len(layout))
+
+    # Negative indices count back from the last element defined before the face
+    indices = {}
+    for column, name in enumerate(layout):
+        if columns[name] is None:
+            raise ValueError(f"Faces refer to '{name}' elements the file doesn't have")
+        values = numbers[:, column]
+        if (values < 0).any():
+            defined = np.searchsorted(lines[name], chosen)
+            values = np.where(values < 0, np.repeat(defined, corners) + values + 1, values)
+        values = values - 1
+        if len(values) and (values.min() < 0 or values.max() >= len(columns[name])):
+            raise ValueError(f"A face refers to a '{name}' element that doesn't exist")
+        indices[name] = values
+    return build_mesh(columns["v"], columns["vt"], columns["vn"], indices["v"], indices.get("vt"),
+                      indices.get("vn"), corners)
+
+
+def fan_triangles(corners):
+    # Corner numbers of a fan triangulation of faces with `corners` corners each
+    triangles = np.maximum(corners - 2, 0)
+    face = np.repeat(np.arange(len(corners)), triangles)
+    step = np.arange(triangles.sum()) - np.repeat(np.cumsum(triangles) - triangles, triangles)
+    first = (np.cumsum(corners) - corners)[face]
+    return np.stack((first, first + step + 1, first + step + 2), axis=1)
+
+
+def build_mesh(positions, texcoords, normals, corner_v, corner_vt, corner_vn, corners):
+    # Corners sharing a position, texcoord and normal become one vertex
+    corner_triangles = fan_triangles(corners)
+    if not len(corner_triangles):
+        raise ValueError("Mesh has no triangles")
+    key = corner_v.astype(np.int64)
+    for index, elements in ((corner_vt, texcoords), (corner_vn, normals)):
+        if index is not None and index is not corner_v:
+            key = key * len(elements) + index
+    used, first_corner, remap = np.unique(key, return_index=True, return_inverse=True)
+    triangle_vertices = remap.reshape(-1)[corner_triangles].astype(np.uint32)
+
+    vertex_v = corner_v[first_corner]
+    vertices = np.zeros((len(used), VERTEX_FLOATS), dtype=np.float32)
+    vertices[:, :3] = positions[vertex_v]
+    if corner_vt is not None:
+        vertices[:, 6:8] = texcoords[corner_vt[first_corner]]
+    if corner_vn is not None:
+        vertices[:, 3:6] = normals[corner_vn[first_corner]]
+    else:
+        vertices[:, 3:6] = smooth_normals(positions, corner_v[corner_triangles])[vertex_v]
+    return Mesh(vertices, triangle_vertices.ravel())
+
+
+def smooth_normals(positions, triangles):
+    # Area-weighted average of the normals of the triangles around each position
+    a, b, c = (positions[triangles[:, corner]] for corner in range(3))
+    face_normals = np.cross(b - a, c - a)
+    normals = np.zeros((len(positions), 3), dtype=np.float32)
+    for axis in range(3):
+        weights = np.repeat(face_normals[:, axis], 3)
+        normals[:, axis] = np.bincount(triangles.ravel(), weights, minlength=len(positions))
+    length = np.linalg.norm(normals, axis=1, keepdims=True)
+    return normals / np.where(length > 0.0, length, 1.0)
+
+
+def parse_ply_header(data):
+    end = bytes(data[:65536]).find(b"end_header")
+    if bytes(data[:3]) != b"ply" or end < 0:
+        raise ValueError("Not a PLY file")
+    header_end = bytes(data[end:end + 16]).index(b"\n") + end + 1
+    lines = bytes(data[:header_end]).decode("ascii", "replace").splitlines()
+    encoding = None
+    elements = []
+    for line in lines[1:]:
+        words = line.split()
+        if not words or words[0] in ("comment", "obj_info", "end_header"):
+            continue
+        if words[0] == "format":
+            encoding = words[1]
+        elif words[0] == "element":
+            elements.append((words[1], int(words[2]), []))
+        elif words[0] == "property" and elements:
+            if words[1] == "list":
+                elements[-1][2].append((words[4], ("list", PLY_TYPES[words[2]], PLY_TYPES[words[3]])))
+            else:
+                elements[-1][2].append((words[2], PLY_TYPES[words[1]]))
+        else:
+            raise ValueError(f"Unexpected PLY header line: {line}")
+    if encoding not in ("ascii", "binary_little_endian", "binary_big_endian"):
+        raise ValueError(f"Unsupported PLY format: {encoding}")
+    return encoding, elements, header_end
+
+
+def parse_ply(data):
+    try:
+        encoding, elements, offset = parse_ply_header(data)
+    except (KeyError, IndexError) as e:
+        raise ValueError(f"Malformed PLY header: {e}") from e
+    values = {}
+    if encoding == "ascii":
+        starts, ends = line_bounds(data[offset:])
+        line = 0
+        for element in elements:
+            chosen = slice(line, line + element[1])
+            if line + element[1] > len(starts):
+                raise ValueError(f"PLY element '{element[0]}' runs past the end of the file")
+            values[element[0]] = read_ascii_element(data, starts[chosen] + offset, ends[chosen] + offset, element)
+            line += element[1]
+    else:
+        endian = "<" if encoding == "binary_little_endian" else ">"
+        for element in elements:
+            values[element[0]], offset = read_binary_element(data, offset, element, endian)
+
+    vertex, face = values.get("vertex"), values.get("face")
+    if vertex is None or face is None:
+        raise ValueError("PLY file has no vertex or face element")
+    names = {"vertex_indices", "vertex_index"} & set(face)
+    if not names:
+        raise ValueError("PLY faces have no vertex_indices list")
+    corner_v, corners = face[names.pop()]
+    positions = np.stack([vertex[axis] for axis in "xyz"], axis=1).astype(np.float32)
+    normals = texcoords = None
+    if {"nx", "ny", "nz"} <= set(vertex):
+        normals = np.stack([vertex[axis] for axis in ("nx", "ny", "nz")], axis=1).astype(np.float32)
+    for u, v in (("u", "v"), ("s", "t"), ("texture_u", "texture_v")):
+        if u in vertex and v in vertex:
+            texcoords = np.stack((vertex[u], vertex[v]), axis=1).astype(np.float32)
+            break
+    corner_v = corner_v.astype(np.int64)
+    if len(corner_v) and (corner_v.min() < 0 or corner_v.max() >= len(positions)):
+        raise ValueError("A face refers to a vertex that doesn't exist")
+    # Attributes are per vertex, so they share the position's index
+    return build_mesh(positions, texcoords, normals, corner_v, corner_v if texcoords is not None else None,
+                      corner_v if normals is not None else None, corners)
+
+
+def read_binary_element(data, offset, element, endian):
+    # Fixed-size rows are one structured view of the mapped file. Rows with
+    # a list are read in one go when every list has the same length, which
+    # is the usual all-triangles case; mixed polygons need a pass over the
+    # counts to find where each row starts.
+    name, count, properties = element
+    lists = [prop for prop in properties if isinstance(prop[1], tuple)]
+    if not lists:
+        row = np.dtype([(prop, endian + kind) for prop, kind in properties])
+        rows = np.frombuffer(data, dtype=row, count=count, offset=offset)
+        return {prop: rows[prop] for prop, _ in properties}, offset + count * row.itemsize
+    if len(properties) != 1:
+        raise ValueError(f"PLY element '{name}' mixes a list with other properties")
+    prop, (_, count_kind, item_kind) = properties[0]
+    count_type = np.dtype(endian + count_kind)
+    item_type = np.dtype(endian + item_kind)
+    if count == 0:
+        return {prop: (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))}, offset
+    length = int(np.frombuffer(data, dtype=count_type, count=1, offset=offset)[0])
+    row = np.dtype([("count", count_type), ("items", item_type, (length,))])
+    if offset + count * row.itemsize <= len(data):
+        rows = np.frombuffer(data, dtype=row, count=count, offset=offset)
+        if (rows["count"] == length).all():
+            items = rows["items"].reshape(-1)
+            return {prop: (items, np.full(count, length))}, offset + count * row.itemsize
+    counts = np.empty(count, dtype=np.int64)
+    starts = np.empty(count, dtype=np.int64)
+    raw = memoryview(data)
+    cursor = offset
+    count_format = endian + count_type.char
+    for index in range(count):
+        length = struct.unpack_from(count_format, raw, cursor)[0]
+        counts[index] = length
+        starts[index] = cursor + count_type.itemsize
+        cursor += count_type.itemsize + length * item_type.itemsize
+    byte_offsets = (np.repeat(starts, counts) + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+                    * item_type.itemsize)
+    item_bytes = data[byte_offsets[:, None] + np.arange(item_type.itemsize)]
+    items = np.ascontiguousarray(item_bytes).view(item_type).reshape(-1)
+    return {prop: (items, counts)}, cursor
+
+
+def read_ascii_element(data, starts, ends, element):
+    # Each row is a line of numbers
+    name, count, properties = element
+    text, offsets = line_text(data, starts, ends, 0)
+    numbers = parse_numbers(text, np.float64)
+    counts = token_counts(text, offsets)
+    if numbers.size != counts.sum():
+        raise ValueError(f"Malformed PLY element '{name}'")
+    lists = [prop for prop in properties if isinstance(prop[1], tuple)]
+    if not lists:
+        rows = numbers.reshape(count, len(properties))
+        return {prop: rows[:, column] for column, (prop, _) in enumerate(properties)}
+    if len(properties) != 1:
+        raise ValueError(f"PLY element '{name}' mixes a list with other properties")
+    # A list's line is its length followed by its items
+    keep = np.ones(numbers.size, dtype=bool)
+    keep[(np.cumsum(counts) - counts)[counts > 0]] = False
+    return {properties[0][0]: (numbers[keep].astype(np.int64), np.maximum(counts - 1, 0))}
+
+
+def cache_path(path):
+    return path + CACHE_SUFFIX
+
+
+def read_cache(path):
+    # None when there is no cache or the source changed since it was written
+    try:
+        stat = os.stat(path)
+        with open(cache_path(path), "rb") as file:
+            header = file.read(CACHE_HEADER.size)
+            if len(header) != CACHE_HEADER.size:
+                return None
+            magic, version, size, mtime, vertex_count, index_count, *bounds = CACHE_HEADER.unpack(header)
+            if magic != CACHE_MAGIC or version != CACHE_VERSION or (size, mtime) != (stat.st_size, stat.st_mtime_ns):
+                return None
+            vertices = np.fromfile(file, dtype="<f4", count=vertex_count * VERTEX_FLOATS)
+            indices = np.fromfile(file, dtype="<u4", count=index_count)
+    except OSError:
+        return None
+    if len(vertices) != vertex_count * VERTEX_FLOATS or len(indices) != index_count:
+        return None
+    bounds = (np.array(bounds[:3], dtype=np.float32), np.array(bounds[3:], dtype=np.float32))
+    return Mesh(vertices.reshape(vertex_count, VERTEX_FLOATS), indices, from_cache=True, bounds=bounds)
+
+
+def write_cache(path, mesh):
+    # Best effort: a read-only folder just means parsing again next time
+    target = cache_path(path)
+    try:
+        stat = os.stat(path)
+        low, high = mesh.bounds
+        with open(target + ".tmp", "wb") as file:
+            file.write(CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, stat.st_size, stat.st_mtime_ns,
+                                         len(mesh.vertices), len(mesh.indices), *low.tolist(), *high.tolist()))
+            mesh.vertices.astype("<f4", copy=False).tofile(file)
+            mesh.indices.astype("<u4", copy=False).tofile(file)
+        os.replace(target + ".tmp", target)
+    except OSError as e:
+        tracer.warning("Could not write mesh cache %s: %s", target, e)
+
+
+def look_at(eye, target, up=(0.0, 1.0, 0.0)):
+    eye = np.asarray(eye, dtype=np.float32)
+    forward = np.asarray(target, dtype=np.float32) - eye
+    forward /= np.linalg.norm(forward) or 1.0
+    side = np.cross(forward, up)
+    if not np.linalg.norm(side):
+        side = np.cross(forward, (0.0, 0.0, 1.0))
+    side /= np.linalg.norm(side)
+    upward = np.cross(side, forward)
+    matrix = np.identity(4, dtype=np.float32)
+    matrix[0, :3], matrix[1, :3], matrix[2, :3] = side, upward, -forward
+    matrix[:3, 3] = -matrix[:3, :3] @ eye
+    return matrix
+
+
+def perspective(fov_degrees, aspect, near, far):
+    focal = 1.0 / np.tan(np.radians(fov_degrees) / 2.0)
+    matrix = np.zeros((4, 4), dtype=np.float32)
+    matrix[0, 0] = focal / aspect
+    matrix[1, 1] = focal
+    matrix[2, 2] = (far + near) / (near - far)
+    matrix[2, 3] = 2.0 * far * near / (near - far)
+    matrix[3, 2] = -1.0
+    return matrix
+
+
+def preview_matrices(mesh, camera_pos, aspect):
+    # The mesh is normalised to a unit sphere at the origin, looked at from cameraPos
+    distance = float(np.linalg.norm(camera_pos))
+    view = look_at(camera_pos, (0.0, 0.0, 0.0))
+    projection = perspective(45.0, aspect, max(0.01, distance - 2.0), distance + 2.0)
+    return mesh.model_matrix(), projection @ view
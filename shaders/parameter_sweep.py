@@ -0,0 +1,272 @@
+# parameter_sweep.py
+import itertools
+import math
+import re
+import time
+import numpy as np
+from OpenGL.GL import *
+
+TILE_ORIGIN_UNIFORM = "sweepTileOrigin"
+SWEEP_UNIFORM_PREFIX = "sweep_"
+SPEC_LINE = re.compile(r"^\s*([\w.]+)\s*=\s*(.+?)\s*$")
+RANGE_PATTERN = re.compile(r"^(-?[\d.]+(?:e-?\d+)?)\s*:\s*(-?[\d.]+(?:e-?\d+)?)\s*:\s*(\d+)$")
+FRAG_COORD_PATTERN = re.compile(r"\bgl_FragCoord\b")
+VERSION_PATTERN = re.compile(r"^\s*#version[^\n]*\n?", re.MULTILINE)
+# Node properties are written into generated code as literals; sweeping a
+# numeric one renders the graph once with these stand-ins and turns each
+# into a uniform, so every value of it shares one program
+SENTINEL_BASE = 65537.125
+
+
+def parse_sweep_value(text):
+    parts = [part for part in re.split(r"[\s,]+", text.strip()) if part]
+    try:
+        numbers = [float(part) for part in parts]
+    except ValueError:
+        return text.strip()
+    return numbers[0] if len(numbers) == 1 else tuple(numbers)
+
+
+def parse_sweep_values(text):
+    # "1:128:5" is five values evenly spaced from 1 to 128; otherwise values
+    # are separated by ";" and each is a number, a vector ("1 0 0") or a name
+    match = RANGE_PATTERN.match(text.strip())
+    if match:
+        start, stop, count = float(match.group(1)), float(match.group(2)), int(match.group(3))
+        return [float(value) for value in np.linspace(start, stop, count)]
+    return [parse_sweep_value(item) for item in text.split(";") if item.strip()]
+
+
+def parse_sweep_spec(text):
+    # One "name = values" line per parameter; returns [(name, [values])]
+    parameters = []
+    for number, line in enumerate(text.splitlines(), 1):
+        if not line.strip() or line.strip().startswith("#"):
+            continue
+        match = SPEC_LINE.match(line)
+        if not match:
+            raise ValueError(f"Line {number}: expected 'name = values'")
+        values = parse_sweep_values(match.group(2))
+        if not values:
+            raise ValueError(f"Line {number}: no values for {match.group(1)}")
+        parameters.append((match.group(1), values))
+    return parameters
+
+
+def sweep_combinations(parameters):
+    # Every combination, with the last parameter changing fastest
+    names = [name for name, _ in parameters]
+    return [dict(zip(names, values)) for values in itertools.product(*[values for _, values in parameters])]
+
+
+def format_sweep_value(value):
+    if isinstance(value, float):
+        return f"{value:g}"
+    if isinstance(value, tuple):
+        return "(" + " ".join(f"{v:g}" for v in value) + ")"
+    return str(value)
+
+
+def variant_label(values):
+    # Values only, in spec order: tiles are small and the names are in the spec
+    return ", ".join(format_sweep_value(value) for value in values.values())
+
+
+def grid_columns(parameters, count):
+    # With several parameters each row holds one run of the last parameter
+    if len(parameters) > 1 and len(parameters[-1][1]) <= 12:
+        return len(parameters[-1][1])
+    return max(1, math.ceil(math.sqrt(count)))
+
+
+def sentinel_values(index, value):
+    # Stand-ins for a numeric property, one per component
+    count = len(value) if isinstance(value, tuple) else 1
+    sentinels = [SENTINEL_BASE + index * 8 + component for component in range(count)]
+    return tuple(sentinels) if isinstance(value, tuple) else sentinels[0]
+
+
+def sweep_uniform_name(index, component):
+    return f"{SWEEP_UNIFORM_PREFIX}{index}_{component}"
+
+
+def promote_sentinels(source, index, value):
+    # Replaces the stand-in literals with uniforms; returns the new source and
+    # {uniform: component} for the components that actually appear
+    components = {}
+    sentinels = sentinel_values(index, value)
+    for component, sentinel in enumerate(sentinels if isinstance(sentinels, tuple) else (sentinels,)):
+        pattern = re.compile(r"(?<![\w.])" + re.escape(repr(sentinel)) + r"(?![\w.])")
+        name = sweep_uniform_name(index, component)
+        source, found = pattern.subn(name, source)
+        if found:
+            components[name] = component
+    return declare_uniforms(source, [f"uniform float {name};" for name in components]), components
+
+
+def declare_uniforms(source, declarations):
+    if not declarations:
+        return source
+    match = VERSION_PATTERN.search(source)
+    position = match.end() if match else 0
+    return source[:position] + "\n".join(declarations) + "\n" + source[position:]
+
+
+def tile_fragment_source(source):
+    # Each tile is drawn with its own viewport, so gl_FragCoord is moved back
+    # to the tile's origin; shaders that divide it by resolution still see 0..1
+    source = FRAG_COORD_PATTERN.sub(f"(gl_FragCoord - {TILE_ORIGIN_UNIFORM})", source)
+    return declare_uniforms(source, [f"uniform vec4 {TILE_ORIGIN_UNIFORM};"])
+
+
+def integer_uniform_names(program):
+    # Swept values arrive as floats; int and bool uniforms need glUniform1i
+    names = set()
+    for index in range(glGetProgramiv(program, GL_ACTIVE_UNIFORMS)):
+        name, _, uniform_type = glGetActiveUniform(program, index)
+        if uniform_type in (GL_INT, GL_BOOL):
+            names.add(name.decode("utf-8") if isinstance(name, bytes) else name)
+    return names
+
+
+class SweepTile:
+    __slots__ = ("index", "label", "values", "x", "y", "width", "height")
+
+    def __init__(self, index, label, values, x, y, width, height):
+        self.index = index
+        self.label = label
+        self.values = values
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+
+class ParameterSweep:
+    # Renders variants of a shader as tiles of one atlas: each distinct source
+    # is compiled once and every tile that shares it is just a viewport and a
+    # set of uniforms, all drawn into one target and read back once. Needs a
+    # current GL context.
+    def __init__(self, tile_width=160, tile_height=120, columns=None, padding=2):
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        self.columns = columns
+        self.padding = padding
+        self.stats = {}
+
+    def layout(self, count):
+        columns = min(self.columns or max(1, math.ceil(math.sqrt(count))), count)
+        rows = math.ceil(count / columns)
+        width = columns * self.tile_width + (columns + 1) * self.padding
+        height = rows * self.tile_height + (rows + 1) * self.padding
+        limit = min(glGetIntegerv(GL_MAX_TEXTURE_SIZE), *glGetIntegerv(GL_MAX_VIEWPORT_DIMS))
+        if width > limit or height > limit:
+            raise RuntimeError(f"A {columns}x{rows} atlas of {self.tile_width}x{self.tile_height} tiles is "
+                               f"larger than the GL limit of {limit}px; use smaller tiles")
+        return columns, rows, width, height
+
+    def render(self, variants, builtins=None, textures=None):
+        # variants: [(fragment source, {uniform: value}, label, values)];
+        # returns (atlas pixels top row first, [SweepTile]).
+        # textures: {sampler: texture id} bound for every tile.
+        from shaders.render_graph import RenderGraph, RenderTarget, QUAD_VERTEX_SHADER
+        from shaders.shader_program import ShaderProgram
+        from shaders.pixel_readback import read_pixels_sync
+        from shaders.shader_utils import clean_shader_code
+
+        start = time.perf_counter()
+        columns, rows, width, height = self.layout(len(variants))
+        builtins = dict(builtins or {})
+        builtins["resolution"] = (self.tile_width, self.tile_height)
+        # The graph is only used for its quad and uniform upload
+        quad = RenderGraph(owner="parameter sweep")
+        target = RenderTarget(width, height, owner="parameter sweep")
+        programs = {}
+        tiles = []
+        # The viewport's own state, put back however the sweep ends
+        depth_test = glIsEnabled(GL_DEPTH_TEST)
+        clear_color = glGetFloatv(GL_COLOR_CLEAR_VALUE)
+        try:
+            for source, _, _, _ in variants:
+                if source not in programs:
+                    programs[source] = ShaderProgram(QUAD_VERTEX_SHADER, tile_fragment_source(clean_shader_code(source)),
+                                                     owner="parameter sweep")
+            compiled = time.perf_counter()
+
+            glBindFramebuffer(GL_FRAMEBUFFER, target.fbo)
+            glViewport(0, 0, width, height)
+            glClearColor(0.15, 0.15, 0.15, 1.0)
+            glClear(GL_COLOR_BUFFER_BIT)
+            glDisable(GL_DEPTH_TEST)
+            for unit, texture in enumerate((textures or {}).values()):
+                glActiveTexture(GL_TEXTURE0 + unit)
+                glBindTexture(GL_TEXTURE_2D, texture)
+
+            # Tiles sharing a program are drawn back to back
+            ordinals = {source: ordinal for ordinal, source in enumerate(programs)}
+            order = sorted(range(len(variants)), key=lambda index: ordinals[variants[index][0]])
+            current = None
+            for index in order:
+                source, uniforms, label, values = variants[index]
+                row, column = divmod(index, columns)
+                x = self.padding + column * (self.tile_width + self.padding)
+                # Row 0 at the top of the atlas, which is the end of GL's rows
+                y = height - (row + 1) * (self.tile_height + self.padding)
+                tiles.append(SweepTile(index, label, values, x, height - y - self.tile_height,
+                                       self.tile_width, self.tile_height))
+                program = programs[source].program
+                if program != current:
+                    glUseProgram(program)
+                    for name, value in builtins.items():
+                        quad.upload_uniform(glGetUniformLocation(program, name), value)
+                    for unit, sampler in enumerate(textures or {}):
+                        quad.upload_uniform(glGetUniformLocation(program, sampler), unit)
+                    integer_uniforms = integer_uniform_names(program)
+                    current = program
+                glViewport(x, y, self.tile_width, self.tile_height)
+                quad.upload_uniform(glGetUniformLocation(program, TILE_ORIGIN_UNIFORM), (x, y, 0.0, 0.0))
+                for name, value in uniforms.items():
+                    if name in integer_uniforms:
+                        value = int(value)
+                    quad.upload_uniform(glGetUniformLocation(program, name), value)
+                quad.draw_quad()
+
+            for unit in range(len(textures or {})):
+                glActiveTexture(GL_TEXTURE0 + unit)
+                glBindTexture(GL_TEXTURE_2D, 0)
+            glActiveTexture(GL_TEXTURE0)
+            pixels = read_pixels_sync(target.fbo, 0, 0, width, height).copy()
+        finally:
+            glBindFramebuffer(GL_FRAMEBUFFER, 0)
+            if depth_test:
+                glEnable(GL_DEPTH_TEST)
+            glClearColor(*clear_color)
+            for program in programs.values():
+                program.release()
+            target.release()
+            quad.release()
+
+        tiles.sort(key=lambda tile: tile.index)
+        end = time.perf_counter()
+        self.stats = {"variants": len(variants), "programs": len(programs), "columns": columns, "rows": rows,
+                      "compile_ms": (compiled - start) * 1000.0, "total_ms": (end - start) * 1000.0}
+        return pixels, tiles
+
+
+def uniform_variants(source, parameters):
+    # A shader whose parameters are all uniforms: one source, one program
+    return [(source, {name: sweep_value_as_uniform(value) for name, value in values.items()}, variant_label(values), values)
+            for values in sweep_combinations(parameters)]
+
+
+def sweep_value_as_uniform(value):
+    if isinstance(value, tuple):
+        return tuple(float(v) for v in value)
+    if isinstance(value, str):
+        raise ValueError(f"'{value}' is not a number; only node properties can be swept by name")
+    return float(value)
+
+
+def format_sweep_stats(stats):
+    return (f"{stats['variants']} variants from {stats['programs']} program(s) in a {stats['columns']}x{stats['rows']} "
+            f"atlas: {stats['total_ms']:.1f} ms ({stats['compile_ms']:.1f} ms compiling)")
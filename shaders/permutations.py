@@ -0,0 +1,112 @@
+# permutations.py
+import itertools
+import re
+
+# #define MAX_STEPS 100 // @variant quality low=32 medium=64 high=100
+VARIANT_DIRECTIVE = re.compile(r"^([ \t]*#[ \t]*define[ \t]+(\w+)[ \t]+)(.*?)([ \t]*//[ \t]*@variant[ \t]+(\w+)"
+                               r"((?:[ \t]+\w+=\S+)+)[ \t]*)$", re.MULTILINE)
+OPTION_PATTERN = re.compile(r"(\w+)=(\S+)")
+# Tiers of the quality axis go from cheapest to best in the order declared
+QUALITY_AXIS = "quality"
+# More than this and the variants would push each other out of the program cache
+MAX_VARIANTS = 16
+
+
+class VariantAxis:
+    def __init__(self, name, options):
+        self.name = name
+        self.options = options
+        self.defines = {}  # define name -> {option: value}
+        self.default = None
+
+
+def parse_variant_axes(source):
+    # {axis name: VariantAxis} in the order the axes first appear. Every
+    # define on an axis has to list the same options. The default option is
+    # the one matching the value the source is written with, else the last.
+    axes = {}
+    for match in VARIANT_DIRECTIVE.finditer(source):
+        define, written, axis_name, options = match.group(2), match.group(3).strip(), match.group(5), match.group(6)
+        values = dict(OPTION_PATTERN.findall(options))
+        line = source.count("\n", 0, match.start()) + 1
+        axis = axes.get(axis_name)
+        if axis is None:
+            axis = axes[axis_name] = VariantAxis(axis_name, list(values))
+        elif list(values) != axis.options:
+            raise ValueError(f"Line {line}: {define} gives {axis_name} options {', '.join(values)}, "
+                             f"expected {', '.join(axis.options)}")
+        if define in axis.defines:
+            raise ValueError(f"Line {line}: {define} is already a variant of {axis_name}")
+        axis.defines[define] = values
+        if axis.default is None:
+            matching = [option for option, value in values.items() if value == written]
+            axis.default = matching[0] if matching else axis.options[-1]
+    return axes
+
+
+def resolve_selection(axes, wanted):
+    # The wanted option for every axis that has it, else the axis default
+    return {name: wanted.get(name) if wanted.get(name) in axis.options else axis.default
+            for name, axis in axes.items()}
+
+
+def apply_variant(source, axes, selection):
+    # Rewrites the value of every variant define. The directive comments are
+    # kept, so the result is a variant source too and line numbers in compile
+    # errors still match the editor.
+    values = {}
+    for name, axis in axes.items():
+        for define, options in axis.defines.items():
+            values[define] = options[selection[name]]
+
+    def replace(match):
+        return match.group(1) + values.get(match.group(2), match.group(3)) + match.group(4)
+    return VARIANT_DIRECTIVE.sub(replace, source)
+
+
+def variant_selections(axes):
+    # Every combination of options, the first MAX_VARIANTS of them
+    names = list(axes)
+    combinations = itertools.product(*(axes[name].options for name in names))
+    return [dict(zip(names, options)) for options in itertools.islice(combinations, MAX_VARIANTS)]
+
+
+def format_selection(selection):
+    return ", ".join(f"{name} {option}" for name, option in selection.items())
+
+
+class QualityController:
+    # Drives the quality axis from measured frame times: steps down a tier
+    # when the median of a window of frames is over budget, and back up when
+    # it is well under and the tier above wasn't already seen over budget.
+    # The window restarts after every switch so a tier is judged on its own frames.
+    def __init__(self, target_ms=1000.0 / 60.0, window=12, headroom=0.5):
+        self.target_ms = target_ms
+        self.window = window
+        self.headroom = headroom
+        self.samples = []
+        self.measured = {}  # tier -> median frame time last seen
+
+    def reset(self):
+        self.samples = []
+        self.measured = {}
+
+    def observe(self, frame_ms, tiers, current):
+        # Returns the tier to switch to, or None to stay
+        self.samples.append(frame_ms)
+        if len(self.samples) < self.window:
+            return None
+        median = sorted(self.samples)[len(self.samples) // 2]
+        self.samples = []
+        self.measured[current] = median
+        index = tiers.index(current)
+        if median > self.target_ms and index > 0:
+            return tiers[index - 1]
+        if median < self.target_ms * self.headroom and index < len(tiers) - 1:
+            upper = tiers[index + 1]
+            if self.measured.get(upper, 0.0) <= self.target_ms:
+                return upper
+        return None
+
+    def median_ms(self, tier):
+        return self.measured.get(tier)
@@ -0,0 +1,126 @@
+# pixel_readback.py
+import ctypes
+import numpy as np
+from OpenGL.GL import *
+from shaders.gl_resources import gl_resources
+
+
+class ReadbackRequest:
+    __slots__ = ("id", "width", "height", "buffer", "fence", "age", "callback", "flip")
+
+    def __init__(self, request_id, width, height, buffer, fence, callback, flip):
+        self.id = request_id
+        self.width = width
+        self.height = height
+        self.buffer = buffer
+        self.fence = fence
+        self.age = 0
+        self.callback = callback
+        self.flip = flip
+
+
+class PixelReadback:
+    # glReadPixels into a pixel pack buffer returns straight away; the copy
+    # runs on the GPU and the buffer is mapped a frame or more later, so
+    # capturing doesn't stall the pipeline. Requests complete in order.
+    def __init__(self, ring_size=3, owner="pixel readback"):
+        self.ring_size = ring_size
+        self.owner = owner
+        self.buffers = []  # [pbo, size in bytes]
+        self.free = []
+        self.pending = []
+        self.ready = []  # copies for reads without a callback, until polled
+        self.next_id = 0
+        # Without fences (GL < 3.2) a read counts as done after ring_size - 1
+        # later frames, which is when a double/triple buffered driver is done
+        self.use_fences = bool(glFenceSync)
+        self.completed = 0
+        self.forced = 0
+
+    def queue(self, fbo, x, y, width, height, callback=None, flip=True):
+        # callback(request_id, pixels): pixels is a (height, width, 4) uint8
+        # view of the mapped buffer, only valid during the call. Without a
+        # callback poll() returns copies instead.
+        if not self.free and len(self.buffers) >= self.ring_size:
+            # Ring full: finish the oldest read rather than grow without bound
+            self.forced += 1
+            self.complete(self.pending.pop(0))
+        if not self.free:
+            self.free.append(len(self.buffers))
+            self.buffers.append([gl_resources.gen_buffer(self.owner), 0])
+        index = self.free.pop()
+        pbo, size = self.buffers[index]
+        needed = width * height * 4
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+        if size != needed:
+            glBufferData(GL_PIXEL_PACK_BUFFER, needed, None, GL_STREAM_READ)
+            gl_resources.set_bytes("buffer", pbo, needed)
+            self.buffers[index][1] = needed
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, fbo)
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        glReadPixels(x, y, width, height, GL_RGBA, GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        fence = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0) if self.use_fences else None
+        request = ReadbackRequest(self.next_id, width, height, index, fence, callback, flip)
+        self.next_id += 1
+        self.pending.append(request)
+        return request.id
+
+    def is_ready(self, request):
+        if request.fence is not None:
+            status = glClientWaitSync(request.fence, 0, 0)
+            return status in (GL_ALREADY_SIGNALED, GL_CONDITION_SATISFIED)
+        return request.age >= self.ring_size - 1
+
+    def poll(self, wait=False):
+        # Completes every read that is ready (all of them if wait), in
+        # order, and returns [(request_id, array)] for reads without a callback
+        for request in self.pending:
+            request.age += 1
+        while self.pending and (wait or self.is_ready(self.pending[0])):
+            self.complete(self.pending.pop(0))
+        results, self.ready = self.ready, []
+        return results
+
+    def complete(self, request):
+        pbo, size = self.buffers[request.buffer]
+        if request.fence is not None:
+            glClientWaitSync(request.fence, GL_SYNC_FLUSH_COMMANDS_BIT, 1000000000)
+            glDeleteSync(request.fence)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+        address = glMapBuffer(GL_PIXEL_PACK_BUFFER, GL_READ_ONLY)
+        try:
+            if address:
+                mapped = (ctypes.c_ubyte * size).from_address(address)
+                pixels = np.frombuffer(mapped, dtype=np.uint8).reshape(request.height, request.width, 4)
+                if request.flip:
+                    # GL rows run bottom-up; flipping the view costs nothing
+                    pixels = pixels[::-1]
+                if request.callback:
+                    request.callback(request.id, pixels)
+                else:
+                    self.ready.append((request.id, pixels.copy()))
+        finally:
+            glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self.free.append(request.buffer)
+        self.completed += 1
+
+    def release(self):
+        for request in self.pending:
+            if request.fence is not None:
+                glDeleteSync(request.fence)
+        self.pending = []
+        for pbo, _ in self.buffers:
+            gl_resources.delete_buffer(pbo)
+        self.buffers = []
+        self.free = []
+
+
+def read_pixels_sync(fbo, x, y, width, height, flip=True):
+    # Blocking fallback: waits for the GPU to finish everything queued
+    glBindFramebuffer(GL_READ_FRAMEBUFFER, fbo)
+    glPixelStorei(GL_PACK_ALIGNMENT, 1)
+    data = glReadPixels(x, y, width, height, GL_RGBA, GL_UNSIGNED_BYTE)
+    pixels = np.frombuffer(data, dtype=np.uint8).reshape(height, width, 4)
+    return pixels[::-1] if flip else pixels
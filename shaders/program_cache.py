@@ -0,0 +1,131 @@
+# program_cache.py
+import hashlib
+import os
+from collections import OrderedDict
+from shaders.gl_resources import gl_resources
+from utils.tracing import tracer
+
+HISTORY_PATH = os.path.join(os.path.expanduser("~"), ".cache", "shader-editor", "compile_history.txt")
+# Digests remembered across sessions; the oldest are dropped past this
+HISTORY_LIMIT = 4096
+
+
+def source_digest(vertex_shader_source, fragment_shader_source):
+    digest = hashlib.sha1(vertex_shader_source.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(fragment_shader_source.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ProgramCache:
+    def __init__(self, capacity=32, history_path=None):
+        # The history is only kept on disk when asked for (--compile-history)
+        if history_path is None and os.environ.get("SHADER_EDITOR_COMPILE_HISTORY"):
+            history_path = HISTORY_PATH
+        self.capacity = capacity
+        self.history_path = history_path
+        self.programs = OrderedDict()
+        # Use counts of the programs a ShaderProgram is drawing with; these
+        # are never evicted
+        self.pins = {}
+        self.hits = 0
+        self.misses = 0
+        # Misses whose source was already compiled in an earlier session: the
+        # hit rate a persistent binary cache would get across restarts
+        self.cross_session_hits = 0
+        # Digests in the order they were first compiled
+        self.history = OrderedDict()
+        self.history_changed = False
+        self.load_history()
+
+    def load_history(self):
+        if not self.history_path or not os.path.exists(self.history_path):
+            return
+        try:
+            with open(self.history_path, "r") as file:
+                for line in file:
+                    if line.strip():
+                        self.remember(line.strip())
+        except OSError as e:
+            tracer.warning("Could not read shader compile history: %s", e)
+        self.history_changed = False
+
+    def lookup(self, digest):
+        program = self.programs.get(digest)
+        if program is not None:
+            self.programs.move_to_end(digest)
+            self.hits += 1
+            return program
+        self.misses += 1
+        if digest in self.history:
+            self.cross_session_hits += 1
+        return None
+
+    def store(self, digest, program):
+        gl_resources.set_owner("program", program, "program cache")
+        self.programs[digest] = program
+        self.programs.move_to_end(digest)
+        while len(self.programs) > self.capacity:
+            evicted = next((key for key, cached in self.programs.items() if cached not in self.pins), None)
+            if evicted is None:
+                break
+            gl_resources.delete_program(self.programs.pop(evicted))
+        self.remember(digest)
+
+    def remember(self, digest):
+        if digest in self.history:
+            return
+        self.history[digest] = None
+        self.history_changed = True
+        while len(self.history) > HISTORY_LIMIT:
+            self.history.popitem(last=False)
+
+    def save_history(self):
+        # Rewrites the file with the bounded history; called on shutdown,
+        # never while compiling
+        if not self.history_path or not self.history_changed:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.history_path), exist_ok=True)
+            temporary = self.history_path + ".tmp"
+            with open(temporary, "w") as file:
+                file.writelines(digest + "\n" for digest in self.history)
+            os.replace(temporary, self.history_path)
+            self.history_changed = False
+        except OSError as e:
+            tracer.warning("Could not record shader compile history: %s", e)
+
+    def owns(self, program):
+        return program in self.programs.values()
+
+    def pin(self, program):
+        self.pins[program] = self.pins.get(program, 0) + 1
+
+    def unpin(self, program):
+        # True if the cache manages the program and will delete it itself
+        count = self.pins.get(program)
+        if count is None:
+            return False
+        if count > 1:
+            self.pins[program] = count - 1
+        else:
+            del self.pins[program]
+        return True
+
+    def clear(self):
+        for program in self.programs.values():
+            gl_resources.delete_program(program)
+        self.programs.clear()
+        self.pins.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "lookups": lookups,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "cross_session_hits": self.cross_session_hits,
+            "cross_session_hit_rate": (self.hits + self.cross_session_hits) / lookups if lookups else 0.0,
+            "cached_programs": len(self.programs),
+        }
@@ -0,0 +1,467 @@
+# render_graph.py
+import ctypes
+import re
+import numpy as np
+from OpenGL.GL import *
+from shaders.shader_program import ShaderProgram
+from shaders.gl_resources import gl_resources
+
+PASS_DIRECTIVE = re.compile(r"^\s*//\s*@pass\s+(\w+)(.*)$")
+
+QUAD_VERTEX_SHADER = """
+#version 120
+attribute vec3 position;
+attribute vec2 texCoord;
+varying vec2 TexCoords;
+void main() {
+    gl_Position = vec4(position, 1.0);
+    TexCoords = texCoord;
+}
+"""
+
+PRESENT_FRAGMENT_SHADER = """
+#version 120
+varying vec2 TexCoords;
+uniform sampler2D texture1;
+void main() {
+    gl_FragColor = texture2D(texture1, TexCoords);
+}
+"""
+
+# Built-in uniforms a pass is re-rendered for, but only when its program
+# actually uses them (inactive uniforms report location -1)
+BUILTIN_UNIFORMS = ("resolution", "iTime", "cameraPos", "lightPos")
+
+
+class RenderTarget:
+    def __init__(self, width, height, internal_format=GL_RGBA8, owner="render target"):
+        self.width = width
+        self.height = height
+        self.internal_format = internal_format
+        self.texture = gl_resources.gen_texture(owner)
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        pixel_type = GL_FLOAT if internal_format in (GL_RGBA16F, GL_RGBA32F) else GL_UNSIGNED_BYTE
+        gl_resources.texture_image(self.texture, internal_format, width, height, GL_RGBA, pixel_type, None)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+        self.fbo = gl_resources.gen_framebuffer(owner)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, self.texture, 0)
+        status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        if status != GL_FRAMEBUFFER_COMPLETE:
+            self.release()
+            raise RuntimeError(f"Framebuffer incomplete: 0x{status:x}")
+
+    def bind(self):
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glViewport(0, 0, self.width, self.height)
+
+    def release(self):
+        if self.fbo:
+            gl_resources.delete_framebuffer(self.fbo)
+            self.fbo = None
+        if self.texture:
+            gl_resources.delete_texture(self.texture)
+            self.texture = None
+
+
+class RenderPass:
+    def __init__(self, name, fragment_source, inputs=None, uniforms=None, feedback=False, scale=1.0,
+                 internal_format=GL_RGBA8):
+        self.name = name
+        self.fragment_source = fragment_source
+        # sampler uniform name -> pass name; a pass naming itself reads its
+        # previous frame, which makes it a ping-pong (feedback) pass
+        self.inputs = dict(inputs or {})
+        self.uniforms = dict(uniforms or {})
+        self.feedback = feedback or name in self.inputs.values()
+        self.scale = scale
+        self.internal_format = internal_format
+        self.program = None
+        self.targets = []
+        self.active_builtins = ()
+        self.cache_key = None
+        self.version = 0
+        self.executions = 0
+        self.skips = 0
+
+    def output_target(self):
+        return self.targets[0] if self.targets else None
+
+    def previous_target(self):
+        return self.targets[1] if self.feedback and len(self.targets) > 1 else self.output_target()
+
+    def time_dependent(self):
+        return self.feedback or "iTime" in self.active_builtins
+
+    def invalidate(self):
+        self.cache_key = None
+
+    def release(self):
+        for target in self.targets:
+            target.release()
+        self.targets = []
+        if self.program:
+            self.program.release()
+        self.program = None
+        self.invalidate()
+
+
+class RenderGraph:
+    def __init__(self, owner="render graph"):
+        self.owner = owner
+        self.passes = {}
+        self.order = []
+        self.output = None
+        self.width = 0
+        self.height = 0
+        self.vbo = None
+        self.present_program = None
+        # sampler uniform name -> texture made outside the graph (an image)
+        self.textures = {}
+
+    def add_pass(self, name, fragment_source, inputs=None, uniforms=None, feedback=False, scale=1.0,
+                 internal_format=GL_RGBA8):
+        if name in self.passes:
+            self.remove_pass(name)
+        render_pass = RenderPass(name, fragment_source, inputs, uniforms, feedback, scale, internal_format)
+        self.passes[name] = render_pass
+        self.output = name
+        self.order = []
+        return render_pass
+
+    def remove_pass(self, name):
+        render_pass = self.passes.pop(name)
+        render_pass.release()
+        if self.output == name:
+            self.output = next(reversed(self.passes), None)
+        self.order = []
+
+    def sync_passes(self, pass_specs):
+        # Rebuilds the graph from (name, source, inputs, feedback, scale,
+        # internal_format) tuples, keeping the passes that are unchanged along
+        # with their cached output; returns the names of the kept passes.
+        # New and changed passes are compiled first: if one fails the graph
+        # is left as it was and the error raised.
+        kept = []
+        created = {}
+        try:
+            for name, source, inputs, feedback, scale, internal_format in pass_specs:
+                render_pass = self.passes.get(name)
+                if render_pass and (render_pass.fragment_source, render_pass.inputs, render_pass.feedback,
+                                    render_pass.scale, render_pass.internal_format) == \
+                        (source, dict(inputs or {}), feedback or name in (inputs or {}).values(), scale,
+                         internal_format):
+                    kept.append(name)
+                    continue
+                if name in created:
+                    created.pop(name).release()
+                render_pass = RenderPass(name, source, inputs, feedback=feedback, scale=scale,
+                                         internal_format=internal_format)
+                created[name] = render_pass
+                self.compile_pass(render_pass)
+            names = [spec[0] for spec in pass_specs]
+            passes = {name: created[name] if name in created else self.passes[name] for name in names}
+            pass_order(passes)
+        except (RuntimeError, ValueError):
+            for render_pass in created.values():
+                render_pass.release()
+            raise
+
+        replaced = set(created)
+        for name, render_pass in self.passes.items():
+            if name in created or name not in passes:
+                render_pass.release()
+                replaced.add(name)
+        # The last pass is the output
+        self.passes = passes
+        self.output = names[-1] if names else None
+        self.order = []
+        for name in kept:
+            # A new upstream pass restarts its version count, so the cache key
+            # of a kept reader can't be trusted
+            if replaced & set(self.passes[name].inputs.values()):
+                self.passes[name].invalidate()
+        return kept
+
+    def set_output(self, name):
+        self.output = name
+
+    def set_source(self, name, fragment_source):
+        render_pass = self.passes[name]
+        render_pass.fragment_source = fragment_source
+        if render_pass.program:
+            render_pass.program.compile(QUAD_VERTEX_SHADER, fragment_source)
+            render_pass.active_builtins = self.active_builtins(render_pass)
+        render_pass.invalidate()
+
+    def set_texture(self, sampler, texture):
+        # Texture names get reused after a delete, so setting one always
+        # re-renders the passes that sample it
+        self.textures[sampler] = texture
+        for render_pass in self.passes.values():
+            if re.search(rf"\b{sampler}\b", render_pass.fragment_source):
+                render_pass.invalidate()
+
+    def set_uniform(self, name, uniform, value):
+        self.passes[name].uniforms[uniform] = value
+
+    def resize(self, width, height):
+        if (width, height) == (self.width, self.height):
+            return
+        self.width = width
+        self.height = height
+        for render_pass in self.passes.values():
+            for target in render_pass.targets:
+                target.release()
+            render_pass.targets = []
+            render_pass.invalidate()
+
+    def execution_order(self):
+        if not self.order:
+            self.order = pass_order(self.passes)
+        return self.order
+
+    def active_builtins(self, render_pass):
+        program = render_pass.program.program
+        return tuple(name for name in BUILTIN_UNIFORMS if glGetUniformLocation(program, name) != -1)
+
+    def compile_pass(self, render_pass):
+        render_pass.program = ShaderProgram(QUAD_VERTEX_SHADER, render_pass.fragment_source,
+                                            owner=f"{self.owner}: {render_pass.name}")
+        render_pass.active_builtins = self.active_builtins(render_pass)
+
+    def prepare_pass(self, render_pass):
+        if render_pass.program is None:
+            self.compile_pass(render_pass)
+        width = max(1, int(self.width * render_pass.scale))
+        height = max(1, int(self.height * render_pass.scale))
+        if not render_pass.targets:
+            count = 2 if render_pass.feedback else 1
+            render_pass.targets = [RenderTarget(width, height, render_pass.internal_format, f"{self.owner}: {render_pass.name}")
+                                   for _ in range(count)]
+            render_pass.invalidate()
+
+    def pass_key(self, render_pass, builtins):
+        upstream = tuple((source, self.passes[source].version) for source in sorted(render_pass.inputs.values())
+                         if source != render_pass.name)
+        used = tuple((name, self.freeze(builtins.get(name))) for name in render_pass.active_builtins)
+        uniforms = tuple(sorted((name, self.freeze(value)) for name, value in render_pass.uniforms.items()))
+        return (render_pass.fragment_source, used, uniforms, upstream)
+
+    def freeze(self, value):
+        if isinstance(value, np.ndarray):
+            return tuple(value.tolist())
+        if isinstance(value, list):
+            return tuple(value)
+        return value
+
+    def render(self, builtins, screen_fbo=0):
+        # builtins: values for resolution, iTime, cameraPos, lightPos
+        self.ensure_quad()
+        for name in self.execution_order():
+            render_pass = self.passes[name]
+            self.prepare_pass(render_pass)
+            key = self.pass_key(render_pass, builtins)
+            # Feedback passes read their own last frame, so they always advance
+            if key == render_pass.cache_key and not render_pass.feedback:
+                render_pass.skips += 1
+                continue
+            self.execute_pass(render_pass, builtins)
+            render_pass.cache_key = key
+            render_pass.version += 1
+            render_pass.executions += 1
+        glBindFramebuffer(GL_FRAMEBUFFER, screen_fbo)
+
+    def execute_pass(self, render_pass, builtins):
+        if render_pass.feedback:
+            # Ping-pong: last frame's output becomes this frame's input
+            render_pass.targets.reverse()
+        target = render_pass.output_target()
+        target.bind()
+        glDisable(GL_DEPTH_TEST)
+        glClear(GL_COLOR_BUFFER_BIT)
+        program = render_pass.program.program
+        glUseProgram(program)
+
+        for name in render_pass.active_builtins:
+            value = (target.width, target.height) if name == "resolution" else builtins.get(name)
+            if value is not None:
+                self.upload_uniform(glGetUniformLocation(program, name), value)
+        for name, value in render_pass.uniforms.items():
+            self.upload_uniform(glGetUniformLocation(program, name), value)
+
+        unit = 0
+        for sampler, source in render_pass.inputs.items():
+            location = glGetUniformLocation(program, sampler)
+            if location == -1:
+                continue
+            source_pass = self.passes[source]
+            source_target = source_pass.previous_target() if source == render_pass.name else source_pass.output_target()
+            glActiveTexture(GL_TEXTURE0 + unit)
+            glBindTexture(GL_TEXTURE_2D, source_target.texture)
+            glUniform1i(location, unit)
+            unit += 1
+        for sampler, texture in self.textures.items():
+            location = glGetUniformLocation(program, sampler)
+            if location == -1 or sampler in render_pass.inputs:
+                continue
+            glActiveTexture(GL_TEXTURE0 + unit)
+            glBindTexture(GL_TEXTURE_2D, texture)
+            glUniform1i(location, unit)
+            unit += 1
+
+        self.draw_quad()
+        for index in range(unit):
+            glActiveTexture(GL_TEXTURE0 + index)
+            glBindTexture(GL_TEXTURE_2D, 0)
+        glActiveTexture(GL_TEXTURE0)
+        glEnable(GL_DEPTH_TEST)
+
+    def upload_uniform(self, location, value):
+        if location == -1:
+            return
+        if isinstance(value, int):
+            glUniform1i(location, value)
+        elif isinstance(value, float):
+            glUniform1f(location, value)
+        else:
+            value = [float(v) for v in value]
+            [glUniform1f, glUniform2f, glUniform3f, glUniform4f][len(value) - 1](location, *value)
+
+    def output_texture(self):
+        if self.output is None or self.output not in self.passes:
+            return None
+        target = self.passes[self.output].output_target()
+        return target.texture if target else None
+
+    def present(self, width, height, screen_fbo=0):
+        texture = self.output_texture()
+        if texture is None:
+            return
+        if self.present_program is None:
+            self.present_program = ShaderProgram(QUAD_VERTEX_SHADER, PRESENT_FRAGMENT_SHADER, owner=self.owner)
+        glBindFramebuffer(GL_FRAMEBUFFER, screen_fbo)
+        glViewport(0, 0, width, height)
+        self.present_program.use()
+        glActiveTexture(GL_TEXTURE0)
+        glBindTexture(GL_TEXTURE_2D, texture)
+        glUniform1i(glGetUniformLocation(self.present_program.program, "texture1"), 0)
+        self.draw_quad()
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+    def ensure_quad(self):
+        if self.vbo is not None:
+            return
+        # Triangle strip with interleaved position (xyz) and texCoord (uv)
+        vertices = np.array([
+            -1.0, -1.0, 0.0, 0.0, 0.0,
+             1.0, -1.0, 0.0, 1.0, 0.0,
+            -1.0,  1.0, 0.0, 0.0, 1.0,
+             1.0,  1.0, 0.0, 1.0, 1.0,
+        ], dtype=np.float32)
+        self.vbo = gl_resources.gen_buffer(self.owner)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        gl_resources.buffer_data(GL_ARRAY_BUFFER, self.vbo, vertices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def draw_quad(self):
+        self.ensure_quad()
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        glEnableVertexAttribArray(0)
+        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 5 * 4, ctypes.c_void_p(0))
+        glEnableVertexAttribArray(1)
+        glVertexAttribPointer(1, 2, GL_FLOAT, GL_FALSE, 5 * 4, ctypes.c_void_p(3 * 4))
+        glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
+        glDisableVertexAttribArray(0)
+        glDisableVertexAttribArray(1)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def stats(self):
+        return {name: {"executions": p.executions, "skips": p.skips, "time_dependent": p.time_dependent()}
+                for name, p in self.passes.items()}
+
+    def release(self):
+        for render_pass in self.passes.values():
+            render_pass.release()
+        if self.vbo is not None:
+            gl_resources.delete_buffer(self.vbo)
+            self.vbo = None
+        if self.present_program:
+            self.present_program.release()
+        self.present_program = None
+
+
+def pass_order(passes):
+    # Pass names with every pass after the ones it reads; raises
+    # RuntimeError for a cycle or an input naming no pass
+    order = []
+    state = {}
+
+    def visit(name):
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise RuntimeError(f"Render graph has a cycle through pass '{name}'")
+        state[name] = "visiting"
+        for source in passes[name].inputs.values():
+            if source != name:
+                if source not in passes:
+                    raise RuntimeError(f"Pass '{name}' reads unknown pass '{source}'")
+                visit(source)
+        state[name] = "done"
+        order.append(name)
+
+    for name in passes:
+        visit(name)
+    return order
+
+
+def is_multipass_source(source):
+    return any(PASS_DIRECTIVE.match(line) for line in source.splitlines())
+
+
+def parse_multipass_source(source):
+    # Splits "// @pass name [sampler=pass ...] [feedback] [scale=0.5] [float]"
+    # sections into (name, fragment_source, inputs, feedback, scale,
+    # internal_format) tuples; float passes render to half floats
+    passes = []
+    current = None
+    for line_number, line in enumerate(source.splitlines(), 1):
+        match = PASS_DIRECTIVE.match(line)
+        if match:
+            name, options = match.group(1), match.group(2).split()
+            current = {"name": name, "lines": [], "inputs": {}, "feedback": False, "scale": 1.0,
+                       "internal_format": GL_RGBA8}
+            for option in options:
+                if option == "feedback":
+                    current["feedback"] = True
+                elif option == "float":
+                    current["internal_format"] = GL_RGBA16F
+                elif option.startswith("scale="):
+                    current["scale"] = parse_scale(option.split("=", 1)[1], line_number)
+                elif "=" in option:
+                    sampler, source_pass = option.split("=", 1)
+                    current["inputs"][sampler] = source_pass
+            passes.append(current)
+        elif current is not None:
+            current["lines"].append(line)
+    return [(p["name"], "\n".join(p["lines"]), p["inputs"], p["feedback"], p["scale"], p["internal_format"])
+            for p in passes]
+
+
+def parse_scale(value, line_number):
+    # Half-typed options are common while editing, so they're compile errors
+    try:
+        scale = float(value)
+    except ValueError:
+        scale = 0.0
+    if not 0.0 < scale < float("inf"):
+        raise ValueError(f"Line {line_number}: scale must be a positive number, got '{value}'")
+    return scale
@@ -1,41 +1,111 @@
 # shader_program.py
 from OpenGL.GL import *
+from shaders.program_cache import source_digest
+from shaders.gl_resources import gl_resources
+from utils.tracing import tracer
 
 class ShaderProgram:
-    def __init__(self, vertex_shader_source, fragment_shader_source):
+    def __init__(self, vertex_shader_source, fragment_shader_source, cache=None, owner="shader program"):
         self.vertex_shader_source = vertex_shader_source
         self.fragment_shader_source = fragment_shader_source
         self.program = None
+        self.cache = cache
+        self.owner = owner
+        self.from_cache = False
+        self.generation = 0
+        self.uniform_names = None
         self.compile(self.vertex_shader_source, self.fragment_shader_source)
 
     def compile(self, vertex_shader_source, fragment_shader_source):
-        if self.program:
-            glDeleteProgram(self.program)
-        self.program = glCreateProgram()
-        vertex_shader = self.compile_shader(GL_VERTEX_SHADER, vertex_shader_source)
-        fragment_shader = self.compile_shader(GL_FRAGMENT_SHADER, fragment_shader_source)
-        glAttachShader(self.program, vertex_shader)
-        glAttachShader(self.program, fragment_shader)
-        glBindAttribLocation(self.program, 0, "position")
-        glBindAttribLocation(self.program, 1, "texCoord")
-        glLinkProgram(self.program)
-        if not glGetProgramiv(self.program, GL_LINK_STATUS):
-            log = glGetProgramInfoLog(self.program)
-            print("Shader linking failed:", log)
-            raise RuntimeError('Shader linking failed: ' + log.decode('utf-8'))
+        with tracer.span("ShaderProgram.compile", "gl", owner=self.owner) as span:
+            self.compile_program(vertex_shader_source, fragment_shader_source)
+            span.set(from_cache=self.from_cache)
+
+    def compile_program(self, vertex_shader_source, fragment_shader_source):
+        digest = source_digest(vertex_shader_source, fragment_shader_source)
+        cached = self.cache.lookup(digest) if self.cache else None
+        if cached is not None:
+            self.cache.pin(cached)
+            self.swap(cached, True)
+            return
+        # The previous program stays in use until this one has linked
+        program = gl_resources.create_program(self.owner)
+        try:
+            vertex_shader = self.compile_shader(GL_VERTEX_SHADER, vertex_shader_source)
+            try:
+                fragment_shader = self.compile_shader(GL_FRAGMENT_SHADER, fragment_shader_source)
+            except RuntimeError:
+                gl_resources.delete_shader(vertex_shader)
+                raise
+            glAttachShader(program, vertex_shader)
+            glAttachShader(program, fragment_shader)
+            glBindAttribLocation(program, 0, "position")
+            glBindAttribLocation(program, 1, "texCoord")
+            glBindAttribLocation(program, 2, "normal")
+            with tracer.span("link program", "gl"):
+                glLinkProgram(program)
+            # The linked program keeps its own copy of the code
+            for shader in (vertex_shader, fragment_shader):
+                glDetachShader(program, shader)
+                gl_resources.delete_shader(shader)
+            if not glGetProgramiv(program, GL_LINK_STATUS):
+                log = glGetProgramInfoLog(program)
+                tracer.error("Shader linking failed: %s", log.decode("utf-8"))
+                raise RuntimeError('Shader linking failed: ' + log.decode('utf-8'))
+        except RuntimeError:
+            gl_resources.delete_program(program)
+            raise
+        gl_resources.set_program_bytes(program)
+        if self.cache:
+            self.cache.pin(program)
+            self.cache.store(digest, program)
+        self.swap(program, False)
+
+    def swap(self, program, from_cache):
+        if program != self.program:
+            self.release()
+        elif self.cache:
+            # Recompiling to the program already in use pinned it twice
+            self.cache.unpin(program)
+        self.program = program
+        self.from_cache = from_cache
+        self.generation += 1
+        self.uniform_names = None
+
+    def release(self):
+        # Cached programs belong to the cache, which only evicts them once
+        # they're unpinned here
+        if self.program and not (self.cache and self.cache.unpin(self.program)):
+            gl_resources.delete_program(self.program)
+        self.program = None
 
     def compile_shader(self, shader_type, source):
-        shader = glCreateShader(shader_type)
+        shader = gl_resources.create_shader(shader_type, self.owner)
         glShaderSource(shader, source)
-        glCompileShader(shader)
+        with tracer.span("compile vertex shader" if shader_type == GL_VERTEX_SHADER else "compile fragment shader",
+                         "gl"):
+            glCompileShader(shader)
         if not glGetShaderiv(shader, GL_COMPILE_STATUS):
             log = glGetShaderInfoLog(shader)
-            print("Shader compilation failed:", log)
+            gl_resources.delete_shader(shader)
+            tracer.error("Shader compilation failed: %s", log.decode("utf-8"))
             raise RuntimeError('Shader compilation failed: ' + log.decode('utf-8'))
         return shader
 
+    def active_uniforms(self):
+        # Uniforms the linker kept; anything optimised out can't affect the image
+        if self.uniform_names is None:
+            names = set()
+            if self.program:
+                for index in range(glGetProgramiv(self.program, GL_ACTIVE_UNIFORMS)):
+                    name, _, _ = glGetActiveUniform(self.program, index)
+                    name = name.decode('utf-8') if isinstance(name, bytes) else name
+                    names.add(name.split('[')[0])
+            self.uniform_names = names
+        return self.uniform_names
+
     def use(self):
         if self.program:
             glUseProgram(self.program)
         else:
-            print("Shader program is not compiled properly.")
+            tracer.warning("Shader program is not compiled properly.")
@@ -1,4 +1,47 @@
 # shader_utils.py
+import os
+import re
+
+
 def load_shader_source(file_path):
     with open(file_path, 'r') as file:
         return file.read()
+
+
+def clean_shader_code(shader_source):
+    # Ensures a single #version line, and that it comes first
+    shader_source = shader_source.strip()
+
+    if not shader_source.startswith("#version"):
+        shader_source = "#version 120\n" + shader_source
+
+    lines = shader_source.split('\n')
+    cleaned_lines = [lines[0]]
+
+    for line in lines[1:]:
+        if not line.strip().startswith("#version"):
+            cleaned_lines.append(line)
+
+    return '\n'.join(cleaned_lines)
+
+
+INCLUDE_PATTERN = re.compile(r'^[ \t]*#[ \t]*include[ \t]+"([^"]+)"[ \t]*$', re.MULTILINE)
+
+
+def load_shader_source_with_includes(file_path):
+    # Expands #include "file" lines (relative to the including file) and
+    # returns the source with every file it was built from
+    files = []
+
+    def expand(path, stack):
+        path = os.path.abspath(path)
+        if path in stack:
+            raise ValueError(f"Circular #include of {path}")
+        if path not in files:
+            files.append(path)
+        source = load_shader_source(path)
+        directory = os.path.dirname(path)
+        return INCLUDE_PATTERN.sub(lambda match: expand(os.path.join(directory, match.group(1)), stack + [path]),
+                                   source)
+
+    return expand(file_path, []), files
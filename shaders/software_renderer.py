@@ -0,0 +1,194 @@
+# software_renderer.py
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from shaders.glsl_numpy import CompiledShader, FLOAT
+from shaders.shader_utils import clean_shader_code
+from utils.tracing import tracer
+
+# Tiles are bands of rows of about this many pixels: large enough that
+# NumPy's per-call overhead disappears, small enough to balance the workers
+TILE_PIXELS = 32768
+# Same as render_graph's, which can't be imported without PyOpenGL
+PASS_DIRECTIVE = re.compile(r"^\s*//\s*@pass\s+(\w+)(.*)$", re.MULTILINE)
+
+
+def shade_rows(shader, width, height, first_row, last_row, uniforms, textures):
+    # GL rows first_row..last_row - 1 (row 0 at the bottom) as RGBA8, top row first
+    rows = last_row - first_row
+    ys, xs = np.mgrid[last_row - 1:first_row - 1:-1, 0:width]
+    frag_coord = np.empty((rows * width, 4), dtype=FLOAT)
+    frag_coord[:, 0] = xs.ravel() + 0.5
+    frag_coord[:, 1] = ys.ravel() + 0.5
+    frag_coord[:, 2] = 0.5
+    frag_coord[:, 3] = 1.0
+    color = np.nan_to_num(shader.shade(frag_coord, (width, height), uniforms, textures))
+    return (np.clip(color, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8).reshape(rows, width, 4)
+
+
+def shared_array(prefix, shape):
+    # A file in shared memory where there is some (/dev/shm), mapped as an array
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    file = tempfile.NamedTemporaryFile(prefix=prefix, dir=directory, delete=False)
+    file.close()
+    return file.name, np.memmap(file.name, dtype=np.uint8, mode="w+", shape=shape)
+
+
+# Each worker keeps its translated shaders and its mappings of the frame and
+# textures, so a tile only carries the source text and the uniforms
+_worker_shaders = {}
+_worker_frame = [None, None]
+_worker_textures = {}
+
+
+def render_tile(source, frame_path, frame_shape, first_row, last_row, uniforms, texture_files):
+    start = time.perf_counter()
+    shader = _worker_shaders.get(source)
+    if shader is None:
+        if len(_worker_shaders) > 4:
+            _worker_shaders.clear()
+        shader = _worker_shaders[source] = CompiledShader(source)
+    if _worker_frame[0] != frame_path:
+        _worker_frame[:] = [frame_path, np.memmap(frame_path, dtype=np.uint8, mode="r+", shape=frame_shape)]
+    textures = {}
+    for path in set(_worker_textures) - {path for path, _ in texture_files.values()}:
+        del _worker_textures[path]
+    for sampler, (path, shape) in texture_files.items():
+        if path not in _worker_textures:
+            _worker_textures[path] = np.memmap(path, dtype=np.uint8, mode="r", shape=shape).astype(FLOAT) / 255.0
+        textures[sampler] = _worker_textures[path]
+    height, width = frame_shape[:2]
+    _worker_frame[1][height - last_row:height - first_row] = shade_rows(shader, width, height, first_row, last_row,
+                                                                        uniforms, textures)
+    return time.perf_counter() - start
+
+
+class SoftwareRenderer:
+    # CPU fallback for hosts without a usable OpenGL. compile_shaders() has
+    # the viewport's interface and render() returns a frame as RGBA8, top row
+    # first. Bands of rows are shaded by a process pool straight into a frame
+    # in shared memory; workers=0 shades in this process.
+    def __init__(self, workers=None):
+        self.workers = max(1, (os.cpu_count() or 2) - 1) if workers is None else workers
+        self.shader = None
+        self.shader_source = None
+        self.custom_uniforms = {}
+        # One image read by every sampler2D, like the viewport's texture unit 0
+        self.texture = None
+        self.texture_file = None
+        self.float_texture = None
+        self.pool = None
+        self.frame_path = None
+        self.frame = None
+        self.stats = {}
+
+    def compile_shaders(self, shader_source, is_3d=False):
+        if is_3d:
+            return False, "The software renderer only draws 2D shaders on the fullscreen quad."
+        if PASS_DIRECTIVE.search(shader_source):
+            return False, "Multi-pass shaders need OpenGL; the software renderer draws a single pass."
+        source = clean_shader_code(shader_source)
+        try:
+            shader = CompiledShader(source)
+        except RuntimeError as e:
+            return False, "Shader compilation failed: " + str(e)
+        self.shader = shader
+        self.shader_source = source
+        return True, "Shader translated for the software renderer."
+
+    def is_animated(self):
+        return self.shader is not None and "iTime" in self.shader.uniforms
+
+    def set_uniform_value(self, name, value):
+        self.custom_uniforms[name] = value
+
+    def set_texture(self, pixels):
+        # pixels: (height, width, 4) uint8 with row 0 at t = 0, or None for white
+        self.texture = None if pixels is None else np.ascontiguousarray(pixels, dtype=np.uint8)
+        self.float_texture = None
+        if self.texture_file:
+            os.unlink(self.texture_file[0])
+            self.texture_file = None
+
+    def textures(self):
+        if self.texture is None:
+            return {}
+        if self.float_texture is None:
+            self.float_texture = self.texture.astype(FLOAT) / 255.0
+        return {name: self.float_texture for name, type_name in self.shader.uniforms.items()
+                if type_name == "sampler2D"}
+
+    def texture_files(self):
+        if self.texture is None:
+            return {}
+        if self.texture_file is None:
+            path, mapped = shared_array("shader-software-texture-", self.texture.shape)
+            mapped[:] = self.texture
+            mapped.flush()
+            del mapped
+            self.texture_file = (path, self.texture.shape)
+        return {name: self.texture_file for name, type_name in self.shader.uniforms.items()
+                if type_name == "sampler2D"}
+
+    def tile_rows(self, width, height):
+        rows = max(1, TILE_PIXELS // max(1, width))
+        # At least a few tiles per worker: rows cost very different amounts
+        return max(1, min(rows, -(-height // (max(1, self.workers) * 4))))
+
+    @tracer.traced("SoftwareRenderer.render", "render")
+    def render(self, width, height, builtins=None):
+        if self.shader is None:
+            raise RuntimeError("No shader compiled")
+        start = time.perf_counter()
+        uniforms = dict(self.custom_uniforms)
+        uniforms.update(builtins or {})
+        uniforms.setdefault("resolution", (width, height))
+        rows = self.tile_rows(width, height)
+        bands = [(first, min(first + rows, height)) for first in range(0, height, rows)]
+        busy = 0.0
+        if self.workers == 0:
+            pixels = np.empty((height, width, 4), dtype=np.uint8)
+            textures = self.textures()
+            for first, last in bands:
+                tile_start = time.perf_counter()
+                pixels[height - last:height - first] = shade_rows(self.shader, width, height, first, last, uniforms,
+                                                                  textures)
+                busy += time.perf_counter() - tile_start
+        else:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            if self.frame is None or self.frame.shape != (height, width, 4):
+                self.release_frame()
+                self.frame_path, self.frame = shared_array("shader-software-frame-", (height, width, 4))
+            texture_files = self.texture_files()
+            futures = [self.pool.submit(render_tile, self.shader_source, self.frame_path, (height, width, 4),
+                                        first, last, uniforms, texture_files) for first, last in bands]
+            busy = sum(future.result() for future in futures)
+            pixels = np.array(self.frame)
+        elapsed = time.perf_counter() - start
+        self.stats = {"width": width, "height": height, "tiles": len(bands), "workers": self.workers,
+                      "ms": elapsed * 1000.0, "utilisation": busy / (elapsed * max(1, self.workers))}
+        return pixels
+
+    def release_frame(self):
+        if self.frame is not None:
+            del self.frame
+            self.frame = None
+            os.unlink(self.frame_path)
+            self.frame_path = None
+
+    def release(self):
+        if self.pool:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            self.pool = None
+        self.release_frame()
+        self.set_texture(None)
+
+
+def format_software_stats(stats):
+    return (f"{stats['width']}x{stats['height']} in {stats['ms']:.1f} ms on the CPU: {stats['tiles']} tiles, "
+            f"{stats['workers'] or 'no'} worker process(es), {stats['utilisation'] * 100:.0f}% busy")
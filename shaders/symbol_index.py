@@ -0,0 +1,318 @@
+# symbol_index.py
+import re
+import textdistance
+
+GLSL_TYPES = (
+    "void", "bool", "int", "float", "vec2", "vec3", "vec4", "bvec2", "bvec3", "bvec4", "ivec2", "ivec3", "ivec4",
+    "mat2", "mat3", "mat4", "sampler1D", "sampler2D", "sampler3D", "samplerCube", "sampler2DShadow",
+)
+GLSL_KEYWORDS = (
+    "attribute", "const", "uniform", "varying", "break", "continue", "do", "for", "while", "if", "else", "in",
+    "out", "inout", "true", "false", "lowp", "mediump", "highp", "precision", "struct", "discard", "return",
+    "invariant", "centroid",
+)
+GLSL_FUNCTIONS = {
+    "radians": "genType radians(genType degrees)", "degrees": "genType degrees(genType radians)",
+    "sin": "genType sin(genType angle)", "cos": "genType cos(genType angle)", "tan": "genType tan(genType angle)",
+    "asin": "genType asin(genType x)", "acos": "genType acos(genType x)",
+    "atan": "genType atan(genType y, genType x)", "pow": "genType pow(genType x, genType y)",
+    "exp": "genType exp(genType x)", "log": "genType log(genType x)", "exp2": "genType exp2(genType x)",
+    "log2": "genType log2(genType x)", "sqrt": "genType sqrt(genType x)",
+    "inversesqrt": "genType inversesqrt(genType x)", "abs": "genType abs(genType x)",
+    "sign": "genType sign(genType x)", "floor": "genType floor(genType x)", "ceil": "genType ceil(genType x)",
+    "fract": "genType fract(genType x)", "mod": "genType mod(genType x, genType y)",
+    "min": "genType min(genType x, genType y)", "max": "genType max(genType x, genType y)",
+    "clamp": "genType clamp(genType x, genType minVal, genType maxVal)",
+    "mix": "genType mix(genType x, genType y, genType a)", "step": "genType step(genType edge, genType x)",
+    "smoothstep": "genType smoothstep(genType edge0, genType edge1, genType x)",
+    "length": "float length(genType x)", "distance": "float distance(genType p0, genType p1)",
+    "dot": "float dot(genType x, genType y)", "cross": "vec3 cross(vec3 x, vec3 y)",
+    "normalize": "genType normalize(genType x)", "faceforward": "genType faceforward(genType N, genType I, genType Nref)",
+    "reflect": "genType reflect(genType I, genType N)", "refract": "genType refract(genType I, genType N, float eta)",
+    "matrixCompMult": "mat matrixCompMult(mat x, mat y)", "outerProduct": "mat outerProduct(vec c, vec r)",
+    "transpose": "mat transpose(mat m)", "lessThan": "bvec lessThan(vec x, vec y)",
+    "lessThanEqual": "bvec lessThanEqual(vec x, vec y)", "greaterThan": "bvec greaterThan(vec x, vec y)",
+    "greaterThanEqual": "bvec greaterThanEqual(vec x, vec y)", "equal": "bvec equal(vec x, vec y)",
+    "notEqual": "bvec notEqual(vec x, vec y)", "any": "bool any(bvec x)", "all": "bool all(bvec x)",
+    "not": "bvec not(bvec x)", "texture2D": "vec4 texture2D(sampler2D sampler, vec2 coord)",
+    "texture2DProj": "vec4 texture2DProj(sampler2D sampler, vec3 coord)",
+    "texture2DLod": "vec4 texture2DLod(sampler2D sampler, vec2 coord, float lod)",
+    "textureCube": "vec4 textureCube(samplerCube sampler, vec3 coord)",
+    "texture3D": "vec4 texture3D(sampler3D sampler, vec3 coord)",
+    "dFdx": "genType dFdx(genType p)", "dFdy": "genType dFdy(genType p)", "fwidth": "genType fwidth(genType p)",
+}
+GLSL_VARIABLES = (
+    "gl_FragCoord", "gl_FragColor", "gl_FragData", "gl_FragDepth", "gl_FrontFacing", "gl_PointCoord",
+    "gl_Position", "gl_PointSize",
+)
+# Ranking: things defined in the shader first, then built-in functions and
+# variables, then types and keywords
+KIND_RANK = {"builtin function": 1, "builtin variable": 1, "type": 2, "keyword": 2}
+PRECISION = r"(?:(?:lowp|mediump|highp)\s+)?"
+
+COMMENT_PATTERN = re.compile(r"//.*|/\*.*?\*/")
+DEFINE_PATTERN = re.compile(r"^\s*#\s*define\s+([A-Za-z_]\w*)")
+STRUCT_PATTERN = re.compile(r"\bstruct\s+([A-Za-z_]\w*)")
+FUNCTION_PATTERN = re.compile(rf"^\s*{PRECISION}([A-Za-z_]\w*)\s+([A-Za-z_]\w*)\s*\(")
+DECLARATION_PATTERN = re.compile(rf"\b(?:(uniform|attribute|varying|const)\s+)?{PRECISION}([A-Za-z_]\w*)\s+"
+                                 r"([A-Za-z_]\w*)\s*(?:\[[^\]]*\]\s*)?(?=[=;,)\[]|$)")
+PARENTHESES_PATTERN = re.compile(r"\([^()]*\)")
+WORD_PATTERN = re.compile(r"[A-Za-z_]\w*")
+
+
+class TrieNode:
+    __slots__ = ("children", "count")
+
+    def __init__(self):
+        self.children = {}
+        self.count = 0  # references to the word ending here
+
+
+class Trie:
+    # Reference-counted, so a name defined on several lines stays until the
+    # last of them is removed
+    def __init__(self):
+        self.root = TrieNode()
+
+    def add(self, word):
+        node = self.root
+        for char in word:
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = TrieNode()
+            node = child
+        node.count += 1
+
+    def remove(self, word):
+        path = [self.root]
+        for char in word:
+            node = path[-1].children.get(char)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].count -= 1
+        # Prune the branch back to the last node still in use
+        for depth in range(len(word), 0, -1):
+            node = path[depth]
+            if node.count > 0 or node.children:
+                break
+            del path[depth - 1].children[word[depth - 1]]
+
+    def find(self, prefix):
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    def words(self, prefix, limit):
+        # Up to `limit` words starting with prefix, shortest first
+        start = self.find(prefix)
+        if start is None:
+            return []
+        words = []
+        level = [(prefix, start)]
+        while level and len(words) < limit:
+            next_level = []
+            for word, node in level:
+                if node.count > 0:
+                    words.append(word)
+                    if len(words) >= limit:
+                        break
+                next_level.extend((word + char, child) for char, child in node.children.items())
+            level = next_level
+        return words
+
+    def near_words(self, lowered, allowed, limit):
+        # Words with the same first letter whose start is within `allowed`
+        # edits (Damerau, ignoring case) of lowered. Walks the trie with one
+        # edit distance row per node and drops a branch as soon as every entry
+        # of its row is over the limit.
+        found = []
+        first_row = [1] + list(range(len(lowered)))  # after matching the first letter
+        stack = [(char, child, first_row, None, lowered[0]) for char, child in self.root.children.items()
+                 if char.lower() == lowered[0]]
+        while stack and len(found) < limit:
+            word, node, row, previous_row, previous_char = stack.pop()
+            for char, child in node.children.items():
+                lower = char.lower()
+                new_row = [row[0] + 1]
+                for i in range(1, len(row)):
+                    cost = lowered[i - 1] != lower
+                    value = min(new_row[i - 1] + 1, row[i] + 1, row[i - 1] + cost)
+                    if (previous_row is not None and i > 1 and lowered[i - 1] == previous_char
+                            and lowered[i - 2] == lower):
+                        value = min(value, previous_row[i - 2] + 1)
+                    new_row.append(value)
+                if new_row[-1] <= allowed:
+                    found.extend(self.words(word + char, limit - len(found)))
+                    if len(found) >= limit:
+                        break
+                elif min(new_row) <= allowed:
+                    stack.append((word + char, child, new_row, row, lower))
+        return found
+
+
+def parse_line(text, types):
+    # (name, kind, detail) for every symbol a line defines. Lines are parsed
+    # on their own, so a declaration split over lines or inside a multi-line
+    # comment can be missed or misread.
+    text = COMMENT_PATTERN.sub("", text)
+    if "/*" in text:
+        text = text[:text.index("/*")]
+    symbols = []
+    match = DEFINE_PATTERN.match(text)
+    if match:
+        return [(match.group(1), "macro", text.strip())]
+    for match in STRUCT_PATTERN.finditer(text):
+        symbols.append((match.group(1), "struct", f"struct {match.group(1)}"))
+    match = FUNCTION_PATTERN.match(text)
+    if match and (match.group(1) in types) and match.group(2) not in GLSL_FUNCTIONS:
+        signature = text.strip().rstrip("{;").strip()
+        symbols.append((match.group(2), "function", signature))
+    for match in DECLARATION_PATTERN.finditer(text):
+        qualifier, type_name, name = match.groups()
+        if type_name not in types or name in types:
+            continue
+        kind = qualifier or "variable"
+        symbols.append((name, kind, f"{qualifier + ' ' if qualifier else ''}{type_name} {name}"))
+        # The rest of a comma list: float a = f(1.0, 2.0), b; parameters are
+        # inside parentheses and are matched one by one instead
+        if text.count("(", 0, match.start()) > text.count(")", 0, match.start()):
+            continue
+        statement = text[match.end():].split(";", 1)[0]
+        previous = None
+        while previous != statement:
+            previous, statement = statement, PARENTHESES_PATTERN.sub("", statement)
+        if "(" in statement or ")" in statement:
+            continue
+        for piece in statement.split(",")[1:]:
+            extra = WORD_PATTERN.match(piece.strip())
+            if extra:
+                symbols.append((extra.group(0), kind, f"{qualifier + ' ' if qualifier else ''}{type_name} "
+                                                      f"{extra.group(0)}"))
+    return symbols
+
+
+class SymbolIndex:
+    # Symbols of one document, kept per line so an edit only reparses the
+    # lines it touched. update_lines() mirrors QTextDocument's contentsChange.
+    def __init__(self):
+        self.trie = Trie()
+        self.lines = []
+        self.texts = []  # each line's text, to reparse it when a struct changes
+        self.kinds = {}  # name -> {kind: references}
+        self.details = {}
+        self.types = set(GLSL_TYPES)
+        self.fuzzy = textdistance.DamerauLevenshtein(external=False)
+        for name in GLSL_TYPES:
+            self.add_builtin(name, "type", name)
+        for name in GLSL_KEYWORDS:
+            self.add_builtin(name, "keyword", name)
+        for name, signature in GLSL_FUNCTIONS.items():
+            self.add_builtin(name, "builtin function", signature)
+        for name in GLSL_VARIABLES:
+            self.add_builtin(name, "builtin variable", name)
+
+    def add_builtin(self, name, kind, detail):
+        self.add_symbol((name, kind, detail))
+
+    def add_symbol(self, symbol):
+        name, kind, detail = symbol
+        self.trie.add(name)
+        kinds = self.kinds.setdefault(name, {})
+        kinds[kind] = kinds.get(kind, 0) + 1
+        self.details.setdefault((name, kind), detail)
+        if kind == "struct":
+            self.types.add(name)
+
+    def remove_symbol(self, symbol):
+        name, kind, _ = symbol
+        self.trie.remove(name)
+        kinds = self.kinds[name]
+        kinds[kind] -= 1
+        if not kinds[kind]:
+            del kinds[kind]
+            del self.details[(name, kind)]
+            if kind == "struct":
+                self.types.discard(name)
+        if not kinds:
+            del self.kinds[name]
+
+    def set_text(self, text):
+        self.update_lines(0, len(self.lines), text.split("\n"))
+
+    def update_lines(self, first, removed, new_lines):
+        # Lines first..first + removed - 1 were replaced by new_lines
+        types = set(self.types)
+        for symbols in self.lines[first:first + removed]:
+            for symbol in symbols:
+                self.remove_symbol(symbol)
+        parse_types = set(self.types)
+        parsed = [parse_line(line, self.types) for line in new_lines]
+        self.lines[first:first + removed] = parsed
+        self.texts[first:first + removed] = new_lines
+        for symbols in parsed:
+            for symbol in symbols:
+                self.add_symbol(symbol)
+        # Declarations using a struct that was added or removed along the way
+        # were parsed with the wrong types; which structs a line defines
+        # doesn't depend on the types, so one more pass settles it
+        changed = (types ^ parse_types) | (parse_types ^ self.types)
+        if changed:
+            pattern = re.compile(r"\b(?:" + "|".join(map(re.escape, changed)) + r")\b")
+            numbers = [number for number, text in enumerate(self.texts) if pattern.search(text)]
+            reparsed = [parse_line(self.texts[number], self.types) for number in numbers]
+            for number, symbols in zip(numbers, reparsed):
+                for symbol in self.lines[number]:
+                    self.remove_symbol(symbol)
+                self.lines[number] = symbols
+                for symbol in symbols:
+                    self.add_symbol(symbol)
+
+    def rank(self, name):
+        return min(KIND_RANK.get(kind, 0) for kind in self.kinds[name])
+
+    def complete(self, prefix, limit=20):
+        # Names starting with prefix; if there are too few, names whose start
+        # is within a typo or two of it, ignoring case (GetDistance for getdsit)
+        if not prefix:
+            return []
+        candidates = self.trie.words(prefix, limit * 10)
+        results = sorted((name for name in candidates if name != prefix),
+                         key=lambda name: (self.rank(name), len(name), name))[:limit]
+        if len(results) < limit and len(prefix) >= 3:
+            seen = set(results) | {prefix}
+            lowered = prefix.lower()
+            scored = []
+            distances = {}  # near words mostly share their start; score each once
+            for name in self.trie.near_words(lowered, max(1, len(prefix) // 4), limit * 5):
+                if name not in seen:
+                    start = name[:len(prefix)].lower()
+                    if start not in distances:
+                        distances[start] = self.fuzzy.distance(lowered, start)
+                    scored.append((distances[start], self.rank(name), len(name), name))
+            results.extend(name for *_, name in sorted(scored)[:limit - len(results)])
+        return results
+
+    def describe(self, name):
+        # Signature or declaration of a name, for tooltips and the status bar
+        kinds = self.kinds.get(name)
+        if not kinds:
+            return None
+        kind = min(kinds, key=lambda kind: KIND_RANK.get(kind, 0))
+        return self.details[(name, kind)]
+
+    def definition(self, name, line=None):
+        # Line of the definition a use on `line` most likely refers to: the
+        # closest one above it (locals shadow globals), else the first
+        found = [number for number, symbols in enumerate(self.lines)
+                 if any(symbol[0] == name for symbol in symbols)]
+        if not found:
+            return None
+        if line is not None:
+            above = [number for number in found if number <= line]
+            if above:
+                return above[-1]
+        return found[0]
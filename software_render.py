@@ -0,0 +1,29 @@
+import argparse
+import sys
+from shaders.export_pipeline import write_png
+from shaders.shader_utils import load_shader_source_with_includes
+from shaders.software_renderer import SoftwareRenderer, format_software_stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render a frame of a shader on the CPU, without OpenGL")
+    parser.add_argument("shader", help="fragment shader (.glsl)")
+    parser.add_argument("output", help="PNG file")
+    parser.add_argument("--size", default="640x360", help="WIDTHxHEIGHT")
+    parser.add_argument("--time", type=float, default=0.0, help="iTime of the frame")
+    parser.add_argument("--workers", type=int, default=None, help="render processes; 0 renders in this process")
+    args = parser.parse_args()
+
+    width, height = (int(value) for value in args.size.lower().split("x"))
+    source, _ = load_shader_source_with_includes(args.shader)
+    renderer = SoftwareRenderer(args.workers)
+    success, message = renderer.compile_shaders(source)
+    if not success:
+        print(message)
+        sys.exit(1)
+    try:
+        pixels = renderer.render(width, height, {"iTime": args.time, "resolution": (width, height)})
+    finally:
+        renderer.release()
+    write_png(args.output, pixels)
+    print(format_software_stats(renderer.stats))
+    sys.exit(0)
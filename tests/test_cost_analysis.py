@@ -0,0 +1,15 @@
+import pytest
+
+from shaders.cost_analysis import evaluate_constant
+
+
+@pytest.mark.parametrize("expression, expected", [("2 * N", 16.0), ("-(N + 4) / 2", -6.0), ("1e3", 1000.0),
+                                                  ("1.5f", 1.5)])
+def test_constant_expressions_evaluate(expression, expected):
+    assert evaluate_constant(expression, {"N": "8"}) == expected
+
+
+@pytest.mark.parametrize("expression", ["9**9**9", "N // 2", "5 / 0", "(" * 5000 + "1" + ")" * 5000])
+def test_non_glsl_expressions_are_not_constants(expression):
+    # Refused without evaluating, so ** can't stall the analysis
+    assert evaluate_constant(expression, {"N": "8"}) is None
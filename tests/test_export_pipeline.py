@@ -0,0 +1,75 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip("OpenGL")
+
+# Picks the EGL platform, so it comes before anything importing OpenGL.GL
+from shaders.headless import HeadlessContext
+from shaders.export_pipeline import ExportPipeline
+
+SOURCE = """#version 120
+uniform float iTime;
+void main() { gl_FragColor = vec4(fract(iTime), gl_FragCoord.x / 8.0, 0.5, 1.0); }
+"""
+FRAMES = 6
+
+
+@pytest.fixture
+def context():
+    try:
+        context = HeadlessContext()
+    except Exception as e:
+        pytest.skip(f"No EGL context: {e}")
+    yield context
+    context.release()
+
+
+def pipeline(output, export_format=None):
+    return ExportPipeline(SOURCE, str(output), FRAMES, fps=4.0, width=8, height=8, export_format=export_format,
+                          workers=1, queue_depth=2)
+
+
+@pytest.mark.parametrize("name", ["clip.y4m", "clip.raw"])
+def test_resume_point_counts_whole_frames_in_the_stream(tmp_path, name):
+    export = pipeline(tmp_path / name)
+    header, frame_size = export.stream_layout()
+    assert export.resume_point(4) == 0
+    (tmp_path / name).write_bytes(header + b"\0" * (frame_size * 3 + frame_size // 2))
+    assert export.resume_point(4) == 3
+    assert export.resume_point(2) == 2
+    # Reopening drops the partial frame
+    export.open_stream(3).close()
+    assert (tmp_path / name).stat().st_size == len(header) + 3 * frame_size
+
+
+def test_resume_point_stops_at_a_missing_png(tmp_path):
+    export = pipeline(tmp_path / "frames")
+    os.makedirs(export.output)
+    for frame in (0, 1, 3):
+        open(export.frame_path(frame), "wb").close()
+    assert export.resume_point(4) == 2
+
+
+@pytest.mark.parametrize("name", ["clip.y4m", "clip.raw"])
+def test_resume_after_the_output_was_lost_or_truncated(context, tmp_path, name):
+    output = tmp_path / name
+    assert pipeline(output).run()["completed"] == FRAMES
+    expected = output.read_bytes()
+
+    # The manifest says done, but the stream is gone
+    output.unlink()
+    stats = pipeline(output).run()
+    assert stats["resumed_from"] == 0
+    assert output.read_bytes() == expected
+
+    # Cut off half way through the fourth frame
+    header, frame_size = pipeline(output).stream_layout()
+    with open(output, "r+b") as stream:
+        stream.truncate(len(header) + 3 * frame_size + frame_size // 2)
+    stats = pipeline(output).run()
+    assert stats["resumed_from"] == 3
+    assert output.read_bytes() == expected
+    with open(pipeline(output).manifest_path()) as file:
+        assert json.load(file)["completed"] == FRAMES
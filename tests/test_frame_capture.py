@@ -0,0 +1,40 @@
+import pytest
+
+pytest.importorskip("OpenGL")
+
+# Picks the EGL platform, so it comes before anything importing OpenGL.GL
+from shaders.headless import HeadlessContext
+from shaders.frame_capture import FrameRecorder, FrameReplayer
+
+# Red encodes the frame's iTime, so each read back frame can be identified
+SOURCE = """#version 120
+uniform float iTime;
+void main() { gl_FragColor = vec4(iTime / 255.0, 0.0, 0.0, 1.0); }
+"""
+
+
+@pytest.fixture
+def context():
+    try:
+        context = HeadlessContext()
+    except Exception as e:
+        pytest.skip(f"No EGL context: {e}")
+    yield context
+    context.release()
+
+
+def test_on_frame_gets_the_frame_index(context, tmp_path):
+    path = str(tmp_path / "capture.bin")
+    recorder = FrameRecorder(path)
+    for frame in range(12):
+        recorder.record(SOURCE, {"resolution": (4, 4), "iTime": float(frame), "cameraPos": (0.0, 0.0, 0.0),
+                                 "lightPos": (0.0, 0.0, 0.0)}, {})
+    recorder.close()
+
+    read_back = []
+    replayer = FrameReplayer(path, warmup=3, on_frame=lambda index, pixels: read_back.append((index, pixels[0, 0, 0])))
+    try:
+        replayer.replay()
+    finally:
+        replayer.release()
+    assert read_back == [(index, index) for index in range(12)]
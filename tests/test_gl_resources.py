@@ -0,0 +1,51 @@
+import pytest
+
+pytest.importorskip("OpenGL")
+
+# Picks the EGL platform, so it comes before anything importing OpenGL.GL
+from shaders.headless import HeadlessContext
+
+VERTEX = "#version 120\nattribute vec3 position;\nvoid main() { gl_Position = vec4(position, 1.0); }\n"
+FRAGMENT = "#version 120\nvoid main() {{ gl_FragColor = vec4({}.0); }}\n"
+BROKEN = "#version 120\nvoid main() {{ gl_FragColor = {}; }}\n"
+
+
+@pytest.fixture
+def context():
+    try:
+        context = HeadlessContext()
+    except Exception as e:
+        pytest.skip(f"No EGL context: {e}")
+    yield context
+    context.release()
+
+
+def live_counts(gl_resources):
+    return {kind: entry["count"] for kind, entry in gl_resources.summary()["kinds"].items()}
+
+
+def test_compiles_do_not_leak(context):
+    from shaders.gl_resources import gl_resources
+    from shaders.program_cache import ProgramCache
+    from shaders.shader_program import ShaderProgram
+
+    cache = ProgramCache(capacity=8)
+    cached = ShaderProgram(VERTEX, FRAGMENT.format(0), cache, owner="leak test")
+    uncached = ShaderProgram(VERTEX, FRAGMENT.format(0), owner="leak test")
+    baseline = None
+    for index in range(3000):
+        # New sources overflow the cache, repeats hit it, and every third fails
+        program = cached if index % 2 else uncached
+        source = BROKEN.format(index) if index % 3 == 0 else FRAGMENT.format(index % 40)
+        try:
+            program.compile(VERTEX, source)
+        except RuntimeError:
+            pass
+        if index == 100:
+            baseline = live_counts(gl_resources)
+    assert live_counts(gl_resources) == baseline
+    cached.release()
+    uncached.release()
+    cache.clear()
+    assert not gl_resources.live("leak test")
+    assert not gl_resources.live("program cache")
@@ -0,0 +1,20 @@
+import pytest
+
+pytest.importorskip("OpenGL")
+
+from shaders.heatmap import LOOP_COUNTER, instrument_shader
+
+COUNT = f"{LOOP_COUNTER} += 1.0;"
+
+
+def test_do_while_counts_its_body():
+    source = "void main() {\n    int i = 0;\n    do { i++; } while (i < 4);\n    do i++; while (i < 8);\n}\n"
+    instrumented = instrument_shader(source)
+    assert f"do {{ {COUNT} i++; }} while (i < 4);" in instrumented
+    assert f"do {{ {COUNT} i++; }} while (i < 8);" in instrumented
+    assert instrumented.count(COUNT) == 2
+
+
+def test_while_after_a_block_is_still_a_loop():
+    instrumented = instrument_shader("void main() {\n    int i = 0;\n    if (i > 0) {} while (i < 4) { i++; }\n}\n")
+    assert f"while (i < 4) {{ {COUNT} i++; }}" in instrumented
@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+QtWidgets = pytest.importorskip("PySide6.QtWidgets")
+pytest.importorskip("NodeGraphQt")
+
+from PySide6 import QtCore
+
+from ui.main_window import MainWindow
+
+
+def process_events(app, rounds=20):
+    for _ in range(rounds):
+        app.processEvents()
+        QtCore.QThread.msleep(5)
+
+
+def test_startup_leaves_the_code_editor_unbuilt(monkeypatch):
+    # The software viewport keeps this test free of a GL context
+    monkeypatch.setenv("SHADER_EDITOR_SOFTWARE_RENDERER", "1")
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    window = MainWindow()
+    window.show()
+    process_events(app)
+    assert window.node_editor_tab.is_built()
+    assert not window.code_editor_tab.is_built()
+    # Opening it shows the code the node editor generated meanwhile
+    code = window.pending_code
+    window.tabs.setCurrentWidget(window.code_editor_tab)
+    process_events(app)
+    assert window.code_editor.get_code() == code
+    window.close()
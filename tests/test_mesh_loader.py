@@ -0,0 +1,137 @@
+import os
+import struct
+
+import numpy as np
+import pytest
+
+from shaders.mesh_loader import cache_path, load_mesh
+
+SQUARE = "v 0 0 0\nv 1 0 0\nv 1 1 0\nv 0 1 0\n"
+
+
+def write(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_bytes(content.encode("ascii") if isinstance(content, str) else content)
+    return str(path)
+
+
+def triangles(mesh):
+    # Each triangle as a tuple of corner positions
+    corners = mesh.vertices[mesh.indices.astype(np.int64), :3].reshape(-1, 3, 3)
+    return [tuple(map(tuple, triangle.tolist())) for triangle in corners]
+
+
+def test_quads_and_polygons_are_fanned(tmp_path):
+    mesh = load_mesh(write(tmp_path, "fan.obj", SQUARE + "v 0.5 1.5 0\nf 1 2 3 4\nf 1 2 3 5 4\n"), use_cache=False)
+    assert mesh.triangle_count() == 2 + 3
+    assert triangles(mesh)[:2] == [((0, 0, 0), (1, 0, 0), (1, 1, 0)), ((0, 0, 0), (1, 1, 0), (0, 1, 0))]
+    assert len(mesh.vertices) == 5
+    # No normals in the file, so they're smoothed from the faces
+    assert np.allclose(mesh.vertices[:, 3:6], (0, 0, 1))
+
+
+def test_negative_indices_count_back_from_the_face(tmp_path):
+    relative = SQUARE + "f -4 -3 -2 -1\nv 5 5 5\nf -5 -4 -3\n"
+    absolute = SQUARE + "f 1 2 3 4\nv 5 5 5\nf 1 2 3\n"
+    assert (triangles(load_mesh(write(tmp_path, "relative.obj", relative), use_cache=False))
+            == triangles(load_mesh(write(tmp_path, "absolute.obj", absolute), use_cache=False)))
+
+
+def test_position_and_normal_layout(tmp_path):
+    mesh = load_mesh(write(tmp_path, "normals.obj", SQUARE + "vn 0 0 -1\nf 1//1 2//1 3//1 4//1\n"),
+                     use_cache=False)
+    assert mesh.triangle_count() == 2
+    assert np.allclose(mesh.vertices[:, 3:6], (0, 0, -1))
+    assert np.allclose(mesh.vertices[:, 6:8], 0)
+
+
+def test_full_layout_splits_vertices_with_different_attributes(tmp_path):
+    content = SQUARE + "vt 0 0\nvt 1 0\nvt 1 1\nvt 0 1\nvt 0.5 0.5\nvn 0 0 1\n" \
+                       "f 1/1/1 2/2/1 3/3/1\nf 1/5/1 3/3/1 4/4/1\n"
+    mesh = load_mesh(write(tmp_path, "full.obj", content), use_cache=False)
+    assert mesh.triangle_count() == 2
+    # Position 1 is used with two texture coordinates, so it becomes two vertices
+    assert len(mesh.vertices) == 5
+    corners = mesh.vertices[mesh.indices.astype(np.int64)]
+    assert np.allclose(corners[:, 6:8], [(0, 0), (1, 0), (1, 1), (0.5, 0.5), (1, 1), (0, 1)])
+    assert np.allclose(corners[:, 3:6], (0, 0, 1))
+
+
+@pytest.mark.parametrize("content, message", [
+    (SQUARE.replace("v 1 1 0", "v 1 x 0") + "f 1 2 3\n", "Malformed number"),
+    (SQUARE + "f 1 2 3\nf 1 2 z\n", "Malformed number"),
+    (SQUARE + "f 1 2 9\n", "doesn't exist"),
+    (SQUARE + "f 1 2 3\nf 1/1 2/1 3/1\n", "mix index formats"),
+    (SQUARE + "f 1/1 2/1 3/1\n", "doesn't have"),
+    ("v 0 0\nf 1 1 1\n", "fewer than 3 values"),
+    (SQUARE, "no vertices or no faces"),
+])
+def test_malformed_obj_is_a_value_error(tmp_path, content, message):
+    with pytest.raises(ValueError, match=message):
+        load_mesh(write(tmp_path, "broken.obj", content), use_cache=False)
+
+
+def ply_header(encoding):
+    return (f"ply\nformat {encoding} 1.0\ncomment square\nelement vertex 4\n"
+            "property float x\nproperty float y\nproperty float z\n"
+            "element face 2\nproperty list uchar int vertex_indices\nend_header\n")
+
+
+def test_ascii_ply_matches_obj(tmp_path):
+    ply = ply_header("ascii") + "0 0 0\n1 0 0\n1 1 0\n0 1 0\n3 0 1 2\n3 0 2 3\n"
+    obj = SQUARE + "f 1 2 3\nf 1 3 4\n"
+    assert (triangles(load_mesh(write(tmp_path, "square.ply", ply), use_cache=False))
+            == triangles(load_mesh(write(tmp_path, "square.obj", obj), use_cache=False)))
+
+
+@pytest.mark.parametrize("encoding, endian", [("binary_little_endian", "<"), ("binary_big_endian", ">")])
+@pytest.mark.parametrize("faces", [[(0, 1, 2), (0, 2, 3)], [(0, 1, 2, 3), (0, 1, 2)]])
+def test_binary_ply_matches_ascii(tmp_path, encoding, endian, faces):
+    positions = [(0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0)]
+    body = b"".join(struct.pack(endian + "3f", *position) for position in positions)
+    body += b"".join(struct.pack(f"{endian}B{len(face)}i", len(face), *face) for face in faces)
+    binary = load_mesh(write(tmp_path, "binary.ply", ply_header(encoding).encode("ascii") + body),
+                       use_cache=False)
+    text = ply_header("ascii") + "".join(" ".join(map(str, p)) + "\n" for p in positions)
+    text += "".join(f"{len(face)} " + " ".join(map(str, face)) + "\n" for face in faces)
+    assert binary.triangle_count() == sum(len(face) - 2 for face in faces)
+    assert triangles(binary) == triangles(load_mesh(write(tmp_path, "text.ply", text), use_cache=False))
+
+
+@pytest.mark.parametrize("content, message", [
+    ("ply\nelement vertex 4\n", "Not a PLY file"),
+    (ply_header("ascii") + "0 0 0\n1 0 0\n", "runs past the end"),
+    (ply_header("ascii").replace("float x", "quad x") + "0 0 0\n", "Malformed PLY header"),
+    (ply_header("ascii") + "0 0 0\n1 0 0\n1 1 0\n0 1 0\n3 0 1 9\n3 0 2 3\n", "doesn't exist"),
+])
+def test_malformed_ply_is_a_value_error(tmp_path, content, message):
+    with pytest.raises(ValueError, match=message):
+        load_mesh(write(tmp_path, "broken.ply", content), use_cache=False)
+
+
+def test_cache_is_used_until_the_source_changes(tmp_path):
+    path = write(tmp_path, "cached.obj", SQUARE + "f 1 2 3 4\n")
+    first = load_mesh(path)
+    assert not first.from_cache and os.path.exists(cache_path(path))
+    second = load_mesh(path)
+    assert second.from_cache
+    assert np.array_equal(second.vertices, first.vertices) and np.array_equal(second.indices, first.indices)
+    assert all(np.array_equal(a, b) for a, b in zip(second.bounds, first.bounds))
+
+    # Same size, so only the modification time tells the cache is stale
+    write(tmp_path, "cached.obj", SQUARE.replace("v 1 1 0", "v 2 2 0") + "f 1 2 3 4\n")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    third = load_mesh(path)
+    assert not third.from_cache
+    assert (2, 2, 0) in triangles(third)[0]
+    assert load_mesh(path).from_cache
+
+
+def test_corrupt_cache_is_ignored(tmp_path):
+    path = write(tmp_path, "cached.obj", SQUARE + "f 1 2 3 4\n")
+    load_mesh(path)
+    with open(cache_path(path), "r+b") as file:
+        file.truncate(40)
+    mesh = load_mesh(path)
+    assert not mesh.from_cache and mesh.triangle_count() == 2
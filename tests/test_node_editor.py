@@ -0,0 +1,109 @@
+import os
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+QtWidgets = pytest.importorskip("PySide6.QtWidgets")
+pytest.importorskip("NodeGraphQt")
+
+from graph.project_format import GraphProject
+from graph.shader_graph import ShaderGraph
+from ui.node_editor import NodeEditorView, unique_names
+from ui.viewer_benchmark import benchmark_project
+
+
+@pytest.fixture
+def editor():
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    editor = NodeEditorView()
+    yield editor
+    editor.view_timer.stop()
+    app.processEvents()
+
+
+def editor_project(node_count):
+    # As the editor saves it: every property written out, names unique
+    graph = ShaderGraph.from_project(benchmark_project(node_count))
+    graph.names = unique_names(graph.names)
+    return graph.to_project()
+
+
+def test_import_generates_code_before_views(editor):
+    codes = []
+    editor.node_selected.connect(codes.append)
+    editor.import_project(editor_project(500))
+    assert len(codes) == 1
+    assert len(editor.views) < 500
+    editor.create_views()
+    assert len(editor.node_graph.all_nodes()) == 500
+
+
+def test_import_then_export_is_identical(editor):
+    project = editor_project(500)
+    editor.import_project(project)
+    # Saving part way through reads the nodes without views from the model
+    assert editor.export_project().to_bytes() == project.to_bytes()
+    editor.create_views()
+    assert editor.export_project().to_bytes() == project.to_bytes()
+    pipes = sum(len(port.connected_ports()) for node in editor.node_graph.all_nodes() for port in node.input_ports())
+    assert pipes == project.edge_count()
+
+
+def test_default_preview_bakes_with_nothing_selected(editor):
+    project = GraphProject()
+    project.add_node("UVNode", "UV", 0.0, 0.0, {})
+    project.add_node("GradientNode", "Gradient", 250.0, 0.0, {})
+    project.add_node("ColorNode", "Color", 0.0, 200.0, {})
+    project.add_node("BlendNode", "Blend", 500.0, 0.0, {})
+    for edge in ((0, 0, 1, 0), (1, 0, 3, 0), (2, 0, 3, 1)):
+        project.add_edge(*edge)
+    codes = []
+    editor.node_selected.connect(codes.append)
+    editor.import_project(project)
+    editor.create_views()
+    assert editor.preview_mode and editor.bake_enabled
+    assert "// @pass bake_" in codes[-1]
+    # A selected node is shown by the single-pass preview program
+    editor.on_node_selected(editor.views[1])
+    assert "// @pass" not in codes[-1]
+    editor.on_node_selected(None)
+    assert "// @pass bake_" in codes[-1]
+
+
+def test_sweep_variants_share_a_program_per_named_value(editor):
+    project = GraphProject()
+    project.add_node("ColorNode", "Color", 0.0, 0.0, {})
+    project.add_node("ColorNode", "Color", 0.0, 200.0, {})
+    project.add_node("BlendNode", "Blend", 250.0, 0.0, {})
+    for edge in ((0, 0, 2, 0), (1, 0, 2, 1)):
+        project.add_edge(*edge)
+    editor.import_project(project)
+    editor.create_views()
+    color, blend = editor.views[0].name(), editor.views[2].name()
+    before = editor.export_project().to_bytes()
+    variants = editor.sweep_variants([(f"{color}.node_color", [(1.0, 0.0, 0.0), (0.0, 0.5, 1.0)]),
+                                      (f"{blend}.blend_mode", ["Multiply", "Add"])])
+    assert len(variants) == 4
+    # One source per blend mode; the colour is uniforms in both
+    assert len({source for source, _, _, _ in variants}) == 2
+    source, uniforms, label, values = variants[1]
+    assert "uniform float sweep_0_0;" in source and "65537" not in source
+    assert uniforms == {"sweep_0_0": 1.0, "sweep_0_1": 0.0, "sweep_0_2": 0.0}
+    assert label == "(1 0 0), Add"
+    assert variants[2][1] == {"sweep_0_0": 0.0, "sweep_0_1": 0.5, "sweep_0_2": 1.0}
+    # The model is left as it was
+    assert editor.export_project().to_bytes() == before
+
+
+@pytest.mark.parametrize("parameters, message", [
+    ([("Nothing.node_color", [1.0])], "No node property"),
+    ([("{color}.node_color", [1.0])], "needs 3 components"),
+])
+def test_sweep_variants_rejects_bad_parameters(editor, parameters, message):
+    project = GraphProject()
+    project.add_node("ColorNode", "Color", 0.0, 0.0, {})
+    editor.import_project(project)
+    editor.create_views()
+    color = editor.views[0].name()
+    with pytest.raises(ValueError, match=message):
+        editor.sweep_variants([(name.format(color=color), values) for name, values in parameters])
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("OpenGL")
+
+# Picks the EGL platform, so it comes before anything importing OpenGL.GL
+from shaders.headless import HeadlessContext
+from OpenGL.GL import (glClearColor, glDisable, glEnable, glGetFloatv, glIsEnabled, GL_COLOR_CLEAR_VALUE,
+                       GL_DEPTH_TEST)
+from shaders.gl_resources import gl_resources
+from shaders.parameter_sweep import (ParameterSweep, grid_columns, parse_sweep_spec, promote_sentinels,
+                                     sentinel_values, sweep_combinations, uniform_variants)
+
+SOURCE = """#version 120
+uniform float level;
+uniform vec2 resolution;
+void main() {
+    gl_FragColor = vec4(level, gl_FragCoord.x / resolution.x, 0.0, 1.0);
+}
+"""
+
+
+@pytest.fixture
+def context():
+    try:
+        context = HeadlessContext()
+    except Exception as e:
+        pytest.skip(f"No EGL context: {e}")
+    yield context
+    context.release()
+
+
+def test_spec_parsing():
+    spec = "# comment\n\nlevel = 0:1:3\ntint = 1 0 0; 0, 1, 0\nNode.blend_mode = Multiply; Add\nscale = 2\n"
+    assert parse_sweep_spec(spec) == [
+        ("level", [0.0, 0.5, 1.0]),
+        ("tint", [(1.0, 0.0, 0.0), (0.0, 1.0, 0.0)]),
+        ("Node.blend_mode", ["Multiply", "Add"]),
+        ("scale", [2.0]),
+    ]
+
+
+@pytest.mark.parametrize("spec, message", [("level 0:1:3", "Line 1: expected"), ("\nlevel = ;", "Line 2: no values")])
+def test_malformed_spec_is_a_line_numbered_error(spec, message):
+    with pytest.raises(ValueError, match=message):
+        parse_sweep_spec(spec)
+
+
+def test_combinations_and_grid_columns():
+    parameters = [("a", [1.0, 2.0]), ("b", ["x", "y", "z"])]
+    assert sweep_combinations(parameters) == [
+        {"a": a, "b": b} for a in (1.0, 2.0) for b in ("x", "y", "z")]
+    # One row per run of the last parameter, otherwise about square
+    assert grid_columns(parameters, 6) == 3
+    assert grid_columns([("a", [1.0] * 10)], 10) == 4
+
+
+def test_sentinel_promotion():
+    value = (0.5, 0.25, 1.0)
+    sentinels = sentinel_values(1, value)
+    source = (f"#version 120\nvoid main() {{ gl_FragColor = vec4({sentinels[0]!r}, {sentinels[2]!r}, "
+              f"1{sentinels[1]!r}, 1.0); }}\n")
+    promoted, components = promote_sentinels(source, 1, value)
+    # The second component only appears inside another number, so it stays
+    assert components == {"sweep_1_0": 0, "sweep_1_2": 2}
+    assert promoted.startswith("#version 120\nuniform float sweep_1_0;\nuniform float sweep_1_2;\n")
+    assert f"vec4(sweep_1_0, sweep_1_2, 1{sentinels[1]!r}, 1.0)" in promoted
+    assert promote_sentinels("void main() {}", 0, 1.0) == ("void main() {}", {})
+
+
+def test_tile_layout(context):
+    variants = uniform_variants(SOURCE, [("level", [0.0, 0.25, 0.5, 0.75, 1.0])])
+    sweep = ParameterSweep(tile_width=8, tile_height=4, columns=3, padding=2)
+    pixels, tiles = sweep.render(variants)
+    # Three columns, two rows, padding around and between the tiles
+    assert pixels.shape == (2 * 4 + 3 * 2, 3 * 8 + 4 * 2, 4)
+    assert sweep.stats["programs"] == 1
+    assert [(tile.x, tile.y) for tile in tiles] == [(2, 2), (12, 2), (22, 2), (2, 8), (12, 8)]
+    for tile, level in zip(tiles, (0.0, 0.25, 0.5, 0.75, 1.0)):
+        block = pixels[tile.y:tile.y + tile.height, tile.x:tile.x + tile.width]
+        assert np.abs(block[..., 0].astype(int) - round(level * 255)).max() <= 1
+        # gl_FragCoord runs from the tile's own corner
+        assert block[0, 0, 1] < 32 and block[0, -1, 1] > 200
+    # The unused slot and the padding keep the clear colour
+    assert (pixels[8:12, 22:30, :3] == 38).all()
+    assert (pixels[0, :, :3] == 38).all()
+    assert not gl_resources.live("parameter sweep")
+
+
+@pytest.mark.parametrize("depth_test", [False, True])
+def test_render_keeps_the_viewport_state(context, depth_test):
+    (glEnable if depth_test else glDisable)(GL_DEPTH_TEST)
+    glClearColor(0.2, 0.4, 0.6, 1.0)
+    ParameterSweep(tile_width=8, tile_height=4).render(uniform_variants(SOURCE, [("level", [0.0, 1.0])]))
+    assert bool(glIsEnabled(GL_DEPTH_TEST)) == depth_test
+    assert np.allclose(glGetFloatv(GL_COLOR_CLEAR_VALUE), (0.2, 0.4, 0.6, 1.0))
+
+
+def test_failed_render_keeps_the_viewport_state(context):
+    glDisable(GL_DEPTH_TEST)
+    glClearColor(0.2, 0.4, 0.6, 1.0)
+    with pytest.raises(RuntimeError):
+        ParameterSweep(tile_width=8, tile_height=4).render([("void main() {", {}, "broken", {})])
+    assert not glIsEnabled(GL_DEPTH_TEST)
+    assert np.allclose(glGetFloatv(GL_COLOR_CLEAR_VALUE), (0.2, 0.4, 0.6, 1.0))
+    assert not gl_resources.live("parameter sweep")
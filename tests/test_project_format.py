@@ -0,0 +1,209 @@
+import json
+import zlib
+
+import pytest
+
+from graph.glsl_codegen import GlslGenerator
+from graph.project_format import (GraphProject, HEADER, MAGIC, SECTION, VERSION, load_project, save_project,
+                                  to_little_endian)
+from graph.shader_graph import ShaderGraph
+from ui.viewer_benchmark import benchmark_project
+
+GREY = (128 / 255.0,) * 3
+
+
+def mixed_project():
+    # Every node type, shared and distinct property rows, a widened input
+    project = GraphProject()
+    project.add_node("UVNode", "UV", 0.0, 0.0, {}, uid=1)
+    project.add_node("GradientNode", "Gradient", 250.0, 0.0, {}, uid=2)
+    project.add_node("ColorNode", "Color", 0.0, 200.0, {"node_color": (1.0, 0.5, 0.25)}, uid=3)
+    project.add_node("BlendNode", "Blend", 500.0, 0.0, {"blend_mode": "Overlay"}, uid=4)
+    project.add_node("AddNode", "Add", 750.0, 0.0, {}, uid=5)
+    project.add_node("TextureNode", "Texture", 250.0, 200.0, {"texture": "bricks.png"}, uid=6)
+    project.add_node("MaterialNode", "Material", 1000.0, 0.0,
+                     {"shading_model": "Phong", "node_color": GREY, "specular_color": (0.1, 0.2, 0.3),
+                      "specular_intensity": 2.0, "shininess": 16.0}, uid=7)
+    project.add_node("ColorNode", "Color 1", 0.0, 400.0, {"node_color": (1.0, 0.5, 0.25)}, uid=8)
+    for edge in ((0, 0, 1, 0), (1, 0, 3, 0), (2, 0, 3, 1), (3, 0, 4, 0), (7, 0, 4, 1), (0, 0, 5, 0),
+                 (4, 0, 6, 0)):
+        project.add_edge(*edge)
+    return project
+
+
+def editor_project():
+    # A large graph as the editor saves it, with every property written out
+    return ShaderGraph.from_project(benchmark_project(500)).to_project()
+
+
+def legacy_bytes(project):
+    # A version 1 file: the same layout without the uid column
+    meta = json.dumps({"types": project.types, "property_keys": project.property_keys}).encode("utf-8")
+    sections = [meta, to_little_endian(project.node_types), to_little_endian(project.node_rows),
+                to_little_endian(project.positions), to_little_endian(project.edges),
+                "\0".join(project.names).encode("utf-8"),
+                ("[" + ",".join(project.property_rows) + "]").encode("utf-8")]
+    payload = zlib.compress(b"".join(SECTION.pack(len(section)) + section for section in sections), 1)
+    return HEADER.pack(MAGIC, 1, len(project), project.edge_count(), 1) + payload
+
+
+def columns(project):
+    return (project.types, project.property_keys, project.node_types.tolist(), project.node_rows.tolist(),
+            project.uids.tolist(), project.positions.tolist(), project.edges.tolist(), project.names,
+            project.property_rows)
+
+
+def generated_code(project):
+    generator = GlslGenerator(ShaderGraph.from_project(project))
+    return generator.build_glsl_code(), generator.build_baked_glsl_code(1.0), generator.build_preview_glsl_code()
+
+
+@pytest.mark.parametrize("make_project", [mixed_project, editor_project])
+def test_sep_round_trip_is_byte_identical(tmp_path, make_project):
+    project = make_project()
+    first = tmp_path / "first.sep"
+    second = tmp_path / "second.sep"
+    save_project(project, str(first))
+    save_project(load_project(str(first)), str(second))
+    assert first.read_bytes() == second.read_bytes()
+    # And through the model the editor and graph_to_glsl build from it
+    model_project = ShaderGraph.from_project(load_project(str(first))).to_project()
+    assert model_project.to_bytes() == first.read_bytes()
+
+
+@pytest.mark.parametrize("make_project", [mixed_project, editor_project])
+def test_json_round_trip_is_identical(tmp_path, make_project):
+    project = make_project()
+    first = tmp_path / "first.json"
+    second = tmp_path / "second.json"
+    save_project(project, str(first))
+    loaded = load_project(str(first))
+    save_project(loaded, str(second))
+    assert first.read_text() == second.read_text()
+    assert columns(loaded) == columns(project)
+    assert columns(ShaderGraph.from_project(loaded).to_project()) == columns(project)
+
+
+def test_sep_and_json_load_the_same_project(tmp_path):
+    project = mixed_project()
+    save_project(project, str(tmp_path / "project.sep"))
+    save_project(project, str(tmp_path / "project.json"))
+    assert columns(load_project(str(tmp_path / "project.sep"))) == \
+        columns(load_project(str(tmp_path / "project.json")))
+
+
+@pytest.mark.parametrize("extension", [".sep", ".json"])
+def test_generated_glsl_is_identical_after_round_trip(tmp_path, extension):
+    project = mixed_project()
+    path = str(tmp_path / ("project" + extension))
+    save_project(project, path)
+    assert generated_code(load_project(path)) == generated_code(project)
+
+
+def test_sep_without_uid_column_loads(tmp_path):
+    project = mixed_project()
+    path = tmp_path / "legacy.sep"
+    path.write_bytes(legacy_bytes(project))
+    loaded = load_project(str(path))
+    assert [uid for _, _, _, _, uid in loaded.nodes()] == [0] * len(project)
+    assert loaded.edge_tuples() == project.edge_tuples()
+    # Nodes without uids are numbered in file order, the order these had
+    saved = ShaderGraph.from_project(loaded).to_project()
+    assert saved.uids.tolist() == list(range(1, len(project) + 1))
+    assert generated_code(loaded) == generated_code(project)
+
+
+def test_json_without_uids_loads(tmp_path):
+    project = mixed_project()
+    data = json.loads(project.to_json())
+    del data["uids"]
+    path = tmp_path / "legacy.json"
+    path.write_text(json.dumps(data))
+    loaded = load_project(str(path))
+    assert [uid for _, _, _, _, uid in loaded.nodes()] == [0] * len(project)
+    assert generated_code(loaded) == generated_code(project)
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_truncated_sep_raises_value_error(compress):
+    data = mixed_project().to_bytes(compress=compress)
+    for length in range(len(data)):
+        with pytest.raises(ValueError):
+            GraphProject.from_bytes(data[:length])
+
+
+def test_corrupt_sep_raises_value_error():
+    data = mixed_project().to_bytes()
+    for offset in range(HEADER.size, len(data)):
+        corrupt = bytearray(data)
+        corrupt[offset] ^= 0xFF
+        with pytest.raises(ValueError):
+            GraphProject.from_bytes(bytes(corrupt))
+
+
+def test_newer_version_is_refused():
+    data = bytearray(mixed_project().to_bytes())
+    HEADER.pack_into(data, 0, MAGIC, VERSION + 1, 8, 7, 1)
+    with pytest.raises(ValueError, match="newer"):
+        GraphProject.from_bytes(bytes(data))
+
+
+def load_or_value_error(load):
+    # A damaged file either fails with ValueError or loads a project the
+    # editor can build a graph from (or refuse, also with ValueError)
+    try:
+        project = load()
+        list(project.nodes())
+        project.edge_tuples()
+        ShaderGraph.from_project(project)
+    except ValueError:
+        pass
+
+
+def test_corrupt_uncompressed_sep_never_crashes():
+    data = mixed_project().to_bytes(compress=False)
+    for offset in range(HEADER.size, len(data)):
+        for flip in (0x01, 0x80, 0xFF):
+            corrupt = bytearray(data)
+            corrupt[offset] ^= flip
+            load_or_value_error(lambda: GraphProject.from_bytes(bytes(corrupt)))
+
+
+@pytest.mark.parametrize("change", [
+    lambda data: data.pop("types"),
+    lambda data: data.pop("node_rows"),
+    lambda data: data["names"].pop(),
+    lambda data: data["positions"].pop(),
+    lambda data: data["node_types"].append(0),
+    lambda data: data["node_types"].__setitem__(0, 99),
+    lambda data: data["node_rows"].__setitem__(0, 99),
+    lambda data: data["node_types"].__setitem__(0, -1),
+    lambda data: data["edges"].pop(),
+    lambda data: data["edges"].__setitem__(0, 99),
+    lambda data: data["edges"].__setitem__(2, -1),
+    lambda data: data["uids"].pop(),
+    lambda data: data["property_rows"].__setitem__(0, 1),
+    lambda data: data["property_rows"].__setitem__(1, []),
+    lambda data: data["property_keys"].pop("ColorNode"),
+    lambda data: data.__setitem__("names", "UV"),
+    lambda data: data.__setitem__("positions", ["x"] * 16),
+])
+def test_damaged_json_raises_value_error(change):
+    data = json.loads(mixed_project().to_json())
+    change(data)
+    with pytest.raises(ValueError):
+        GraphProject.from_json(json.dumps(data))
+
+
+def test_truncated_json_raises_value_error():
+    text = mixed_project().to_json()
+    for length in range(len(text)):
+        with pytest.raises(ValueError):
+            GraphProject.from_json(text[:length])
+
+
+def test_newer_json_version_is_refused():
+    data = json.loads(mixed_project().to_json())
+    data["version"] = VERSION + 1
+    with pytest.raises(ValueError, match="newer"):
+        GraphProject.from_json(json.dumps(data))
@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip("OpenGL")
+
+# Picks the EGL platform, so it comes before anything importing OpenGL.GL
+from shaders.headless import HeadlessContext
+from shaders.gl_resources import gl_resources
+from shaders.render_graph import RenderGraph, parse_multipass_source
+
+SOURCE = "// @pass blur {option}\nvoid main() {{ gl_FragColor = vec4(1.0); }}\n// @pass main blurred=blur\nvoid main() {{}}\n"
+
+GOOD = """// @pass blur scale=0.5
+#version 120
+void main() { gl_FragColor = vec4(0.5); }
+// @pass main blurred=blur
+#version 120
+uniform sampler2D blurred;
+void main() { gl_FragColor = texture2D(blurred, vec2(0.5)); }
+"""
+
+
+@pytest.fixture
+def context():
+    try:
+        context = HeadlessContext()
+    except Exception as e:
+        pytest.skip(f"No EGL context: {e}")
+    yield context
+    context.release()
+
+
+def test_scale_option_is_parsed():
+    passes = parse_multipass_source(SOURCE.format(option="scale=0.5 float"))
+    assert [(name, scale) for name, _, _, _, scale, _ in passes] == [("blur", 0.5), ("main", 1.0)]
+
+
+@pytest.mark.parametrize("option", ["scale=", "scale=abc", "scale=0", "scale=-1", "scale=inf"])
+def test_malformed_scale_is_a_line_numbered_error(option):
+    with pytest.raises(ValueError, match="Line 1: scale"):
+        parse_multipass_source(SOURCE.format(option=option))
+
+
+@pytest.mark.parametrize("broken", [GOOD.replace("vec4(0.5)", "vec4(0.5"), GOOD.replace("blurred=blur", "blurred=nothing")])
+def test_failed_sync_keeps_the_graph(context, broken):
+    graph = RenderGraph(owner="render graph test")
+    graph.resize(16, 16)
+    graph.sync_passes(parse_multipass_source(GOOD))
+    passes = dict(graph.passes)
+    programs = [render_pass.program.program for render_pass in passes.values()]
+    with pytest.raises(RuntimeError):
+        graph.sync_passes(parse_multipass_source(broken))
+    assert graph.passes == passes
+    assert [render_pass.program.program for render_pass in graph.passes.values()] == programs
+    # The graph still renders, and fixing the edit keeps the unchanged pass
+    graph.render({}, 0)
+    assert graph.sync_passes(parse_multipass_source(GOOD.replace("vec4(0.5)", "vec4(0.25)"))) == ["main"]
+    graph.release()
+    assert not gl_resources.live("render graph test")
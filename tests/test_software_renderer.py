@@ -0,0 +1,144 @@
+import os
+
+import numpy as np
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+pytest.importorskip("PySide6.QtWidgets")
+
+from shaders.glsl_numpy import CompiledShader, LOOP_LIMIT
+from shaders.software_renderer import SoftwareRenderer
+from ui.main_window import EXAMPLE_SHADER_CODE, RAYMARCH_SHADER_CODE
+
+
+def render(source, width=8, height=4, builtins=None):
+    renderer = SoftwareRenderer(workers=0)
+    try:
+        ok, message = renderer.compile_shaders(source)
+        assert ok, message
+        return renderer.render(width, height, builtins)
+    finally:
+        renderer.release()
+
+
+def shade_x(source, columns=6):
+    # One row of pixels; returns the red channel per column
+    frag_coord = np.array([[x + 0.5, 0.5, 0.0, 1.0] for x in range(columns)], dtype=np.float32)
+    return CompiledShader(source).shade(frag_coord, (columns, 1))[:, 0]
+
+
+def test_blue_example_renders_blue():
+    pixels = render(EXAMPLE_SHADER_CODE)
+    assert pixels.shape == (4, 8, 4)
+    assert (pixels == (0, 0, 255, 255)).all()
+
+
+def test_raymarch_example_renders_the_scene():
+    # At iTime 1.5 the light is off to the side, so the sphere's lit edge shows
+    pixels = render(RAYMARCH_SHADER_CODE, 32, 18, {"resolution": (32, 18), "iTime": 1.5})
+    assert pixels.shape == (18, 32, 4)
+    assert (pixels[..., 3] == 255).all()
+    # Red sphere in the middle, grey floor at the bottom and black sky on top
+    sphere = pixels[8, 16]
+    assert sphere[0] > sphere[1] == sphere[2]
+    floor = pixels[-1, 2]
+    assert floor[0] == floor[1] == floor[2] > 0
+    assert (pixels[0, :, :3] == 0).all()
+
+
+def test_raymarch_example_matches_gl():
+    pytest.importorskip("OpenGL")
+    from shaders.headless import HeadlessContext
+    try:
+        context = HeadlessContext()
+    except Exception as e:
+        pytest.skip(f"No EGL context: {e}")
+    from OpenGL.GL import glBindFramebuffer, glReadPixels, GL_FRAMEBUFFER, GL_RGBA, GL_UNSIGNED_BYTE
+    from shaders.render_graph import RenderGraph
+    width, height = 32, 18
+    builtins = {"resolution": (width, height), "iTime": 1.5}
+    graph = RenderGraph(owner="software renderer test")
+    try:
+        graph.resize(width, height)
+        graph.add_pass("main", RAYMARCH_SHADER_CODE)
+        graph.set_output("main")
+        graph.render(builtins)
+        glBindFramebuffer(GL_FRAMEBUFFER, graph.passes["main"].output_target().fbo)
+        data = glReadPixels(0, 0, width, height, GL_RGBA, GL_UNSIGNED_BYTE)
+        expected = np.frombuffer(data, dtype=np.uint8).reshape(height, width, 4)[::-1]
+    finally:
+        graph.release()
+        context.release()
+    pixels = render(RAYMARCH_SHADER_CODE, width, height, builtins)
+    assert np.abs(pixels.astype(int) - expected).max() <= 1
+
+
+def test_loop_trip_counts_differ_per_pixel():
+    red = shade_x("""void main() {
+        float n = 0.0;
+        for (int i = 0; i < 10; i++) {
+            if (float(i) >= gl_FragCoord.x) { break; }
+            n += 1.0;
+        }
+        gl_FragColor = vec4(n, 0.0, 0.0, 1.0);
+    }""")
+    assert list(red) == [1.0, 2.0, 3.0, 4.0, 5.0, 6.0]
+
+
+def test_while_loop_is_masked_per_pixel():
+    red = shade_x("""void main() {
+        float x = gl_FragCoord.x;
+        float steps = 0.0;
+        while (x > 1.0) {
+            x -= 1.0;
+            steps += 1.0;
+        }
+        gl_FragColor = vec4(steps, 0.0, 0.0, 1.0);
+    }""")
+    assert list(red) == [0.0, 1.0, 2.0, 3.0, 4.0, 5.0]
+
+
+def test_return_inside_a_loop_only_stops_its_pixels():
+    red = shade_x("""float first_above(float limit) {
+        for (int i = 0; i < 8; i++) {
+            if (float(i) > limit) { return float(i); }
+        }
+        return -1.0;
+    }
+    void main() {
+        gl_FragColor = vec4(first_above(gl_FragCoord.x), 0.0, 0.0, 1.0);
+    }""", columns=8)
+    assert list(red) == [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, -1.0]
+
+
+def test_discard_clears_only_its_pixels():
+    pixels = render("""void main() {
+        if (gl_FragCoord.x < 4.0) { discard; }
+        gl_FragColor = vec4(1.0);
+    }""")
+    assert (pixels[:, :4] == 0).all()
+    assert (pixels[:, 4:] == 255).all()
+
+
+@pytest.mark.parametrize("source, message", [
+    ("struct Light { vec3 p; };\nvoid main() {}", "structs are not supported"),
+    ("void main() {\n  float values[4];\n}", "arrays are not supported"),
+    ("void f(out float x) { x = 1.0; }\nvoid main() {}", "out and inout parameters are not supported"),
+    ("void f(inout float x) { x = 1.0; }\nvoid main() {}", "out and inout parameters are not supported"),
+    ("float main() { return 1.0; }", "main\\(\\) must be 'void main\\(\\)'"),
+])
+def test_unsupported_features_are_compile_errors(source, message):
+    with pytest.raises(RuntimeError, match=message):
+        CompiledShader(source)
+    ok, text = SoftwareRenderer(workers=0).compile_shaders(source)
+    assert not ok and text.startswith("Shader compilation failed")
+
+
+def test_runaway_loop_is_an_error():
+    shader = CompiledShader("""void main() {
+        float x = 0.0;
+        while (x < 1.0) { x *= 2.0; }
+        gl_FragColor = vec4(x);
+    }""")
+    with pytest.raises(RuntimeError, match=f"Loop at line 3 ran more than {LOOP_LIMIT} iterations"):
+        shader.shade(np.zeros((1, 4), np.float32), (1, 1))
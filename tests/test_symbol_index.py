@@ -0,0 +1,85 @@
+import random
+import time
+
+import pytest
+
+pytest.importorskip("textdistance")
+
+from shaders.symbol_index import SymbolIndex, Trie
+
+LINES = [
+    "struct Ray { vec3 origin; vec3 direction; };",
+    "struct Hit { float t; };",
+    "Ray camera;",
+    "Hit trace(Ray ray) {",
+    "uniform float iTime;",
+    "float GetDistance(vec3 p) {",
+    "    Hit hit = trace(camera);",
+    "    float a = 1.0, b = 2.0;",
+    "#define STEPS 64",
+    "}",
+    "",
+]
+
+
+def state(index):
+    return index.lines, index.kinds, index.types, sorted(index.trie.words("", 10 ** 6))
+
+
+def fresh(index):
+    reparsed = SymbolIndex()
+    reparsed.update_lines(0, 0, list(index.texts))
+    return reparsed
+
+
+def test_struct_declared_in_the_same_edit():
+    index = SymbolIndex()
+    index.set_text("struct Ray {...};\nRay r;\nRay march(Ray a) {")
+    assert index.describe("r") == "Ray r"
+    assert index.describe("march") == "Ray march(Ray a)"
+    # Removing the struct drops what was declared with it
+    index.update_lines(0, 1, [""])
+    assert index.describe("r") is None and index.describe("march") is None
+    assert state(index) == state(fresh(index))
+
+
+def test_edits_match_a_fresh_parse():
+    randomness = random.Random(46)
+    index = SymbolIndex()
+    index.set_text("")
+    for _ in range(1500):
+        first = randomness.randrange(len(index.lines) + 1)
+        removed = randomness.randrange(min(3, len(index.lines) - first) + 1)
+        index.update_lines(first, removed, randomness.choices(LINES, k=randomness.randrange(4)))
+        assert state(index) == state(fresh(index))
+
+
+def test_trie_counts_references():
+    trie = Trie()
+    for word in ("march", "marble", "march"):
+        trie.add(word)
+    trie.remove("march")
+    assert trie.words("mar", 10) == ["march", "marble"]
+    trie.remove("march")
+    assert trie.words("mar", 10) == ["marble"]
+    assert trie.find("marc") is None
+
+
+def test_complete():
+    index = SymbolIndex()
+    index.set_text("\n".join(LINES))
+    # Shader names rank before built-ins, then shorter names first
+    assert index.complete("tr")[0] == "trace"
+    assert "GetDistance" in index.complete("getdsit")
+    assert index.complete("STE")[0] == "STEPS"
+    assert index.complete("") == []
+
+
+def test_complete_is_sub_millisecond_on_a_large_shader():
+    index = SymbolIndex()
+    index.set_text("\n".join(f"float value{number} = {number}.0;" for number in range(10000)))
+    prefixes = ["val", "value1", "valeu", "smo", "Get", "tex", "gl_"] * 30
+    start = time.perf_counter()
+    for prefix in prefixes:
+        index.complete(prefix)
+    assert (time.perf_counter() - start) / len(prefixes) < 0.001
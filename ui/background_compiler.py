@@ -0,0 +1,67 @@
+from PySide6.QtCore import QObject, QThread, Signal, Slot
+from PySide6.QtGui import QOpenGLContext, QOffscreenSurface
+from OpenGL.GL import glFinish
+from shaders.shader_program import ShaderProgram
+from shaders.program_cache import source_digest
+from utils.tracing import tracer
+
+
+class CompileWorker(QObject):
+    finished = Signal(str, int, str)  # digest, program, error message
+
+    def __init__(self, context, surface):
+        super().__init__()
+        self.context = context
+        self.surface = surface
+
+    @Slot(str, str)
+    @tracer.traced("background compile", "gl")
+    def compile(self, vertex_shader_source, fragment_shader_source):
+        digest = source_digest(vertex_shader_source, fragment_shader_source)
+        if not self.context.makeCurrent(self.surface):
+            self.finished.emit(digest, 0, "Background GL context could not be made current")
+            return
+        try:
+            program = ShaderProgram(vertex_shader_source, fragment_shader_source)
+            # The program is handed to the GUI thread's context; make sure
+            # the driver has finished with it first
+            glFinish()
+            self.finished.emit(digest, program.program, "")
+        except RuntimeError as e:
+            self.finished.emit(digest, 0, str(e))
+        finally:
+            self.context.doneCurrent()
+
+
+class BackgroundCompiler(QObject):
+    # Compiles and links on a worker thread with a context shared with the
+    # viewport, so the GUI thread only has to adopt the finished program
+    compile_requested = Signal(str, str)
+    finished = Signal(str, int, str)
+
+    def __init__(self, share_context, parent=None):
+        super().__init__(parent)
+        # Surfaces have to be created on the GUI thread
+        self.surface = QOffscreenSurface()
+        self.surface.setFormat(share_context.format())
+        self.surface.create()
+        self.context = QOpenGLContext()
+        self.context.setFormat(share_context.format())
+        self.context.setShareContext(share_context)
+        if not self.context.create() or not self.context.shareContext():
+            raise RuntimeError("Could not create a shared GL context for background compiles")
+
+        self.thread = QThread()
+        self.worker = CompileWorker(self.context, self.surface)
+        self.context.moveToThread(self.thread)
+        self.worker.moveToThread(self.thread)
+        self.compile_requested.connect(self.worker.compile)
+        self.worker.finished.connect(self.finished)
+        self.thread.start()
+
+    def compile(self, vertex_shader_source, fragment_shader_source):
+        self.compile_requested.emit(vertex_shader_source, fragment_shader_source)
+
+    def stop(self):
+        self.thread.quit()
+        self.thread.wait()
@@ -1,6 +1,14 @@
-from PySide6.QtWidgets import QPlainTextEdit, QVBoxLayout, QWidget, QMessageBox, QTextEdit
+import difflib
+import re
+from PySide6.QtWidgets import QPlainTextEdit, QVBoxLayout, QWidget, QMessageBox, QTextEdit, QCompleter, QToolTip
 from PySide6.QtGui import QSyntaxHighlighter, QTextCharFormat, QFont, QColor, QTextCursor, QPainter
-from PySide6.QtCore import Qt, QRegularExpression, QRect, QSize
+from PySide6.QtCore import Qt, QRegularExpression, QRect, QSize, Signal, QStringListModel, QEvent
+from shaders.symbol_index import SymbolIndex
+
+# Identifier being typed just before the cursor
+PREFIX_PATTERN = re.compile(r"[A-Za-z_]\w*$")
+# Typed characters before the completion popup opens by itself
+AUTO_COMPLETE_CHARS = 3
 
 
 class LineNumberArea(QWidget):
@@ -92,6 +100,9 @@ class GLSLSyntaxHighlighter(QSyntaxHighlighter):
 
 
 class CodeEditor(QPlainTextEdit):
+    # textChanged minus the changes made by set_code(..., notify=False)
+    code_edited = Signal()
+
     def __init__(self):
         super().__init__()
         self.lineNumberArea = LineNumberArea(self)
@@ -103,6 +114,23 @@ class CodeEditor(QPlainTextEdit):
         self.updateRequest.connect(self.updateLineNumberArea)
         self.cursorPositionChanged.connect(self.highlightCurrentLine)
         self.textChanged.connect(self.match_brackets)
+        self.textChanged.connect(self.on_text_changed)
+        self.notify_changes = True
+
+        # Hot spot shading from the cost analyser, kept underneath the other
+        # extra selections (current line, brackets, errors)
+        self.hotspot_selections = []
+
+        # Symbols for completion and go-to-definition, reparsed per edited line
+        self.symbol_index = SymbolIndex()
+        self.symbol_index.set_text(self.toPlainText())
+        self.document().contentsChange.connect(self.update_symbols)
+        self.completion_prefix = ""
+        self.completion_model = QStringListModel(self)
+        self.completer = QCompleter(self.completion_model, self)
+        self.completer.setWidget(self)
+        self.completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.completer.activated.connect(self.insert_completion)
 
         self.updateLineNumberAreaWidth(0)
         self.highlightCurrentLine()
@@ -141,7 +169,7 @@ class CodeEditor(QPlainTextEdit):
             selection.cursor.clearSelection()
             extraSelections.append(selection)
 
-        self.setExtraSelections(extraSelections)
+        self.setExtraSelections(self.hotspot_selections + extraSelections)
 
     def lineNumberAreaPaintEvent(self, event):
         painter = QPainter(self.lineNumberArea)
@@ -167,8 +195,179 @@ class CodeEditor(QPlainTextEdit):
     def get_code(self):
         return self.toPlainText()
 
-    def set_code(self, code):
-        self.setPlainText(code)
+    def on_text_changed(self):
+        if self.notify_changes:
+            self.code_edited.emit()
+
+    def set_code(self, code, notify=True):
+        # Patches the lines that differ instead of replacing the document, so
+        # undo history survives and only the changed blocks are re-highlighted.
+        # The patch is one edit block: one undo step and one textChanged.
+        # Returns whether anything changed.
+        self.hotspot_selections = []
+        old_lines = self.toPlainText().split("\n")
+        new_lines = code.split("\n")
+        if old_lines == new_lines:
+            self.highlightCurrentLine()
+            return False
+        # Generated shaders mostly change in one place; trimming the common
+        # ends keeps the diff proportional to the change
+        head = 0
+        limit = min(len(old_lines), len(new_lines))
+        while head < limit and old_lines[head] == new_lines[head]:
+            head += 1
+        tail = 0
+        while tail < limit - head and old_lines[-1 - tail] == new_lines[-1 - tail]:
+            tail += 1
+        matcher = difflib.SequenceMatcher(None, old_lines[head:len(old_lines) - tail],
+                                          new_lines[head:len(new_lines) - tail])
+        changes = [(i1 + head, i2 + head, new_lines[j1 + head:j2 + head])
+                   for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal"]
+
+        self.notify_changes = notify
+        cursor = QTextCursor(self.document())
+        cursor.beginEditBlock()
+        try:
+            # Back to front, so the line numbers of earlier changes stay valid
+            for first, last, lines in reversed(changes):
+                self.replace_lines(cursor, first, last, lines, len(old_lines))
+        finally:
+            cursor.endEditBlock()
+            self.notify_changes = True
+        return True
+
+    def replace_lines(self, cursor, first, last, lines, line_count):
+        # Lines first..last - 1 of a document with line_count lines become `lines`
+        document = self.document()
+        if last < line_count:
+            cursor.setPosition(document.findBlockByNumber(first).position())
+            cursor.setPosition(document.findBlockByNumber(last).position(), QTextCursor.KeepAnchor)
+            cursor.insertText("".join(line + "\n" for line in lines))
+            return
+        # The change runs to the end of the document, which has no final newline
+        if first == line_count:
+            cursor.movePosition(QTextCursor.End)
+            cursor.insertText("\n" + "\n".join(lines))
+            return
+        if lines or first == 0:
+            cursor.setPosition(document.findBlockByNumber(first).position())
+        else:
+            # Deleting the last lines also deletes the newline before them
+            cursor.setPosition(document.findBlockByNumber(first - 1).position()
+                               + document.findBlockByNumber(first - 1).length() - 1)
+        cursor.movePosition(QTextCursor.End, QTextCursor.KeepAnchor)
+        cursor.insertText("\n".join(lines))
+
+    def update_symbols(self, position, removed, added):
+        # The blocks from the one holding `position` to the one holding the end
+        # of the inserted text replace as many old lines as the block count
+        # didn't grow by
+        document = self.document()
+        first = document.findBlock(position).blockNumber()
+        end = min(position + added, document.characterCount() - 1)
+        last = document.findBlock(end).blockNumber()
+        removed_lines = last - first + 1 - (document.blockCount() - len(self.symbol_index.lines))
+        if first < 0 or last < first or removed_lines < 0 or first + removed_lines > len(self.symbol_index.lines):
+            self.symbol_index.set_text(self.toPlainText())
+            return
+        block = document.findBlockByNumber(first)
+        lines = []
+        for _ in range(first, last + 1):
+            lines.append(block.text())
+            block = block.next()
+        self.symbol_index.update_lines(first, removed_lines, lines)
+
+    def keyPressEvent(self, event):
+        popup = self.completer.popup()
+        if popup.isVisible() and event.key() in (Qt.Key_Enter, Qt.Key_Return, Qt.Key_Escape, Qt.Key_Tab,
+                                                 Qt.Key_Backtab):
+            # The completer handles these
+            event.ignore()
+            return
+        if event.key() == Qt.Key_F12:
+            self.go_to_definition(self.textCursor())
+            return
+        forced = event.key() == Qt.Key_Space and event.modifiers() & Qt.ControlModifier
+        if not forced:
+            super().keyPressEvent(event)
+        self.update_completions(forced)
+
+    def update_completions(self, forced=False):
+        cursor = self.textCursor()
+        before = cursor.block().text()[:cursor.positionInBlock()]
+        match = PREFIX_PATTERN.search(before)
+        prefix = match.group(0) if match else ""
+        if not prefix or (len(prefix) < AUTO_COMPLETE_CHARS and not forced):
+            self.completer.popup().hide()
+            return
+        completions = self.symbol_index.complete(prefix)
+        if not completions:
+            self.completer.popup().hide()
+            return
+        self.completion_prefix = prefix
+        self.completion_model.setStringList(completions)
+        popup = self.completer.popup()
+        popup.setCurrentIndex(self.completion_model.index(0))
+        rect = self.cursorRect()
+        rect.translate(self.viewportMargins().left(), 0)
+        rect.setWidth(popup.sizeHintForColumn(0) + popup.verticalScrollBar().sizeHint().width())
+        self.completer.complete(rect)
+
+    def insert_completion(self, completion):
+        # Replaces the typed prefix, which may differ from the completion by a typo
+        cursor = self.textCursor()
+        cursor.movePosition(QTextCursor.Left, QTextCursor.KeepAnchor, len(self.completion_prefix))
+        cursor.insertText(completion)
+        self.setTextCursor(cursor)
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton and event.modifiers() & Qt.ControlModifier:
+            self.go_to_definition(self.cursorForPosition(event.position().toPoint()))
+            return
+        super().mousePressEvent(event)
+
+    def viewportEvent(self, event):
+        # Hovering a name shows its signature or declaration
+        if event.type() == QEvent.ToolTip:
+            cursor = self.cursorForPosition(event.pos())
+            cursor.select(QTextCursor.WordUnderCursor)
+            description = self.symbol_index.describe(cursor.selectedText())
+            if description:
+                QToolTip.showText(event.globalPos(), description, self)
+            else:
+                QToolTip.hideText()
+            return True
+        return super().viewportEvent(event)
+
+    def go_to_definition(self, cursor):
+        cursor.select(QTextCursor.WordUnderCursor)
+        name = cursor.selectedText()
+        line = self.symbol_index.definition(name, cursor.blockNumber()) if name else None
+        if line is None:
+            return False
+        block = self.document().findBlockByNumber(line)
+        match = re.search(rf"\b{re.escape(name)}\b", block.text())
+        target = QTextCursor(block)
+        if match:
+            target.setPosition(block.position() + match.start())
+        self.setTextCursor(target)
+        self.centerCursor()
+        return True
+
+    def set_hotspots(self, hot_lines):
+        # hot_lines: [(line number, cost)] with the most expensive first
+        self.hotspot_selections = []
+        if hot_lines:
+            top = max(cost for _, cost in hot_lines) or 1.0
+            for line_num, cost in hot_lines:
+                selection = QTextEdit.ExtraSelection()
+                strength = int(40 + 120 * cost / top)
+                selection.format.setBackground(QColor(255, 140, 0, strength))
+                selection.format.setProperty(QTextCharFormat.FullWidthSelection, True)
+                selection.format.setToolTip(f"~{cost:.0f} ops per pixel")
+                selection.cursor = QTextCursor(self.document().findBlockByLineNumber(line_num - 1))
+                self.hotspot_selections.append(selection)
+        self.highlightCurrentLine()
 
     def highlight_errors(self, error_message):
         error_lines = self.parse_errors(error_message)
@@ -179,7 +378,7 @@ class CodeEditor(QPlainTextEdit):
             line_cursor = QTextCursor(self.document().findBlockByLineNumber(line_num - 1))
             selection.cursor = line_cursor
             extraSelections.append(selection)
-        self.setExtraSelections(extraSelections)
+        self.setExtraSelections(self.hotspot_selections + extraSelections)
         QMessageBox.warning(self, "Shader Compilation Errors", error_message)
 
     def parse_errors(self, error_message):
@@ -197,7 +396,8 @@ class CodeEditor(QPlainTextEdit):
         text = self.toPlainText()
         pos = cursor.position()
 
-        if pos > 0:
+        # Positions count UTF-16 units, so past an emoji they can overshoot the str
+        if 0 < pos <= len(text):
             char = text[pos - 1]
             match = None
 
@@ -216,7 +416,7 @@ class CodeEditor(QPlainTextEdit):
                 selection.cursor.movePosition(QTextCursor.Right, QTextCursor.KeepAnchor)
                 extraSelections.append(selection)
 
-            self.setExtraSelections(extraSelections)
+            self.setExtraSelections(self.hotspot_selections + extraSelections)
 
     def find_matching_bracket(self, text, pos, char, forward=True):
         brackets = {"(": ")", "[": "]", "{": "}", ")": "(", "]": "[", "}": "{"}
@@ -246,8 +446,8 @@ class CodeEditorWidget(QWidget):
     def get_code(self):
         return self.editor.get_code()
 
-    def set_code(self, code):
-        self.editor.set_code(code)
+    def set_code(self, code, notify=True):
+        return self.editor.set_code(code, notify)
 
     def highlight_errors(self, error_message):
         self.editor.highlight_errors(error_message)
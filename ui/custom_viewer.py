@@ -1,6 +1,198 @@
+import math
+import time
+from PySide6 import QtCore, QtGui, QtWidgets
+from NodeGraphQt.constants import NodeEnum, PipeEnum
+from NodeGraphQt.qgraphics.node_abstract import AbstractNodeItem
+from NodeGraphQt.qgraphics.node_base import NodeItem
+from NodeGraphQt.qgraphics.pipe import PipeItem, LivePipeItem
 from NodeGraphQt.widgets.viewer import NodeViewer
 
+# Levels of detail by view scale: below DETAIL_SCALE nodes hide their
+# embedded widgets and labels, below BLOCK_SCALE they're plain blocks
+DETAIL_SCALE = 0.6
+BLOCK_SCALE = 0.35
+LOD_FULL = 0
+LOD_SIMPLE = 1
+LOD_BLOCK = 2
+# Scene units per side of a cached cell of the LOD_BLOCK overview
+OVERVIEW_CELL_SIZE = 2000.0
+# Seconds a frame may spend building overview cells; the rest fill in over
+# the next frames, so zooming out over a big graph never stalls
+OVERVIEW_BUILD_BUDGET = 0.008
+
+
+def level_of_detail(scale):
+    if scale >= DETAIL_SCALE:
+        return LOD_FULL
+    if scale >= BLOCK_SCALE:
+        return LOD_SIMPLE
+    return LOD_BLOCK
+
+
+class LodNodeItem(NodeItem):
+    # NodeGraphQt measures every node on screen each time it's painted to
+    # decide whether to hide its widgets; this reads the viewer's level instead
+    def auto_switch_mode(self):
+        lod = getattr(self.viewer(), 'lod', None)
+        if lod is None:
+            super(LodNodeItem, self).auto_switch_mode()
+        else:
+            self.set_proxy_mode(lod != LOD_FULL)
+
+    def itemChange(self, change, value):
+        # Every way a node joins or leaves the graph (adding, deleting,
+        # pasting, undo, clearing) puts its item in or out of the scene; the
+        # viewer passes that on so the editor's model follows
+        if change == QtWidgets.QGraphicsItem.ItemSceneChange and value is None:
+            viewer = self.viewer()
+            if isinstance(viewer, CustomNodeViewer):
+                viewer.node_item_removed.emit(self.id)
+        elif change == QtWidgets.QGraphicsItem.ItemSceneHasChanged and value is not None:
+            viewer = self.viewer()
+            if isinstance(viewer, CustomNodeViewer):
+                viewer.node_item_added.emit(self.id)
+        return super(LodNodeItem, self).itemChange(change, value)
+
+
 class CustomNodeViewer(NodeViewer):
+    # A LodNodeItem's id as it enters or leaves the scene
+    node_item_added = QtCore.Signal(str)
+    node_item_removed = QtCore.Signal(str)
+
+    def __init__(self, *args, **kwargs):
+        # Set before the base class, which zooms while it's set up
+        self.lod_enabled = True
+        self.lod = LOD_FULL
+        self.overview = {}  # cell -> (pipe lines, {color: node rects}) at LOD_BLOCK
+        super(CustomNodeViewer, self).__init__(*args, **kwargs)
+
+    def set_lod_enabled(self, enabled):
+        self.lod_enabled = enabled
+        self.update_level_of_detail()
+        self.scene().update()
+
+    def update_level_of_detail(self):
+        lod = level_of_detail(self.transform().m11()) if self.lod_enabled else None
+        if lod == self.lod:
+            return
+        blocks = lod == LOD_BLOCK
+        if blocks != (self.lod == LOD_BLOCK):
+            self.set_overview(blocks)
+        self.lod = lod
+        self.setRenderHint(QtGui.QPainter.Antialiasing, not blocks)
+
+    def set_overview(self, enabled):
+        # Zoomed out to blocks, nodes and pipes are drawn by the viewer in a
+        # few batched calls (see paintEvent) instead of one paint, and one
+        # re-cached pixmap per zoom step, per item. The items stay in the
+        # scene untouched, so they can still be selected and dragged.
+        scene = self.scene()
+        if enabled:
+            scene.changed.connect(self.invalidate_overview)
+            self.setCacheMode(QtWidgets.QGraphicsView.CacheNone)
+        else:
+            scene.changed.disconnect(self.invalidate_overview)
+            self.setCacheMode(QtWidgets.QGraphicsView.CacheBackground)
+        self.overview = {}
+        self.resetCachedContent()
+
+    def overview_cells(self, rect):
+        first_column = math.floor(rect.left() / OVERVIEW_CELL_SIZE)
+        first_row = math.floor(rect.top() / OVERVIEW_CELL_SIZE)
+        last_column = math.floor(rect.right() / OVERVIEW_CELL_SIZE)
+        last_row = math.floor(rect.bottom() / OVERVIEW_CELL_SIZE)
+        return [(column, row) for column in range(first_column, last_column + 1)
+                for row in range(first_row, last_row + 1)]
+
+    def invalidate_overview(self, regions):
+        for region in regions:
+            for cell in self.overview_cells(region):
+                self.overview.pop(cell, None)
+
+    def build_overview_cell(self, cell):
+        # Built the first time the cell is in view, so zooming out to blocks
+        # only pays for what's on screen. An item crossing cells is drawn
+        # by each of them.
+        column, row = cell
+        rect = QtCore.QRectF(column * OVERVIEW_CELL_SIZE, row * OVERVIEW_CELL_SIZE,
+                             OVERVIEW_CELL_SIZE, OVERVIEW_CELL_SIZE)
+        lines = []
+        rects = {}
+        for item in self.scene().items(rect, QtCore.Qt.IntersectsItemBoundingRect):
+            if isinstance(item, PipeItem):
+                if isinstance(item, LivePipeItem) or not (item.input_port and item.output_port):
+                    continue
+            elif not isinstance(item, AbstractNodeItem):
+                continue
+            if not item.isVisible():
+                continue
+            if isinstance(item, PipeItem):
+                lines.append(QtCore.QLineF(item.output_port.sceneBoundingRect().center(),
+                                           item.input_port.sceneBoundingRect().center()))
+            else:
+                color = NodeEnum.SELECTED_BORDER_COLOR.value if item.isSelected() else item.color
+                rects.setdefault(tuple(color), []).append(item.sceneBoundingRect())
+        self.overview[cell] = (lines, rects)
+        return lines, rects
+
+    def drawBackground(self, painter, rect):
+        super(CustomNodeViewer, self).drawBackground(painter, rect)
+        if self.lod != LOD_BLOCK:
+            return
+        # Only the cells in view: everything off screen is culled here
+        lines = []
+        rects = {}
+        deadline = time.perf_counter() + OVERVIEW_BUILD_BUDGET
+        pending = False
+        for cell in self.overview_cells(rect):
+            cached = self.overview.get(cell)
+            if cached is None:
+                if time.perf_counter() > deadline:
+                    pending = True
+                    continue
+                cached = self.build_overview_cell(cell)
+            cell_lines, cell_rects = cached
+            lines.extend(cell_lines)
+            for color, node_rects in cell_rects.items():
+                rects.setdefault(color, []).extend(node_rects)
+        painter.save()
+        painter.setPen(QtGui.QPen(QtGui.QColor(*PipeEnum.COLOR.value), 0))
+        painter.drawLines(lines)
+        painter.setPen(QtCore.Qt.NoPen)
+        for color, node_rects in rects.items():
+            painter.setBrush(QtGui.QColor(*color))
+            painter.drawRects(node_rects)
+        painter.restore()
+        if pending:
+            QtCore.QTimer.singleShot(0, self.viewport().update)
+
+    def paintEvent(self, event):
+        if self.lod != LOD_BLOCK:
+            super(CustomNodeViewer, self).paintEvent(event)
+            return
+        # No items are drawn one by one: the overview in drawBackground stands
+        # in for nodes and pipes, and only a connection or cut being dragged
+        # is painted over it
+        painter = QtGui.QPainter(self.viewport())
+        painter.setRenderHints(self.renderHints())
+        painter.setTransform(self.viewportTransform())
+        exposed = self.mapToScene(event.rect()).boundingRect()
+        self.drawBackground(painter, exposed)
+        option = QtWidgets.QStyleOptionGraphicsItem()
+        for item in (self._LIVE_PIPE, self._SLICER_PIPE):
+            if item.isVisible():
+                painter.save()
+                painter.setTransform(item.sceneTransform(), True)
+                item.paint(painter, option, self.viewport())
+                painter.restore()
+        self.drawForeground(painter, exposed)
+        painter.end()
+
+    def _update_scene(self):
+        # Every pan and zoom ends up here
+        super(CustomNodeViewer, self)._update_scene()
+        self.update_level_of_detail()
+
     def wheelEvent(self, event):
         delta = event.angleDelta().y()
         pos = event.position()
@@ -0,0 +1,33 @@
+from PySide6.QtWidgets import QWidget, QVBoxLayout
+from PySide6.QtCore import Signal, QTimer
+from utils.startup_profiler import startup_profiler
+
+
+class LazyWidget(QWidget):
+    built = Signal(QWidget)
+
+    def __init__(self, factory, label, parent=None):
+        super().__init__(parent)
+        self._factory = factory
+        self._label = label
+        self._widget = None
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(layout)
+
+    def is_built(self):
+        return self._widget is not None
+
+    def widget(self):
+        if self._widget is None:
+            with startup_profiler.phase("widget construction", self._label):
+                self._widget = self._factory()
+            self.layout().addWidget(self._widget)
+            self.built.emit(self._widget)
+        return self._widget
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        # Let the window paint once before paying for the real widget
+        if self._widget is None:
+            QTimer.singleShot(0, self.widget)
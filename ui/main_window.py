@@ -1,159 +1,28 @@
-from PySide6.QtWidgets import QMainWindow, QTabWidget, QVBoxLayout, QHBoxLayout, QWidget, QLabel, QMenuBar, QFileDialog, QSplitter, QPushButton
-from PySide6.QtGui import QAction
+import os
+import re
+from PySide6.QtWidgets import QMainWindow, QTabWidget, QVBoxLayout, QHBoxLayout, QWidget, QLabel, QMenuBar, QFileDialog, QSplitter, QPushButton, QMessageBox
+from PySide6.QtGui import QAction, QActionGroup
 from PySide6.QtCore import Qt
-from ui.opengl_widget import OpenGLWidget
-from ui.code_editor import CodeEditor
-from ui.node_editor import NodeEditorView
-from ui.nodes.custom_nodes import TextureNode
-
-class MainWindow(QMainWindow):
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("Interactive Shader Editor")
-        self.resize(1200, 800)
-
-        self.opengl_widget = OpenGLWidget()
-
-        self.node_editor_widget = NodeEditorView()
-        self.node_editor_widget.node_selected.connect(self.update_code_editor)
-
-        self.code_editor = CodeEditor()
-        self.code_editor.textChanged.connect(self.compile_shader)  # Fix this line
-
-        self.opengl_widget.shader_compiled.connect(self.on_shader_compiled)
-
-        self.tabs = QTabWidget()
-        self.tabs.addTab(self.node_editor_widget, "Node Editor")
-        self.tabs.addTab(self.code_editor, "Code Editor")
-
-        self.status_label = QLabel("")
-
-        self.compile_button = QPushButton("Compile")
-        self.compile_button.clicked.connect(self.compile_shader)
-
-        left_layout = QVBoxLayout()
-        left_layout.addWidget(self.tabs)
-        left_layout.addWidget(self.compile_button)
-        left_layout.addWidget(self.status_label)
-
-        left_container = QWidget()
-        left_container.setLayout(left_layout)
-
-        splitter = QSplitter(Qt.Horizontal)
-        splitter.addWidget(left_container)
-        splitter.addWidget(self.opengl_widget)
-        splitter.setSizes([600, 600])
-
-        main_layout = QHBoxLayout()
-        main_layout.addWidget(splitter)
-
-        container = QWidget()
-        container.setLayout(main_layout)
-        self.setCentralWidget(container)
-
-        self.create_menu_bar()
-
-
-    def create_menu_bar(self):
-        menu_bar = QMenuBar(self)
-        file_menu = menu_bar.addMenu("File")
-
-        save_action = QAction("Save", self)
-        save_action.triggered.connect(self.save_shader)
-        load_action = QAction("Load", self)
-        load_action.triggered.connect(self.load_shader)
-        exit_action = QAction("Exit", self)
-        exit_action.triggered.connect(self.close)
-
-        example_action = QAction("Load Blue Shader Example", self)
-        example_action.triggered.connect(self.load_example_shader)
-
-        raymarch_example_action = QAction("Load Ray Marching Shader Example", self)
-        raymarch_example_action.triggered.connect(self.load_raymarch_shader)
-
-        file_menu.addAction(save_action)
-        file_menu.addAction(load_action)
-        file_menu.addAction(example_action)
-        file_menu.addAction(raymarch_example_action)
-        file_menu.addSeparator()
-        file_menu.addAction(exit_action)
-
-        self.setMenuBar(menu_bar)
-
-    def compile_shader(self):
-        if self.tabs.currentWidget() == self.code_editor:
-            fragment_shader_code = self.code_editor.get_code()
-            print(f"Compiling from Code Editor: {fragment_shader_code}")
-            self.opengl_widget.compile_shaders(fragment_shader_code)
-        elif self.tabs.currentWidget() == self.node_editor_widget:
-            # Generate GLSL code from the node editor
-            glsl_code = self.node_editor_widget.generate_glsl_code()
-            print(f"Compiling from Node Editor: {glsl_code}")
-
-            # Ensure the generated code is valid
-            if glsl_code.strip():  # Check if the generated code is non-empty
-                self.opengl_widget.compile_shaders(glsl_code)
-            else:
-                print("No valid GLSL code generated, skipping shader compilation.")
-
-    def compile_selected_node_shader(self):
-        selected_nodes = self.node_editor_widget.node_graph.selected_nodes()
-        if selected_nodes:
-            selected_node = selected_nodes[0]
-            if isinstance(selected_node, TextureNode):
-                texture_path = selected_node.get_property('texture')
-                print(f"Texture path set: {texture_path}")
-                self.opengl_widget.set_texture_path(texture_path)
-            glsl_code = self.node_editor_widget.generate_glsl_code_for_node(selected_node)
-            self.opengl_widget.compile_shaders(glsl_code)
-
-    def on_shader_compiled(self, success, message):
-        self.status_label.setText(message)
-        if success:
-            self.status_label.setStyleSheet("color: green;")
-        else:
-            self.status_label.setStyleSheet("color: red;")
-
-    def save_shader(self):
-        options = QFileDialog.Options()
-        file_path, _ = QFileDialog.getSaveFileName(self, "Save Shader", "", "GLSL Files (*.glsl);;All Files (*)", options=options)
-        if file_path:
-            with open(file_path, 'w') as file:
-                if self.tabs.currentWidget() ==  self.code_editor:
-                    file.write(self.code_editor.get_code())
-                elif self.tabs.currentWidget() == self.node_editor_widget:
-                    glsl_code = self.node_editor_widget.generate_glsl_code()
-                    file.write(glsl_code)
-
-    def load_shader(self):
-        options = QFileDialog.Options()
-        file_path, _ = QFileDialog.getOpenFileName(self, "Load Shader", "", "GLSL Files (*.glsl);;All Files (*)", options=options)
-        if file_path:
-            with open(file_path, 'r') as file:
-                shader_code = file.read()
-                if self.tabs.currentWidget() == self.code_editor:
-                    self.code_editor.set_code(shader_code)
-                elif self.tabs.currentWidget() == self.node_editor_widget:
-                    self.node_editor_widget.scene.parse_shader_code(shader_code)
-
-    def load_example_shader(self):
-        example_fragment_shader_code = """#version 120
-        varying vec2 TexCoords;
-        uniform sampler2D texture1;
-        void main() {
-            gl_FragColor = vec4(0.0, 0.0, 1.0, 1.0);  // Blue color
-        }
-        """
-        self.code_editor.set_code(example_fragment_shader_code)
-        self.tabs.setCurrentWidget(self.code_editor)
-        self.compile_shader()
+from ui.lazy_widget import LazyWidget
+from utils.startup_profiler import startup_profiler
+from utils.tracing import tracer
+from graph.port_types import PortTypeError
+
+PROJECT_EXTENSIONS = (".sep", ".json")
+
+EXAMPLE_SHADER_CODE = """#version 120
+varying vec2 TexCoords;
+uniform sampler2D texture1;
+void main() {
+    gl_FragColor = vec4(0.0, 0.0, 1.0, 1.0);  // Blue color
+}
+"""
 
-    def load_raymarch_shader(self):
-        raymarch_shader_code = """#version 120
+RAYMARCH_SHADER_CODE = """#version 120
 
-#define MAX_STEPS 100
-#define MAX_DISTANCE 100.0
-#define SURFACE_DISTANCE 0.01
+#define MAX_STEPS 100 // @variant quality low=32 medium=64 high=100
+#define MAX_DISTANCE 100.0 // @variant quality low=40.0 medium=70.0 high=100.0
+#define SURFACE_DISTANCE 0.01 // @variant quality low=0.05 medium=0.02 high=0.01
 
 uniform vec2 resolution;
 uniform float iTime;
@@ -285,10 +154,644 @@ void main()
     gl_FragColor = vec4(colour, 1.0);
 }
 """
-        self.code_editor.set_code(raymarch_shader_code)
-        self.tabs.setCurrentWidget(self.code_editor)
+
+class MainWindow(QMainWindow):
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Interactive Shader Editor")
+        self.resize(1200, 800)
+
+        # Heavy subsystems (PyOpenGL, NodeGraphQt) are only built once their
+        # panel is first shown, so the window can paint straight away
+        self.opengl_tab = LazyWidget(self.create_opengl_widget, "opengl widget")
+        self.opengl_tab.built.connect(self.on_opengl_widget_built)
+
+        self.node_editor_tab = LazyWidget(self.create_node_editor, "node editor")
+        self.node_editor_tab.built.connect(self.on_node_editor_built)
+
+        self.code_editor_tab = LazyWidget(self.create_code_editor, "code editor")
+        self.code_editor_tab.built.connect(self.on_code_editor_built)
+
+        self.tabs = QTabWidget()
+        self.tabs.addTab(self.node_editor_tab, "Node Editor")
+        self.tabs.addTab(self.code_editor_tab, "Code Editor")
+
+        self.status_label = QLabel("")
+
+        self.compile_button = QPushButton("Compile")
+        self.compile_button.clicked.connect(self.compile_shader)
+
+        left_layout = QVBoxLayout()
+        left_layout.addWidget(self.tabs)
+        left_layout.addWidget(self.compile_button)
+        left_layout.addWidget(self.status_label)
+
+        left_container = QWidget()
+        left_container.setLayout(left_layout)
+
+        splitter = QSplitter(Qt.Horizontal)
+        splitter.addWidget(left_container)
+        splitter.addWidget(self.opengl_tab)
+        splitter.setSizes([600, 600])
+
+        main_layout = QHBoxLayout()
+        main_layout.addWidget(splitter)
+
+        container = QWidget()
+        container.setLayout(main_layout)
+        self.setCentralWidget(container)
+
+        self.heatmap_reported = False
+        self.shader_watcher = None
+        self.watched_path = None
+        self.export_process = None
+        self.sweep_dialog = None
+        # Generated code waiting for the code editor to be built
+        self.pending_code = None
+        self.create_menu_bar()
+
+    def create_opengl_widget(self):
+        if self.use_software_renderer():
+            from ui.software_viewport import SoftwareViewport
+            return SoftwareViewport()
+        with startup_profiler.phase("imports", "PyOpenGL / NumPy"):
+            from ui.opengl_widget import OpenGLWidget
+        return OpenGLWidget()
+
+    def use_software_renderer(self):
+        # Forced with SHADER_EDITOR_SOFTWARE_RENDERER=1 (main.py --software-renderer),
+        # otherwise used when PyOpenGL is missing or Qt can't create a GL context
+        if os.environ.get("SHADER_EDITOR_SOFTWARE_RENDERER") == "1":
+            return True
+        import importlib.util
+        if importlib.util.find_spec("OpenGL") is None:
+            tracer.warning("PyOpenGL is not available; using the software renderer")
+            return True
+        from PySide6.QtGui import QOpenGLContext
+        if not QOpenGLContext().create():
+            tracer.warning("No OpenGL context available; using the software renderer")
+            return True
+        return False
+
+    def create_node_editor(self):
+        with startup_profiler.phase("imports", "NodeGraphQt"):
+            from ui.node_editor import NodeEditorView
+        return NodeEditorView()
+
+    def create_code_editor(self):
+        from ui.code_editor import CodeEditor
+        return CodeEditor()
+
+    def on_opengl_widget_built(self, widget):
+        widget.shader_compiled.connect(self.on_shader_compiled)
+        widget.heatmap_updated.connect(self.on_heatmap_updated)
+        widget.reload_timed.connect(self.on_reload_timed)
+
+    def on_node_editor_built(self, widget):
+        widget.node_selected.connect(self.update_code_editor)
+        widget.preview_selection_changed.connect(self.on_preview_selection_changed)
+        widget.graph_error.connect(lambda message: self.on_shader_compiled(False, message))
+        widget.bake_enabled = self.bake_action.isChecked()
+        widget.bake_scale = self.bake_scale
+        widget.set_preview_mode(self.preview_mode_action.isChecked())
+
+    def on_code_editor_built(self, widget):
+        widget.code_edited.connect(self.compile_shader)
+        if self.pending_code is not None:
+            widget.set_code(self.pending_code, notify=False)
+            self.pending_code = None
+
+    @property
+    def opengl_widget(self):
+        return self.opengl_tab.widget()
+
+    @property
+    def node_editor_widget(self):
+        return self.node_editor_tab.widget()
+
+    @property
+    def code_editor(self):
+        return self.code_editor_tab.widget()
+
+    def create_menu_bar(self):
+        menu_bar = QMenuBar(self)
+        file_menu = menu_bar.addMenu("File")
+
+        save_action = QAction("Save", self)
+        save_action.triggered.connect(self.save_shader)
+        load_action = QAction("Load", self)
+        load_action.triggered.connect(self.load_shader)
+        exit_action = QAction("Exit", self)
+        exit_action.triggered.connect(self.close)
+
+        example_action = QAction("Load Blue Shader Example", self)
+        example_action.triggered.connect(self.load_example_shader)
+
+        raymarch_example_action = QAction("Load Ray Marching Shader Example", self)
+        raymarch_example_action.triggered.connect(self.load_raymarch_shader)
+
+        screenshot_action = QAction("Save Screenshot...", self)
+        screenshot_action.triggered.connect(self.save_screenshot)
+
+        file_menu.addAction(save_action)
+        file_menu.addAction(load_action)
+        file_menu.addAction(screenshot_action)
+        self.export_action = QAction("Export Animation...", self)
+        self.export_action.triggered.connect(self.export_animation)
+        file_menu.addAction(self.export_action)
+        file_menu.addAction(example_action)
+        file_menu.addAction(raymarch_example_action)
+        file_menu.addSeparator()
+        mesh_action = QAction("Load Preview Mesh...", self)
+        mesh_action.triggered.connect(self.load_preview_mesh)
+        file_menu.addAction(mesh_action)
+        clear_mesh_action = QAction("Clear Preview Mesh", self)
+        clear_mesh_action.triggered.connect(lambda: self.opengl_widget.clear_mesh())
+        file_menu.addAction(clear_mesh_action)
+        file_menu.addSeparator()
+        self.watch_action = QAction("Reload Shader Files on Change", self)
+        self.watch_action.setCheckable(True)
+        self.watch_action.setChecked(True)
+        self.watch_action.toggled.connect(self.set_watch_mode)
+        file_menu.addAction(self.watch_action)
+        file_menu.addSeparator()
+        file_menu.addAction(exit_action)
+
+        view_menu = menu_bar.addMenu("View")
+        self.preview_mode_action = QAction("Node Preview Without Recompiling", self)
+        self.preview_mode_action.setCheckable(True)
+        self.preview_mode_action.setChecked(True)
+        self.preview_mode_action.toggled.connect(self.set_node_preview_mode)
+        view_menu.addAction(self.preview_mode_action)
+
+        self.bake_action = QAction("Bake Static Node Branches", self)
+        self.bake_action.setCheckable(True)
+        self.bake_action.setChecked(True)
+        self.bake_action.toggled.connect(lambda checked: self.set_bake_options(enabled=checked))
+        view_menu.addAction(self.bake_action)
+        self.bake_scale = 1.0
+        bake_menu = view_menu.addMenu("Bake Resolution")
+        bake_group = QActionGroup(self)
+        for label, scale in (("Full", 1.0), ("Half", 0.5), ("Quarter", 0.25)):
+            action = QAction(label, self)
+            action.setCheckable(True)
+            action.setChecked(scale == self.bake_scale)
+            action.triggered.connect(lambda checked, scale=scale: self.set_bake_options(scale=scale))
+            bake_group.addAction(action)
+            bake_menu.addAction(action)
+
+        heatmap_menu = view_menu.addMenu("Cost Heat Map")
+        heatmap_group = QActionGroup(self)
+        for label, metric in (("Off", None), ("Loop Iterations", 0), ("Function Calls", 1)):
+            action = QAction(label, self)
+            action.setCheckable(True)
+            action.setChecked(metric is None)
+            action.triggered.connect(lambda checked, metric=metric: self.set_heatmap_mode(metric))
+            heatmap_group.addAction(action)
+            heatmap_menu.addAction(action)
+
+        # Rebuilt from the shader's "// @variant" axes each time it opens
+        self.variants_menu = view_menu.addMenu("Shader Variants")
+        self.variants_menu.aboutToShow.connect(self.populate_variants_menu)
+        self.adaptive_quality_action = QAction("Adapt Quality to Frame Time", self)
+        self.adaptive_quality_action.setCheckable(True)
+        self.adaptive_quality_action.toggled.connect(self.set_adaptive_quality)
+
+        tools_menu = menu_bar.addMenu("Tools")
+        cost_action = QAction("Analyse Shader Cost", self)
+        cost_action.triggered.connect(self.analyse_shader_cost)
+        tools_menu.addAction(cost_action)
+
+        resources_action = QAction("GL Resources", self)
+        resources_action.triggered.connect(self.show_gl_resources)
+        tools_menu.addAction(resources_action)
+
+        sweep_action = QAction("Parameter Sweep...", self)
+        sweep_action.triggered.connect(self.show_parameter_sweep)
+        tools_menu.addAction(sweep_action)
+
+        self.capture_action = QAction("Record Frame Capture...", self)
+        self.capture_action.setCheckable(True)
+        self.capture_action.triggered.connect(self.toggle_frame_capture)
+        tools_menu.addAction(self.capture_action)
+
+        tools_menu.addSeparator()
+        self.trace_action = QAction("Record Trace", self)
+        self.trace_action.setCheckable(True)
+        self.trace_action.setChecked(tracer.enabled)
+        self.trace_action.toggled.connect(tracer.enable)
+        tools_menu.addAction(self.trace_action)
+        save_trace_action = QAction("Save Trace...", self)
+        save_trace_action.triggered.connect(self.save_trace)
+        tools_menu.addAction(save_trace_action)
+
+        self.setMenuBar(menu_bar)
+
+    def set_node_preview_mode(self, enabled):
+        if self.node_editor_tab.is_built():
+            self.node_editor_widget.set_preview_mode(enabled)
+
+    def set_bake_options(self, enabled=None, scale=None):
+        if scale is not None:
+            self.bake_scale = scale
+        if not self.node_editor_tab.is_built():
+            return
+        if enabled is not None:
+            self.node_editor_widget.bake_enabled = enabled
+        self.node_editor_widget.bake_scale = self.bake_scale
+        # The node preview draws the baked program while nothing is selected
+        if self.node_editor_widget.preview_mode:
+            self.node_editor_widget.update_code_editor(self.node_editor_widget.selected_node)
+        else:
+            self.node_editor_widget.update_code_editor()
+
+    def closeEvent(self, event):
+        if self.opengl_tab.is_built():
+            self.opengl_widget.stop_capture()
+            self.opengl_widget.stop_background_compiler()
+        if self.export_process:
+            # Progress is kept, so the export resumes if it is run again
+            self.export_process.kill()
+            self.export_process.waitForFinished()
+        super().closeEvent(event)
+
+    def populate_variants_menu(self):
+        self.variants_menu.clear()
+        axes = self.opengl_widget.variant_axes if self.opengl_tab.is_built() else {}
+        if not axes:
+            action = self.variants_menu.addAction("No @variant defines in this shader")
+            action.setEnabled(False)
+        for name, axis in axes.items():
+            self.variants_menu.addSection(name.capitalize())
+            group = QActionGroup(self.variants_menu)
+            for option in axis.options:
+                action = QAction(option.capitalize(), self.variants_menu)
+                action.setCheckable(True)
+                action.setChecked(self.opengl_widget.variant_selection.get(name) == option)
+                action.triggered.connect(lambda checked, name=name, option=option:
+                                         self.opengl_widget.set_variant(name, option))
+                group.addAction(action)
+                self.variants_menu.addAction(action)
+        self.variants_menu.addSeparator()
+        self.variants_menu.addAction(self.adaptive_quality_action)
+
+    def set_adaptive_quality(self, enabled):
+        self.opengl_widget.set_adaptive_quality(enabled)
+
+    def set_heatmap_mode(self, metric):
+        self.heatmap_reported = False
+        self.opengl_widget.set_heatmap_mode(metric is not None, metric)
+
+    def on_heatmap_updated(self, summary):
+        from shaders.heatmap import METRICS, format_heatmap_summary
+        stats = summary[METRICS[self.opengl_widget.heatmap_metric]]
+        self.status_label.setText(f"Heat map: {stats['mean']:.1f} {METRICS[self.opengl_widget.heatmap_metric]} per pixel "
+                                  f"(p95 {stats['p95']:.0f}, max {stats['max']:.0f})")
+        self.status_label.setStyleSheet("color: black;")
+        if not self.heatmap_reported:
+            # Full histogram once per shader; the status line keeps updating
+            tracer.info(format_heatmap_summary(summary))
+            self.heatmap_reported = True
+
+    def on_preview_selection_changed(self, index):
+        from graph.glsl_codegen import PREVIEW_UNIFORM
+        self.opengl_widget.set_uniform_value(PREVIEW_UNIFORM, index)
+
+    def compile_shader(self):
+        if self.tabs.currentWidget() is self.code_editor_tab:
+            if self.node_editor_tab.is_built():
+                self.node_editor_widget.invalidate_preview()
+            fragment_shader_code = self.code_editor.get_code()
+            tracer.debug("Compiling from Code Editor: %s", fragment_shader_code)
+            self.opengl_widget.compile_shaders(fragment_shader_code)
+        elif self.tabs.currentWidget() is self.node_editor_tab:
+            if self.node_editor_widget.preview_mode:
+                self.node_editor_widget.invalidate_preview()
+                self.node_editor_widget.update_code_editor(self.node_editor_widget.selected_node)
+                return
+            # Generate GLSL code from the node editor
+            try:
+                glsl_code = self.node_editor_widget.generate_glsl_code()
+            except PortTypeError as e:
+                self.on_shader_compiled(False, str(e))
+                return
+            tracer.debug("Compiling from Node Editor: %s", glsl_code)
+
+            # Ensure the generated code is valid
+            if glsl_code.strip():  # Check if the generated code is non-empty
+                self.opengl_widget.compile_shaders(glsl_code)
+            else:
+                tracer.info("No valid GLSL code generated, skipping shader compilation.")
+
+    def analyse_shader_cost(self):
+        from shaders.cost_analysis import analyse_shader_cost
+        on_code_tab = self.tabs.currentWidget() is self.code_editor_tab
+        if on_code_tab:
+            code = self.code_editor.get_code()
+        else:
+            # The full graph keeps its "// Begin ... Node" markers, so the
+            # report can attribute cost back to nodes
+            try:
+                code = self.node_editor_widget.build_glsl_code()
+            except PortTypeError as e:
+                self.on_shader_compiled(False, str(e))
+                return
+        if not code.strip():
+            return
+        report = analyse_shader_cost(code)
+        if on_code_tab:
+            self.code_editor.set_hotspots([(line, cost.total()) for line, cost in report.hot_lines()])
+        summary = f"~{report.per_pixel.alu:.0f} ALU ops, {report.per_pixel.texture:.0f} texture fetches per pixel"
+        self.status_label.setText(summary)
+        box = QMessageBox(QMessageBox.Information, "Shader Cost", summary, QMessageBox.Ok, self)
+        box.setDetailedText(report.format())
+        box.exec()
+
+    def show_gl_resources(self):
+        from shaders.gl_resources import gl_resources
+        box = QMessageBox(QMessageBox.Information, "GL Resources", "Live OpenGL objects by kind and owner.",
+                          QMessageBox.Ok, self)
+        box.setDetailedText(gl_resources.format_summary())
+        box.exec()
+
+    def show_parameter_sweep(self):
+        from ui.sweep_dialog import ParameterSweepDialog
+        if self.sweep_dialog is None:
+            self.sweep_dialog = ParameterSweepDialog(self.render_parameter_sweep, self.sweep_spec_template(), self)
+        self.sweep_dialog.show()
+        self.sweep_dialog.raise_()
+
+    def sweep_spec_template(self):
+        # A starting point: every float uniform, or the selected node's numbers
+        if self.tabs.currentWidget() is self.code_editor_tab:
+            from shaders.render_graph import BUILTIN_UNIFORMS
+            names = re.findall(r"uniform\s+float\s+(\w+)\s*;", self.code_editor.get_code())
+            return "\n".join(f"{name} = 0:1:5" for name in names if name not in BUILTIN_UNIFORMS)
+        node = self.node_editor_widget.selected_node
+        if node is None:
+            return ""
+        return "\n".join(f"{node.name()}.{prop} = {value * 0.5:g}:{value * 2.0:g}:5"
+                         for prop, value in node.model.custom_properties.items() if isinstance(value, float))
+
+    def render_parameter_sweep(self, spec, tile_width, tile_height):
+        from shaders.parameter_sweep import parse_sweep_spec, uniform_variants, grid_columns, format_sweep_stats
+        from shaders.render_graph import is_multipass_source
+        parameters = parse_sweep_spec(spec)
+        if not parameters:
+            raise ValueError("Nothing to sweep")
+        if self.tabs.currentWidget() is self.code_editor_tab:
+            source = self.code_editor.get_code()
+            if is_multipass_source(source):
+                raise ValueError("Multi-pass shaders can't be swept")
+            variants = uniform_variants(source, parameters)
+        else:
+            variants = self.node_editor_widget.sweep_variants(parameters)
+        pixels, tiles, stats = self.opengl_widget.render_sweep(variants, tile_width, tile_height,
+                                                               grid_columns(parameters, len(variants)))
+        return pixels, tiles, format_sweep_stats(stats)
+
+    def toggle_frame_capture(self, checked):
+        if not checked:
+            frames = self.opengl_widget.stop_capture()
+            self.status_label.setText(f"Frame capture stopped after {frames} frames.")
+            return
+        options = QFileDialog.Options()
+        file_name, _ = QFileDialog.getSaveFileName(self, "Record Frame Capture", "",
+                                                   "Frame Capture (*.sefc);;All Files (*)", options=options)
+        if not file_name:
+            self.capture_action.setChecked(False)
+            return
+        if not file_name.endswith(".sefc"):
+            file_name += ".sefc"
+        self.opengl_widget.start_capture(file_name)
+        self.status_label.setText(f"Recording frames to {file_name}")
+
+    def save_trace(self):
+        options = QFileDialog.Options()
+        file_name, _ = QFileDialog.getSaveFileName(self, "Save Trace", "", "Chrome Trace (*.json);;All Files (*)",
+                                                   options=options)
+        if not file_name:
+            return
+        try:
+            events = tracer.save(file_name)
+        except OSError as e:
+            self.on_shader_compiled(False, f"Could not save trace: {e}")
+            return
+        message = f"Saved {events} trace events to {file_name}"
+        if tracer.dropped():
+            message += f" ({tracer.dropped()} older events dropped)"
+        self.status_label.setText(message)
+
+    def compile_selected_node_shader(self):
+        from ui.nodes.custom_nodes import TextureNode
+        selected_nodes = self.node_editor_widget.node_graph.selected_nodes()
+        if selected_nodes:
+            selected_node = selected_nodes[0]
+            if isinstance(selected_node, TextureNode):
+                texture_path = selected_node.get_property('texture')
+                tracer.info("Texture path set: %s", texture_path)
+                self.opengl_widget.set_texture_path(texture_path)
+            try:
+                glsl_code = self.node_editor_widget.generate_glsl_code_for_node(selected_node)
+            except PortTypeError as e:
+                self.on_shader_compiled(False, str(e))
+                return
+            self.opengl_widget.compile_shaders(glsl_code)
+
+    def on_shader_compiled(self, success, message):
+        self.heatmap_reported = False
+        self.status_label.setText(message)
+        if success:
+            self.status_label.setStyleSheet("color: green;")
+        else:
+            self.status_label.setStyleSheet("color: red;")
+
+    def save_shader(self):
+        options = QFileDialog.Options()
+        if self.tabs.currentWidget() is self.node_editor_tab:
+            file_filter = "Shader Project (*.sep);;JSON Project (*.json);;GLSL Files (*.glsl);;All Files (*)"
+        else:
+            file_filter = "GLSL Files (*.glsl);;All Files (*)"
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save Shader", "", file_filter, options=options)
+        if file_path:
+            if self.tabs.currentWidget() is self.node_editor_tab:
+                if file_path.lower().endswith(PROJECT_EXTENSIONS):
+                    self.node_editor_widget.save_project(file_path)
+                else:
+                    try:
+                        glsl_code = self.node_editor_widget.generate_glsl_code()
+                    except PortTypeError as e:
+                        self.on_shader_compiled(False, f"Could not save shader: {e}")
+                        return
+                    with open(file_path, 'w') as file:
+                        file.write(glsl_code)
+            elif self.tabs.currentWidget() is self.code_editor_tab:
+                with open(file_path, 'w') as file:
+                    file.write(self.code_editor.get_code())
+
+    def load_shader(self):
+        options = QFileDialog.Options()
+        if self.tabs.currentWidget() is self.node_editor_tab:
+            file_filter = "Shader Project (*.sep *.json);;All Files (*)"
+        else:
+            file_filter = "GLSL Files (*.glsl);;All Files (*)"
+        file_path, _ = QFileDialog.getOpenFileName(self, "Load Shader", "", file_filter, options=options)
+        if file_path:
+            if self.tabs.currentWidget() is self.node_editor_tab:
+                try:
+                    self.node_editor_widget.load_project(file_path)
+                except (ValueError, KeyError) as e:
+                    self.on_shader_compiled(False, f"Could not load project: {e}")
+            elif self.tabs.currentWidget() is self.code_editor_tab:
+                from shaders.shader_utils import load_shader_source_with_includes
+                self.watched_path = file_path
+                try:
+                    if self.watch_action.isChecked():
+                        source = self.watcher().watch(file_path)
+                    else:
+                        source, _ = load_shader_source_with_includes(file_path)
+                except (OSError, ValueError) as e:
+                    self.on_shader_compiled(False, f"Could not load shader: {e}")
+                    return
+                self.code_editor.set_code(source, notify=False)
+                self.compile_shader()
+
+    def load_preview_mesh(self):
+        options = QFileDialog.Options()
+        file_path, _ = QFileDialog.getOpenFileName(self, "Load Preview Mesh", "",
+                                                   "Meshes (*.obj *.ply);;All Files (*)", options=options)
+        if not file_path:
+            return
+        try:
+            message = self.opengl_widget.load_mesh(file_path)
+        except (OSError, ValueError, RuntimeError) as e:
+            self.on_shader_compiled(False, f"Could not load mesh: {e}")
+            return
+        tracer.info(message)
+        self.on_shader_compiled(True, message)
+
+    def watcher(self):
+        if self.shader_watcher is None:
+            from ui.shader_watcher import ShaderFileWatcher
+            self.shader_watcher = ShaderFileWatcher(parent=self)
+            self.shader_watcher.source_changed.connect(self.on_watched_source_changed)
+            self.shader_watcher.reload_failed.connect(
+                lambda path, error: self.on_shader_compiled(False, f"Could not reload {path}: {error}"))
+        return self.shader_watcher
+
+    def set_watch_mode(self, enabled):
+        if not enabled:
+            if self.shader_watcher:
+                self.shader_watcher.unwatch()
+        elif self.watched_path:
+            try:
+                self.watcher().watch(self.watched_path)
+            except (OSError, ValueError) as e:
+                self.on_shader_compiled(False, f"Could not watch shader: {e}")
+
+    def on_watched_source_changed(self, path, source, timing):
+        self.code_editor.set_code(source, notify=False)
+        self.opengl_widget.compile_shaders_in_background(source, timing)
+
+    def on_reload_timed(self, timing):
+        total = (timing["frame"] - timing["saved"]) * 1000.0
+        stages = (("debounce", "event", "read"), ("compile", "read", "compiled"), ("present", "compiled", "frame"))
+        details = ", ".join(f"{name} {(timing[end] - timing[start]) * 1000.0:.0f} ms" for name, start, end in stages)
+        self.status_label.setText(f"Reloaded {os.path.basename(self.watched_path or '')}: "
+                                  f"{total:.0f} ms from save to frame ({details})")
+        self.status_label.setStyleSheet("color: green;")
+
+    def save_screenshot(self):
+        options = QFileDialog.Options()
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save Screenshot", "", "PNG Image (*.png);;All Files (*)",
+                                                   options=options)
+        if not file_path:
+            return
+
+        def on_frame(request_id, pixels):
+            from PySide6.QtGui import QImage
+            height, width, _ = pixels.shape
+            # pixels is a flipped view of the mapped buffer: QImage copies it
+            # before the buffer is unmapped
+            image = QImage(pixels.tobytes(), width, height, width * 4, QImage.Format_RGBA8888).copy()
+            if image.save(file_path):
+                self.status_label.setText(f"Screenshot saved to {file_path}")
+            else:
+                self.on_shader_compiled(False, f"Could not save screenshot to {file_path}")
+
+        self.opengl_widget.grab_frame_async(on_frame)
+
+    def export_animation(self):
+        import sys
+        import tempfile
+        from PySide6.QtCore import QProcess
+        from PySide6.QtWidgets import QInputDialog
+        source = self.opengl_widget.shader_source
+        if not source:
+            self.on_shader_compiled(False, "Compile a shader before exporting.")
+            return
+        options = QFileDialog.Options()
+        file_path, selected_filter = QFileDialog.getSaveFileName(
+            self, "Export Animation", "",
+            "PNG Sequence (folder) (*);;Y4M Video (*.y4m);;Raw RGBA Video (*.raw)", options=options)
+        if not file_path:
+            return
+        if selected_filter.startswith("Y4M") and not file_path.endswith(".y4m"):
+            file_path += ".y4m"
+        elif selected_filter.startswith("Raw") and not file_path.endswith(".raw"):
+            file_path += ".raw"
+        frames, ok = QInputDialog.getInt(self, "Export Animation", "Frames:", 240, 1, 1000000)
+        if not ok:
+            return
+        fps, ok = QInputDialog.getDouble(self, "Export Animation", "Frames per second:", 60.0, 1.0, 240.0, 2)
+        if not ok:
+            return
+
+        # The export renders in its own headless context, off the UI thread
+        with tempfile.NamedTemporaryFile("w", suffix=".glsl", delete=False) as file:
+            file.write(source)
+        script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "export_animation.py")
+        # Even dimensions, which Y4M's 4:2:0 chroma needs
+        size = f"{self.opengl_widget.width() // 2 * 2}x{self.opengl_widget.height() // 2 * 2}"
+        self.export_process = QProcess(self)
+        self.export_process.setProcessChannelMode(QProcess.MergedChannels)
+        self.export_process.readyReadStandardOutput.connect(self.on_export_output)
+        self.export_process.finished.connect(lambda code, status: self.on_export_finished(code, file.name))
+        self.export_process.start(sys.executable, [script, file.name, file_path, "--frames", str(frames),
+                                                   "--fps", str(fps), "--size", size])
+        self.export_action.setEnabled(False)
+        self.status_label.setText(f"Exporting to {file_path}")
+        self.status_label.setStyleSheet("color: black;")
+
+    def on_export_output(self):
+        output = bytes(self.export_process.readAllStandardOutput()).decode("utf-8", "replace")
+        for line in output.splitlines():
+            if line.startswith("progress "):
+                self.status_label.setText(f"Exporting: {line[len('progress '):]}")
+            else:
+                tracer.info(line)
+
+    def on_export_finished(self, exit_code, source_path):
+        os.unlink(source_path)
+        self.export_process = None
+        self.export_action.setEnabled(True)
+        self.on_shader_compiled(exit_code == 0, "Export finished." if exit_code == 0 else "Export failed, see the console.")
+
+    def load_example_shader(self):
+        self.code_editor.set_code(EXAMPLE_SHADER_CODE, notify=False)
+        self.tabs.setCurrentWidget(self.code_editor_tab)
+        self.compile_shader()
+
+    def load_raymarch_shader(self):
+        self.code_editor.set_code(RAYMARCH_SHADER_CODE, notify=False)
+        self.tabs.setCurrentWidget(self.code_editor_tab)
         self.compile_shader()
 
     def update_code_editor(self, code):
-        self.code_editor.set_code(code)
+        # Compiled right here, so the edit mustn't trigger a second compile.
+        # Node edits don't build the code editor; it shows the code once opened.
+        if self.code_editor_tab.is_built():
+            self.code_editor.set_code(code, notify=False)
+        else:
+            self.pending_code = code
         self.opengl_widget.compile_shaders(code)
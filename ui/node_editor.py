@@ -1,19 +1,82 @@
+import collections
+import re
+import time
+from contextlib import contextmanager
 from NodeGraphQt.widgets.viewer import NodeViewer
 from PySide6 import QtWidgets, QtGui, QtCore
 from NodeGraphQt import NodeGraph
+from NodeGraphQt.constants import PortTypeEnum
 from ui.nodes.custom_nodes import MaterialNode, ColorNode, BlendNode, TextureNode, UVNode, GradientNode, AddNode
 from PySide6.QtGui import QCursor, QKeyEvent
 from ui.custom_viewer import CustomNodeViewer
+from graph.project_format import save_project, load_project
+from graph.port_types import PortTypeError
+from graph.shader_graph import ShaderGraph
+from graph.glsl_codegen import GlslGenerator
+from utils.tracing import tracer
+
+# Seconds per event loop turn spent building the views of an imported project
+VIEW_BUILD_BUDGET = 0.016
+NODE_CLASSES = {cls.__name__: cls for cls in (MaterialNode, ColorNode, BlendNode, TextureNode, UVNode, GradientNode, AddNode)}
+
+
+class ShaderNodeGraph(NodeGraph):
+    def __init__(self, *args, **kwargs):
+        super(ShaderNodeGraph, self).__init__(*args, **kwargs)
+        # How many nodes use each name, kept up to date as nodes come, go and
+        # are renamed, so get_unique_name needn't list them all every time
+        self.node_names = {}  # node id -> name
+        self.name_counts = {}
+        self.viewer().node_item_added.connect(self._count_added_node)
+        self.viewer().node_item_removed.connect(self._count_removed_node)
+        self.property_changed.connect(self._count_renamed_node)
+
+    def _count_name(self, name, count):
+        self.name_counts[name] = self.name_counts.get(name, 0) + count
+
+    def _count_added_node(self, node_id):
+        node = self.get_node_by_id(node_id)
+        if node is not None and node_id not in self.node_names:
+            self.node_names[node_id] = node.name()
+            self._count_name(node.name(), 1)
+
+    def _count_removed_node(self, node_id):
+        name = self.node_names.pop(node_id, None)
+        if name is not None:
+            self._count_name(name, -1)
+
+    def _count_renamed_node(self, node, name, value):
+        if name == 'name' and node.id in self.node_names:
+            self._count_name(self.node_names[node.id], -1)
+            self.node_names[node.id] = value
+            self._count_name(value, 1)
+
+    def get_unique_name(self, name):
+        # NodeGraph's naming ("Color", "Color 1", ...) over the counts
+        name = ' '.join(name.split())
+        if not self.name_counts.get(name):
+            return name
+        search = re.search(r'\w+ (\d+)$', name)
+        if search:
+            name = name[:-len(search.group(1))].strip()
+        suffix = 1
+        while self.name_counts.get(f"{name} {suffix}"):
+            suffix += 1
+        return f"{name} {suffix}"
+
 
 class NodeEditorView(QtWidgets.QWidget):
     node_selected = QtCore.Signal(str)
+    preview_selection_changed = QtCore.Signal(int)
+    # The graph can't be turned into a shader, or a connection was refused
+    graph_error = QtCore.Signal(str)
 
     def __init__(self):
         super(NodeEditorView, self).__init__()
         layout = QtWidgets.QVBoxLayout(self)
         self.setLayout(layout)
 
-        self.node_graph = NodeGraph(viewer=CustomNodeViewer())
+        self.node_graph = ShaderNodeGraph(viewer=CustomNodeViewer())
         self.node_graph_widget = self.node_graph.widget
         layout.addWidget(self.node_graph_widget)
 
@@ -22,15 +85,109 @@ class NodeEditorView(QtWidgets.QWidget):
 
         self.node_graph.node_double_clicked.connect(self.on_node_double_clicked)
         self.node_graph.node_selected.connect(self.on_node_selected)
+        # Edits in the viewer write through to the model as they happen
+        self.node_graph.property_changed.connect(self.on_property_changed)
+        self.node_graph.port_connected.connect(self.on_port_connected)
+        self.node_graph.port_disconnected.connect(self.on_port_disconnected)
+        self.node_graph.viewer().node_item_added.connect(self.on_node_added)
+        self.node_graph.viewer().node_item_removed.connect(self.on_node_removed)
+        # Registered so copy/paste and undo can recreate nodes by type
+        self.node_graph.register_nodes(list(NODE_CLASSES.values()))
 
         self.selected_node = None
+        self.transaction_depth = 0
+        self.transaction_dirty = False
+
+        # In preview mode the whole graph is compiled once with every node's
+        # value reachable, and selection only changes the previewNode uniform
+        self.preview_mode = True
+        self.preview_code = None
+        self.preview_index = {}
+        self.preview_revision = None
+        self.emitted_code = None  # what the viewport was last sent in preview mode
+
+        # Full-graph compiles render static branches once into textures, at
+        # bake_scale times the viewport's resolution. In preview mode that
+        # is the program drawn while no node is selected.
+        self.bake_enabled = True
+        self.bake_scale = 1.0
+        self.baked_code = None
+        self.baked_key = None
+
+        # The nodes in the viewer are views of this model, which generates
+        # the code; the handlers below write their edits through to it
+        self.shader_graph = ShaderGraph()
+        self.model_nodes = {}  # view node id -> node in shader_graph
+        self.views = {}  # node in shader_graph -> view node
+        # Nodes added without connection signals (paste and its redo), whose
+        # connections are read from the viewer before the next codegen
+        self.unconnected_nodes = set()
+        self.refusing = False
+        # Bumped by every edit that changes the generated code
+        self.revision = 0
+
+        # Model nodes still waiting for a view after an import
+        self.view_queue = collections.deque()
+        self.view_consumers = {}  # node -> [(output port, node, input port)] it feeds
+        self.view_timer = QtCore.QTimer(self)
+        self.view_timer.setInterval(0)
+        self.view_timer.timeout.connect(lambda: self.create_views(VIEW_BUILD_BUDGET))
 
     def keyPressEvent(self, event: QKeyEvent):
+        ctrl = event.modifiers() & QtCore.Qt.ControlModifier
+        shift = event.modifiers() & QtCore.Qt.ShiftModifier
         if event.key() in (QtCore.Qt.Key_Delete, QtCore.Qt.Key_Backspace):
             self.delete_selected_node()
+        elif ctrl and event.key() == QtCore.Qt.Key_C:
+            self.node_graph.copy_nodes()
+        elif ctrl and event.key() == QtCore.Qt.Key_V:
+            self.paste_nodes()
+        elif ctrl and event.key() == QtCore.Qt.Key_Z:
+            self.redo() if shift else self.undo()
+        elif ctrl and event.key() == QtCore.Qt.Key_Y:
+            self.redo()
         else:
             super(NodeEditorView, self).keyPressEvent(event)
 
+    def begin_transaction(self):
+        self.transaction_depth += 1
+
+    def commit_transaction(self):
+        self.transaction_depth -= 1
+        if self.transaction_depth == 0 and self.transaction_dirty:
+            self.transaction_dirty = False
+            self.update_code_editor()
+
+    @contextmanager
+    def transaction(self):
+        # Codegen, the code editor update and the compile are held back until
+        # the outermost transaction commits, then run exactly once
+        self.begin_transaction()
+        try:
+            yield self
+        finally:
+            self.commit_transaction()
+
+    def in_transaction(self):
+        return self.transaction_depth > 0
+
+    def paste_nodes(self):
+        with self.transaction():
+            nodes = self.node_graph.paste_nodes()
+            if nodes:
+                self.update_code_editor()
+        return nodes
+
+    def undo(self):
+        with self.transaction():
+            self.node_graph.undo_stack().undo()
+            self.update_code_editor()
+
+    def redo(self):
+        with self.transaction():
+            self.node_graph.undo_stack().redo()
+            self.update_code_editor()
+
     def open_context_menu(self, position):
         menu = QtWidgets.QMenu(self)
         pos = QCursor.pos()
@@ -61,62 +218,313 @@ class NodeEditorView(QtWidgets.QWidget):
             self.add_node(AddNode, "Add Node", position)
 
     def add_node(self, node_class, name, pos, **kwargs):
-        node = node_class()
-        node.set_name(name)
-        self.node_graph.add_node(node)
-        node.set_pos(pos.x(), pos.y())
-        self.update_code_editor()
+        with self.transaction():
+            node = node_class()
+            node.set_name(name)
+            self.node_graph.add_node(node)
+            node.set_pos(pos.x(), pos.y())
+            self.update_code_editor()
         return node
 
     def delete_selected_node(self):
-        if self.selected_node:
-            self.node_graph.remove_node(self.selected_node)
+        nodes = self.node_graph.selected_nodes() or ([self.selected_node] if self.selected_node else [])
+        if nodes:
+            with self.transaction():
+                self.node_graph.delete_nodes(nodes)
+                self.selected_node = None
+                self.update_code_editor()
+        else:
+            QtWidgets.QMessageBox.warning(self, "No Node Selected", "Please select a node to delete.")
+
+    def export_project(self):
+        # Dragging nodes doesn't signal; positions are only read on save
+        graph = self.update_shader_graph()
+        for index, node in self.views.items():
+            graph.set_position(index, *node.pos())
+        return graph.to_project()
+
+    def import_project(self, project):
+        # The model is built and the shader generated right away; the views,
+        # which cost far more to build, follow a batch per event loop turn
+        # (see create_views), so a large project opens without a stall
+        with self.transaction():
+            self.node_graph.clear_session()
             self.selected_node = None
+            graph = ShaderGraph.from_project(project)
+            graph.names = unique_names(graph.names)
+            self.shader_graph = graph
+            self.model_nodes = {}
+            self.views = {}
+            self.unconnected_nodes = set()
+            self.revision += 1
+            self.view_queue = collections.deque(graph.node_ids())
+            self.view_consumers = {}
+            for out_node, out_port, in_node, in_port in graph.edges():
+                self.view_consumers.setdefault(out_node, []).append((out_port, in_node, in_port))
             self.update_code_editor()
+        self.view_timer.start()
+
+    def create_views(self, budget=None):
+        # Views for queued model nodes, for up to budget seconds (all of
+        # them if None), without undo commands or connection signals, each
+        # connected to the neighbours that already have views
+        graph = self.shader_graph
+        deadline = None if budget is None else time.perf_counter() + budget
+        created = []
+        while self.view_queue and (deadline is None or time.perf_counter() < deadline):
+            index = self.view_queue.popleft()
+            if not graph.is_live(index):
+                continue
+            node = NODE_CLASSES[graph.type_name(index)]()
+            node.model.set_property('uid', graph.uids[index])
+            for prop_name, value in graph.properties(index).items():
+                node.model.set_property(prop_name, value)
+                widget = node.view.widgets.get(prop_name)
+                if widget:
+                    widget.blockSignals(True)
+                    widget.set_value(value)
+                    widget.blockSignals(False)
+            # Registered first, so on_node_added leaves the model alone
+            self.model_nodes[node.id] = index
+            self.views[index] = node
+            self.node_graph.add_node(node, pos=list(graph.position(index)), selected=False, push_undo=False)
+            # set_name, without an undo command
+            node.set_property('name', graph.names[index], push_undo=False)
+
+            edges = [(out_node, out_port, index, in_port) for in_port, out_node, out_port in graph.sources(index)]
+            edges += [(index, out_port, in_node, in_port)
+                      for out_port, in_node, in_port in self.view_consumers.pop(index, ())]
+            for out_node, out_port, in_node, in_port in edges:
+                # Skipped if either end has no view yet, or it was rewired
+                if out_node in self.views and in_node in self.views and \
+                        graph.source(in_node, in_port) == (out_node, out_port):
+                    self.views[in_node].input(in_port).connect_to(self.views[out_node].output(out_port),
+                                                                  push_undo=False, emit_signal=False)
+            created.append(node)
+        if not self.view_queue:
+            self.view_timer.stop()
+            self.view_consumers = {}
+        return created
+
+    def save_project(self, file_path):
+        save_project(self.export_project(), file_path)
+
+    def load_project(self, file_path):
+        return self.import_project(load_project(file_path))
+
+    def on_node_added(self, node_id):
+        node = self.node_graph.get_node_by_id(node_id)
+        if node is None or node_id in self.model_nodes:
+            return
+        properties = dict(node.model.custom_properties)
+        uid = properties.pop('uid')
+        index = self.shader_graph.add_node(type(node).__name__, node.name(), *node.pos(), properties, uid)
+        self.model_nodes[node_id] = index
+        self.views[index] = node
+        self.unconnected_nodes.add(index)
+        self.revision += 1
+
+    def on_node_removed(self, node_id):
+        index = self.model_nodes.pop(node_id, None)
+        if index is None:
+            return
+        # The view keeps the uid the model gave it, so undoing the delete
+        # brings the node back in the same place in the code
+        self.views.pop(index).model.set_property('uid', self.shader_graph.uids[index])
+        self.unconnected_nodes.discard(index)
+        self.shader_graph.remove_node(index)
+        self.revision += 1
+
+    def on_property_changed(self, node, name, value):
+        index = self.model_nodes.get(node.id)
+        if index is None:
+            return
+        graph = self.shader_graph
+        if name == 'pos':
+            graph.set_position(index, *value)
+            return
+        if name == 'name':
+            if graph.names[index] == value:
+                return
+            graph.names[index] = value
+        elif name in graph.spec(index).property_keys:
+            graph.set_property(index, name, value)
         else:
-            QtWidgets.QMessageBox.warning(self, "No Node Selected", "Please select a node to delete.")
+            return
+        self.revision += 1
+
+    def model_port(self, port):
+        # (node, port index) in the model of a view's port, or None
+        index = self.model_nodes.get(port.node().id)
+        if index is None:
+            return None
+        spec = self.shader_graph.spec(index)
+        names = spec.inputs if port.type_() == PortTypeEnum.IN.value else spec.outputs
+        return index, names.index(port.name())
+
+    def write_connection(self, in_port, out_port):
+        target = self.model_port(in_port)
+        source = self.model_port(out_port)
+        if target and source:
+            self.shader_graph.connect(*source, *target)
+            self.revision += 1
+
+    def on_port_connected(self, in_port, out_port):
+        # Connections that wouldn't compile are refused. This relies on how
+        # NodeGraphQt 0.6.37 (see requirements.txt) connects ports: the
+        # signal comes from inside the undo macro making the connection, so
+        # it's refused once that macro is complete (see refuse_connection).
+        self.write_connection(in_port, out_port)
+        if self.refusing:
+            return
+        try:
+            self.shader_graph.port_types()
+        except PortTypeError as e:
+            index = self.node_graph.undo_stack().index()
+            error = str(e)
+            QtCore.QTimer.singleShot(0, lambda: self.refuse_connection(in_port, out_port, index, error))
+
+    def on_port_disconnected(self, in_port, out_port):
+        target = self.model_port(in_port)
+        if target and self.shader_graph.source(*target) == self.model_port(out_port):
+            self.shader_graph.disconnect(*target)
+            self.revision += 1
+
+    def refuse_connection(self, in_port, out_port, index, error):
+        if out_port not in in_port.connected_ports():
+            return
+        stack = self.node_graph.undo_stack()
+        self.refusing = True
+        try:
+            if stack.index() == index + 1:
+                # Undone as a whole, so a connection it replaced comes back;
+                # the stack then drops it as obsolete instead of undoing it
+                command = stack.command(index)
+                command.undo()
+                command.setObsolete(True)
+                stack.undo()
+            else:
+                # Connected without an undo command
+                in_port.disconnect_from(out_port, push_undo=False)
+        finally:
+            self.refusing = False
+        self.graph_error.emit(f"Connection refused: {error}")
+
+    def update_shader_graph(self):
+        # Reads the connections of nodes added without signals; every other
+        # edit is already in the model
+        for index in self.unconnected_nodes:
+            node = self.views[index]
+            for port in node.input_ports() + node.output_ports():
+                for connected in port.connected_ports():
+                    if port.type_() == PortTypeEnum.IN.value:
+                        self.write_connection(port, connected)
+                    else:
+                        self.write_connection(connected, port)
+        self.unconnected_nodes.clear()
+        return self.shader_graph
+
+    def glsl_generator(self):
+        # Code generation over the model; raises PortTypeError for a graph
+        # that can't compile
+        return GlslGenerator(self.update_shader_graph())
 
+    @tracer.traced("generate_glsl_code", "codegen")
     def generate_glsl_code(self):
-        generated_code = []
-        used_vars = set()
-        final_output_var = None
-
-        for node in self.node_graph.all_nodes():
-            if hasattr(node, 'generate_glsl'):
-                var_name = node.generate_glsl(generated_code, used_vars)
-                final_output_var = var_name
-
-        # Construct the final GLSL code
-        if final_output_var:
-            # Ensure the final output variable is a vec3 before using it in a vec4 context
-            final_code = f"""#version 120
-    {self.format_glsl_code(generated_code)}
-
-    void main() {{
-        vec3 color = {final_output_var}.rgb;  // Ensure it's a vec3
-        gl_FragColor = vec4(color, 1.0);  // Convert to vec4 with alpha 1.0
-    }}
-    """
+        generator = self.glsl_generator()
+        if self.bake_enabled:
+            final_code = generator.build_baked_glsl_code(self.bake_scale)
         else:
-            final_code = """#version 120
-    void main() {
-        gl_FragColor = vec4(0.0, 0.0, 0.0, 1.0);  // Default to black if no output
-    }
-    """
-
-        # Output for debugging purposes
-        print(f"Generated GLSL code:\n{final_code}")
+            final_code = generator.build_glsl_code()
+        tracer.debug("Generated GLSL code:\n%s", final_code)
         return final_code
 
-    def format_glsl_code(self, code_lines):
-        formatted_code = ""
-        indent = "    "
-        for line in code_lines:
-            if line.strip().startswith("//"):
-                formatted_code += f"{line}\n"
-            else:
-                formatted_code += f"{indent}{line}\n"
-        return formatted_code
+    def generate_baked_preview_code(self):
+        # The multi-pass baked program, or None if nothing can be baked
+        key = (self.revision, self.bake_scale)
+        if key != self.baked_key:
+            generator = self.glsl_generator()
+            roots, _ = generator.bake_roots()
+            self.baked_code = generator.build_baked_glsl_code(self.bake_scale) if roots else None
+            self.baked_key = key
+        return self.baked_code
+
+    def build_glsl_code(self):
+        return self.glsl_generator().build_glsl_code()
+
+    def build_baked_glsl_code(self):
+        # A multi-pass shader with static branches baked (see GlslGenerator)
+        return self.glsl_generator().build_baked_glsl_code(self.bake_scale)
+
+    def sweep_variants(self, parameters):
+        # parameters: [("Node Name.property", [values])]. Numeric properties
+        # become uniforms so all their values share one program; named ones
+        # (blend mode, shading model) need a program per value.
+        from shaders.parameter_sweep import (sweep_combinations, sentinel_values, promote_sentinels,
+                                             sweep_value_as_uniform, variant_label)
+        graph = self.update_shader_graph()
+        targets = []
+        for name, values in parameters:
+            node_name, _, prop = name.rpartition(".")
+            view = self.node_graph.get_node_by_name(node_name)
+            if view is None or prop not in graph.spec(self.model_nodes[view.id]).property_keys:
+                raise ValueError(f"No node property '{name}'; use 'Node Name.property'")
+            node = self.model_nodes[view.id]
+            current = graph.get_property(node, prop)
+            numeric = all(not isinstance(value, str) for value in values)
+            for value in values:
+                if numeric and isinstance(current, (tuple, list)) and \
+                        (not isinstance(value, tuple) or len(value) != len(current)):
+                    raise ValueError(f"{name} needs {len(current)} components per value")
+            targets.append((name, node, prop, current, numeric))
+
+        def set_value(node, prop, value):
+            # Model only: the views and the compiled shader stay as they are
+            graph.set_property(node, prop, value)
+
+        sources = {}
+        variants = []
+        try:
+            for index, (name, node, prop, current, numeric) in enumerate(targets):
+                if numeric:
+                    set_value(node, prop, sentinel_values(index, parameters[index][1][0]))
+            for values in sweep_combinations(parameters):
+                named = tuple((name, values[name]) for name, _, _, _, numeric in targets if not numeric)
+                if named not in sources:
+                    for name, value in named:
+                        _, node, prop, _, _ = next(target for target in targets if target[0] == name)
+                        set_value(node, prop, value)
+                    source = GlslGenerator(graph).build_glsl_code()
+                    components = {}
+                    for index, (name, _, _, _, numeric) in enumerate(targets):
+                        if numeric:
+                            source, components[name] = promote_sentinels(source, index, values[name])
+                    sources[named] = (source, components)
+                source, components = sources[named]
+                uniforms = {}
+                for name, mapping in components.items():
+                    value = sweep_value_as_uniform(values[name])
+                    for uniform, component in mapping.items():
+                        uniforms[uniform] = value[component] if isinstance(value, tuple) else value
+                variants.append((source, uniforms, variant_label(values), values))
+        finally:
+            for name, node, prop, current, numeric in targets:
+                set_value(node, prop, current)
+        return variants
+
+    @tracer.traced("generate_preview_glsl_code", "codegen")
+    def generate_preview_glsl_code(self):
+        # The code and each model node's previewNode index
+        return self.glsl_generator().build_preview_glsl_code()
+
+    def invalidate_preview(self):
+        # Something else replaced the active program; the next update recompiles
+        self.emitted_code = None
+
+    def set_preview_mode(self, enabled):
+        self.preview_mode = enabled
+        self.emitted_code = None
+        self.update_code_editor(self.selected_node)
 
     def on_node_double_clicked(self, node):
         self.selected_node = node
@@ -127,6 +535,35 @@ class NodeEditorView(QtWidgets.QWidget):
         self.update_code_editor(node)
 
     def update_code_editor(self, selected_node=None):
+        if self.in_transaction():
+            self.transaction_dirty = True
+            return
+
+        try:
+            self.emit_code(selected_node)
+        except PortTypeError as e:
+            # Nothing that can't compile goes on to the code editor
+            self.graph_error.emit(str(e))
+
+    def emit_code(self, selected_node):
+        if self.preview_mode:
+            # Only a graph change needs new code and a compile; selection is
+            # a uniform update
+            if self.preview_code is None or self.preview_revision != self.revision:
+                self.preview_code, self.preview_index = self.generate_preview_glsl_code()
+                self.preview_revision = self.revision
+            node = self.model_nodes.get(selected_node.id) if selected_node else None
+            glsl_code = self.preview_code
+            if node is None and self.bake_enabled:
+                # Nothing selected shows the graph's output, which the baked
+                # program draws without recomputing its static branches
+                glsl_code = self.generate_baked_preview_code() or glsl_code
+            if glsl_code != self.emitted_code:
+                self.emitted_code = glsl_code
+                self.node_selected.emit(glsl_code)
+            self.preview_selection_changed.emit(self.preview_index.get(node, -1))
+            return
+
         if selected_node and isinstance(selected_node, (GradientNode, UVNode)):
             return
 
@@ -136,21 +573,29 @@ class NodeEditorView(QtWidgets.QWidget):
             glsl_code = self.generate_glsl_code()
         self.node_selected.emit(glsl_code)
 
+    @tracer.traced("generate_glsl_code_for_node", "codegen")
     def generate_glsl_code_for_node(self, node):
-        generated_code = []
-        used_vars = set()
-
-        if hasattr(node, 'generate_glsl'):
-            var_name = node.generate_glsl(generated_code, used_vars)
-            final_output_var = var_name
-
-        final_code = f"""
-    #version 120
-    {self.format_glsl_code(generated_code)}
-
-    void main() {{
-        gl_FragColor = vec4(vec3({final_output_var}), 1.0);
-    }}
-    """
-        print(f"Generated GLSL code for node:\n{final_code}")
+        generator = self.glsl_generator()
+        final_code = generator.build_node_glsl_code(self.model_nodes[node.id])
+        tracer.debug("Generated GLSL code for node:\n%s", final_code)
         return final_code
+
+
+def unique_names(names):
+    # Names as NodeGraph would give them, made unique in one pass: a repeat
+    # takes the next free "name 1", "name 2", ...
+    taken = set()
+    suffixes = {}  # name -> the suffix to try next
+    unique = []
+    for name in names:
+        name = ' '.join(name.split())
+        candidate = name
+        if candidate in taken:
+            suffix = suffixes.get(name, 1)
+            while f"{name} {suffix}" in taken:
+                suffix += 1
+            candidate = f"{name} {suffix}"
+            suffixes[name] = suffix + 1
+        taken.add(candidate)
+        unique.append(candidate)
+    return unique
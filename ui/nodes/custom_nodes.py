@@ -2,6 +2,8 @@ from NodeGraphQt import BaseNode, NodeBaseWidget
 from PySide6.QtWidgets import QPushButton, QWidget, QColorDialog, QComboBox, QVBoxLayout, QLabel, QSlider, QDoubleSpinBox, QFileDialog, QHBoxLayout
 from PySide6.QtGui import QColor
 from PySide6.QtCore import Qt, Signal
+from ui.custom_viewer import LodNodeItem
+from graph.shader_graph import NODE_SPECS
 
 
 class ColorButtonWidget(NodeBaseWidget):
@@ -154,9 +156,15 @@ class SliderWidget(NodeBaseWidget):
 class MaterialNode(BaseNode):
     __identifier__ = 'nodes'
     NODE_NAME = 'Material'
+    # A view of a node in the editor's graph.shader_graph model, which holds
+    # its ports' types and generates its code
+    SPEC = NODE_SPECS['MaterialNode']
+    INPUT_TYPES = SPEC.input_types
+    OUTPUT_TYPES = SPEC.output_types
 
     def __init__(self):
-        super(MaterialNode, self).__init__()
+        super(MaterialNode, self).__init__(LodNodeItem)
+        self.create_property('uid', 0)
         self.add_input('Color')
         self.add_output('Output')
 
@@ -182,51 +190,6 @@ class MaterialNode(BaseNode):
 
         self.set_node_color(255, 150, 150)
 
-    def generate_glsl(self, generated_code, used_vars):
-        node_id = id(self)
-        shading_model = self.get_property('shading_model')
-        color_var = self.get_input_var_name('Color', generated_code, used_vars)
-        var_name = f"material_{node_id}"
-        if var_name in used_vars:
-            return var_name
-        used_vars.add(var_name)
-
-        spec_color = self.get_property('specular_color')
-        spec_intensity = self.get_property('specular_intensity')
-        shininess = self.get_property('shininess')
-
-        generated_code.append(f"// Begin Material Node {node_id} ({self.NODE_NAME})")
-        if shading_model == 'Lambert':
-            generated_code.append(f"""
-    vec3 lightDir = normalize(vec3(0.0, 0.0, 1.0)); // Light coming straight down
-    vec3 normal = normalize(vec3(0.0, 0.0, 1.0)); // Surface normal
-    vec4 {var_name} = vec4({color_var}.rgb * max(dot(normal, lightDir), 0.0), 1.0);
-    """)
-        elif shading_model == 'Phong':
-            generated_code.append(f"""
-    vec3 normal = normalize(vec3(0.0, 0.0, 1.0)); // Surface normal
-    vec3 lightDir = normalize(vec3(0.0, 0.0, 1.0)); // Light coming straight down
-    vec3 viewDir = normalize(vec3(0.0, 0.0, 1.0)); // View direction
-    vec3 reflectDir = reflect(-lightDir, normal);
-    float spec = {spec_intensity} * pow(max(dot(viewDir, reflectDir), {shininess}), 32.0);
-    vec4 {var_name} = vec4({color_var}.rgb * max(dot(normal, lightDir), 0.0) + vec3({spec_color[0]}, {spec_color[1]}, {spec_color[2]}) * spec, 1.0);
-    """)
-        return var_name
-
-    def get_input_var_name(self, input_name, generated_code, used_vars):
-        input_port = self.get_input(input_name)
-        if input_port and input_port.connected_ports():
-            connected_port = input_port.connected_ports()[0]
-            connected_node = connected_port.node()
-            if hasattr(connected_node, 'generate_glsl'):
-                var_name = connected_node.generate_glsl(generated_code, used_vars)
-                return var_name
-        # Use the node's base color if no connection is found
-        base_color = self.get_property('node_color')
-        var_name = f"base_color_{id(self)}"
-        generated_code.append(f"vec3 {var_name} = vec3({base_color[0]}, {base_color[1]}, {base_color[2]});")
-        return var_name
-
     def set_node_color(self, r, g, b):
         self.base_color_widget.set_value((r / 255.0, g / 255.0, b / 255.0))
 
@@ -238,9 +201,13 @@ class MaterialNode(BaseNode):
 class ColorNode(BaseNode):
     __identifier__ = 'nodes'
     NODE_NAME = 'Color'
+    SPEC = NODE_SPECS['ColorNode']
+    INPUT_TYPES = SPEC.input_types
+    OUTPUT_TYPES = SPEC.output_types
 
     def __init__(self):
-        super(ColorNode, self).__init__()
+        super(ColorNode, self).__init__(LodNodeItem)
+        self.create_property('uid', 0)
         self.add_output('Color')
 
         self.color_button_widget = ColorButtonWidget(self.view, 'node_color', 'Pick Color')
@@ -249,18 +216,6 @@ class ColorNode(BaseNode):
 
         self.set_node_color(150, 255, 150)
 
-    def generate_glsl(self, generated_code, used_vars):
-        node_id = id(self)
-        color = self.get_property('node_color')
-        var_name = f"color_{node_id}"
-        if var_name in used_vars:
-            return var_name
-        used_vars.add(var_name)
-        generated_code.append(f"// Begin Color Node {node_id} ({self.NODE_NAME})")
-        generated_code.append(f"vec4 {var_name} = vec4({color[0]}, {color[1]}, {color[2]}, 1.0);")
-        generated_code.append(f"// End Color Node {node_id} ({self.NODE_NAME})")
-        return var_name
-
     def set_node_color(self, r, g, b):
         color = (r / 255.0, g / 255.0, b / 255.0)
         self.color_button_widget.set_value(color)
@@ -335,9 +290,13 @@ class BlendModeWidget(NodeBaseWidget):
 class BlendNode(BaseNode):
     __identifier__ = 'nodes'
     NODE_NAME = 'Blend'
+    SPEC = NODE_SPECS['BlendNode']
+    INPUT_TYPES = SPEC.input_types
+    OUTPUT_TYPES = SPEC.output_types
 
     def __init__(self):
-        super(BlendNode, self).__init__()
+        super(BlendNode, self).__init__(LodNodeItem)
+        self.create_property('uid', 0)
         self.add_input('Color A')
         self.add_input('Color B')
         self.add_output('Output')
@@ -346,39 +305,6 @@ class BlendNode(BaseNode):
         self.blend_mode_widget.value_changed.connect(self._on_property_changed)
         self.add_custom_widget(self.blend_mode_widget, 'blend_mode', 'Blend Mode')
 
-    def generate_glsl(self, generated_code, used_vars):
-        node_id = id(self)
-        color_a_var = self.get_input_var_name('Color A', generated_code, used_vars)
-        color_b_var = self.get_input_var_name('Color B', generated_code, used_vars)
-        var_name = f"blend_{node_id}"
-        if var_name in used_vars:
-            return var_name
-        used_vars.add(var_name)
-
-        blend_mode = self.get_property('blend_mode')
-        generated_code.append(f"// Begin Blend Node {node_id} ({self.NODE_NAME})")
-
-        if blend_mode == 'Multiply':
-            generated_code.append(f"vec4 {var_name} = vec4({color_a_var}.rgb * {color_b_var}.rgb, 1.0);")
-        elif blend_mode == 'Screen':
-            generated_code.append(f"vec4 {var_name} = vec4(1.0 - (1.0 - {color_a_var}.rgb) * (1.0 - {color_b_var}.rgb), 1.0);")
-        elif blend_mode == 'Overlay':
-            generated_code.append(f"vec4 {var_name} = vec4("
-                        f"({color_a_var}.r < 0.5) ? (2.0 * {color_a_var}.r * {color_b_var}.r) : (1.0 - 2.0 * (1.0 - {color_a_var}.r) * (1.0 - {color_b_var}.r)), "
-                        f"({color_a_var}.g < 0.5) ? (2.0 * {color_a_var}.g * {color_b_var}.g) : (1.0 - 2.0 * (1.0 - {color_a_var}.g) * (1.0 - {color_b_var}.g)), "
-                        f"({color_a_var}.b < 0.5) ? (2.0 * {color_a_var}.b * {color_b_var}.b) : (1.0 - 2.0 * (1.0 - {color_a_var}.b) * (1.0 - {color_b_var}.b)), 1.0);")
-        return var_name
-
-    def get_input_var_name(self, input_name, generated_code, used_vars):
-        input_port = self.get_input(input_name)
-        if input_port and input_port.connected_ports():
-            connected_port = input_port.connected_ports()[0]
-            connected_node = connected_port.node()
-            if hasattr(connected_node, 'generate_glsl'):
-                var_name = connected_node.generate_glsl(generated_code, used_vars)
-                return var_name
-        return "vec3(1.0)"  # Default to white if no input
-
     def _on_property_changed(self, name, value):
         self.set_property(name, value)
         self.update()
@@ -410,21 +336,6 @@ class TextureWidget(NodeBaseWidget):
             self._texture_button.setText(texture_path.split('/')[-1])
             self.value_changed.emit(self._name, self._texture_path)
 
-    def generate_glsl(self, generated_code, used_vars):
-        node_id = id(self)
-        uv_var = self.get_input_var_name('UV', generated_code, used_vars) or 'vec2(0.0, 0.0)'
-        var_name = f"texture_{node_id}"
-        if var_name in used_vars:
-            return var_name
-        used_vars.add(var_name)
-
-        texture_uniform_name = f"texture_sampler_{node_id}"
-        generated_code.append(f"// Begin Texture Node {node_id} ({self.NODE_NAME})")
-        generated_code.append(f"uniform sampler2D {texture_uniform_name};")
-        generated_code.append(f"vec4 {var_name} = texture2D({texture_uniform_name}, {uv_var});")
-        generated_code.append(f"// End Texture Node {node_id} ({self.NODE_NAME})")
-        return var_name
-
     def get_value(self):
         return self._texture_path
 
@@ -438,9 +349,13 @@ class TextureWidget(NodeBaseWidget):
 class TextureNode(BaseNode):
     __identifier__ = 'nodes'
     NODE_NAME = 'Texture'
+    SPEC = NODE_SPECS['TextureNode']
+    INPUT_TYPES = SPEC.input_types
+    OUTPUT_TYPES = SPEC.output_types
 
     def __init__(self):
-        super(TextureNode, self).__init__()
+        super(TextureNode, self).__init__(LodNodeItem)
+        self.create_property('uid', 0)
         self.add_input('UV')
         self.add_output('Color')
 
@@ -448,100 +363,41 @@ class TextureNode(BaseNode):
         self.texture_widget.value_changed.connect(self._on_property_changed)
         self.add_custom_widget(self.texture_widget, 'texture', 'Texture')
 
-    def generate_glsl(self, generated_code, used_vars):
-        node_id = id(self)
-        uv_var = self.get_input_var_name('UV', generated_code, used_vars)
-        var_name = f"texture_{node_id}"
-        if var_name in used_vars:
-            return var_name
-        used_vars.add(var_name)
-
-        texture_uniform_name = f"texture_sampler_{node_id}"
-        generated_code.append(f"// Begin Texture Node {node_id} ({self.NODE_NAME})")
-        generated_code.append(f"uniform sampler2D {texture_uniform_name};")
-        generated_code.append(f"vec4 {var_name} = texture2D({texture_uniform_name}, {uv_var});")
-        generated_code.append(f"// End Texture Node {node_id} ({self.NODE_NAME})")
-        return var_name
-
     def _on_property_changed(self, name, value):
         self.set_property(name, value)
         self.update()
         self.graph.node_double_clicked.emit(self)
 
-    def get_input_var_name(self, input_name, generated_code, used_vars):
-        input_port = self.get_input(input_name)
-        if input_port and input_port.connected_ports():
-            connected_port = input_port.connected_ports()[0]
-            connected_node = connected_port.node()
-            if hasattr(connected_node, 'generate_glsl'):
-                var_name = connected_node.generate_glsl(generated_code, used_vars)
-                return var_name
-        var_name = "default_uv"
-        if var_name not in used_vars:
-            generated_code.append(f"vec2 {var_name} = vec2(0.0, 0.0);")
-        return var_name
-
 
 class UVNode(BaseNode):
     __identifier__ = 'nodes'
     NODE_NAME = 'UV'
+    SPEC = NODE_SPECS['UVNode']
+    INPUT_TYPES = SPEC.input_types
+    OUTPUT_TYPES = SPEC.output_types
 
     def __init__(self):
-        super(UVNode, self).__init__()
+        super(UVNode, self).__init__(LodNodeItem)
+        self.create_property('uid', 0)
         self.add_output('UV')
 
-    def generate_glsl(self, generated_code, used_vars):
-        node_id = id(self)
-        var_name = f"uv_{node_id}"
-        if var_name in used_vars:
-            return var_name
-        used_vars.add(var_name)
-
-        generated_code.append(f"// Begin UV Node {node_id} ({self.NODE_NAME})")
-        generated_code.append(f"uniform vec2 resolution;")
-        generated_code.append(f"vec2 {var_name} = gl_FragCoord.xy / resolution;")
-        generated_code.append(f"// End UV Node {node_id} ({self.NODE_NAME})")
-        return var_name
-
 
 class GradientNode(BaseNode):
     __identifier__ = 'nodes'
     NODE_NAME = 'Gradient'
+    SPEC = NODE_SPECS['GradientNode']
+    INPUT_TYPES = SPEC.input_types
+    OUTPUT_TYPES = SPEC.output_types
 
     def __init__(self):
-        super(GradientNode, self).__init__()
+        super(GradientNode, self).__init__(LodNodeItem)
+        self.create_property('uid', 0)
         self.add_input('UV')
         self.add_output('Color')
 
         # Initial gradient values (example)
         self.gradient = [255, 128, 64, 128, 255]
 
-    def generate_glsl(self, generated_code, used_vars):
-        node_id = id(self)
-        uv_var = self.get_input_var_name('UV', generated_code, used_vars)
-        var_name = f"gradient_{node_id}"
-        if var_name in used_vars:
-            return var_name
-        used_vars.add(var_name)
-
-        generated_code.append(f"// Begin Gradient Node {node_id} ({self.NODE_NAME})")
-        generated_code.append(f"vec3 {var_name} = mix(vec3(1.0, 0.0, 0.0), vec3(0.0, 0.0, 1.0), {uv_var}.y);")
-        generated_code.append(f"// End Gradient Node {node_id} ({self.NODE_NAME})")
-        return var_name
-
-    def get_input_var_name(self, input_name, generated_code, used_vars):
-        input_port = self.get_input(input_name)
-        if input_port and input_port.connected_ports():
-            connected_port = input_port.connected_ports()[0]
-            connected_node = connected_port.node()
-            if hasattr(connected_node, 'generate_glsl'):
-                var_name = connected_node.generate_glsl(generated_code, used_vars)
-                return var_name
-        var_name = "default_uv"
-        if var_name not in used_vars:
-            generated_code.append(f"vec2 {var_name} = vec2(0.0, 0.0);")
-        return var_name
-
     def _on_gradient_changed(self, gradient):
         self.gradient = gradient
         self.update()
@@ -550,38 +406,13 @@ class GradientNode(BaseNode):
 class AddNode(BaseNode):
     __identifier__ = 'nodes'
     NODE_NAME = 'Add'
+    SPEC = NODE_SPECS['AddNode']
+    INPUT_TYPES = SPEC.input_types
+    OUTPUT_TYPES = SPEC.output_types
 
     def __init__(self):
-        super(AddNode, self).__init__()
+        super(AddNode, self).__init__(LodNodeItem)
+        self.create_property('uid', 0)
         self.add_input('A')
         self.add_input('B')
         self.add_output('Output')
-
-    def generate_glsl(self, generated_code, used_vars):
-        node_id = id(self)
-        input_a = self.get_input_var_name('A', generated_code, used_vars)
-        input_b = self.get_input_var_name('B', generated_code, used_vars)
-        var_name = f"add_{node_id}"
-        if var_name in used_vars:
-            return var_name
-        used_vars.add(var_name)
-
-        generated_code.append(f"// Begin Add Node {node_id} ({self.NODE_NAME})")
-        generated_code.append(f"vec4 {var_name} = {input_a} + {input_b};")
-        generated_code.append(f"// End Add Node {node_id} ({self.NODE_NAME})")
-        return var_name
-
-    def get_input_var_name(self, input_name, generated_code, used_vars):
-        input_port = self.get_input(input_name)
-        if input_port and input_port.connected_ports():
-            connected_port = input_port.connected_ports()[0]
-            connected_node = connected_port.node()
-            if hasattr(connected_node, 'generate_glsl'):
-                var_name = connected_node.generate_glsl(generated_code, used_vars)
-                return var_name
-        # Default value if no input is connected
-        var_name = f"default_{input_name}_{id(self)}"
-        if var_name not in used_vars:
-            generated_code.append(f"vec4 {var_name} = vec4(0.0, 0.0, 0.0, 1.0);")
-            used_vars.add(var_name)
-        return var_name
@@ -1,13 +1,30 @@
+import re
 import numpy as np
 from PySide6.QtOpenGLWidgets import QOpenGLWidget
-from PySide6.QtGui import QSurfaceFormat
-from PySide6.QtCore import Signal
+from PySide6.QtGui import QSurfaceFormat, QImage
+from PySide6.QtCore import Signal, QTimer
 from OpenGL.GL import *
 from shaders.shader_program import ShaderProgram
+from shaders.program_cache import ProgramCache, source_digest
+from shaders.render_graph import RenderGraph, RenderTarget, is_multipass_source, parse_multipass_source
+from shaders.heatmap import HeatMapProfiler
+from shaders.shader_utils import clean_shader_code
+from shaders.frame_capture import FrameRecorder
+from shaders.gl_resources import gl_resources
+from shaders.pixel_readback import PixelReadback, read_pixels_sync
+from shaders.mesh_loader import load_mesh, preview_matrices, VERTEX_FLOATS
+from shaders.permutations import (parse_variant_axes, resolve_selection, apply_variant, variant_selections,
+                                  format_selection, QualityController, QUALITY_AXIS)
+from shaders.gpu_timer import GpuTimer
+from utils.startup_profiler import startup_profiler
+from utils.tracing import tracer
 import time
 
 class OpenGLWidget(QOpenGLWidget):
     shader_compiled = Signal(bool, str)
+    heatmap_updated = Signal(dict)
+    reload_timed = Signal(dict)
+    frame_read = Signal(int, object)  # request id, (height, width, 4) uint8 array
 
     def __init__(self):
         super().__init__()
@@ -15,6 +32,7 @@ class OpenGLWidget(QOpenGLWidget):
         fmt = QSurfaceFormat()
         fmt.setVersion(2, 1)
         fmt.setProfile(QSurfaceFormat.CoreProfile)
+        fmt.setDepthBufferSize(24)
         QSurfaceFormat.setDefaultFormat(fmt)
         self.shader_program = None
         self.texture = None
@@ -22,6 +40,53 @@ class OpenGLWidget(QOpenGLWidget):
         self.ebo = None
         self.texture_path = None
         self.is_3d = False
+        self.pending_shader = None
+        # Mesh preview: when a mesh is loaded it is drawn with mesh_vertex
+        # instead of the fullscreen quad, as one indexed draw call
+        self.mesh = None
+        self.mesh_vbo = None
+        self.mesh_ebo = None
+        self.custom_uniforms = {}
+        self.program_cache = ProgramCache()
+        self.texture_samplers = []
+        self.render_graph = None
+        # Last frame of a time-invariant shader, blitted on repaints that
+        # don't change anything the program reads
+        self.frame_cache = None
+        self.frame_cache_key = None
+        self.frame_stats = {"rendered": 0, "cached": 0}
+        # Profiling mode: the shader is rewritten to count loop iterations and
+        # calls per pixel, and those counts are drawn instead of the image
+        self.shader_source = None
+        self.heatmap_enabled = False
+        self.heatmap = None
+        self.heatmap_metric = 0
+        self.heatmap_read_time = 0.0
+        self.frame_recorder = None
+        self.background_compiler = None
+        self.background_sources = {}
+        self.background_latest = None
+        # Shader permutations: "// @variant" defines are rewritten for the
+        # selected options, and the other variants compile in the background
+        # so switching between them is a program cache lookup
+        self.variant_axes = {}
+        self.variant_selection = {}
+        self.variant_source = None
+        self.variant_pending = set()
+        # Set while the quality tier follows measured GPU frame times
+        self.quality_controller = None
+        self.gpu_timer = None
+        # Timing marks for the reload in flight, stamped until its frame shows
+        self.reload_timing = None
+        # Asynchronous readback of presented frames through a PBO ring
+        self.readback = None
+        self.readback_requests = []
+        self.continuous_readback = None
+        self.readback_timer = QTimer(self)
+        self.readback_timer.setSingleShot(True)
+        self.readback_timer.setInterval(16)
+        self.readback_timer.timeout.connect(self.service_readback)
+        self.frameSwapped.connect(self.on_frame_swapped)
         self.cameraPos = np.array([0.0, 0.0, 5.0], dtype=np.float32)
         self.lightPos = np.array([5.0, 5.0, 5.0], dtype=np.float32)
         self.boilerplate_vertex = """
@@ -34,6 +99,24 @@ class OpenGLWidget(QOpenGLWidget):
             TexCoords = texCoord;
         }
         """
+        self.mesh_vertex = """
+        #version 120
+        attribute vec3 position;
+        attribute vec2 texCoord;
+        attribute vec3 normal;
+        uniform mat4 modelMatrix;
+        uniform mat4 viewProjection;
+        varying vec2 TexCoords;
+        varying vec3 Normal;
+        varying vec3 FragPos;
+        void main() {
+            vec4 world = modelMatrix * vec4(position, 1.0);
+            gl_Position = viewProjection * world;
+            TexCoords = texCoord;
+            Normal = normal;  // the model matrix only scales uniformly
+            FragPos = world.xyz;
+        }
+        """
         self.boilerplate_fragment = """
         #version 120
         varying vec2 TexCoords;
@@ -44,29 +127,397 @@ class OpenGLWidget(QOpenGLWidget):
         """
 
     def initializeGL(self):
-        glClearColor(0.0, 0.0, 0.0, 1.0)
-        glEnable(GL_DEPTH_TEST)
-        self.shader_program = ShaderProgram(self.boilerplate_vertex, self.boilerplate_fragment)
-        self.initialize_geometry()
-        self.initialize_texture()
-        self.update_uniforms()
-
+        with startup_profiler.phase("GL init"):
+            glClearColor(0.0, 0.0, 0.0, 1.0)
+            glEnable(GL_DEPTH_TEST)
+            self.shader_program = ShaderProgram(self.boilerplate_vertex, self.boilerplate_fragment, self.program_cache,
+                                                owner="viewport")
+            self.context().aboutToBeDestroyed.connect(self.cleanup_gl)
+            self.initialize_geometry()
+            self.initialize_texture()
+            if self.mesh:
+                self.upload_mesh()
+            self.update_uniforms()
+        if self.pending_shader:
+            self.compile_shaders(*self.pending_shader)
+
+    @tracer.traced("OpenGLWidget.compile_shaders", "gl")
     def compile_shaders(self, shader_source, is_3d=False):
-        self.is_3d = is_3d
+        if self.shader_program is None:
+            # The widget is created lazily; compile once the context exists
+            self.pending_shader = (shader_source, is_3d)
+            return True, "Shader queued until OpenGL is initialized."
+        self.pending_shader = None
+        # Restored if the shader fails, as the last good program keeps drawing
+        was_3d, self.is_3d = self.is_3d, is_3d
+        self.makeCurrent()
+        self.frame_cache_key = None
+        if is_multipass_source(shader_source):
+            compiled, message = self.compile_render_graph(shader_source)
+            if compiled:
+                self.variant_axes = {}
+            else:
+                self.is_3d = was_3d
+            return compiled, message
         shader_source = self.clean_shader_code(shader_source)
-        print("Compiling shader with source:\n", shader_source)  # Debugging print
+        tracer.debug("Compiling shader with source:\n%s", shader_source)
         try:
-            self.shader_program.compile(self.boilerplate_vertex, shader_source)
+            shader_source = self.expand_variants(shader_source)
+            self.shader_program.compile(self.vertex_source(), shader_source)
+            # A multi-pass shader drew until this one compiled
+            self.release_render_graph()
+            self.texture_samplers = re.findall(r"uniform\s+sampler2D\s+(\w+)\s*;", shader_source)
             self.shader_program.use()
             self.update_uniforms()  # Update uniforms like resolution and time
-            self.shader_compiled.emit(True, "Shader compiled successfully.")
+            self.shader_source = shader_source
+            message = "Shader compiled successfully."
+            if self.shader_program.from_cache:
+                message = "Shader loaded from program cache."
+            if self.variant_axes:
+                message += f" Variant: {format_selection(self.variant_selection)}."
+                self.precompile_variants()
+            if self.heatmap_enabled:
+                self.build_heatmap()
+                message += " Showing cost heat map."
+            self.shader_compiled.emit(True, message)
             self.update()  # Trigger the OpenGL widget to repaint
-            return True, "Shader compiled successfully."
-        except RuntimeError as e:
+            return True, message
+        except (RuntimeError, ValueError) as e:
+            self.is_3d = was_3d
+            self.shader_compiled.emit(False, str(e))
+            return False, str(e)
+
+    def expand_variants(self, source):
+        # The source with the selected variant applied. A new shader keeps the
+        # options picked before for axes it shares with the old one.
+        axes = parse_variant_axes(source)
+        base = apply_variant(source, axes, {name: axis.options[0] for name, axis in axes.items()}) if axes else None
+        if base != self.variant_source:
+            self.variant_source = base
+            if self.quality_controller:
+                self.quality_controller.reset()
+        self.variant_axes = axes
+        if not axes:
+            return source
+        self.variant_selection = resolve_selection(axes, self.variant_selection)
+        return apply_variant(source, axes, self.variant_selection)
+
+    def variant_digest(self, selection):
+        return source_digest(self.vertex_source(), apply_variant(self.shader_source, self.variant_axes, selection))
+
+    def precompile_variants(self):
+        # Queues every variant that isn't in the program cache yet
+        if not self.ensure_background_compiler():
+            return
+        for selection in variant_selections(self.variant_axes):
+            source = apply_variant(self.shader_source, self.variant_axes, selection)
+            digest = source_digest(self.vertex_source(), source)
+            if digest in self.program_cache.programs or digest in self.variant_pending:
+                continue
+            self.variant_pending.add(digest)
+            self.background_compiler.compile(self.vertex_source(), source)
+
+    def set_variant(self, axis, option):
+        # Recompiles the current shader with another option; once the variant
+        # has been precompiled this only swaps programs
+        self.variant_selection[axis] = option
+        if self.shader_source and self.variant_axes and not self.render_graph:
+            return self.compile_shaders(self.shader_source, self.is_3d)
+        return False, "The shader has no variants."
+
+    def set_adaptive_quality(self, enabled, target_ms=None):
+        # Steps the quality axis up and down to keep GPU frame times under target_ms
+        if not enabled:
+            self.quality_controller = None
+            return
+        if self.quality_controller is None:
+            self.quality_controller = QualityController()
+        if target_ms:
+            self.quality_controller.target_ms = target_ms
+        self.update()
+
+    def observe_frame_time(self, frame_ms):
+        axis = self.variant_axes.get(QUALITY_AXIS)
+        if axis is None or self.render_graph or self.heatmap:
+            return
+        current = self.variant_selection[QUALITY_AXIS]
+        tier = self.quality_controller.observe(frame_ms, axis.options, current)
+        if tier is None:
+            return
+        selection = dict(self.variant_selection, **{QUALITY_AXIS: tier})
+        if self.variant_digest(selection) not in self.program_cache.programs:
+            # Not precompiled yet: switching now would stall on the compile
+            return
+        tracer.info("Quality %s -> %s (median GPU frame time %.2f ms)", current, tier,
+                    self.quality_controller.median_ms(current))
+        self.set_variant(QUALITY_AXIS, tier)
+
+
+
+    def compile_shaders_in_background(self, shader_source, timing=None):
+        self.reload_timing = timing
+        if self.shader_program is None or is_multipass_source(shader_source):
+            return self.compile_shaders(shader_source)
+        source = self.clean_shader_code(shader_source)
+        try:
+            source = self.expand_variants(source)
+        except ValueError as e:
+            self.shader_compiled.emit(False, str(e))
+            return False, str(e)
+        digest = source_digest(self.vertex_source(), source)
+        if not self.ensure_background_compiler() or digest in self.program_cache.programs:
+            result = self.compile_shaders(source)
+            if self.reload_timing is not None:
+                self.reload_timing["compiled"] = time.time()
+            return result
+        self.background_sources[digest] = source
+        self.background_latest = digest
+        self.background_compiler.compile(self.vertex_source(), source)
+        return True, "Compiling in the background."
+
+    def ensure_background_compiler(self):
+        if self.background_compiler is None:
+            from ui.background_compiler import BackgroundCompiler
+            try:
+                self.background_compiler = BackgroundCompiler(self.context(), self)
+                self.background_compiler.finished.connect(self.on_background_compiled)
+            except RuntimeError as e:
+                tracer.warning("Falling back to compiling on the GUI thread: %s", e)
+                self.background_compiler = False
+        return self.background_compiler
+
+    def vertex_source(self):
+        return self.mesh_vertex if self.mesh else self.boilerplate_vertex
+
+    def load_mesh(self, path):
+        # Raises ValueError/OSError for files that can't be read, leaving
+        # the current mesh (or the quad) in place
+        mesh = load_mesh(path)
+        self.mesh = mesh
+        if self.shader_program is not None:
+            self.makeCurrent()
+            self.upload_mesh()
+            self.recompile_for_geometry()
+        source = "cache" if mesh.from_cache else "file"
+        return (f"Loaded {mesh.triangle_count()} triangles, {len(mesh.vertices)} vertices "
+                f"from {source} in {mesh.load_ms:.0f} ms.")
+
+    def clear_mesh(self):
+        self.mesh = None
+        if self.shader_program is not None:
+            self.makeCurrent()
+            self.release_mesh()
+            self.recompile_for_geometry()
+
+    def recompile_for_geometry(self):
+        # The fragment shader has to be linked against the other vertex shader
+        if not self.render_graph:
+            self.compile_shaders(self.shader_source or self.boilerplate_fragment, self.is_3d)
+        self.update()
+
+    def upload_mesh(self):
+        self.release_mesh()
+        self.mesh_vbo = gl_resources.gen_buffer("mesh preview")
+        self.mesh_ebo = gl_resources.gen_buffer("mesh preview")
+        glBindBuffer(GL_ARRAY_BUFFER, self.mesh_vbo)
+        gl_resources.buffer_data(GL_ARRAY_BUFFER, self.mesh_vbo, self.mesh.vertices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.mesh_ebo)
+        gl_resources.buffer_data(GL_ELEMENT_ARRAY_BUFFER, self.mesh_ebo, self.mesh.indices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+    def release_mesh(self):
+        for name in (self.mesh_vbo, self.mesh_ebo):
+            gl_resources.delete_buffer(name)
+        self.mesh_vbo = self.mesh_ebo = None
+
+    def on_background_compiled(self, digest, program, error):
+        source = self.background_sources.pop(digest, None)
+        if not error:
+            # A variant that failed stays pending so it isn't queued again
+            self.variant_pending.discard(digest)
+        if digest != self.background_latest:
+            # A precompiled variant, or superseded by a newer save; keep the
+            # work for if it comes back
+            if program:
+                self.makeCurrent()
+                if digest in self.program_cache.programs:
+                    gl_resources.delete_program(program)
+                else:
+                    self.program_cache.store(digest, program)
+            elif error:
+                tracer.warning("Variant failed to compile: %s", error)
+            return
+        self.background_latest = None
+        if error:
+            self.reload_timing = None
+            self.shader_compiled.emit(False, error)
+            return
+        self.makeCurrent()
+        # Adopting the program through the cache turns the compile below into a lookup
+        self.program_cache.store(digest, program)
+        if self.reload_timing is not None:
+            self.reload_timing["compiled"] = time.time()
+        self.compile_shaders(source)
+
+    def on_frame_swapped(self):
+        if self.gpu_timer:
+            self.makeCurrent()
+            for frame_ms in self.gpu_timer.poll():
+                if self.quality_controller:
+                    self.observe_frame_time(frame_ms)
+        if self.reload_timing and "compiled" in self.reload_timing:
+            self.reload_timing["frame"] = time.time()
+            self.reload_timed.emit(self.reload_timing)
+            self.reload_timing = None
+        if self.readback_requests or self.continuous_readback or (self.readback and self.readback.pending):
+            self.service_readback(queue_frame=True)
+
+    def grab_frame_async(self, callback=None):
+        # Reads the next presented frame without stalling. callback(id, pixels)
+        # gets a view that is only valid during the call; without one a copy
+        # arrives through frame_read.
+        self.readback_requests.append(callback)
+        self.update()
+
+    def start_continuous_readback(self, callback=None):
+        self.continuous_readback = callback or True
+        self.update()
+
+    def stop_continuous_readback(self):
+        self.continuous_readback = None
+
+    def grab_frame(self):
+        # Synchronous fallback; stalls until the GPU has finished the frame
+        self.makeCurrent()
+        width, height = self.framebuffer_size()
+        pixels = read_pixels_sync(self.defaultFramebufferObject(), 0, 0, width, height).copy()
+        glBindFramebuffer(GL_FRAMEBUFFER, self.defaultFramebufferObject())
+        return pixels
+
+    def service_readback(self, queue_frame=False):
+        # The widget's framebuffer keeps the frame after the swap, so it can
+        # be read from here; finished reads are handed out first
+        self.makeCurrent()
+        if self.readback is None:
+            self.readback = PixelReadback(owner="viewport readback")
+        callbacks = []
+        if queue_frame:
+            callbacks = self.readback_requests
+            self.readback_requests = []
+            if self.continuous_readback:
+                callbacks.append(None if self.continuous_readback is True else self.continuous_readback)
+        width, height = self.framebuffer_size()
+        for callback in callbacks:
+            self.readback.queue(self.defaultFramebufferObject(), 0, 0, width, height, callback)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.defaultFramebufferObject())
+        for request_id, pixels in self.readback.poll():
+            self.frame_read.emit(request_id, pixels)
+        if self.readback.pending:
+            # Keep polling when no new frames are coming to do it for us
+            self.readback_timer.start()
+
+    def stop_background_compiler(self):
+        if self.background_compiler:
+            self.background_compiler.stop()
+        self.background_compiler = None
+
+    def compile_render_graph(self, shader_source):
+        # Passes whose source and inputs didn't change keep their program and
+        # cached output, so editing one branch doesn't re-render the others.
+        # A failed edit leaves the current graph drawing unchanged.
+        graph = self.render_graph or RenderGraph(owner="viewport render graph")
+        try:
+            kept = graph.sync_passes([(name, self.clean_shader_code(source), inputs, feedback, scale, internal_format)
+                                      for name, source, inputs, feedback, scale, internal_format
+                                      in parse_multipass_source(shader_source)])
+            self.bind_graph_textures(graph)
+            graph.resize(self.width(), self.height())
+            for name in graph.execution_order():
+                graph.prepare_pass(graph.passes[name])
+        except (RuntimeError, ValueError) as e:
+            if graph is not self.render_graph:
+                graph.release()
             self.shader_compiled.emit(False, str(e))
             return False, str(e)
+        self.release_heatmap()
+        self.render_graph = graph
+        self.shader_source = shader_source
+        message = f"Render graph compiled with {len(graph.passes)} passes."
+        if kept:
+            message += f" {len(kept)} unchanged."
+        self.shader_compiled.emit(True, message)
+        self.update()
+        return True, message
+
+    def bind_graph_textures(self, graph):
+        # Samplers that aren't pass inputs read the viewport's image, as they
+        # do in a single-pass shader
+        inputs = set()
+        samplers = set()
+        for render_pass in graph.passes.values():
+            inputs.update(render_pass.inputs)
+            samplers.update(re.findall(r"uniform\s+sampler2D\s+(\w+)\s*;", render_pass.fragment_source))
+        for sampler in sorted(samplers - inputs):
+            if self.texture and graph.textures.get(sampler) != self.texture:
+                graph.set_texture(sampler, self.texture)
+
+    def set_heatmap_mode(self, enabled, metric=None):
+        self.heatmap_enabled = enabled
+        if metric is not None:
+            self.heatmap_metric = metric
+        if self.shader_program is None:
+            return
+        self.makeCurrent()
+        if enabled and self.shader_source and not self.render_graph:
+            self.build_heatmap()
+        else:
+            self.release_heatmap()
+        self.update()
 
+    def build_heatmap(self):
+        self.release_heatmap()
+        try:
+            heatmap = HeatMapProfiler(self.shader_source, self.heatmap_metric)
+            heatmap.prepare(*self.framebuffer_size())
+        except RuntimeError as e:
+            self.shader_compiled.emit(False, f"Heat map instrumentation failed: {e}")
+            return
+        self.heatmap = heatmap
+        self.heatmap_read_time = 0.0
+
+    def release_heatmap(self):
+        if self.heatmap:
+            self.heatmap.release()
+            self.heatmap = None
+
+    def start_capture(self, path):
+        self.stop_capture()
+        self.frame_recorder = FrameRecorder(path)
+        self.update()
 
+    def stop_capture(self):
+        # Returns the number of frames written
+        if not self.frame_recorder:
+            return 0
+        frames = self.frame_recorder.frames
+        self.frame_recorder.close()
+        self.frame_recorder = None
+        return frames
+
+    def release_render_graph(self):
+        self.release_heatmap()
+        if self.render_graph:
+            self.render_graph.release()
+            self.render_graph = None
+
+    def builtin_uniform_values(self):
+        return {
+            "resolution": (self.width(), self.height()),
+            "iTime": time.time() - self.start_time,
+            "cameraPos": self.cameraPos,
+            "lightPos": self.lightPos,
+        }
 
     def initialize_geometry(self):
         vertices = np.array([
@@ -77,18 +528,20 @@ class OpenGLWidget(QOpenGLWidget):
         ], dtype=np.float32)
         indices = np.array([0, 1, 2, 2, 3, 0], dtype=np.uint32)
 
-        self.vbo = glGenBuffers(1)
-        self.ebo = glGenBuffers(1)
+        self.vbo = gl_resources.gen_buffer("viewport")
+        self.ebo = gl_resources.gen_buffer("viewport")
 
         glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
-        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        gl_resources.buffer_data(GL_ARRAY_BUFFER, self.vbo, vertices, GL_STATIC_DRAW)
 
         glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ebo)
-        glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW)
+        gl_resources.buffer_data(GL_ELEMENT_ARRAY_BUFFER, self.ebo, indices, GL_STATIC_DRAW)
 
     def initialize_texture(self):
+        # Called again whenever the texture path changes
+        gl_resources.delete_texture(self.texture)
         if self.texture_path:
-            self.texture = glGenTextures(1)
+            self.texture = gl_resources.gen_texture("viewport texture")
             glBindTexture(GL_TEXTURE_2D, self.texture)
 
             image = QImage(self.texture_path)
@@ -97,71 +550,214 @@ class OpenGLWidget(QOpenGLWidget):
             height = image.height()
             image_data = image.bits().tobytes()
 
-            glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, width, height, 0, GL_RGBA, GL_UNSIGNED_BYTE, image_data)
+            gl_resources.texture_image(self.texture, GL_RGBA, width, height, GL_RGBA, GL_UNSIGNED_BYTE, image_data)
             glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
             glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
             glBindTexture(GL_TEXTURE_2D, 0)
         else:
-            self.texture = glGenTextures(1)
+            self.texture = gl_resources.gen_texture("viewport texture")
             glBindTexture(GL_TEXTURE_2D, self.texture)
             white_texture = np.array([255, 255, 255, 255], dtype=np.uint8)
-            glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, 1, 1, 0, GL_RGBA, GL_UNSIGNED_BYTE, white_texture)
+            gl_resources.texture_image(self.texture, GL_RGBA, 1, 1, GL_RGBA, GL_UNSIGNED_BYTE, white_texture)
             glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
             glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
             glBindTexture(GL_TEXTURE_2D, 0)
 
     def set_texture_path(self, path):
         self.texture_path = path
+        self.frame_cache_key = None
+        if self.shader_program is None:
+            return
+        self.makeCurrent()
         self.initialize_texture()
+        if self.render_graph:
+            for sampler in list(self.render_graph.textures):
+                self.render_graph.set_texture(sampler, self.texture)
         self.update()
 
+    @tracer.traced("paintGL", "render")
     def paintGL(self):
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        if self.frame_recorder and self.shader_source:
+            self.frame_recorder.record(self.shader_source, self.builtin_uniform_values(), self.custom_uniforms)
+        if self.render_graph:
+            # Passes whose inputs didn't change keep their cached output
+            self.render_graph.resize(self.width(), self.height())
+            self.render_graph.render(self.builtin_uniform_values(), self.defaultFramebufferObject())
+            self.render_graph.present(self.width(), self.height(), self.defaultFramebufferObject())
+            startup_profiler.first_frame()
+            return
+
+        if self.heatmap:
+            width, height = self.framebuffer_size()
+            self.heatmap.render(self.builtin_uniform_values(), width, height, self.defaultFramebufferObject())
+            # Reading float counts back stalls the pipeline, so animated
+            # shaders only refresh the statistics a couple of times a second
+            now = time.time()
+            if now - self.heatmap_read_time > 0.5:
+                self.heatmap_read_time = now
+                summary = self.heatmap.summary()
+                glBindFramebuffer(GL_FRAMEBUFFER, self.defaultFramebufferObject())
+                if summary:
+                    self.heatmap_updated.emit(summary)
+            return
+
+        if not self.shader_program or not self.shader_program.program:
+            # Nothing has compiled yet; a failed compile keeps the last good program
+            return
+        key = self.frame_key()
+        if key is None:
+            self.draw_timed()
+            self.frame_stats["rendered"] += 1
+        else:
+            width, height = self.framebuffer_size()
+            if self.frame_cache is None or (self.frame_cache.width, self.frame_cache.height) != (width, height):
+                self.release_frame_cache()
+                self.frame_cache = RenderTarget(width, height, owner="frame cache")
+            if key != self.frame_cache_key:
+                self.frame_cache.bind()
+                glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+                self.draw_timed()
+                self.frame_cache_key = key
+                self.frame_stats["rendered"] += 1
+            else:
+                self.frame_stats["cached"] += 1
+            glBindFramebuffer(GL_READ_FRAMEBUFFER, self.frame_cache.fbo)
+            glBindFramebuffer(GL_DRAW_FRAMEBUFFER, self.defaultFramebufferObject())
+            glBlitFramebuffer(0, 0, width, height, 0, 0, width, height, GL_COLOR_BUFFER_BIT, GL_NEAREST)
+            glBindFramebuffer(GL_FRAMEBUFFER, self.defaultFramebufferObject())
+            glViewport(0, 0, width, height)
+        startup_profiler.first_frame()
+
+    def draw_timed(self):
+        # Frame times for adaptive quality come from GPU timer queries
+        if not self.quality_controller:
+            self.draw_shader()
+            return
+        if self.gpu_timer is None:
+            self.gpu_timer = GpuTimer(owner="viewport frame timer")
+        self.gpu_timer.begin()
+        try:
+            self.draw_shader()
+        finally:
+            self.gpu_timer.end()
+
+    @tracer.traced("draw", "render")
+    def draw_shader(self):
         self.shader_program.use()
 
         if self.texture:
             glActiveTexture(GL_TEXTURE0)
             glBindTexture(GL_TEXTURE_2D, self.texture)
-            texture_location = glGetUniformLocation(self.shader_program.program, "texture_sampler_4303718352")
-            glUniform1i(texture_location, 0)  # Bind the uniform to texture unit 0
+            for sampler in self.texture_samplers:
+                texture_location = glGetUniformLocation(self.shader_program.program, sampler)
+                if texture_location != -1:
+                    glUniform1i(texture_location, 0)  # Bind the uniform to texture unit 0
 
         self.update_uniforms()
 
+        if self.mesh_vbo:
+            self.draw_mesh()
+            glBindTexture(GL_TEXTURE_2D, 0)
+            return
+
         glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
         glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ebo)
 
-        position_location = glGetAttribLocation(self.shader_program.program, "position")
-        texCoord_location = glGetAttribLocation(self.shader_program.program, "texCoord")
-
-        glEnableVertexAttribArray(position_location)
-        glVertexAttribPointer(position_location, 3, GL_FLOAT, GL_FALSE, 5 * 4, ctypes.c_void_p(0))
-
-        glEnableVertexAttribArray(texCoord_location)
-        glVertexAttribPointer(texCoord_location, 2, GL_FLOAT, GL_FALSE, 5 * 4, ctypes.c_void_p(3 * 4))
+        # Shaders that never read TexCoords lose the texCoord attribute
+        attributes = []
+        for name, size, offset in (("position", 3, 0), ("texCoord", 2, 3)):
+            location = glGetAttribLocation(self.shader_program.program, name)
+            if location != -1:
+                glEnableVertexAttribArray(location)
+                glVertexAttribPointer(location, size, GL_FLOAT, GL_FALSE, 5 * 4, ctypes.c_void_p(offset * 4))
+                attributes.append(location)
 
         glDrawElements(GL_TRIANGLES, 6, GL_UNSIGNED_INT, None)
 
-        glDisableVertexAttribArray(position_location)
-        glDisableVertexAttribArray(texCoord_location)
+        for location in attributes:
+            glDisableVertexAttribArray(location)
         glBindTexture(GL_TEXTURE_2D, 0)
 
+    def draw_mesh(self):
+        glBindBuffer(GL_ARRAY_BUFFER, self.mesh_vbo)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.mesh_ebo)
+        stride = VERTEX_FLOATS * 4
+        # Attributes the fragment shader doesn't use are optimised away
+        attributes = []
+        for name, size, offset in (("position", 3, 0), ("normal", 3, 3), ("texCoord", 2, 6)):
+            location = glGetAttribLocation(self.shader_program.program, name)
+            if location != -1:
+                glEnableVertexAttribArray(location)
+                glVertexAttribPointer(location, size, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(offset * 4))
+                attributes.append(location)
+        glDrawElements(GL_TRIANGLES, len(self.mesh.indices), GL_UNSIGNED_INT, None)
+        for location in attributes:
+            glDisableVertexAttribArray(location)
+
+    def framebuffer_size(self):
+        ratio = self.devicePixelRatio()
+        return int(self.width() * ratio), int(self.height() * ratio)
+
+    def frame_key(self):
+        # None means the frame depends on time and has to be drawn every paint
+        uniforms = self.shader_program.active_uniforms()
+        if "iTime" in uniforms:
+            return None
+        if self.mesh_vbo:
+            # The cache target has no depth buffer to draw a mesh into
+            return None
+        key = [self.shader_program.program, self.shader_program.generation, self.framebuffer_size(),
+               self.width(), self.height(), self.texture]
+        if "cameraPos" in uniforms:
+            key.append(tuple(self.cameraPos.tolist()))
+        if "lightPos" in uniforms:
+            key.append(tuple(self.lightPos.tolist()))
+        for name, value in sorted(self.custom_uniforms.items()):
+            if name in uniforms:
+                key.append((name, value if isinstance(value, (int, float)) else tuple(value)))
+        return tuple(key)
+
+    def cleanup_gl(self):
+        # The context is going away: free everything this widget made, then
+        # anything still registered was leaked by someone
+        self.makeCurrent()
+        self.stop_capture()
+        if self.readback:
+            self.readback.release()
+            self.readback = None
+        self.release_render_graph()
+        self.release_frame_cache()
+        if self.gpu_timer:
+            self.gpu_timer.release()
+            self.gpu_timer = None
+        if self.shader_program:
+            self.shader_program.release()
+            self.shader_program = None
+        self.program_cache.clear()
+        self.program_cache.save_history()
+        for name in (self.vbo, self.ebo):
+            gl_resources.delete_buffer(name)
+        self.vbo = self.ebo = None
+        self.release_mesh()
+        gl_resources.delete_texture(self.texture)
+        self.texture = None
+        tracer.info(gl_resources.leak_report())
+        self.doneCurrent()
 
-    def clean_shader_code(self, shader_source):
-        shader_source = shader_source.strip()
-
-        if not shader_source.startswith("#version"):
-            shader_source = "#version 120\n" + shader_source
-
-        lines = shader_source.split('\n')
-        cleaned_lines = [lines[0]]
-
-        for line in lines[1:]:
-            if not line.strip().startswith("#version"):
-                cleaned_lines.append(line)
+    def release_frame_cache(self):
+        if self.frame_cache:
+            self.frame_cache.release()
+            self.frame_cache = None
+        self.frame_cache_key = None
 
-        return '\n'.join(cleaned_lines)
+    def clean_shader_code(self, shader_source):
+        return clean_shader_code(shader_source)
 
+    @tracer.traced("upload uniforms", "render")
     def update_uniforms(self):
+        if not self.shader_program or not self.shader_program.program:
+            return
         self.shader_program.use()
         resolution_location = glGetUniformLocation(self.shader_program.program, "resolution")
         if resolution_location != -1:
@@ -179,6 +775,54 @@ class OpenGLWidget(QOpenGLWidget):
         if cameraPosLoc != -1:
             glUniform3fv(cameraPosLoc, 1, self.cameraPos)
 
+        if self.mesh:
+            model, view_projection = preview_matrices(self.mesh, self.cameraPos, self.width() / max(1, self.height()))
+            for name, matrix in (("modelMatrix", model), ("viewProjection", view_projection)):
+                location = glGetUniformLocation(self.shader_program.program, name)
+                if location != -1:
+                    # NumPy is row-major, GL expects columns
+                    glUniformMatrix4fv(location, 1, GL_FALSE, np.ascontiguousarray(matrix.T))
+
+        for name, value in self.custom_uniforms.items():
+            location = glGetUniformLocation(self.shader_program.program, name)
+            if location == -1:
+                continue
+            if isinstance(value, int):
+                glUniform1i(location, value)
+            elif isinstance(value, float):
+                glUniform1f(location, value)
+            elif len(value) == 2:
+                glUniform2f(location, *value)
+            elif len(value) == 3:
+                glUniform3f(location, *value)
+            elif len(value) == 4:
+                glUniform4f(location, *value)
+
+    def render_sweep(self, variants, tile_width, tile_height, columns=None):
+        from shaders.parameter_sweep import ParameterSweep
+        self.makeCurrent()
+        builtins = self.builtin_uniform_values()
+        samplers = set()
+        for source, _, _, _ in variants:
+            samplers.update(re.findall(r"uniform\s+sampler2D\s+(\w+)\s*;", source))
+        textures = {sampler: self.texture for sampler in sorted(samplers)} if self.texture else {}
+        sweep = ParameterSweep(tile_width, tile_height, columns)
+        try:
+            pixels, tiles = sweep.render(variants, builtins, textures)
+        finally:
+            glBindFramebuffer(GL_FRAMEBUFFER, self.defaultFramebufferObject())
+            glViewport(0, 0, *self.framebuffer_size())
+            self.update()
+        return pixels, tiles, sweep.stats
+
+    def set_uniform_value(self, name, value):
+        # Persists across recompiles; applied with the built-in uniforms
+        self.custom_uniforms[name] = value
+        self.update()
+
     def resizeGL(self, w, h):
         glViewport(0, 0, w, h)
+        if self.quality_controller:
+            # Frame times measured at the old size no longer apply
+            self.quality_controller.reset()
         self.update_uniforms()
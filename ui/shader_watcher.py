@@ -0,0 +1,81 @@
+import hashlib
+import os
+import time
+from PySide6.QtCore import QObject, QFileSystemWatcher, QTimer, Signal
+from shaders.shader_utils import load_shader_source_with_includes
+
+
+class ShaderFileWatcher(QObject):
+    # path, expanded source, timing marks (time.time() seconds) for latency reports
+    source_changed = Signal(str, str, dict)
+    reload_failed = Signal(str, str)
+
+    def __init__(self, debounce_ms=150, parent=None):
+        super().__init__(parent)
+        self.path = None
+        self.files = []
+        self.digest = None
+        self.first_event_time = None
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.on_file_changed)
+        # Editors save as truncate + write, or write-temp + rename, which
+        # arrives as a burst of events; only the last one triggers a reload
+        self.debounce = QTimer(self)
+        self.debounce.setSingleShot(True)
+        self.debounce.setInterval(debounce_ms)
+        self.debounce.timeout.connect(self.reload)
+
+    def watch(self, path):
+        self.unwatch()
+        self.path = os.path.abspath(path)
+        source, files = load_shader_source_with_includes(self.path)
+        self.digest = hashlib.sha1(source.encode("utf-8")).hexdigest()
+        self.set_files(files)
+        return source
+
+    def unwatch(self):
+        self.debounce.stop()
+        if self.watcher.files():
+            self.watcher.removePaths(self.watcher.files())
+        self.path = None
+        self.files = []
+        self.digest = None
+
+    def set_files(self, files):
+        self.files = files
+        watched = set(self.watcher.files())
+        stale = [path for path in watched if path not in files]
+        if stale:
+            self.watcher.removePaths(stale)
+        # A file replaced by rename drops out of the watcher, so re-adding
+        # every file after each reload keeps the watch alive
+        missing = [path for path in files if path not in watched and os.path.exists(path)]
+        if missing:
+            self.watcher.addPaths(missing)
+
+    def on_file_changed(self, path):
+        if self.first_event_time is None:
+            self.first_event_time = time.time()
+        self.debounce.start()
+
+    def reload(self):
+        if not self.path:
+            return
+        marks = {"event": self.first_event_time or time.time()}
+        self.first_event_time = None
+        try:
+            source, files = load_shader_source_with_includes(self.path)
+        except (OSError, ValueError) as e:
+            # Mid-rename the file can be briefly missing; the next event retries
+            self.set_files(self.files)
+            self.reload_failed.emit(self.path, str(e))
+            return
+        marks["saved"] = max(os.path.getmtime(path) for path in files if os.path.exists(path))
+        marks["read"] = time.time()
+        self.set_files(files)
+        digest = hashlib.sha1(source.encode("utf-8")).hexdigest()
+        if digest == self.digest:
+            # Touched or re-saved without changes
+            return
+        self.digest = digest
+        self.source_changed.emit(self.path, source, marks)
@@ -0,0 +1,202 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PySide6.QtWidgets import QWidget
+from PySide6.QtGui import QImage, QPainter, QColor
+from PySide6.QtCore import Signal, QTimer, Qt
+from shaders.software_renderer import SoftwareRenderer
+from shaders.permutations import parse_variant_axes, resolve_selection, apply_variant
+from utils.startup_profiler import startup_profiler
+
+
+class SoftwareViewport(QWidget):
+    # Stands in for OpenGLWidget when there is no usable OpenGL. Frames are
+    # rendered by a SoftwareRenderer on a helper thread (which mostly waits on
+    # the worker processes) so the GUI stays responsive; animated shaders
+    # start their next frame as soon as one is shown.
+    shader_compiled = Signal(bool, str)
+    heatmap_updated = Signal(dict)
+    reload_timed = Signal(dict)
+    frame_read = Signal(int, object)  # request id, (height, width, 4) uint8 array
+
+    def __init__(self, workers=None):
+        super().__init__()
+        self.start_time = time.time()
+        self.renderer = SoftwareRenderer(workers)
+        self.render_thread = ThreadPoolExecutor(1)
+        self.frame_future = None
+        self.frame_dirty = False
+        self.image = None
+        self.shader_source = None
+        self.texture_path = None
+        self.heatmap_metric = 0
+        self.custom_uniforms = self.renderer.custom_uniforms
+        # Variants are applied before translating; there is nothing to precompile
+        self.variant_axes = {}
+        self.variant_selection = {}
+        # Grabs waiting for the next frame to start, and those it will answer
+        self.frame_requests = []
+        self.frame_future_requests = []
+        self.next_request_id = 0
+        self.reload_timing = None
+        self.cameraPos = np.array([0.0, 0.0, 5.0], dtype=np.float32)
+        self.lightPos = np.array([5.0, 5.0, 5.0], dtype=np.float32)
+        self.poll_timer = QTimer(self)
+        self.poll_timer.setInterval(10)
+        self.poll_timer.timeout.connect(self.poll_frame)
+        self.setMinimumSize(64, 64)
+
+    def compile_shaders(self, shader_source, is_3d=False):
+        try:
+            self.variant_axes = parse_variant_axes(shader_source)
+        except ValueError as e:
+            self.shader_compiled.emit(False, str(e))
+            return False, str(e)
+        if self.variant_axes:
+            self.variant_selection = resolve_selection(self.variant_axes, self.variant_selection)
+            shader_source = apply_variant(shader_source, self.variant_axes, self.variant_selection)
+        success, message = self.renderer.compile_shaders(shader_source, is_3d)
+        if success:
+            self.shader_source = self.renderer.shader_source
+            self.request_frame()
+        else:
+            self.reload_timing = None
+        self.shader_compiled.emit(success, message)
+        return success, message
+
+    def compile_shaders_in_background(self, shader_source, timing=None):
+        # Translating is quick next to rendering, so it happens right here
+        self.reload_timing = timing
+        result = self.compile_shaders(shader_source)
+        if self.reload_timing is not None:
+            self.reload_timing["compiled"] = time.time()
+        return result
+
+    def stop_background_compiler(self):
+        # Nothing compiles in the background, but frames render off the GUI
+        # thread and in worker processes; stop those
+        self.poll_timer.stop()
+        if self.frame_future:
+            self.frame_future.cancel()
+        self.render_thread.shutdown(wait=True)
+        self.renderer.release()
+
+    def builtin_uniform_values(self):
+        return {
+            "resolution": (self.width(), self.height()),
+            "iTime": time.time() - self.start_time,
+            "cameraPos": self.cameraPos,
+            "lightPos": self.lightPos,
+        }
+
+    def request_frame(self):
+        # One frame in flight at a time; a change while it renders asks for another
+        if self.renderer.shader is None:
+            return
+        if self.frame_future is not None:
+            self.frame_dirty = True
+            return
+        self.frame_dirty = False
+        width, height = max(1, self.width()), max(1, self.height())
+        self.frame_future = self.render_thread.submit(self.renderer.render, width, height,
+                                                      self.builtin_uniform_values())
+        self.frame_future_requests, self.frame_requests = self.frame_requests, []
+        self.poll_timer.start()
+
+    def poll_frame(self):
+        future = self.frame_future
+        if future is None or not future.done():
+            return
+        self.frame_future = None
+        self.poll_timer.stop()
+        try:
+            pixels = future.result()
+        except (RuntimeError, OSError) as e:
+            self.shader_compiled.emit(False, f"Software render failed: {e}")
+            return
+        height, width, _ = pixels.shape
+        self.image = QImage(pixels.tobytes(), width, height, width * 4, QImage.Format_RGBA8888).copy()
+        self.update()
+        requests, self.frame_future_requests = self.frame_future_requests, []
+        for request_id, callback in requests:
+            if callback:
+                callback(request_id, pixels)
+            else:
+                self.frame_read.emit(request_id, pixels.copy())
+        if self.reload_timing and "compiled" in self.reload_timing:
+            self.reload_timing["frame"] = time.time()
+            self.reload_timed.emit(self.reload_timing)
+            self.reload_timing = None
+        startup_profiler.first_frame()
+        if self.frame_dirty or self.renderer.is_animated():
+            self.request_frame()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(0, 0, 0))
+        if self.image is not None:
+            # Stretched while a frame at the new size is on its way
+            painter.drawImage(self.rect(), self.image)
+        else:
+            painter.setPen(QColor(200, 200, 200))
+            painter.drawText(self.rect(), Qt.AlignCenter, "Software renderer")
+        painter.end()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.request_frame()
+
+    def set_uniform_value(self, name, value):
+        self.renderer.set_uniform_value(name, value)
+        self.request_frame()
+
+    def set_texture_path(self, path):
+        self.texture_path = path
+        pixels = None
+        if path:
+            image = QImage(path).convertToFormat(QImage.Format_RGBA8888)
+            if not image.isNull():
+                pixels = np.frombuffer(image.constBits(), dtype=np.uint8).reshape(
+                    image.height(), image.bytesPerLine() // 4, 4)[:, :image.width()].copy()
+        # Queued behind any frame in flight, which may still be reading the old one
+        self.render_thread.submit(self.renderer.set_texture, pixels)
+        self.request_frame()
+
+    def grab_frame_async(self, callback=None):
+        # Same contract as OpenGLWidget: the next frame started goes to
+        # callback(id, pixels), or out through frame_read
+        self.next_request_id += 1
+        self.frame_requests.append((self.next_request_id, callback))
+        self.request_frame()
+        return self.next_request_id
+
+    def set_heatmap_mode(self, enabled, metric=None):
+        if metric is not None:
+            self.heatmap_metric = metric
+        if enabled:
+            self.shader_compiled.emit(False, "The cost heat map needs OpenGL.")
+
+    def start_capture(self, path):
+        self.shader_compiled.emit(False, "Frame capture needs OpenGL.")
+
+    def stop_capture(self):
+        return 0
+
+    def load_mesh(self, path):
+        raise RuntimeError("Mesh preview needs OpenGL.")
+
+    def clear_mesh(self):
+        pass
+
+    def set_variant(self, axis, option):
+        self.variant_selection[axis] = option
+        if self.shader_source and self.variant_axes:
+            return self.compile_shaders(self.shader_source)
+        return False, "The shader has no variants."
+
+    def set_adaptive_quality(self, enabled, target_ms=None):
+        if enabled:
+            self.shader_compiled.emit(False, "Adaptive quality needs OpenGL frame timers.")
+
+    def render_sweep(self, variants, tile_width, tile_height, columns=None):
+        raise RuntimeError("Parameter sweeps need OpenGL.")
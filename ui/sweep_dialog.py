@@ -0,0 +1,99 @@
+from PySide6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QPlainTextEdit, QPushButton, QLabel, QSpinBox,
+                               QScrollArea, QFileDialog)
+from PySide6.QtGui import QImage, QPainter, QPixmap, QColor, QFont
+from PySide6.QtCore import Qt
+
+SWEEP_HELP = ("One parameter per line: name = values. Values are separated by ';' and can be numbers, "
+              "vectors (1 0 0) or names (Screen), or a range start:stop:count. From the code editor names are "
+              "uniforms; from the node editor they are 'Node Name.property'.")
+
+
+def annotate_atlas(pixels, tiles):
+    # A label strip along the bottom of every tile
+    height, width, _ = pixels.shape
+    image = QImage(pixels.tobytes(), width, height, width * 4, QImage.Format_RGBA8888).copy()
+    painter = QPainter(image)
+    font = QFont()
+    font.setPixelSize(11)
+    painter.setFont(font)
+    strip = 16
+    for tile in tiles:
+        painter.fillRect(tile.x, tile.y + tile.height - strip, tile.width, strip, QColor(0, 0, 0, 170))
+        painter.setPen(QColor(255, 255, 255))
+        label = painter.fontMetrics().elidedText(tile.label, Qt.ElideMiddle, tile.width - 6)
+        painter.drawText(tile.x + 3, tile.y + tile.height - strip, tile.width - 6, strip,
+                         Qt.AlignLeft | Qt.AlignVCenter, label)
+    painter.end()
+    return image
+
+
+class ParameterSweepDialog(QDialog):
+    def __init__(self, render_sweep, spec="", parent=None):
+        # render_sweep(spec text, tile width, tile height) -> (pixels, tiles, summary)
+        super().__init__(parent)
+        self.setWindowTitle("Parameter Sweep")
+        self.resize(900, 700)
+        self.render_sweep = render_sweep
+        self.image = None
+
+        help_label = QLabel(SWEEP_HELP)
+        help_label.setWordWrap(True)
+        self.spec_edit = QPlainTextEdit(spec)
+        self.spec_edit.setMaximumHeight(110)
+
+        self.tile_width = QSpinBox()
+        self.tile_width.setRange(16, 1024)
+        self.tile_width.setValue(160)
+        self.tile_height = QSpinBox()
+        self.tile_height.setRange(16, 1024)
+        self.tile_height.setValue(120)
+        render_button = QPushButton("Render")
+        render_button.clicked.connect(self.render)
+        self.save_button = QPushButton("Save Image...")
+        self.save_button.setEnabled(False)
+        self.save_button.clicked.connect(self.save_image)
+
+        controls = QHBoxLayout()
+        controls.addWidget(QLabel("Tile size"))
+        controls.addWidget(self.tile_width)
+        controls.addWidget(QLabel("x"))
+        controls.addWidget(self.tile_height)
+        controls.addStretch()
+        controls.addWidget(render_button)
+        controls.addWidget(self.save_button)
+
+        self.atlas_label = QLabel()
+        self.atlas_label.setAlignment(Qt.AlignCenter)
+        scroll = QScrollArea()
+        scroll.setWidget(self.atlas_label)
+        scroll.setWidgetResizable(True)
+        self.status_label = QLabel("")
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(help_label)
+        layout.addWidget(self.spec_edit)
+        layout.addLayout(controls)
+        layout.addWidget(scroll)
+        layout.addWidget(self.status_label)
+
+    def render(self):
+        try:
+            pixels, tiles, summary = self.render_sweep(self.spec_edit.toPlainText(), self.tile_width.value(),
+                                                       self.tile_height.value())
+        except (ValueError, RuntimeError) as e:
+            self.status_label.setText(str(e))
+            self.status_label.setStyleSheet("color: red;")
+            return
+        self.image = annotate_atlas(pixels, tiles)
+        self.atlas_label.setPixmap(QPixmap.fromImage(self.image))
+        self.save_button.setEnabled(True)
+        self.status_label.setText(summary)
+        self.status_label.setStyleSheet("color: black;")
+
+    def save_image(self):
+        options = QFileDialog.Options()
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save Sweep", "", "PNG Image (*.png);;All Files (*)",
+                                                   options=options)
+        if file_path and not self.image.save(file_path):
+            self.status_label.setText(f"Could not save {file_path}")
+            self.status_label.setStyleSheet("color: red;")
@@ -0,0 +1,77 @@
+import time
+from graph.project_format import GraphProject
+
+# The benchmark graph repeats UV -> Gradient -> Add <- Color, Add -> Blend
+CHAIN = ("UVNode", "GradientNode", "ColorNode", "AddNode", "BlendNode")
+CHAIN_EDGES = ((0, 0, 1, 0), (1, 0, 3, 0), (2, 0, 3, 1), (3, 0, 4, 0))
+NODE_SPACING = (250.0, 200.0)
+PAN_SCALES = (1.0, 0.4, 0.1)
+PAN_STEP = 40  # pixels on screen per frame
+ZOOM_STEP = 0.9
+ZOOM_OUT_TO = 0.03
+
+
+def benchmark_project(node_count, columns=None):
+    # node_count nodes (rounded down to whole chains) in a roughly square grid
+    columns = columns or max(len(CHAIN), int(node_count ** 0.5) // len(CHAIN) * len(CHAIN))
+    project = GraphProject()
+    for index in range(node_count // len(CHAIN) * len(CHAIN)):
+        type_name = CHAIN[index % len(CHAIN)]
+        row, column = divmod(index, columns)
+        project.add_node(type_name, type_name[:-len("Node")], column * NODE_SPACING[0], row * NODE_SPACING[1], {},
+                         uid=index + 1)
+    for first in range(0, len(project), len(CHAIN)):
+        for out_node, out_port, in_node, in_port in CHAIN_EDGES:
+            project.add_edge(first + out_node, out_port, first + in_node, in_port)
+    return project
+
+
+def paint_frame(viewer):
+    # Milliseconds for one synchronous repaint of the viewer
+    start = time.perf_counter()
+    viewer.viewport().repaint()
+    return (time.perf_counter() - start) * 1000.0
+
+
+def zoom_to(viewer, scale, center):
+    factor = scale / viewer.transform().m11()
+    viewer.scale(factor, factor, center)
+
+
+def run_pan_zoom(viewer, center, frames=60):
+    # Frame times by phase: panning at a few fixed scales, then zooming out
+    # to the whole graph and back in, which re-renders every cached item
+    stats = {}
+    for scale in PAN_SCALES:
+        viewer.reset_zoom(center)
+        zoom_to(viewer, scale, center)
+        paint_frame(viewer)
+        step = PAN_STEP / scale
+        times = []
+        for frame in range(frames):
+            # Back and forth, so the view stays over the graph
+            direction = 1 if frame // (frames // 2 or 1) == 0 else -1
+            viewer._set_viewer_pan(step * direction, step * direction * 0.5)
+            times.append(paint_frame(viewer))
+        stats[f"pan at {scale:g}x"] = times
+    viewer.reset_zoom(center)
+    times = []
+    while viewer.transform().m11() > ZOOM_OUT_TO:
+        viewer.scale(ZOOM_STEP, ZOOM_STEP, center)
+        times.append(paint_frame(viewer))
+    while viewer.transform().m11() < 1.0:
+        viewer.scale(1.0 / ZOOM_STEP, 1.0 / ZOOM_STEP, center)
+        times.append(paint_frame(viewer))
+    stats["zoom out and in"] = times
+    return stats
+
+
+def format_benchmark_stats(stats):
+    lines = []
+    for phase, times in stats.items():
+        ordered = sorted(times)
+        median = ordered[len(ordered) // 2]
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        lines.append(f"  {phase:<18} median {median:7.2f} ms  p95 {p95:7.2f} ms  max {ordered[-1]:7.2f} ms  "
+                     f"({1000.0 / median:6.1f} fps)")
+    return "\n".join(lines)
@@ -0,0 +1,61 @@
+# startup_profiler.py
+import os
+import time
+from contextlib import contextmanager
+
+
+class StartupProfiler:
+    PHASES = ("imports", "widget construction", "GL init", "first frame")
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.enabled = bool(os.environ.get("SHADER_EDITOR_PROFILE_STARTUP"))
+        self.entries = []  # (phase, label, seconds)
+        self._stack = []
+        self.reported = False
+
+    def enable(self):
+        self.enabled = True
+
+    @contextmanager
+    def phase(self, phase, label=None):
+        if not self.enabled:
+            yield
+            return
+        # Nested phases (e.g. a deferred import inside a lazy widget build) are
+        # subtracted from their parent so the report never double counts
+        self._stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += elapsed
+            self.entries.append((phase, label or phase, elapsed - nested))
+
+    def first_frame(self):
+        # Called from the first paintGL; everything up to here counts as cold start
+        if not self.enabled or self.reported:
+            return
+        self.entries.append(("first frame", "time to first frame", time.perf_counter() - self.origin))
+        self.report()
+
+    def report(self):
+        self.reported = True
+        lines = ["Startup profile:"]
+        for phase in self.PHASES:
+            entries = [entry for entry in self.entries if entry[0] == phase]
+            if not entries:
+                continue
+            total = sum(seconds for _, _, seconds in entries)
+            lines.append(f"  {phase:<22}{total * 1000.0:9.1f} ms")
+            if len(entries) > 1 or entries[0][1] != phase:
+                for _, label, seconds in entries:
+                    lines.append(f"    {label:<20}{seconds * 1000.0:9.1f} ms")
+        print("\n".join(lines))
+        return lines
+
+
+startup_profiler = StartupProfiler()
@@ -0,0 +1,152 @@
+# tracing.py
+import json
+import os
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+# Longest log message kept in a trace event; shader sources can be big
+TRACE_MESSAGE_CHARS = 4096
+
+
+class NullSpan:
+    # Handed out for every span while tracing is off, so a disabled span
+    # costs one attribute check and no allocation
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    __slots__ = ("tracer", "name", "category", "args", "start")
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        if exc[0] is not None:
+            self.args["error"] = exc[0].__name__
+        self.tracer.record("X", self.name, self.category, self.start, end - self.start, self.args)
+        return False
+
+    def set(self, **args):
+        # Details only known once the work is done (cache hits, sizes)
+        self.args.update(args)
+
+
+class Tracer:
+    # Spans and log events go into a ring buffer of the last `capacity`
+    # events, exported as Chrome trace JSON (chrome://tracing, Perfetto).
+    # Log messages below the level are only formatted when tracing is on.
+    def __init__(self, capacity=65536):
+        self.enabled = bool(os.environ.get("SHADER_EDITOR_TRACE"))
+        self.level = LEVELS.get(os.environ.get("SHADER_EDITOR_LOG_LEVEL", "info").lower(), LEVELS["info"])
+        self.events = deque(maxlen=capacity)
+        self.recorded = 0
+        self.origin = time.perf_counter_ns()
+        self.thread_names = {}
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def set_level(self, level):
+        self.level = LEVELS[level]
+
+    def span(self, name, category="editor", **args):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, category, args)
+
+    def traced(self, name=None, category="editor"):
+        # Decorator form of span(); the name defaults to the function's
+        def decorate(function):
+            span_name = name or function.__qualname__
+
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with Span(self, span_name, category, {}):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def record(self, phase, name, category, start, duration, args):
+        thread = threading.get_ident()
+        if thread not in self.thread_names:
+            self.thread_names[thread] = threading.current_thread().name
+        self.events.append((phase, name, category, start, duration, thread, args))
+        self.recorded += 1
+
+    def log(self, level, message, *values):
+        number = LEVELS[level]
+        if number < self.level and not self.enabled:
+            return
+        text = message % values if values else message
+        if number >= self.level:
+            print(text if number < LEVELS["warning"] else f"{level.upper()}: {text}")
+        if self.enabled:
+            title = text.split("\n", 1)[0][:80]
+            self.record("i", title, "log", time.perf_counter_ns(), 0,
+                        {"level": level, "message": text[:TRACE_MESSAGE_CHARS]})
+
+    def debug(self, message, *values):
+        self.log("debug", message, *values)
+
+    def info(self, message, *values):
+        self.log("info", message, *values)
+
+    def warning(self, message, *values):
+        self.log("warning", message, *values)
+
+    def error(self, message, *values):
+        self.log("error", message, *values)
+
+    def dropped(self):
+        return self.recorded - len(self.events)
+
+    def clear(self):
+        self.events.clear()
+        self.recorded = 0
+
+    def chrome_trace(self):
+        pid = os.getpid()
+        events = [{"ph": "M", "name": "thread_name", "pid": pid, "tid": thread, "args": {"name": name}}
+                  for thread, name in self.thread_names.items()]
+        for phase, name, category, start, duration, thread, args in list(self.events):
+            event = {"ph": phase, "name": name, "cat": category, "pid": pid, "tid": thread,
+                     "ts": (start - self.origin) / 1000.0, "args": args}
+            if phase == "X":
+                event["dur"] = duration / 1000.0
+            else:
+                event["s"] = "t"
+            events.append(event)
+        return {"traceEvents": events, "displayTimeUnit": "ms",
+                "otherData": {"dropped_events": self.dropped()}}
+
+    def save(self, path):
+        with open(path, "w") as file:
+            json.dump(self.chrome_trace(), file, default=str)
+        return len(self.events)
+
+
+tracer = Tracer()